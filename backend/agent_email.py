@@ -1,25 +1,36 @@
 """
-agent_email.py - Generates and sends the daily portfolio report email.
-
-Uses SMTP (Gmail app password) via environment variables:
-  AGENT_SMTP_EMAIL    - sender Gmail address
-  AGENT_SMTP_PASSWORD - Gmail app password (not account password)
+agent_email.py - Generates the daily portfolio report email and hands it to
+the mail queue (mail_queue.py), which delivers over one pooled SMTP session.
+
+Uses SMTP (Gmail app password by default) via environment variables:
+  AGENT_SMTP_EMAIL    - sender address
+  AGENT_SMTP_PASSWORD - Gmail app password (not account password); leave
+                        empty for servers without AUTH (local stand-ins)
+  AGENT_SMTP_HOST / AGENT_SMTP_PORT / AGENT_SMTP_STARTTLS / AGENT_SMTP_SSL
+                      - server settings, see mail_queue.py
+
+queue_report() is what the market-close run uses: it returns as soon as the
+report is in the outbox, keyed per user and day so repeats are dropped.
+send_report() queues a one-off report and waits for its delivery.
 """
 
+import base64
 import os
-import smtplib
+import re
 import datetime
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from email.utils import formatdate
+from typing import Optional
+
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
 
-SMTP_EMAIL    = os.getenv("AGENT_SMTP_EMAIL", "")
-SMTP_PASSWORD = os.getenv("AGENT_SMTP_PASSWORD", "")
-SMTP_HOST     = "smtp.gmail.com"
-SMTP_PORT     = 587
+from mail_queue import MailQueue, message_id, SMTP_EMAIL, SMTP_HOST
+
 APP_URL       = os.getenv("APP_URL", "http://localhost:5173")
+SEND_TIMEOUT  = float(os.getenv("AGENT_MAIL_SEND_TIMEOUT", "60"))   # send_report() wait
 
 
 def _color_pnl(val: float) -> str:
@@ -30,86 +41,95 @@ def _sign(val: float) -> str:
     return f"+{val:.1f}" if val >= 0 else f"{val:.1f}"
 
 
-def _build_html(email: str, user: dict) -> str:
-    name       = user.get("name", email.split("@")[0])
-    profile    = user.get("profile", {})
-    agent_st   = user.get("agentState", {})
-    holdings   = user.get("holdings", {})
-    stocks     = holdings.get("stocks", [])
-    mfs        = holdings.get("mutualFunds", [])
-    prices     = agent_st.get("lastPrices", {})
+# ─────────────────────────────────────────────────────────────────────────────
+# Precompiled templates
+# ─────────────────────────────────────────────────────────────────────────────
 
-    verdict        = agent_st.get("verdict", "All Good")
-    verdict_reason = agent_st.get("verdictReason", "")
-    summary        = agent_st.get("overallSummary", "")
-    top_alerts     = agent_st.get("topAlerts", [])
-    last_checked   = agent_st.get("lastChecked", "")
+_SLOT = re.compile(r"\$\{(\w+)\}")
 
-    verdict_colors = {
-        "All Good":        ("#166534", "#dcfce7"),
-        "Caution":         ("#92400e", "#fef3c7"),
-        "Immediate Action":("#991b1b", "#fee2e2"),
-    }
-    txt_c, bg_c = verdict_colors.get(verdict, ("#166534", "#dcfce7"))
-
-    total_invested = sum(float(s.get("avgBuyPrice", 0)) * float(s.get("qty", 0)) for s in stocks) + \
-                     sum(float(m.get("investedAmount", 0)) for m in mfs)
-    total_current  = sum(float(s.get("currentValue", 0)) for s in stocks) + \
-                     sum(float(m.get("currentValue", 0)) for m in mfs)
-    pnl            = total_current - total_invested
-    pnl_pct        = (pnl / total_invested * 100) if total_invested > 0 else 0
-
-    # Holdings rows
-    stock_rows = ""
-    for s in stocks[:8]:
-        sym  = s.get("symbol", "")
-        nm   = s.get("name", sym)
-        cv   = float(s.get("currentValue", 0))
-        cost = float(s.get("avgBuyPrice", 0)) * float(s.get("qty", 0))
-        chg  = prices.get(sym, {}).get("change_pct")
-        spnl = cv - cost
-        stock_rows += f"""
+
+class _Template:
+    """
+    ${name} slots split out once at import; render() is a single join over
+    the literal chunks. bind() folds values that are the same for a whole
+    batch (date, market section) into the literals, so they are formatted once.
+    """
+
+    __slots__ = ("literals", "names")
+
+    def __init__(self, text: str):
+        parts = _SLOT.split(text)
+        self.literals = parts[0::2]
+        self.names    = parts[1::2]
+
+    def bind(self, **values) -> "_Template":
+        bound = _Template.__new__(_Template)
+        literals, names = [self.literals[0]], []
+        for name, lit in zip(self.names, self.literals[1:]):
+            if name in values:
+                literals[-1] += str(values[name]) + lit
+            else:
+                names.append(name)
+                literals.append(lit)
+        bound.literals, bound.names = literals, names
+        return bound
+
+    def render(self, ctx: dict) -> str:
+        lits = self.literals
+        out = [lits[0]]
+        for i, name in enumerate(self.names, 1):
+            out.append(str(ctx[name]))
+            out.append(lits[i])
+        return "".join(out)
+
+
+_STOCK_ROW = _Template("""
         <tr>
           <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;">
             <span style="background:#eff6ff;color:#1d4ed8;padding:2px 6px;border-radius:4px;font-size:11px;font-weight:600;">EQ</span>
-            &nbsp;{nm[:28]}
+            &nbsp;${name}
           </td>
-          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;">₹{cv:,.0f}</td>
-          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;color:{_color_pnl(spnl)};">{_sign(spnl)}</td>
-          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;color:{_color_pnl(chg or 0)};">{_sign(chg or 0)}%</td>
-        </tr>"""
-
-    mf_rows = ""
-    for m in mfs[:5]:
-        nm      = m.get("fundName", m.get("name", "MF"))
-        cv      = float(m.get("currentValue", 0))
-        invested = float(m.get("investedAmount", 0))
-        mpnl    = cv - invested
-        mf_rows += f"""
+          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;">₹${value}</td>
+          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;color:${pnl_color};">${pnl}</td>
+          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;color:${chg_color};">${chg}%</td>
+        </tr>""")
+
+_MF_ROW = _Template("""
         <tr>
           <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;">
             <span style="background:#f0fdf4;color:#15803d;padding:2px 6px;border-radius:4px;font-size:11px;font-weight:600;">MF</span>
-            &nbsp;{nm[:28]}
+            &nbsp;${name}
           </td>
-          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;">₹{cv:,.0f}</td>
-          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;color:{_color_pnl(mpnl)};">{_sign(mpnl)}</td>
+          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;">₹${value}</td>
+          <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;color:${pnl_color};">${pnl}</td>
           <td style="padding:6px 8px;border-bottom:1px solid #e5e7eb;text-align:right;">-</td>
-        </tr>"""
+        </tr>""")
 
-    # Alert rows
-    alert_rows = ""
-    for a in top_alerts[:3]:
-        alert_rows += f"""
+_ALERT_ROW = _Template("""
         <tr>
           <td style="padding:8px;border-left:3px solid #f59e0b;background:#fffbeb;margin-bottom:4px;">
-            <strong>{a.get('holding', '')}</strong>: {a.get('issue', '')}<br>
-            <span style="color:#6b7280;font-size:12px;">→ {a.get('action', '')}</span>
+            <strong>${holding}</strong>: ${issue}<br>
+            <span style="color:#6b7280;font-size:12px;">→ ${action}</span>
           </td>
-        </tr>"""
+        </tr>""")
 
-    today = datetime.date.today().strftime("%d %B %Y")
+_MOVER_ROW = _Template("""
+        <tr>
+          <td style="padding:4px 8px;border-bottom:1px solid #e5e7eb;">${symbol}</td>
+          <td style="padding:4px 8px;border-bottom:1px solid #e5e7eb;text-align:right;">₹${price}</td>
+          <td style="padding:4px 8px;border-bottom:1px solid #e5e7eb;text-align:right;color:${chg_color};">${chg}%</td>
+        </tr>""")
+
+_MARKET = _Template("""<!-- Market movers -->
+  <div style="padding:0 32px 16px;">
+    <div style="font-size:13px;font-weight:600;color:#374151;margin-bottom:8px;">Today's Movers</div>
+    <table style="width:100%;border-collapse:collapse;font-size:12px;">${rows}
+    </table>
+  </div>
+
+  """)
 
-    return f"""<!DOCTYPE html>
+_REPORT = _Template("""<!DOCTYPE html>
 <html>
 <head><meta charset="UTF-8"><meta name="viewport" content="width=device-width,initial-scale=1"></head>
 <body style="font-family:-apple-system,BlinkMacSystemFont,'Segoe UI',sans-serif;background:#f9fafb;margin:0;padding:0;">
@@ -119,12 +139,12 @@ def _build_html(email: str, user: dict) -> str:
   <div style="background:linear-gradient(135deg,#0f172a,#1e293b);padding:24px 32px;">
     <div style="color:#94a3b8;font-size:12px;letter-spacing:1px;text-transform:uppercase;">Diversifi Portfolio Agent</div>
     <div style="color:#fff;font-size:22px;font-weight:700;margin-top:4px;">Daily Portfolio Report</div>
-    <div style="color:#64748b;font-size:13px;margin-top:4px;">{today}</div>
+    <div style="color:#64748b;font-size:13px;margin-top:4px;">${today}</div>
   </div>
 
   <!-- Greeting -->
   <div style="padding:24px 32px 0;">
-    <p style="color:#374151;font-size:15px;margin:0;">Hi {name},</p>
+    <p style="color:#374151;font-size:15px;margin:0;">Hi ${name},</p>
     <p style="color:#6b7280;font-size:14px;margin:8px 0 0;">
       Your portfolio agent ran its end-of-day analysis. Here's the summary.
     </p>
@@ -132,10 +152,10 @@ def _build_html(email: str, user: dict) -> str:
 
   <!-- Verdict -->
   <div style="padding:16px 32px;">
-    <div style="background:{bg_c};border-radius:8px;padding:16px;">
-      <div style="font-size:18px;font-weight:700;color:{txt_c};">{verdict}</div>
-      <div style="font-size:13px;color:{txt_c};margin-top:4px;opacity:0.85;">{verdict_reason}</div>
-      {"<p style='font-size:13px;color:#374151;margin:8px 0 0;'>" + summary + "</p>" if summary else ""}
+    <div style="background:${bg_c};border-radius:8px;padding:16px;">
+      <div style="font-size:18px;font-weight:700;color:${txt_c};">${verdict}</div>
+      <div style="font-size:13px;color:${txt_c};margin-top:4px;opacity:0.85;">${verdict_reason}</div>
+      ${summary}
     </div>
   </div>
 
@@ -144,17 +164,17 @@ def _build_html(email: str, user: dict) -> str:
     <div style="display:flex;gap:12px;">
       <div style="flex:1;background:#f8fafc;border-radius:8px;padding:14px;">
         <div style="font-size:11px;color:#6b7280;text-transform:uppercase;letter-spacing:0.5px;">Portfolio Value</div>
-        <div style="font-size:20px;font-weight:700;color:#0f172a;margin-top:4px;">₹{total_current:,.0f}</div>
+        <div style="font-size:20px;font-weight:700;color:#0f172a;margin-top:4px;">₹${total_current}</div>
       </div>
       <div style="flex:1;background:#f8fafc;border-radius:8px;padding:14px;">
         <div style="font-size:11px;color:#6b7280;text-transform:uppercase;letter-spacing:0.5px;">Total P&amp;L</div>
-        <div style="font-size:20px;font-weight:700;color:{_color_pnl(pnl)};margin-top:4px;">{_sign(pnl)} ({_sign(pnl_pct)}%)</div>
+        <div style="font-size:20px;font-weight:700;color:${pnl_color};margin-top:4px;">${pnl} (${pnl_pct}%)</div>
       </div>
     </div>
   </div>
 
-  <!-- Alerts -->
-  {"<div style='padding:0 32px 16px;'><div style='font-size:13px;font-weight:600;color:#374151;margin-bottom:8px;'>⚠️ Today's Alerts</div><table style='width:100%;border-collapse:collapse;'>" + alert_rows + "</table></div>" if alert_rows else ""}
+  ${market}<!-- Alerts -->
+  ${alerts}
 
   <!-- Holdings table -->
   <div style="padding:0 32px 24px;">
@@ -169,58 +189,237 @@ def _build_html(email: str, user: dict) -> str:
         </tr>
       </thead>
       <tbody>
-        {stock_rows}
-        {mf_rows}
+        ${stock_rows}
+        ${mf_rows}
       </tbody>
     </table>
   </div>
 
   <!-- CTA -->
   <div style="padding:0 32px 32px;text-align:center;">
-    <a href="{APP_URL}/agent" style="display:inline-block;background:#0f172a;color:#fff;text-decoration:none;padding:12px 28px;border-radius:8px;font-weight:600;font-size:14px;">View Live Dashboard →</a>
+    <a href="${app_url}/agent" style="display:inline-block;background:#0f172a;color:#fff;text-decoration:none;padding:12px 28px;border-radius:8px;font-weight:600;font-size:14px;">View Live Dashboard →</a>
   </div>
 
   <!-- Footer -->
   <div style="background:#f8fafc;padding:16px 32px;text-align:center;border-top:1px solid #e5e7eb;">
     <p style="color:#9ca3af;font-size:11px;margin:0;">
       Diversifi Portfolio Agent • Auto-generated at market close<br>
-      Last analysed: {last_checked[:19] if last_checked else 'N/A'}
+      Last analysed: ${last_checked}
     </p>
   </div>
 </div>
 </body>
-</html>"""
-
+</html>""").bind(app_url=APP_URL)
+
+_VERDICT_COLORS = {
+    "All Good":        ("#166534", "#dcfce7"),
+    "Caution":         ("#92400e", "#fef3c7"),
+    "Immediate Action":("#991b1b", "#fee2e2"),
+}
+_ALERTS_OPEN  = ("<div style='padding:0 32px 16px;'><div style='font-size:13px;font-weight:600;color:#374151;"
+                 "margin-bottom:8px;'>⚠️ Today's Alerts</div><table style='width:100%;border-collapse:collapse;'>")
+_ALERTS_CLOSE = "</table></div>"
+_SUMMARY_OPEN = "<p style='font-size:13px;color:#374151;margin:8px 0 0;'>"
+TOP_MOVERS    = 3
+
+
+def _market_section(prices: dict) -> str:
+    """'Today's Movers' block: the TOP_MOVERS best and worst 1D moves in `prices`."""
+    moves = sorted(((d["change_pct"], sym, d["price"]) for sym, d in prices.items()
+                    if d.get("change_pct") is not None and d.get("price") is not None), reverse=True)
+    if not moves:
+        return ""
+    picked = moves if len(moves) <= 2 * TOP_MOVERS else moves[:TOP_MOVERS] + moves[-TOP_MOVERS:]
+    rows = "".join(_MOVER_ROW.render({"symbol": sym, "price": f"{price:,.2f}",
+                                      "chg_color": _color_pnl(chg), "chg": _sign(chg)})
+                   for chg, sym, price in picked)
+    return _MARKET.render({"rows": rows})
+
+
+def _report_template(market: Optional[dict] = None, day: Optional[datetime.date] = None) -> _Template:
+    """The report template with this batch's shared parts (date, market movers) rendered in."""
+    return _REPORT.bind(today=(day or datetime.date.today()).strftime("%d %B %Y"),
+                        market=_market_section(market) if market else "")
+
+
+def _render(tpl: _Template, email: str, user: dict) -> str:
+    name       = user.get("name", email.split("@")[0])
+    agent_st   = user.get("agentState", {})
+    holdings   = user.get("holdings", {})
+    stocks     = holdings.get("stocks", [])
+    mfs        = holdings.get("mutualFunds", [])
+    prices     = agent_st.get("lastPrices", {})
 
-def send_report(to_email: str, user: dict) -> None:
-    """Send the daily report email to `to_email`."""
-    if not SMTP_EMAIL or not SMTP_PASSWORD:
-        raise RuntimeError("AGENT_SMTP_EMAIL / AGENT_SMTP_PASSWORD not set in .env")
+    verdict        = agent_st.get("verdict", "All Good")
+    summary        = agent_st.get("overallSummary", "")
+    last_checked   = agent_st.get("lastChecked", "")
+    txt_c, bg_c    = _VERDICT_COLORS.get(verdict, ("#166534", "#dcfce7"))
 
-    html = _build_html(to_email, user)
+    # one pass per holding list: totals and the displayed rows together
+    total_invested = total_current = 0.0
+    stock_rows = []
+    for i, s in enumerate(stocks):
+        cv   = float(s.get("currentValue", 0))
+        cost = float(s.get("avgBuyPrice", 0)) * float(s.get("qty", 0))
+        total_invested += cost
+        total_current  += cv
+        if i < 8:
+            sym  = s.get("symbol", "")
+            chg  = prices.get(sym, {}).get("change_pct") or 0
+            spnl = cv - cost
+            stock_rows.append(_STOCK_ROW.render({
+                "name": s.get("name", sym)[:28], "value": f"{cv:,.0f}",
+                "pnl_color": _color_pnl(spnl), "pnl": _sign(spnl),
+                "chg_color": _color_pnl(chg), "chg": _sign(chg),
+            }))
+    mf_rows = []
+    for i, m in enumerate(mfs):
+        cv       = float(m.get("currentValue", 0))
+        invested = float(m.get("investedAmount", 0))
+        total_invested += invested
+        total_current  += cv
+        if i < 5:
+            mpnl = cv - invested
+            mf_rows.append(_MF_ROW.render({
+                "name": m.get("fundName", m.get("name", "MF"))[:28], "value": f"{cv:,.0f}",
+                "pnl_color": _color_pnl(mpnl), "pnl": _sign(mpnl),
+            }))
+    pnl     = total_current - total_invested
+    pnl_pct = (pnl / total_invested * 100) if total_invested > 0 else 0
+
+    alert_rows = "".join(_ALERT_ROW.render({"holding": a.get("holding", ""), "issue": a.get("issue", ""),
+                                            "action": a.get("action", "")})
+                         for a in agent_st.get("topAlerts", [])[:3])
+
+    return tpl.render({
+        "name":           name,
+        "bg_c":           bg_c,
+        "txt_c":          txt_c,
+        "verdict":        verdict,
+        "verdict_reason": agent_st.get("verdictReason", ""),
+        "summary":        _SUMMARY_OPEN + summary + "</p>" if summary else "",
+        "total_current":  f"{total_current:,.0f}",
+        "pnl_color":      _color_pnl(pnl),
+        "pnl":            _sign(pnl),
+        "pnl_pct":        _sign(pnl_pct),
+        "alerts":         _ALERTS_OPEN + alert_rows + _ALERTS_CLOSE if alert_rows else "",
+        "stock_rows":     "".join(stock_rows),
+        "mf_rows":        "".join(mf_rows),
+        "last_checked":   last_checked[:19] if last_checked else "N/A",
+    })
+
+
+def _build_html(email: str, user: dict, market: Optional[dict] = None) -> str:
+    return _render(_report_template(market), email, user)
+
+
+def render_reports(users: list[tuple[str, dict]], market: Optional[dict] = None) -> list[str]:
+    """
+    Bulk render: the shared sections (date, market movers over `market`, a
+    {symbol: {price, change_pct}} map) are rendered once for the whole batch.
+    """
+    tpl = _report_template(market)
+    return [_render(tpl, email, user) for email, user in users]
+
+
+def _envelope() -> _Template:
+    """
+    The report's MIME skeleton, built once per batch by the email package
+    (encoded Subject, From, Date, boundary); each message only fills in To,
+    Message-ID and the base64 body, which is where email.generator spent
+    most of a bulk run.
+    """
     today = datetime.date.today().strftime("%d %b %Y")
 
     msg = MIMEMultipart("alternative")
-    msg["Subject"] = f"📊 Your Portfolio Report - {today}"
-    msg["From"]    = f"Diversifi Agent <{SMTP_EMAIL}>"
-    msg["To"]      = to_email
-
-    msg.attach(MIMEText(html, "html"))
-
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-        server.ehlo()
-        server.starttls()
-        server.login(SMTP_EMAIL, SMTP_PASSWORD)
-        server.sendmail(SMTP_EMAIL, to_email, msg.as_string())
-
-    # record send time
-    import json, os
-    from agent_service import _load_index, _load_user, _save_user, DATA_DIR
-    index = _load_index()
-    if to_email in index and index[to_email].get("isDataPresent"):
-        df   = index[to_email]["dataFile"]
-        udat = _load_user(df)
-        if udat:
-            import datetime as dt
-            udat.setdefault("agentState", {})["lastReportSentAt"] = dt.datetime.now().isoformat()
-            _save_user(df, udat)
+    msg["Subject"]    = f"📊 Your Portfolio Report - {today}"
+    msg["From"]       = f"Diversifi Agent <{SMTP_EMAIL}>"
+    msg["To"]         = "${to}"
+    msg["Date"]       = formatdate(localtime=True)
+    msg["Message-ID"] = "${message_id}"
+
+    part = MIMEText("", "html", "utf-8")
+    part.set_payload("${body}")
+    msg.attach(part)
+    return _Template(msg.as_string())
+
+
+def _build_message(to_email: str, html: str, key: str, envelope: Optional[_Template] = None) -> str:
+    return (envelope or _envelope()).render({
+        "to":         to_email,
+        "message_id": message_id(key, SMTP_EMAIL.split("@")[-1] or SMTP_HOST),
+        "body":       base64.encodebytes(html.encode("utf-8")).decode("ascii"),
+    })
+
+
+def _record_sent(key: str, to_email: str) -> None:
+    import user_store
+    meta = user_store.get_meta(to_email)
+    if meta and meta["isDataPresent"]:
+        user_store.update_state(to_email, lastReportSentAt=datetime.datetime.now().isoformat())
+
+
+_outbox = MailQueue(on_sent=_record_sent)
+
+
+def queue_report(to_email: str, user: dict, key: Optional[str] = None) -> tuple[int, bool]:
+    """
+    Put the report for `to_email` in the outbox; (outbox id, created). With a
+    `key` (e.g. daily_key()) a report already queued under it is not re-added.
+    """
+    if not SMTP_EMAIL:
+        raise RuntimeError("AGENT_SMTP_EMAIL not set in .env")
+    key = key or f"report:{to_email}:{datetime.datetime.now().timestamp():.6f}"
+    return _outbox.enqueue(SMTP_EMAIL, to_email, _build_message(to_email, _build_html(to_email, user), key), key=key)
+
+
+def unqueued(emails: list[str], day: Optional[datetime.date] = None) -> list[str]:
+    """The emails whose daily report for `day` is not in the outbox yet."""
+    done = _outbox.existing([daily_key(email, day) for email in emails])
+    return [email for email in emails if daily_key(email, day) not in done]
+
+
+def queue_reports(users: list[tuple[str, dict]], day: Optional[datetime.date] = None,
+                  market: Optional[dict] = None) -> int:
+    """
+    Market-close bulk path: render the reports of `users` ((email, user)
+    pairs) not yet queued for `day`, with one shared market-movers section
+    over `market` (default: the batch's prices), and add them to the outbox
+    in one transaction. Returns how many were queued.
+    """
+    if not SMTP_EMAIL:
+        raise RuntimeError("AGENT_SMTP_EMAIL not set in .env")
+    keys  = {email: daily_key(email, day) for email, _ in users}
+    done  = _outbox.existing(list(keys.values()))
+    batch = [(email, user) for email, user in users if keys[email] not in done]
+    if not batch:
+        return 0
+    if market is None:
+        market = {}
+        for _, user in batch:
+            market.update(user.get("agentState", {}).get("lastPrices", {}))
+    htmls = render_reports(batch, market=market)
+    envelope = _envelope()
+    return _outbox.enqueue_many(SMTP_EMAIL, [
+        (email, _build_message(email, html, keys[email], envelope), keys[email])
+        for (email, _), html in zip(batch, htmls)
+    ])
+
+
+def daily_key(to_email: str, day: Optional[datetime.date] = None) -> str:
+    return f"daily:{to_email}:{(day or datetime.date.today()).isoformat()}"
+
+
+def send_report(to_email: str, user: dict) -> None:
+    """Send the report email to `to_email` now; raises if it is not delivered within SEND_TIMEOUT."""
+    row_id, _ = queue_report(to_email, user)
+    status = _outbox.wait(row_id, SEND_TIMEOUT)
+    if status is None or status["status"] == "failed":
+        raise RuntimeError(f"report to {to_email} failed: {(status or {}).get('lastError')}")
+    if status["status"] != "sent":
+        raise RuntimeError(f"report to {to_email} still queued after {SEND_TIMEOUT:.0f}s "
+                           f"(attempt {status['attempts']}: {status['lastError'] or 'waiting for rate limit'})")
+
+
+def get_mail_stats() -> dict:
+    return _outbox.get_stats()
@@ -0,0 +1,227 @@
+"""
+agent_scheduler.py - Concurrent, sharded scheduling of per-user agent runs.
+
+  Pool       - AGENT_WORKERS threads run users concurrently; the cycle thread
+               only dispatches
+  Spreading  - starts are spaced evenly over AGENT_SPREAD_SHARE of the
+               interval, plus up to AGENT_JITTER seconds of random jitter, so
+               price / news / LLM calls do not arrive as one burst
+  In-flight  - a user whose previous run has not finished is skipped for the
+               cycle (also applies to manual triggers)
+  Sharding   - with AGENT_SHARD_COUNT > 1 a process only owns the users whose
+               sha1(email) % AGENT_SHARD_COUNT == AGENT_SHARD_INDEX
+  Lag        - each cycle reports start lag (actual start vs planned slot),
+               skipped users and whether it overran the interval
+  Shutdown   - queued runs are cancelled and count as skipped, releasing
+               their in-flight claim; dispatch threads stop, so a restarted
+               loop starts clean
+
+get_stats() returns the current configuration, in-flight users and the
+most recent cycle reports.
+"""
+
+import concurrent.futures
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+AGENT_WORKERS      = int(os.getenv("AGENT_WORKERS", "8"))
+AGENT_SHARD_INDEX  = int(os.getenv("AGENT_SHARD_INDEX", "0"))
+AGENT_SHARD_COUNT  = int(os.getenv("AGENT_SHARD_COUNT", "1"))
+AGENT_SPREAD_SHARE = float(os.getenv("AGENT_SPREAD_SHARE", "0.5"))
+AGENT_JITTER       = float(os.getenv("AGENT_JITTER", "5"))
+CYCLE_HISTORY      = 20
+
+
+def shard_of(email: str, shard_count: int) -> int:
+    """Stable across processes and restarts (unlike hash())."""
+    digest = hashlib.sha1(email.strip().lower().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+class _Cycle:
+    def __init__(self, number: int, interval: float, users: int):
+        self.number    = number
+        self.interval  = interval
+        self.started   = time.time()
+        self.users     = users
+        self.pending   = users
+        self.ran       = 0
+        self.skipped   = 0
+        self.failed    = 0
+        self.lags: list[float] = []
+
+    def report(self) -> dict:
+        duration = time.time() - self.started
+        return {
+            "cycle":        self.number,
+            "startedAt":    round(self.started, 3),
+            "users":        self.users,
+            "ran":          self.ran,
+            "skipped":      self.skipped,
+            "failed":       self.failed,
+            "meanStartLag": round(sum(self.lags) / len(self.lags), 3) if self.lags else 0.0,
+            "maxStartLag":  round(max(self.lags), 3) if self.lags else 0.0,
+            "duration":     round(duration, 3),
+            "overrun":      round(max(0.0, duration - self.interval), 3),
+        }
+
+
+class AnalysisScheduler:
+    def __init__(self, run: Callable[[str, str], None], interval: float,
+                 workers: int = AGENT_WORKERS, shard_index: int = AGENT_SHARD_INDEX,
+                 shard_count: int = AGENT_SHARD_COUNT, spread_share: float = AGENT_SPREAD_SHARE,
+                 jitter: float = AGENT_JITTER):
+        self.run          = run
+        self.interval     = interval
+        self.workers      = workers
+        self.shard_index  = shard_index
+        self.shard_count  = max(1, shard_count)
+        self.spread_share = spread_share
+        self.jitter       = jitter
+        self._pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._lock        = threading.Lock()
+        self._in_flight:  set[str] = set()
+        self._cycles      = 0
+        self._history:    deque = deque(maxlen=CYCLE_HISTORY)
+        self._stop        = threading.Event()       # replaced on every shutdown
+
+    def owns(self, email: str) -> bool:
+        return self.shard_count == 1 or shard_of(email, self.shard_count) == self.shard_index
+
+    def _executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="agent-user")
+        return self._pool
+
+    # ── Runs ─────────────────────────────────────────────────────────────────
+
+    def _claim(self, email: str) -> bool:
+        with self._lock:
+            if email in self._in_flight:
+                return False
+            self._in_flight.add(email)
+            return True
+
+    def _job(self, email: str, data_file: str, cycle: Optional[_Cycle], due: float) -> None:
+        if cycle is not None:
+            with self._lock:
+                cycle.lags.append(max(0.0, time.time() - due))
+        ok = True
+        try:
+            self.run(email, data_file)
+        except Exception as e:
+            ok = False
+            print(f"[agent] error analysing {email}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(email)
+            if cycle is not None:
+                self._finish(cycle, ran=ok, failed=not ok)
+
+    def _submit(self, pool: concurrent.futures.ThreadPoolExecutor, email: str, data_file: str,
+                cycle: Optional[_Cycle], due: float) -> None:
+        try:
+            future = pool.submit(self._job, email, data_file, cycle, due)
+        except RuntimeError:                  # pool shut down between claim and submit
+            self._dropped(email, cycle)
+            return
+        # a run cancelled by shutdown() never reaches _job's finally
+        future.add_done_callback(lambda f: f.cancelled() and self._dropped(email, cycle))
+
+    def _dropped(self, email: str, cycle: Optional[_Cycle]) -> None:
+        with self._lock:
+            self._in_flight.discard(email)
+        if cycle is not None:
+            self._finish(cycle, skipped=True)
+
+    def _finish(self, cycle: _Cycle, ran: bool = False, skipped: bool = False, failed: bool = False) -> None:
+        with self._lock:
+            cycle.ran     += ran
+            cycle.skipped += skipped
+            cycle.failed  += failed
+            cycle.pending -= 1
+            done = cycle.pending == 0
+        if done:
+            report = cycle.report()
+            self._history.append(report)
+            print(f"[agent] cycle {report['cycle']}: {report['ran']}/{report['users']} ran, "
+                  f"{report['skipped']} skipped, {report['failed']} failed, "
+                  f"start lag mean {report['meanStartLag']}s max {report['maxStartLag']}s, "
+                  f"took {report['duration']}s (overrun {report['overrun']}s)")
+
+    def run_now(self, email: str, data_file: str) -> bool:
+        """Queue an immediate run (manual trigger / onboarding); False if one is in flight."""
+        if not self._claim(email):
+            return False
+        self._submit(self._executor(), email, data_file, None, time.time())
+        return True
+
+    # ── Cycles ───────────────────────────────────────────────────────────────
+
+    def schedule_cycle(self, users: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """
+        Spread this shard's `users` ((email, dataFile) pairs) over the interval.
+        Returns the owned users; dispatch happens on a background thread.
+        """
+        owned = [(email, data_file) for email, data_file in users if self.owns(email)]
+        with self._lock:
+            self._cycles += 1
+            cycle = _Cycle(self._cycles, self.interval, len(owned))
+        if not owned:
+            self._history.append(cycle.report())
+            return owned
+
+        random.shuffle(owned)       # no user is always last in the cycle
+        window = self.interval * self.spread_share
+        step   = window / len(owned)
+        plan   = sorted(
+            (cycle.started + i * step + random.uniform(0, self.jitter), email, data_file)
+            for i, (email, data_file) in enumerate(owned)
+        )
+        threading.Thread(target=self._dispatch, args=(cycle, plan, self._stop), daemon=True,
+                         name=f"agent-cycle-{cycle.number}").start()
+        return owned
+
+    def _dispatch(self, cycle: _Cycle, plan: list[tuple[float, str, str]], stop: threading.Event) -> None:
+        pool = self._executor()
+        for n, (due, email, data_file) in enumerate(plan):
+            delay = due - time.time()
+            if stop.wait(delay) if delay > 0 else stop.is_set():
+                for _ in plan[n:]:             # shut down mid-cycle: the rest never start
+                    self._finish(cycle, skipped=True)
+                return
+            if not self._claim(email):
+                print(f"[agent] {email} still running from a previous cycle, skipped")
+                self._finish(cycle, skipped=True)
+                continue
+            self._submit(pool, email, data_file, cycle, due)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            in_flight = sorted(self._in_flight)
+        return {
+            "workers":     self.workers,
+            "interval":    self.interval,
+            "shard":       f"{self.shard_index}/{self.shard_count}",
+            "spreadShare": self.spread_share,
+            "jitter":      self.jitter,
+            "inFlight":    in_flight,
+            "cycles":      list(self._history),
+        }
+
+    def shutdown(self) -> None:
+        """Stop dispatching and cancel queued runs; runs already executing finish on their own."""
+        self._stop.set()
+        self._stop = threading.Event()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -1,20 +1,31 @@
 """
 agent_service.py - Autonomous Portfolio Agent.
 
-Background loop (every 5 min) per active user:
-  1. Fetches live stock prices via yfinance
-  2. Fetches news + TextBlob sentiment for top 5 holdings by value
+Background loop (every ANALYSIS_INTERVAL) per active user, run concurrently
+and spread over the interval by agent_scheduler:
+  1. Fetches live stock prices via yfinance (once per symbol per cycle,
+     shared by every user holding it)
+  2. Fetches news + TextBlob sentiment for the top AGENT_TOP_NEWS holdings
+     by value, concurrently and cached per symbol for AGENT_NEWS_TTL
   3. Computes per-holding 1D change + rolling trend (3-run window)
   4. Identifies IMMEDIATE_ACTION / CAUTION / GOOD alerts
   5. Synthesises verdict via Claude
-  6. Appends to activityLog (capped at 50 entries)
+  6. Appends each step to the activity log ring (user_store, AGENT_ACTIVITY_CAP)
   7. Pushes SSE events to connected frontend clients
-  8. Auto-sends email report at market close (15:35 IST)
+  8. Queues the email report at market close (15:35 IST, Mon-Fri) through
+     job_scheduler, once per user per day
+
+Between runs, alert_engine re-checks holdings on every quote tick
+(AGENT_TICK_INTERVAL) and pushes alert_added as soon as a threshold is crossed.
 """
 
+import copy
+import functools
+import hashlib
+import itertools
 import json
 import os
-import queue
+import random
 import threading
 import datetime
 import time
@@ -25,74 +36,77 @@ from typing import Optional
 import yfinance as yf
 from textblob import TextBlob
 
-HOLDINGS_FILE = os.path.join(os.path.dirname(__file__), "holdings.json")
+import event_bus
+import llm_gateway
+import user_store
+from agent_scheduler import AnalysisScheduler
+from job_scheduler import JobScheduler
+from verdict_batcher import ProviderBatchQueue, VerdictBatcher
+from alert_engine import AlertEngine, PollingQuoteFeed, classify, thresholds_for
+import sse_hub
+
 DATA_DIR      = os.path.dirname(__file__)
 ANALYSIS_INTERVAL = 120          # seconds between runs (2 min)
-MAX_ACTIVITY_LOG  = 50
 MARKET_CLOSE_HOUR = 15           # 3 PM IST
 MARKET_CLOSE_MIN  = 35           # 3:35 PM IST
+REPORT_CHUNK      = int(os.getenv("AGENT_REPORT_CHUNK", "50"))       # users loaded / rendered per batch
+REPORT_SPREAD     = float(os.getenv("AGENT_REPORT_SPREAD", "120"))   # seconds the close batches are spread over
+LIVE_ALERTS       = os.getenv("AGENT_LIVE_ALERTS", "1") == "1"   # tick-driven alert engine
+MARKET_TTL        = float(os.getenv("AGENT_MARKET_TTL", str(ANALYSIS_INTERVAL)))   # shared quotes / sentiment
+TOP_NEWS_HOLDINGS = int(os.getenv("AGENT_TOP_NEWS", "5"))          # holdings scanned for news per user
+NEWS_TTL          = float(os.getenv("AGENT_NEWS_TTL", "900"))        # headlines move slower than quotes
+NEWS_WORKERS      = int(os.getenv("AGENT_NEWS_WORKERS", "16"))
+NEWS_TIMEOUT      = float(os.getenv("AGENT_NEWS_TIMEOUT", "10"))     # wall-clock cap for one news scan
+VERDICT_MAX_AGE   = float(os.getenv("AGENT_VERDICT_MAX_AGE", "1800"))   # re-ask the LLM at least this often
+VERDICT_BATCHING  = os.getenv("AGENT_VERDICT_BATCHING", "1") == "1"   # group concurrent runs into one call
+VERDICT_BATCH_API = os.getenv("AGENT_VERDICT_BATCH_API", "0") == "1"  # provider batch API off-hours
+VERDICT_PRICE_BUCKET = float(os.getenv("AGENT_VERDICT_PRICE_BUCKET", "1.0"))   # % 1D-change bucket width
 
 _timer:      Optional[threading.Timer] = None
 _lock        = threading.Lock()
 _running     = False
 
-# email -> list of queue.Queue (one per SSE connection)
-_sse_queues: dict[str, list[queue.Queue]] = {}
-
 
 # ─────────────────────────────────────────────────────────────────────────────
-# File helpers
+# Storage helpers (user_store; keyed by dataFile for older callers)
 # ─────────────────────────────────────────────────────────────────────────────
 
 def _load_index() -> dict:
-    with open(HOLDINGS_FILE) as f:
-        return json.load(f)
+    return user_store.load_index()
 
 
 def _save_index(data: dict) -> None:
-    with open(HOLDINGS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    user_store.save_index(data)
 
 
 def _load_user(data_file: str) -> Optional[dict]:
-    path = os.path.join(DATA_DIR, data_file)
-    if not os.path.exists(path):
-        return None
-    with open(path) as f:
-        return json.load(f)
+    email = user_store.email_for_file(data_file)
+    return user_store.load_user(email) if email else None
 
 
-def _save_user(data_file: str, data: dict) -> None:
-    path = os.path.join(DATA_DIR, data_file)
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2, default=str)
+def _save_user(data_file: str, data: dict, base: Optional[dict] = None) -> None:
+    email = user_store.email_for_file(data_file) or data.get("email")
+    if not email:
+        raise ValueError(f"no user for {data_file}")
+    user_store.save_user(email, data, base)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # SSE helpers
 # ─────────────────────────────────────────────────────────────────────────────
 
-def subscribe_sse(email: str) -> "queue.Queue":
-    q: queue.Queue = queue.Queue()
-    with _lock:
-        _sse_queues.setdefault(email, []).append(q)
-    return q
+def subscribe_sse(email: str, last_event_id: Optional[int] = None) -> "sse_hub.Subscriber":
+    """Async subscriber for `email` (call on the server loop); frames come from `await sub.next()`."""
+    return sse_hub.hub.subscribe(email, last_event_id)
 
 
-def unsubscribe_sse(email: str, q: "queue.Queue") -> None:
-    with _lock:
-        if email in _sse_queues:
-            _sse_queues[email] = [x for x in _sse_queues[email] if x is not q]
+def unsubscribe_sse(sub: "sse_hub.Subscriber") -> None:
+    sse_hub.hub.unsubscribe(sub)
 
 
 def _push(email: str, event: dict) -> None:
-    with _lock:
-        queues = list(_sse_queues.get(email, []))
-    for q in queues:
-        try:
-            q.put_nowait(event)
-        except Exception:
-            pass
+    # through the bus so API workers in other processes stream it too
+    event_bus.publish(email, event)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -133,21 +147,154 @@ def _fetch_prices(symbols: list[str]) -> dict[str, dict]:
 # News + sentiment
 # ─────────────────────────────────────────────────────────────────────────────
 
+NEUTRAL_SENTIMENT = {"label": "Neutral", "score": 0.0, "headlines": []}
+
+_news_pool = concurrent.futures.ThreadPoolExecutor(max_workers=NEWS_WORKERS, thread_name_prefix="agent-news")
+
+
+@functools.lru_cache(maxsize=4096)
+def _polarity(headline: str) -> float:
+    # the same headlines come back on every refresh until the story rotates out
+    return TextBlob(headline).sentiment.polarity
+
+
 def _news_sentiment(symbol: str) -> dict:
-    """Returns {label, score, headlines[]} for a stock symbol."""
-    try:
-        ns   = symbol.strip().upper() + ".NS"
-        news = yf.Ticker(ns).news or []
-        headlines = [n.get("content", {}).get("title", "") or n.get("title", "") for n in news[:8]]
-        headlines = [h for h in headlines if h]
-        if not headlines:
-            return {"label": "Neutral", "score": 0.0, "headlines": []}
-        scores = [TextBlob(h).sentiment.polarity for h in headlines]
-        avg    = sum(scores) / len(scores)
-        label  = "Bullish" if avg > 0.1 else ("Bearish" if avg < -0.1 else "Neutral")
-        return {"label": label, "score": round(avg, 3), "headlines": headlines[:3]}
-    except Exception:
-        return {"label": "Neutral", "score": 0.0, "headlines": []}
+    """Returns {label, score, headlines[]} for a stock symbol. Raises on fetch errors."""
+    ns   = symbol.strip().upper() + ".NS"
+    news = yf.Ticker(ns).news or []
+    headlines = [n.get("content", {}).get("title", "") or n.get("title", "") for n in news[:8]]
+    headlines = [h for h in headlines if h]
+    if not headlines:
+        return dict(NEUTRAL_SENTIMENT)
+    scores = [_polarity(h) for h in headlines]
+    avg    = sum(scores) / len(scores)
+    label  = "Bullish" if avg > 0.1 else ("Bearish" if avg < -0.1 else "Neutral")
+    return {"label": label, "score": round(avg, 3), "headlines": headlines[:3]}
+
+
+def _fetch_sentiments(symbols: list[str]) -> dict[str, dict]:
+    """
+    All symbols at once on the shared news pool, bounded by NEWS_TIMEOUT.
+    Symbols that failed or are still running are left out, so they are not
+    cached and the next run asks again.
+    """
+    futures = {_news_pool.submit(_news_sentiment, sym): sym for sym in symbols}
+    done, not_done = concurrent.futures.wait(futures, timeout=NEWS_TIMEOUT)
+    out = {}
+    for f in done:
+        if f.exception() is None:
+            out[futures[f]] = f.result()
+    failed = len(symbols) - len(out)
+    if failed:
+        with _market_lock:
+            _market_stats["sentiment_failures"] += failed
+        print(f"[agent] news scan: {failed}/{len(symbols)} symbols failed or timed out ({len(not_done)} still running)")
+    return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Shared market data (one upstream fetch per symbol per cycle)
+# ─────────────────────────────────────────────────────────────────────────────
+
+_market_lock     = threading.Lock()
+_price_cache:     dict[str, tuple[float, dict]] = {}
+_sentiment_cache: dict[str, tuple[float, dict]] = {}
+_inflight:        dict[tuple[str, str], threading.Event] = {}
+_market_stats    = {"price_fetches": 0, "price_hits": 0, "price_joined": 0,
+                    "sentiment_fetches": 0, "sentiment_hits": 0, "sentiment_joined": 0,
+                    "sentiment_failures": 0}
+MARKET_JOIN_WAIT = 30.0
+
+
+def _cached_market(cache: dict, symbols: list[str], fetch_many, kind: str,
+                   ttl: float = MARKET_TTL) -> dict[str, dict]:
+    """
+    Fresh entries from `cache`; the misses are fetched together in one
+    `fetch_many` call. A symbol another run is already fetching is waited on
+    rather than fetched twice. Symbols fetch_many leaves out are absent.
+    """
+    now = time.time()
+    out, missing, joined = {}, [], {}
+    with _market_lock:
+        for sym in dict.fromkeys(symbols):
+            hit = cache.get(sym)
+            if hit and now - hit[0] < ttl:
+                out[sym] = hit[1]
+            elif (kind, sym) in _inflight:
+                joined[sym] = _inflight[(kind, sym)]
+            else:
+                missing.append(sym)
+                _inflight[(kind, sym)] = threading.Event()
+        _market_stats[f"{kind}_hits"]    += len(out)
+        _market_stats[f"{kind}_fetches"] += len(missing)
+        _market_stats[f"{kind}_joined"]  += len(joined)
+    if missing:
+        fetched: dict[str, dict] = {}
+        try:
+            fetched = fetch_many(missing)
+        finally:
+            with _market_lock:
+                for sym, data in fetched.items():
+                    cache[sym] = (now, data)
+                for sym in missing:
+                    _inflight.pop((kind, sym)).set()
+        out.update(fetched)
+    for sym, done in joined.items():
+        done.wait(MARKET_JOIN_WAIT)
+        with _market_lock:
+            hit = cache.get(sym)
+        if hit:
+            out[sym] = hit[1]
+    return out
+
+
+def _store_prices(quotes: dict[str, dict]) -> None:
+    """Share quotes fetched elsewhere (the live alert feed) with the analysis runs."""
+    now = time.time()
+    with _market_lock:
+        for sym, data in quotes.items():
+            _price_cache[sym] = (now, data)
+
+
+def _get_prices(symbols: list[str]) -> dict[str, dict]:
+    return _cached_market(_price_cache, symbols, _fetch_prices, "price")
+
+
+def _get_sentiments(symbols: list[str]) -> dict[str, dict]:
+    return _cached_market(_sentiment_cache, symbols, _fetch_sentiments, "sentiment", ttl=NEWS_TTL)
+
+
+def _top_symbols(stocks: list[dict], n: int = TOP_NEWS_HOLDINGS) -> list[str]:
+    ranked = sorted(stocks, key=lambda s: float(s.get("currentValue") or 0), reverse=True)
+    return [s["symbol"] for s in ranked[:n] if s.get("symbol")]
+
+
+def _prefetch_market(users: list[tuple[str, str]]) -> None:
+    """
+    Cycle phase 1: collect the symbol union across `users` and fetch each
+    quote / news sentiment once; per-user runs then read the shared cache.
+    """
+    price_syms: dict[str, None] = {}
+    news_syms:  dict[str, None] = {}
+    holdings = 0
+    for email, _ in users:
+        stocks = user_store.load_holdings(email)["stocks"]
+        holdings += len(stocks)
+        price_syms.update(dict.fromkeys(s["symbol"] for s in stocks if s.get("symbol")))
+        news_syms.update(dict.fromkeys(_top_symbols(stocks)))
+
+    t0 = time.time()
+    _get_prices(list(price_syms))
+    _get_sentiments(list(news_syms))
+    print(f"[agent] market data for {len(users)} users / {holdings} holdings: "
+          f"{len(price_syms)} quotes, {len(news_syms)} news symbols in {time.time() - t0:.1f}s")
+
+
+def get_market_stats() -> dict:
+    with _market_lock:
+        return {**_market_stats, "cachedQuotes": len(_price_cache),
+                "cachedSentiments": len(_sentiment_cache), "ttl": MARKET_TTL, "newsTtl": NEWS_TTL,
+                "topNews": TOP_NEWS_HOLDINGS, "polarityCache": _polarity.cache_info()._asdict()}
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -156,53 +303,24 @@ def _news_sentiment(symbol: str) -> dict:
 
 def _compute_alerts(holdings_with_prices: list[dict], prev_alerts: list[dict],
                     profile: dict | None = None) -> tuple[list[dict], list[dict]]:
-    """Returns (immediate_alerts, caution_alerts) using horizon-aware thresholds.
-
-    Long-term investors (horizon contains 'long', 'retire', or ≥10-year keywords):
-      - Caution:   single-day ≤ -8%  OR  ≥5 consecutive down days
-      - Immediate: single-day ≤ -15% OR  ≥10 consecutive down days
-    Short/medium-term:
-      - Caution:   single-day ≤ -3%  OR  ≥2 consecutive down days
-      - Immediate: single-day ≤ -8%  OR  ≥4 consecutive down days
-    """
-    import re as _re
+    """Returns (immediate_alerts, caution_alerts) using horizon-aware thresholds
+    (alert_engine.thresholds_for; the live engine applies the same rules per tick)."""
     immediate, caution = [], []
-    horizon = str((profile or {}).get("horizon") or "")
-    m = _re.search(r"(\d+)", horizon)
-    horizon_years = int(m.group(1)) if m else (10 if "long" in horizon.lower() else 5)
-    long_term = horizon_years >= 7
-
-    if long_term:
-        imm_day, imm_trend = -15, 10
-        cau_day, cau_trend = -8,  5
-    else:
-        imm_day, imm_trend = -8,  4
-        cau_day, cau_trend = -3,  2
+    thresholds = thresholds_for(profile)
 
     for h in holdings_with_prices:
         sym   = h.get("symbol", "")
         chg   = h.get("change_pct")
         if chg is None:
             continue
-        trend = h.get("trend_down_count", 0)
-
-        base = {"symbol": sym, "name": h.get("name", sym), "is_mf": h.get("is_mf", False),
-                "change_pct": chg, "current_value": h.get("current_value", 0)}
-
-        if chg <= imm_day or (trend >= imm_trend and chg < 0):
-            if chg <= imm_day:
-                issue = f"Down {abs(chg):.1f}% today - sharp single-day decline"
-            else:
-                issue = f"{trend} consecutive down days - sustained decline trend"
-            immediate.append({**base, "issue": issue,
-                               "action": f"Review {sym} position. Consider stop-loss or partial exit."})
-        elif chg <= cau_day or (trend >= cau_trend and chg < 0):
-            if chg <= cau_day:
-                issue = f"Down {abs(chg):.1f}% today"
-            else:
-                issue = f"{trend} consecutive down days - watch for continued weakness"
-            caution.append({**base, "issue": issue,
-                            "action": f"Monitor {sym} closely and check for adverse news."})
+        hit = classify(sym, chg, h.get("trend_down_count", 0), thresholds)
+        if hit is None:
+            continue
+        tier, issue, action = hit
+        alert = {"symbol": sym, "name": h.get("name", sym), "is_mf": h.get("is_mf", False),
+                 "change_pct": chg, "current_value": h.get("current_value", 0),
+                 "issue": issue, "action": action}
+        (immediate if tier == "immediate" else caution).append(alert)
 
     return immediate, caution
 
@@ -211,22 +329,40 @@ def _compute_alerts(holdings_with_prices: list[dict], prev_alerts: list[dict],
 # Claude verdict
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _claude_verdict(user_data: dict, immediate: list, caution: list, prices: dict,
-                    emit_fn=None) -> dict:
-    """Returns {verdict, verdictReason, topAlerts, overallSummary}. SDK timeout 45 s."""
-    from dotenv import load_dotenv, find_dotenv
-    load_dotenv(find_dotenv())
-    import anthropic, os
-
-    api_key  = os.getenv("ANTHROPIC_API_KEY", "")
-    resource = os.getenv("ANTHROPIC_FOUNDRY_RESOURCE", "")
-    # Pass timeout at SDK level - this is the correct way to cap wall-clock time.
-    # ThreadPoolExecutor.as_context_manager waits for threads on exit, defeating timeouts.
-    if resource:
-        client = anthropic.AnthropicFoundry(api_key=api_key, resource=resource, timeout=45.0)
-    else:
-        client = anthropic.Anthropic(api_key=api_key, timeout=45.0)
+VERDICT_SYSTEM = """You are a concise Indian portfolio advisor AI acting autonomously on behalf of the investor. Analyse the portfolio in the user message and respond with JSON only, applying the horizon instruction given there.
+
+TONE RULE: Write as the agent reporting what it observes or is doing - never instruct the investor. Use declarative language ("is being monitored", "has been flagged", "the agent will escalate if...") not imperative ("monitor this", "consider selling", "check the news", "review position"). The investor is not expected to take any action.
+
+Respond with ONLY this JSON (no markdown):
+{
+  "verdict": "All Good" | "Caution" | "Immediate Action",
+  "verdictReason": "one sentence - reference the specific goal and horizon",
+  "overallSummary": "2-3 sentences: today's portfolio moves, overall health, one forward-looking insight tied to the goal",
+  "topAlerts": [
+    {"holding": "symbol or 'Portfolio'", "issue": "specific issue", "action": "what the agent is doing or will do - e.g. 'Being monitored for further weakness', 'Will escalate if decline continues past X days'"}
+  ]
+}"""
+
+
+VERDICT_BATCH_SYSTEM = """Several investors are analysed together in the user message. The live prices under "Market context" are shared; each investor section has its own profile, portfolio and alerts. Apply every rule above to each investor independently.
+
+Respond with ONLY a JSON object keyed by investor id, each value being that investor's verdict object in the format above (no markdown):
+{"<investor id>": {"verdict": ..., "verdictReason": ..., "overallSummary": ..., "topAlerts": [...]}}"""
+
+VERDICT_MODEL  = "claude-sonnet-4-6"
+VERDICT_LABELS = {"All Good", "Caution", "Immediate Action"}
+
+
+def _price_lines(prices: dict, limit: int = 10) -> str:
+    return "\n".join(
+        f"  {sym}: ₹{d['price']} ({'+' if d['change_pct']>=0 else ''}{d['change_pct']}%)"
+        for sym, d in list(prices.items())[:limit]
+    ) or "  (no live prices available)"
 
+
+def _verdict_prompt(user_data: dict, immediate: list, caution: list, prices: dict,
+                    shared_prices: bool = False) -> str:
+    """Per-investor verdict prompt; shared_prices=True points at a group's market context instead."""
     import re as _re
 
     profile  = user_data.get("profile", {})
@@ -250,10 +386,10 @@ def _claude_verdict(user_data: dict, immediate: list, caution: list, prices: dic
     horizon_years = int(m.group(1)) if m else (10 if "long" in horizon.lower() else 5)
     is_long_term  = horizon_years >= 7
 
-    price_lines = "\n".join(
-        f"  {sym}: ₹{d['price']} ({'+' if d['change_pct']>=0 else ''}{d['change_pct']}%)"
-        for sym, d in list(prices.items())[:10]
-    ) or "  (no live prices available)"
+    if shared_prices:
+        price_lines = f"  (see Market context: {', '.join(list(prices)[:10]) or 'none available'})"
+    else:
+        price_lines = _price_lines(prices)
 
     # Sector preference notes
     sector_lines = ""
@@ -286,9 +422,7 @@ def _claude_verdict(user_data: dict, immediate: list, caution: list, prices: dic
             "flag > 8% drops as Immediate Action, > 3% or 2+ down days as Caution."
         )
 
-    prompt = f"""You are a concise Indian portfolio advisor AI acting autonomously on behalf of the investor. Analyse this portfolio and respond with JSON only.{patience_note}
-
-TONE RULE: Write as the agent reporting what it observes or is doing - never instruct the investor. Use declarative language ("is being monitored", "has been flagged", "the agent will escalate if...") not imperative ("monitor this", "consider selling", "check the news", "review position"). The investor is not expected to take any action.
+    prompt = f"""{patience_note.strip()}
 
 Investor profile (captured at onboarding):
 - Risk appetite: {risk_appetite}
@@ -304,45 +438,240 @@ Portfolio:
 
 Rule-based alerts (review in context of the investor's profile):
   Immediate ({len(immediate)}): {[a['symbol'] + ': ' + a['issue'] for a in immediate] or 'none'}
-  Caution   ({len(caution)}):   {[a['symbol'] + ': ' + a['issue'] for a in caution] or 'none'}
+  Caution   ({len(caution)}):   {[a['symbol'] + ': ' + a['issue'] for a in caution] or 'none'}"""
+    return prompt
 
-Respond with ONLY this JSON (no markdown):
-{{
-  "verdict": "All Good" | "Caution" | "Immediate Action",
-  "verdictReason": "one sentence - reference the specific goal and horizon",
-  "overallSummary": "2-3 sentences: today's portfolio moves, overall health, one forward-looking insight tied to the goal",
-  "topAlerts": [
-    {{"holding": "symbol or 'Portfolio'", "issue": "specific issue", "action": "what the agent is doing or will do - e.g. 'Being monitored for further weakness', 'Will escalate if decline continues past X days'"}}
-  ]
-}}"""
 
-    def _fallback():
-        if immediate:
-            v, r = "Immediate Action", f"{len(immediate)} holding(s) showing significant decline."
-        elif caution:
-            v, r = "Caution", f"{len(caution)} holding(s) worth monitoring closely."
-        else:
-            v, r = "All Good", "All holdings within normal range for this market session."
-        return {"verdict": v, "verdictReason": r, "overallSummary": r,
-                "topAlerts": (immediate + caution)[:3]}
+def _rule_verdict(immediate: list, caution: list) -> dict:
+    if immediate:
+        v, r = "Immediate Action", f"{len(immediate)} holding(s) showing significant decline."
+    elif caution:
+        v, r = "Caution", f"{len(caution)} holding(s) worth monitoring closely."
+    else:
+        v, r = "All Good", "All holdings within normal range for this market session."
+    return {"verdict": v, "verdictReason": r, "overallSummary": r,
+            "topAlerts": (immediate + caution)[:3], "fallback": True}
 
+
+def _parse_json_reply(raw: str):
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = raw.split("```")[1]
+        if raw.startswith("json"):
+            raw = raw[4:]
+    return json.loads(raw.strip())
+
+
+def _claude_verdict(user_data: dict, immediate: list, caution: list, prices: dict,
+                    emit_fn=None) -> dict:
+    """Returns {verdict, verdictReason, topAlerts, overallSummary}. SDK timeout 45 s."""
+    prompt = _verdict_prompt(user_data, immediate, caution, prices)
     try:
-        msg = client.messages.create(
-            model="claude-sonnet-4-6", max_tokens=1024,
+        # Pass timeout at SDK level - this is the correct way to cap wall-clock time.
+        # ThreadPoolExecutor.as_context_manager waits for threads on exit, defeating timeouts.
+        msg = llm_gateway.create_message(
+            "claude_verdict",
+            model=VERDICT_MODEL, max_tokens=1024, timeout=45.0,
+            system=[{"type": "text", "text": VERDICT_SYSTEM, "cache_control": {"type": "ephemeral"}}],
             messages=[{"role": "user", "content": prompt}]
         )
-        raw = msg.content[0].text.strip()
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-        return json.loads(raw.strip())
+        return _parse_json_reply(msg.content[0].text)
     except Exception as e:
         err_msg = f"{type(e).__name__}: {str(e)[:120]}"
         print(f"[agent] claude_verdict error: {err_msg}")
         if emit_fn:
             emit_fn("⚠️", f"AI error: {err_msg}", "warn")
-        return _fallback()
+        return _rule_verdict(immediate, caution)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Batched verdicts
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _verdict_group(requests: list) -> dict:
+    """One LLM call for investors with overlapping holdings; {request key: verdict} for parsed entries."""
+    prices: dict = {}
+    for r in requests:
+        prices.update(r.payload["prices"])
+    ids = {f"investor_{i + 1}": r for i, r in enumerate(requests)}
+    sections = "\n\n".join(
+        f"### {iid}\n" + _verdict_prompt(r.payload["user"], r.payload["immediate"], r.payload["caution"],
+                                         r.payload["prices"], shared_prices=True)
+        for iid, r in ids.items()
+    )
+    prompt = f"Market context - live prices today:\n{_price_lines(prices, limit=60)}\n\n{sections}"
+    msg = llm_gateway.create_message(
+        "claude_verdict_batch",
+        model=VERDICT_MODEL, max_tokens=min(8192, 900 * len(requests)), timeout=60.0,
+        system=[{"type": "text", "text": VERDICT_SYSTEM},
+                {"type": "text", "text": VERDICT_BATCH_SYSTEM, "cache_control": {"type": "ephemeral"}}],
+        messages=[{"role": "user", "content": prompt}],
+    )
+    try:
+        parsed = _parse_json_reply(msg.content[0].text)
+    except ValueError as e:
+        print(f"[agent] batched verdict parse error: {e}")
+        return {}
+    out = {}
+    for iid, r in ids.items():
+        v = parsed.get(iid) if isinstance(parsed, dict) else None
+        if isinstance(v, dict) and v.get("verdict") in VERDICT_LABELS:
+            out[r.key] = v
+    return out
+
+
+def _verdict_single(request) -> dict:
+    p = request.payload
+    return _claude_verdict(p["user"], p["immediate"], p["caution"], p["prices"])
+
+
+_verdict_batcher = VerdictBatcher(_verdict_group, _verdict_single)
+_verdict_seq     = itertools.count(1)
+
+
+def _apply_batch_result(email: str, fingerprint: str, result) -> None:
+    """Off-hours provider-batch reply: store and push the verdict once it arrives."""
+    if result.result.type != "succeeded":
+        print(f"[agent] batch verdict for {email}: {result.result.type}")
+        return
+    try:
+        data = _parse_json_reply(result.result.message.content[0].text)
+    except ValueError as e:
+        print(f"[agent] batch verdict parse error for {email}: {e}")
+        return
+    fields = {
+        "verdict":           data.get("verdict", "All Good"),
+        "verdictReason":     data.get("verdictReason", ""),
+        "overallSummary":    data.get("overallSummary", ""),
+        "llmVerdictContent": data.get("overallSummary", ""),
+        "topAlerts":         data.get("topAlerts", []),
+        "verdictFingerprint": fingerprint,
+        "verdictAt":         time.time(),
+    }
+    user_store.update_state(email, **fields)
+    _push(email, {"type": "verdict_update", "verdict": fields["verdict"], "reason": fields["verdictReason"],
+                  "summary": fields["overallSummary"], "llmVerdictContent": fields["overallSummary"],
+                  "topAlerts": fields["topAlerts"]})
+
+
+_offhours_batches = ProviderBatchQueue(
+    lambda requests: llm_gateway.create_batch("claude_verdict_batch", requests).id,
+    lambda batch_id: llm_gateway.batch_results("claude_verdict_batch", batch_id),
+)
+
+
+def _request_verdict(user_data: dict, immediate: list, caution: list, prices: dict,
+                     fingerprint: str, emit_fn=None) -> dict:
+    """
+    Verdict for one run: grouped with concurrent runs (VERDICT_BATCHING), or
+    queued to the provider batch API off-hours (VERDICT_BATCH_API) with the
+    rule-based verdict standing in until the reply lands.
+    """
+    email = user_data.get("email", "")
+    if VERDICT_BATCH_API and not _is_market_hours():
+        params = {"model": VERDICT_MODEL, "max_tokens": 1024,
+                  "system": [{"type": "text", "text": VERDICT_SYSTEM, "cache_control": {"type": "ephemeral"}}],
+                  "messages": [{"role": "user", "content": _verdict_prompt(user_data, immediate, caution, prices)}]}
+        _offhours_batches.submit(params, lambda r: _apply_batch_result(email, fingerprint, r))
+        if emit_fn:
+            emit_fn("📨", "Verdict queued for off-hours batch processing")
+        return {**_rule_verdict(immediate, caution), "pending": True}
+
+    if not VERDICT_BATCHING:
+        return _claude_verdict(user_data, immediate, caution, prices, emit_fn=emit_fn)
+
+    symbols = {s["symbol"] for s in user_data.get("holdings", {}).get("stocks", []) if s.get("symbol")}
+    payload = {"user": user_data, "immediate": immediate, "caution": caution, "prices": prices}
+    data = _verdict_batcher.submit(f"{email}#{next(_verdict_seq)}", symbols, payload)
+    if data is None:
+        data = _rule_verdict(immediate, caution)
+    if data.get("fallback") and emit_fn:
+        emit_fn("⚠️", "AI verdict unavailable - using rule-based verdict", "warn")
+    return data
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Verdict change detection
+# ─────────────────────────────────────────────────────────────────────────────
+
+_verdict_lock  = threading.Lock()
+_verdict_stats = {"llm_calls": 0, "reused": 0, "refreshed_stale": 0, "fallbacks": 0, "batch_queued": 0}
+
+
+def _verdict_fingerprint(user_data: dict, immediate: list, caution: list,
+                         prices: dict, news_map: dict) -> str:
+    """
+    Hash of what the verdict depends on, at the granularity that matters:
+    alert tiers per symbol, 1D change in VERDICT_PRICE_BUCKET-wide buckets,
+    sentiment labels, holdings (symbol, qty) and the profile.
+    """
+    stocks = user_data.get("holdings", {}).get("stocks", [])
+    mfs    = user_data.get("holdings", {}).get("mutualFunds", [])
+    material = {
+        "alerts":   sorted([("immediate", a["symbol"]) for a in immediate] +
+                           [("caution", a["symbol"]) for a in caution]),
+        "prices":   {sym: math.floor(d["change_pct"] / VERDICT_PRICE_BUCKET)
+                     for sym, d in sorted(prices.items())},
+        "news":     {sym: n.get("label") for sym, n in sorted(news_map.items())},
+        "holdings": sorted([(s.get("symbol"), s.get("qty")) for s in stocks] +
+                           [(m.get("fundName") or m.get("name"), m.get("investedAmount")) for m in mfs],
+                           key=str),
+        "profile":  user_data.get("profile", {}),
+    }
+    payload = json.dumps(material, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _gated_verdict(user_data: dict, immediate: list, caution: list, prices: dict,
+                   news_map: dict, emit_fn=None) -> dict:
+    """
+    _claude_verdict, unless nothing material changed since the stored verdict
+    and it is younger than VERDICT_MAX_AGE; then the stored one is reused.
+    Returns the verdict dict plus verdictFingerprint / verdictAt to persist.
+    """
+    state = user_data.get("agentState", {})
+    fp    = _verdict_fingerprint(user_data, immediate, caution, prices, news_map)
+    age   = time.time() - float(state.get("verdictAt") or 0)
+
+    if state.get("verdictFingerprint") == fp and age < VERDICT_MAX_AGE:
+        with _verdict_lock:
+            _verdict_stats["reused"] += 1
+        if emit_fn:
+            emit_fn("♻️", f"No material change since last verdict ({int(age // 60)} min ago) - keeping it")
+        return {"verdict": state.get("verdict", "All Good"),
+                "verdictReason": state.get("verdictReason", ""),
+                "overallSummary": state.get("overallSummary", ""),
+                "topAlerts": state.get("topAlerts", []),
+                "verdictFingerprint": fp, "verdictAt": state.get("verdictAt")}
+
+    if emit_fn:
+        emit_fn("🤖", "Synthesising portfolio verdict with AI…")
+    data = _request_verdict(user_data, immediate, caution, prices, fp, emit_fn=emit_fn)
+    with _verdict_lock:
+        if data.pop("pending", False):
+            # queued for the provider batch API; no LLM call was made for this run
+            data.pop("fallback", None)
+            _verdict_stats["batch_queued"] += 1
+            return {**data, "verdictFingerprint": None, "verdictAt": None}
+        _verdict_stats["llm_calls"] += 1
+        if state.get("verdictFingerprint") == fp:
+            _verdict_stats["refreshed_stale"] += 1
+        if data.pop("fallback", False):
+            _verdict_stats["fallbacks"] += 1
+            # an error fallback is not worth reusing; the next run asks again
+            return {**data, "verdictFingerprint": None, "verdictAt": None}
+    return {**data, "verdictFingerprint": fp, "verdictAt": time.time()}
+
+
+def get_verdict_stats() -> dict:
+    with _verdict_lock:
+        stats = dict(_verdict_stats)
+    decided = stats["llm_calls"] + stats["reused"]
+    stats["reuse_rate"] = round(stats["reused"] / decided, 3) if decided else 0.0
+    stats["max_age"] = VERDICT_MAX_AGE
+    stats["batching"] = _verdict_batcher.get_stats() if VERDICT_BATCHING else None
+    stats["offhours_batches"] = _offhours_batches.get_stats() if VERDICT_BATCH_API else None
+    return stats
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -365,15 +694,14 @@ def _analyse_user(email: str, data_file: str) -> None:
     user = _load_user(data_file)
     if not user:
         return
+    loaded = copy.deepcopy(user)      # save only what this run changed
 
     holdings  = user.get("holdings", {})
     stocks    = holdings.get("stocks", [])
     mfs       = holdings.get("mutualFunds", [])
     agent_st  = user.setdefault("agentState", {})
-    act_log   = agent_st.setdefault("activityLog", [])
 
     # Initialise all outputs - always persisted even on partial failure
-    activity:    list[dict] = []
     prices:      dict       = {}
     news_map:    dict       = {}
     trend_state: dict       = agent_st.get("trendState", {})
@@ -389,7 +717,11 @@ def _analyse_user(email: str, data_file: str) -> None:
 
     def _emit(icon, msg, level="info"):
         entry = _log_entry(icon, msg, level)
-        activity.append(entry)
+        try:
+            # appended as it happens; seq lets a reconnecting client resume from the store
+            entry["seq"] = user_store.append_activity(email, [entry])
+        except Exception as e:
+            print(f"[agent] activity log error for {email}: {e}")
         _push(email, {"type": "activity_log", "entry": entry})
 
     _push(email, {"type": "analysis_start"})
@@ -400,7 +732,7 @@ def _analyse_user(email: str, data_file: str) -> None:
         stock_syms = [s["symbol"] for s in stocks if s.get("symbol")]
         if stock_syms:
             _emit("📡", f"Fetching live prices for {len(stock_syms)} stocks…")
-            prices = _fetch_prices(stock_syms)
+            prices = _get_prices(stock_syms)
             for sym, d in prices.items():
                 chg = d["change_pct"]
                 icon = "📈" if chg >= 0 else "📉"
@@ -409,13 +741,13 @@ def _analyse_user(email: str, data_file: str) -> None:
                 _push(email, {"type": "price_update", "symbol": sym,
                               "price": d["price"], "change1d": chg})
 
-        # ── 2. News sentiment for top 5 by value ────────────────────────────
-        sorted_stocks = sorted(stocks, key=lambda s: float(s.get("currentValue") or 0), reverse=True)
-        top5 = [s["symbol"] for s in sorted_stocks[:5] if s.get("symbol")]
-        if top5:
-            _emit("🔍", f"Scanning news for top holdings: {', '.join(top5)}")
-            for sym in top5:
-                sent = _news_sentiment(sym)
+        # ── 2. News sentiment for top holdings by value ─────────────────────
+        top_syms = _top_symbols(stocks)
+        if top_syms:
+            _emit("🔍", f"Scanning news for top holdings: {', '.join(top_syms)}")
+            sentiments = _get_sentiments(top_syms)
+            for sym in top_syms:
+                sent = sentiments.get(sym) or agent_st.get("newsSentiment", {}).get(sym) or dict(NEUTRAL_SENTIMENT)
                 news_map[sym] = sent
                 icon = "🟢" if sent["label"] == "Bullish" else ("🔴" if sent["label"] == "Bearish" else "⚪")
                 _emit(icon, f"{sym} news sentiment: {sent['label']} ({len(sent['headlines'])} articles)")
@@ -468,9 +800,9 @@ def _analyse_user(email: str, data_file: str) -> None:
         if not immediate and not caution:
             _emit("✅", "All holdings within normal range", "success")
 
-        # ── 5. Claude verdict (45-second timeout enforced inside) ────────────
-        _emit("🤖", "Synthesising portfolio verdict with AI…")
-        verdict_data = _claude_verdict(user, immediate, caution, prices, emit_fn=_emit)
+        # ── 5. Claude verdict (45-second timeout enforced inside), skipped when
+        #       nothing material changed since the stored one ────────────────
+        verdict_data = _gated_verdict(user, immediate, caution, prices, news_map, emit_fn=_emit)
         verdict      = verdict_data.get("verdict", "All Good")
 
         icon_map  = {"All Good": "✅", "Caution": "⚠️", "Immediate Action": "🚨"}
@@ -517,7 +849,6 @@ def _analyse_user(email: str, data_file: str) -> None:
 
     # ── 6. Persist - always runs, even on partial failure ────────────────────
     now_iso = datetime.datetime.now().isoformat()
-    act_log = (activity + act_log)[:MAX_ACTIVITY_LOG]
 
     agent_st.update({
         "lastChecked":       now_iso,
@@ -526,28 +857,28 @@ def _analyse_user(email: str, data_file: str) -> None:
         "overallSummary":    verdict_data.get("overallSummary", ""),
         "llmVerdictContent": verdict_data.get("overallSummary", ""),
         "topAlerts":         verdict_data.get("topAlerts", []),
+        "verdictFingerprint": verdict_data.get("verdictFingerprint"),
+        "verdictAt":         verdict_data.get("verdictAt"),
         "alerts":         [{**a, "tier": "immediate"} for a in immediate] +
                           [{**a, "tier": "caution"}   for a in caution],
         "watchlist":      [{**a, "tier": "caution"}   for a in caution],
-        "activityLog":    act_log,
         "lastPrices":     prices if prices else agent_st.get("lastPrices", {}),
         "trendState":     trend_state,
         "newsSentiment":  news_map if news_map else agent_st.get("newsSentiment", {}),
     })
     user["agentState"] = agent_st
     try:
-        _save_user(data_file, user)
+        _save_user(data_file, user, base=loaded)
     except Exception as save_err:
         print(f"[agent] save error for {email}: {save_err}")
 
     _push(email, {"type": "analysis_complete", "lastChecked": now_iso})
+    # refresh the live alert index (holdings, profile, today's trend counters)
+    _alerts.upsert_user(email, user)
 
     # Mark first analysis complete in the index
     try:
-        idx = _load_index()
-        if email in idx and not idx[email].get("isAnalysisPresent"):
-            idx[email]["isAnalysisPresent"] = True
-            _save_index(idx)
+        user_store.set_flags(email, is_analysis_present=True)
     except Exception:
         pass
 
@@ -569,50 +900,107 @@ def _is_market_hours() -> bool:
         return True                        # assume open on any pytz error
 
 
+_scheduler = AnalysisScheduler(_analyse_user, ANALYSIS_INTERVAL)
+
+
+def _on_live_alert(email: str, alert: dict) -> None:
+    immediate = alert["tier"] == "immediate"
+    entry = _log_entry("🚨" if immediate else "⚠️",
+                       f"{'ALERT' if immediate else 'CAUTION'} (live): {alert['symbol']} - {alert['issue']}",
+                       "error" if immediate else "warn")
+    try:
+        entry["seq"] = user_store.append_activity(email, [entry])
+    except Exception as e:
+        print(f"[agent] activity log error for {email}: {e}")
+    _push(email, {"type": "alert_added", "alert": alert})
+    _push(email, {"type": "activity_log", "entry": entry})
+
+
+_alerts     = AlertEngine(_on_live_alert)
+_quote_feed = PollingQuoteFeed(_alerts, _fetch_prices, active=_is_market_hours, on_quotes=_store_prices)
+
+
+def _index_alert_users() -> None:
+    for email, meta in _load_index().items():
+        if meta.get("isDataPresent") and _scheduler.owns(email):
+            user = user_store.load_user(email)
+            if user:
+                _alerts.upsert_user(email, user)
+
+
+def get_scheduler_stats() -> dict:
+    return {**_scheduler.get_stats(), "market": get_market_stats(), "alerts": _alerts.get_stats(),
+            "verdicts": get_verdict_stats(), "jobs": _jobs.get_stats()}
+
+
 def _run_all_users() -> None:
     global _timer
+    # re-arm first: runs are dispatched to the pool, so cycles keep a fixed rate
+    if _running:
+        _timer = threading.Timer(ANALYSIS_INTERVAL, _run_all_users)
+        _timer.daemon = True
+        _timer.start()
+
     try:
         index = _load_index()
     except Exception:
         index = {}
 
-    market_open = _is_market_hours()
+    users = [(email, meta["dataFile"]) for email, meta in index.items()
+             if meta.get("isDataPresent") and _scheduler.owns(email)]
 
-    for email, meta in index.items():
-        if meta.get("isDataPresent"):
-            if market_open:
-                try:
-                    _analyse_user(email, meta["dataFile"])
-                except Exception as e:
-                    print(f"[agent] error analysing {email}: {e}")
-            else:
-                # Outside market hours: just push a minimal heartbeat, no price fetching
-                _push(email, {"type": "market_closed"})
-                _push(email, {"type": "activity_log",
-                              "entry": _log_entry("🌙", "Market closed. Monitoring paused until 9:15 AM IST.", "info")})
+    if _is_market_hours():
+        # phase 1: shared quotes + sentiment for the symbol union; phase 2: per-user fan-out
+        _prefetch_market(users)
+        _scheduler.schedule_cycle(users)
+    else:
+        for email, _ in users:
+            # Outside market hours: just push a minimal heartbeat, no price fetching
+            _push(email, {"type": "market_closed"})
+            _push(email, {"type": "activity_log",
+                          "entry": _log_entry("🌙", "Market closed. Monitoring paused until 9:15 AM IST.", "info")})
 
-    # Auto email at market close
-    try:
-        import pytz
-        now_ist = datetime.datetime.now(pytz.timezone("Asia/Kolkata"))
-        if now_ist.hour == MARKET_CLOSE_HOUR and MARKET_CLOSE_MIN <= now_ist.minute < MARKET_CLOSE_MIN + 6:
-            from agent_email import send_report
-            for email, meta in index.items():
-                if meta.get("isDataPresent"):
-                    user = _load_user(meta["dataFile"])
-                    if user:
-                        try:
-                            send_report(email, user)
-                            print(f"[agent] auto email sent to {email}")
-                        except Exception as e:
-                            print(f"[agent] email error {email}: {e}")
-    except Exception as e:
-        print(f"[agent] market close email check error: {e}")
 
-    if _running:
-        _timer = threading.Timer(ANALYSIS_INTERVAL, _run_all_users)
-        _timer.daemon = True
-        _timer.start()
+# ─────────────────────────────────────────────────────────────────────────────
+# Market-close reports
+# ─────────────────────────────────────────────────────────────────────────────
+
+_jobs = JobScheduler()
+CLOSE_REPORT_JOB = f"close_reports#{_scheduler.shard_index}/{_scheduler.shard_count}"
+
+
+def _close_reports(run_date: datetime.date) -> str:
+    """
+    Daily job: queue the report of every owned user not yet sent for
+    `run_date`, REPORT_CHUNK users at a time with the chunks jittered over
+    REPORT_SPREAD seconds. Safe to re-run - users already in the outbox for
+    the day, or sent a report after the close, are skipped before loading.
+    """
+    from agent_email import queue_reports, unqueued
+
+    index  = _load_index()
+    owned  = [email for email, meta in index.items() if meta.get("isDataPresent") and _scheduler.owns(email)]
+    # lastReportSentAt is server-local naive time
+    due    = _jobs.due_at(CLOSE_REPORT_JOB, run_date).astimezone().replace(tzinfo=None)
+    sent   = user_store.read_state("lastReportSentAt", owned)
+    emails = [e for e in unqueued(owned, run_date)
+              if not (sent.get(e) and datetime.datetime.fromisoformat(sent[e]) >= due)]
+
+    with _market_lock:
+        market = {sym: data for sym, (_, data) in _price_cache.items()} or None
+    chunks = [emails[i:i + REPORT_CHUNK] for i in range(0, len(emails), REPORT_CHUNK)]
+    step   = REPORT_SPREAD / len(chunks) if chunks else 0.0
+    queued = 0
+    for i, chunk in enumerate(chunks):
+        if i:
+            time.sleep(random.uniform(0.5, 1.5) * step)
+        batch = [(email, user) for email in chunk if (user := user_store.load_user(email))]
+        queued += queue_reports(batch, day=run_date, market=market)
+    print(f"[agent] close reports {run_date}: {queued} queued, {len(owned) - len(emails)} already sent")
+    return f"{queued} queued"
+
+
+_jobs.add(CLOSE_REPORT_JOB, MARKET_CLOSE_HOUR, MARKET_CLOSE_MIN, _close_reports)
 
 
 def start_agent_loop() -> None:
@@ -620,11 +1008,19 @@ def start_agent_loop() -> None:
     if _running:
         return
     _running = True
-    # initial run after 10 seconds so Flask startup completes first
+    # initial run after 10 seconds so server startup completes first
     _timer = threading.Timer(10, _run_all_users)
     _timer.daemon = True
     _timer.start()
-    print("[agent] background loop started (interval=5 min)")
+    if LIVE_ALERTS:
+        try:
+            _index_alert_users()
+        except Exception as e:
+            print(f"[agent] alert index error: {e}")
+        _quote_feed.start()
+    _jobs.start()
+    print(f"[agent] background loop started (interval={ANALYSIS_INTERVAL}s, workers={_scheduler.workers}, "
+          f"shard {_scheduler.shard_index}/{_scheduler.shard_count}, live alerts {'on' if LIVE_ALERTS else 'off'})")
 
 
 def stop_agent_loop() -> None:
@@ -632,6 +1028,9 @@ def stop_agent_loop() -> None:
     _running = False
     if _timer:
         _timer.cancel()
+    _quote_feed.stop()
+    _jobs.stop()
+    _scheduler.shutdown()
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -641,13 +1040,12 @@ def stop_agent_loop() -> None:
 def get_agent_status(email: str) -> dict:
     """Returns {status: 'unknown_user'|'needs_onboarding'|'active', dataFile?}."""
     try:
-        index = _load_index()
+        meta = user_store.get_meta(email)
     except Exception:
-        return {"status": "error", "detail": "holdings.json missing"}
+        return {"status": "error", "detail": "user store unavailable"}
 
-    if email not in index:
+    if meta is None:
         return {"status": "unknown_user"}
-    meta = index[email]
     if not meta.get("isDataPresent"):
         return {"status": "needs_onboarding"}
     return {
@@ -659,11 +1057,11 @@ def get_agent_status(email: str) -> dict:
 
 def onboard_user(email: str, holdings: dict, profile: dict) -> dict:
     """Saves holdings + profile, sets isDataPresent=true, triggers first analysis."""
-    index     = _load_index()
-    if email not in index:
+    meta      = user_store.get_meta(email)
+    if meta is None:
         return {"success": False, "error": "Email not in allowed list"}
 
-    data_file = index[email]["dataFile"]
+    data_file = meta["dataFile"]
     name      = profile.get("name") or email.split("@")[0]
 
     user_data = {
@@ -687,26 +1085,31 @@ def onboard_user(email: str, holdings: dict, profile: dict) -> dict:
             "lastReportSentAt": None,
         }
     }
-    _save_user(data_file, user_data)
-
-    index[email]["isDataPresent"]    = True
-    index[email]["isAnalysisPresent"] = False   # set True after first run completes
-    _save_index(index)
+    user_store.save_user(email, user_data, replace=True)
+    # isAnalysisPresent is set True after the first run completes
+    user_store.set_flags(email, is_data_present=True, is_analysis_present=False)
 
     # trigger analysis in background immediately
-    t = threading.Thread(target=_analyse_user, args=(email, data_file), daemon=True)
-    t.start()
+    _scheduler.run_now(email, data_file)
 
     return {"success": True}
 
 
+def get_activity(email: str, after: Optional[int] = None, before: Optional[int] = None,
+                 limit: int = user_store.ACTIVITY_CAP) -> dict:
+    """Cursor page of the activity log (see user_store.read_activity)."""
+    if user_store.get_meta(email) is None:
+        return {"success": False, "error": "Unknown email"}
+    return {"success": True, **user_store.read_activity(email, after=after, before=before, limit=limit)}
+
+
 def get_dashboard(email: str) -> dict:
     """Returns full agentState + holdings snapshot for the dashboard."""
-    index = _load_index()
-    if email not in index or not index[email].get("isDataPresent"):
+    meta = user_store.get_meta(email)
+    if meta is None or not meta["isDataPresent"]:
         return {"success": False, "error": "Not onboarded"}
 
-    user = _load_user(index[email]["dataFile"])
+    user = user_store.load_user(email)
     if not user:
         return {"success": False, "error": "Data file missing"}
 
@@ -752,22 +1155,20 @@ def get_dashboard(email: str) -> dict:
 
 def trigger_analyse(email: str) -> dict:
     """Manually trigger an analysis run for the given user."""
-    index = _load_index()
-    if email not in index or not index[email].get("isDataPresent"):
+    meta = user_store.get_meta(email)
+    if meta is None or not meta["isDataPresent"]:
         return {"success": False, "error": "Not onboarded"}
-    data_file = index[email]["dataFile"]
-    t = threading.Thread(target=_analyse_user, args=(email, data_file), daemon=True)
-    t.start()
+    data_file = meta["dataFile"]
+    if not _scheduler.run_now(email, data_file):
+        return {"success": True, "detail": "Analysis already running"}
     return {"success": True}
 
 
 def reset_user(email: str) -> dict:
     """Set isDataPresent=false for demo onboarding showcase."""
-    index = _load_index()
-    if email not in index:
+    if not user_store.set_flags(email, is_data_present=False):
         return {"success": False, "error": "Unknown email"}
-    index[email]["isDataPresent"] = False
-    _save_index(index)
+    _alerts.remove_user(email)
     return {"success": True}
 
 
@@ -777,14 +1178,6 @@ def extract_profile_with_llm(chat_transcript: str) -> dict:
     Returns {name, investmentStyle, monthlyInvestment, goals, horizon, riskAppetite,
              focusSectors, avoidSectors}.
     """
-    from dotenv import load_dotenv, find_dotenv
-    load_dotenv(find_dotenv())
-    import anthropic, os
-
-    api_key  = os.getenv("ANTHROPIC_API_KEY", "")
-    resource = os.getenv("ANTHROPIC_FOUNDRY_RESOURCE", "")
-    client   = anthropic.AnthropicFoundry(api_key=api_key, resource=resource) if resource else anthropic.Anthropic(api_key=api_key)
-
     prompt = f"""Extract a structured investment profile from this onboarding conversation. Respond ONLY with valid JSON, no markdown.
 
 Conversation:
@@ -803,7 +1196,8 @@ JSON schema (all fields required, use null if not mentioned):
 }}"""
 
     try:
-        msg = client.messages.create(
+        msg = llm_gateway.create_message(
+            "extract_profile",
             model="claude-sonnet-4-6", max_tokens=400,
             messages=[{"role": "user", "content": prompt}]
         )
@@ -0,0 +1,37 @@
+"""
+agent_worker.py - Runs the autonomous agent loop in its own process.
+
+API workers then only serve HTTP and stream the loop's events through
+event_bus:
+
+    AGENT_EVENT_BUS=unix python agent_worker.py
+    AGENT_EVENT_BUS=unix AGENT_LOOP_ENABLED=0 uvicorn app:app --workers 4 --port 8000
+
+With AGENT_EVENT_BUS=unix this process also hosts the socket broker unless
+one is already listening on AGENT_EVENT_SOCKET.
+"""
+
+import signal
+import threading
+
+import event_bus
+from agent_service import start_agent_loop, stop_agent_loop
+
+
+def main() -> None:
+    if event_bus.EVENT_BUS == "unix":
+        event_bus.start_broker(event_bus.EVENT_SOCKET)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    start_agent_loop()
+    print(f"[agent_worker] running, publishing over {event_bus.get_bus().name}")
+    stop.wait()
+    stop_agent_loop()
+    print("[agent_worker] stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+alert_engine.py - Streaming holding alerts driven by quote ticks.
+
+  Thresholds   - derived once per user from the horizon profile
+                 (thresholds_for) and stored with each holding
+  Index        - symbol -> {email: holder}; a tick only visits the holders of
+                 its symbol, O(holders) per tick
+  Firing       - on_alert(email, alert) runs the moment a holding crosses
+                 into caution / immediate; each tier fires at most once per
+                 holding per day
+  Feeds        - PollingQuoteFeed polls a bulk quote function every
+                 AGENT_TICK_INTERVAL seconds and ticks the symbols whose price
+                 moved; any source that calls engine.on_tick (e.g. a broker
+                 websocket) can replace it
+
+classify() is also what agent_service._compute_alerts uses on its periodic
+runs, so live and scheduled alerts agree.
+"""
+
+import datetime
+import os
+import re
+import threading
+from typing import Callable, Iterable, NamedTuple, Optional
+
+AGENT_TICK_INTERVAL = float(os.getenv("AGENT_TICK_INTERVAL", "15"))
+
+_TIER_RANK = {None: 0, "caution": 1, "immediate": 2}
+
+
+class Thresholds(NamedTuple):
+    imm_day:   float
+    imm_trend: int
+    cau_day:   float
+    cau_trend: int
+
+
+def thresholds_for(profile: Optional[dict]) -> Thresholds:
+    """
+    Long-term investors (horizon contains 'long', 'retire', or ≥7 years):
+      - Caution:   single-day ≤ -8%  OR  ≥5 consecutive down days
+      - Immediate: single-day ≤ -15% OR  ≥10 consecutive down days
+    Short/medium-term:
+      - Caution:   single-day ≤ -3%  OR  ≥2 consecutive down days
+      - Immediate: single-day ≤ -8%  OR  ≥4 consecutive down days
+    """
+    horizon = str((profile or {}).get("horizon") or "")
+    m = re.search(r"(\d+)", horizon)
+    horizon_years = int(m.group(1)) if m else (10 if "long" in horizon.lower() else 5)
+    if horizon_years >= 7:
+        return Thresholds(-15, 10, -8, 5)
+    return Thresholds(-8, 4, -3, 2)
+
+
+def classify(sym: str, chg: float, trend: int, t: Thresholds) -> Optional[tuple[str, str, str]]:
+    """(tier, issue, action) for a holding's 1D change and down-day trend, or None."""
+    if chg <= t.imm_day or (trend >= t.imm_trend and chg < 0):
+        if chg <= t.imm_day:
+            issue = f"Down {abs(chg):.1f}% today - sharp single-day decline"
+        else:
+            issue = f"{trend} consecutive down days - sustained decline trend"
+        return "immediate", issue, f"Review {sym} position. Consider stop-loss or partial exit."
+    if chg <= t.cau_day or (trend >= t.cau_trend and chg < 0):
+        if chg <= t.cau_day:
+            issue = f"Down {abs(chg):.1f}% today"
+        else:
+            issue = f"{trend} consecutive down days - watch for continued weakness"
+        return "caution", issue, f"Monitor {sym} closely and check for adverse news."
+    return None
+
+
+class _Holder:
+    __slots__ = ("email", "symbol", "name", "qty", "current_value", "thresholds", "trend", "fired", "fired_on")
+
+    def __init__(self, email: str, holding: dict, thresholds: Thresholds, trend: int):
+        self.email         = email
+        self.symbol        = holding["symbol"]
+        self.name          = holding.get("name", self.symbol)
+        self.qty           = float(holding.get("qty") or 0)
+        self.current_value = float(holding.get("currentValue") or 0)
+        self.thresholds    = thresholds
+        self.trend         = trend
+        self.fired: Optional[str] = None
+        self.fired_on      = ""
+
+
+class AlertEngine:
+    def __init__(self, on_alert: Callable[[str, dict], None]):
+        self.on_alert = on_alert
+        self._lock    = threading.Lock()
+        self._index:  dict[str, dict[str, _Holder]] = {}
+        self._users:  dict[str, list[str]] = {}          # email -> symbols, for removal
+        self._stats   = {"ticks": 0, "holder_checks": 0, "fired": 0}
+
+    # ── Index maintenance ────────────────────────────────────────────────────
+
+    def upsert_user(self, email: str, user: dict) -> None:
+        """(Re)index a user document; keeps today's fired tiers for unchanged holdings."""
+        thresholds = thresholds_for(user.get("profile"))
+        trend_state = (user.get("agentState") or {}).get("trendState") or {}
+        stocks = [s for s in (user.get("holdings") or {}).get("stocks", []) if s.get("symbol")]
+        with self._lock:
+            old = {sym: self._index.get(sym, {}).get(email) for sym in self._users.get(email, [])}
+            self._remove(email)
+            for s in stocks:
+                sym = s["symbol"]
+                holder = _Holder(email, s, thresholds, int(trend_state.get(sym, {}).get("down_count", 0)))
+                prev = old.get(sym)
+                if prev is not None:
+                    holder.fired, holder.fired_on = prev.fired, prev.fired_on
+                self._index.setdefault(sym, {})[email] = holder
+            self._users[email] = [s["symbol"] for s in stocks]
+
+    def remove_user(self, email: str) -> None:
+        with self._lock:
+            self._remove(email)
+
+    def _remove(self, email: str) -> None:
+        for sym in self._users.pop(email, []):
+            holders = self._index.get(sym)
+            if holders is not None:
+                holders.pop(email, None)
+                if not holders:
+                    del self._index[sym]
+
+    def symbols(self) -> list[str]:
+        with self._lock:
+            return list(self._index)
+
+    # ── Ticks ────────────────────────────────────────────────────────────────
+
+    def on_tick(self, symbol: str, price: float, change_pct: float) -> int:
+        """Evaluate the holders of `symbol`; returns the number of alerts fired."""
+        today = datetime.date.today().isoformat()
+        fired: list[tuple[str, dict]] = []
+        with self._lock:
+            holders = self._index.get(symbol)
+            self._stats["ticks"] += 1
+            if not holders:
+                return 0
+            self._stats["holder_checks"] += len(holders)
+            for h in holders.values():
+                hit = classify(symbol, change_pct, h.trend, h.thresholds)
+                if hit is None:
+                    continue
+                tier, issue, action = hit
+                if h.fired_on != today:
+                    h.fired, h.fired_on = None, today
+                if _TIER_RANK[tier] <= _TIER_RANK[h.fired]:
+                    continue
+                h.fired = tier
+                value = h.qty * price if h.qty else h.current_value
+                fired.append((h.email, {
+                    "symbol": symbol, "name": h.name, "is_mf": False, "change_pct": change_pct,
+                    "current_value": round(value, 2), "issue": issue, "action": action,
+                    "tier": tier, "live": True,
+                }))
+            self._stats["fired"] += len(fired)
+
+        for email, alert in fired:
+            try:
+                self.on_alert(email, alert)
+            except Exception as e:
+                print(f"[alert_engine] on_alert error for {email}: {e}")
+        return len(fired)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "symbols": len(self._index), "users": len(self._users),
+                    "holdings": sum(len(h) for h in self._index.values())}
+
+
+class PollingQuoteFeed:
+    """
+    Polls `fetch_many(symbols) -> {symbol: {price, change_pct, ...}}` for the
+    engine's symbols and ticks those whose price changed since the last poll.
+    """
+
+    def __init__(self, engine: AlertEngine, fetch_many: Callable[[list[str]], dict],
+                 interval: float = AGENT_TICK_INTERVAL, active: Callable[[], bool] = lambda: True,
+                 on_quotes: Optional[Callable[[dict], None]] = None):
+        self.engine     = engine
+        self.fetch_many = fetch_many
+        self.interval   = interval
+        self.active     = active
+        self.on_quotes  = on_quotes
+        self._last:     dict[str, float] = {}
+        self._stop      = threading.Event()
+        self._thread:   Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="quote-feed")
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def poll_once(self, symbols: Optional[Iterable[str]] = None) -> int:
+        symbols = list(symbols) if symbols is not None else self.engine.symbols()
+        if not symbols:
+            return 0
+        quotes = self.fetch_many(symbols)
+        if self.on_quotes is not None and quotes:
+            self.on_quotes(quotes)
+        ticks = 0
+        for sym, q in quotes.items():
+            price = q.get("price")
+            if price is None or self._last.get(sym) == price:
+                continue
+            self._last[sym] = price
+            self.engine.on_tick(sym, price, q.get("change_pct", 0.0))
+            ticks += 1
+        return ticks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if not self.active():
+                continue
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"[alert_engine] quote poll error: {e}")
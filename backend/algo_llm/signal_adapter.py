@@ -2,7 +2,7 @@
 from datetime import datetime
 from .trading_state import TradingState
 from .execution_engine import ExecutionEngine
-from .trading_lang import build_graph
+from .trading_lang import build_graph, new_agent_state
 
 
 class SignalAdapter:
@@ -27,26 +27,7 @@ class SignalAdapter:
 
         # ---------- AI ANALYSIS ----------
         question = f"Intraday analysis for {symbol}. Decide Buy or Hold."
-        initial_state = {
-            "question": question,
-            "category": "",
-            "missing_info": None,
-            "confidence": 0.0,
-            "reasoning": "",
-            "clarification_used": False,
-            "answer": "",
-            "trade_signal": None,   # IMPORTANT
-            "status": "RUNNING",
-            "events": [],
-            "symbol": None,
-            "stock_sentiment": None,
-            "bull_analysis": None,
-            "bear_analysis": None,
-            "mf_matches": None,
-            "mf_categories": None,
-            "mf_scraped_data": None,
-            "should_scrape": False
-        }
+        initial_state = new_agent_state(question)
 
         result = self.graph.invoke(initial_state)
 
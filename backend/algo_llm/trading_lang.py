@@ -3,10 +3,13 @@ import warnings
 from mf_scrapper import scrape_mf
 from helper_func import analyze_sentiment, normalize_fund_name
 from news_service import NewsService
+import fast_classifier
+import llm_cache
+import llm_gateway
 warnings.simplefilter(action='ignore', category=FutureWarning)
-from langchain_anthropic import ChatAnthropic
 from dotenv import find_dotenv, load_dotenv
 from langgraph.graph import StateGraph, END
+from langchain_core.messages import HumanMessage, SystemMessage
 from typing import Dict, Optional, TypedDict, List
 from langchain.tools import tool
 from langchain_community.vectorstores import Chroma 
@@ -135,74 +138,229 @@ class AgentState(TypedDict):
     mf_categories: Optional[list]
     mf_scraped_data: Optional[list]
     should_scrape: bool
+    mf_names: Optional[list]
+    mf_profile: Optional[dict]
+    entities_extracted: bool
     trade_signal: Optional[Dict]
 
-_api_key = os.getenv("ANTHROPIC_API_KEY", "")
-_resource = os.getenv("ANTHROPIC_FOUNDRY_RESOURCE", "")
-_anthropic_url = (
-    f"https://{_resource}.services.ai.azure.com/anthropic" if _resource else "https://api.anthropic.com"
-)
-_anthropic_headers = {"Authorization": f"Bearer {_api_key}"} if _resource else {}
-
-llm = ChatAnthropic(
-    model="claude-sonnet-4-6",
-    temperature=0,
-    anthropic_api_key=_api_key,
-    anthropic_api_url=_anthropic_url,
-    default_headers=_anthropic_headers,
-)
+def new_agent_state(question: str) -> AgentState:
+    """Fresh graph state for a question (CLI and SignalAdapter)."""
+    return {
+        "question": question,
+        "category": "",
+        "missing_info": None,
+        "confidence": 0.0,
+        "reasoning": "",
+        "clarification_used": False,
+        "answer": "",
+        "status": "RUNNING",
+        "events": [],
+        "symbol": None,
+        "stock_sentiment": None,
+        "bull_analysis": None,
+        "bear_analysis": None,
+        "mf_matches": None,
+        "mf_categories": None,
+        "mf_scraped_data": None,
+        "should_scrape": False,
+        "mf_names": None,
+        "mf_profile": None,
+        "entities_extracted": False,
+        "trade_signal": None,
+    }
+
+LLM_MODEL = "claude-sonnet-4-6"
+
+llm = llm_gateway.get_chat_model(LLM_MODEL, temperature=0)
 
 tools = [get_finance_info]
 finance_agent = create_react_agent(llm, tools=tools)
 
-def classifier_node(state: AgentState) -> AgentState:
-    prompt = f"""
-    You are a classification assistant for a finance helpdesk. Classify the user's question into one of the following categories exactly: "mf", "stock", "general_finance", "unknown".
+if os.getenv("FAST_CLASSIFIER_EMBEDDINGS", "0") == "1":
+    fast_classifier.enable_embeddings(embeddings.embed_documents)
+
+# Single structured call that classifies the question and extracts every
+# entity the downstream handlers need (symbol for stocks, fund names /
+# categories / profile for MFs), sent as a tool schema.
+ROUTE_SCHEMA = {
+    "title": "route_question",
+    "description": "Classify a finance helpdesk question and extract its entities.",
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": ["mf", "stock", "general_finance", "unknown"]},
+        "confidence": {"type": "number", "description": "0.0 to 1.0"},
+        "missing_info": {"type": ["string", "null"]},
+        "reasoning": {"type": "string", "description": "1-2 sentence explanation"},
+        "symbol": {"type": ["string", "null"], "description": "NSE ticker for stock questions, else null"},
+        "fund_names": {"type": "array", "items": {"type": "string"}},
+        "fund_categories": {"type": "array", "items": {"type": "string"}},
+        "risk": {"type": ["string", "null"], "enum": ["low", "medium", "high", None]},
+        "horizon": {"type": ["string", "null"], "enum": ["short", "medium", "long", None]},
+        "goal": {"type": ["string", "null"], "enum": ["wealth", "steady", "aggressive", "balanced", None]},
+    },
+    "required": ["category", "confidence", "missing_info", "reasoning", "symbol",
+                 "fund_names", "fund_categories", "risk", "horizon", "goal"],
+}
+router_llm = llm.with_structured_output(ROUTE_SCHEMA, include_raw=True)
+
+def _usage(message) -> dict:
+    meta = getattr(message, "usage_metadata", None) or {}
+    return {"input_tokens": meta.get("input_tokens", 0), "output_tokens": meta.get("output_tokens", 0)}
+
+# Static instruction blocks are sent as a cached system prefix and only the
+# question / data goes in the user turn, so the provider can reuse the prefix.
+ROUTER_SYSTEM = """You are a classification and extraction assistant for a finance helpdesk. Classify the user's question into one of the following categories exactly: "mf", "stock", "general_finance", "unknown".
+
+- "mf" = Mutual fund / SIP / NAV / SIP amount / SIP performance / fund recommendations / risk-based fund queries.
+  * Examples: "suggest good mutual funds", "5 years medium risk", "best flexi cap funds", "SIP for aggressive growth"
+
+- "stock" = Stock / shares / ticker / price target / technical analysis questions.
+  * Examples: "should I buy TCS", "RELIANCE analysis", "stock recommendation"
+
+- "general_finance" = Personal Finance, Budgeting, insurance, tax, loans, general investing concepts (not a specific fund or stock).
+  * Examples: "how to save money", "tax planning tips", "insurance guide"
+
+- "unknown" = The question doesn't fit or lacks clarity OR is completely out of scope (like weather, recipes, general chat).
+  * Examples: "hello", "what's the weather", "tell me a joke"
+
+IMPORTANT: 
+- Even vague MF queries like "tell me good funds" or "5 years medium risk" should be classified as "mf"
+- Mark as "unknown" ONLY if truly not related to finance
+- If it mentions risk/horizon/goals without specific fund names, still classify as "mf"
+
+Fill every field of the route_question tool:
+- category, confidence (0.0-1.0) and reasoning (1-2 sentences) as described above.
+- missing_info: For MF queries, ask for: "specific investment goals, risk tolerance, or investment horizon" if none mentioned. For other categories, note what's missing or null.
+- symbol: for "stock" questions, the Indian stock ticker symbol only (e.g. TMPV, ADANIPOWER, RELIANCE); null if none is named or for other categories.
+- fund_names: full mutual fund names mentioned, e.g. "HDFC Flexi Cap Fund", "Parag Parikh Flexi Cap". Empty list if none.
+- fund_categories: for "mf" questions, the fitting categories:
+    * Low risk / short term (1-3 years) / steady returns → Large Cap, Hybrid, Value/Dividend
+    * Medium risk / medium term (3-5 years) / balanced → Flexi Cap, Multi Cap, Large & Mid Cap
+    * High risk / long term (5+ years) / aggressive growth → Mid Cap, Small Cap, Sectoral, Momentum
+    * Wealth creation → Flexi Cap, Multi Cap, Small Cap
+- risk (low/medium/high), horizon (short/medium/long), goal (wealth/steady/aggressive/balanced): only if mentioned or clearly inferable, else null.
+"""
 
-    - "mf" = Mutual fund / SIP / NAV / SIP amount / SIP performance / fund recommendations / risk-based fund queries.
-      * Examples: "suggest good mutual funds", "5 years medium risk", "best flexi cap funds", "SIP for aggressive growth"
-    
-    - "stock" = Stock / shares / ticker / price target / technical analysis questions.
-      * Examples: "should I buy TCS", "RELIANCE analysis", "stock recommendation"
-    
-    - "general_finance" = Personal Finance, Budgeting, insurance, tax, loans, general investing concepts (not a specific fund or stock).
-      * Examples: "how to save money", "tax planning tips", "insurance guide"
-    
-    - "unknown" = The question doesn't fit or lacks clarity OR is completely out of scope (like weather, recipes, general chat).
-      * Examples: "hello", "what's the weather", "tell me a joke"
+MF_EXTRACT_SYSTEM = """You are a mutual fund category expert. Analyze the user's question and extract:
+
+1. **Mutual fund NAMES** (if mentioned) - extract full names like "HDFC Flexi Cap Fund", "Parag Parikh Flexi Cap"
+
+2. **Mutual fund CATEGORIES** - Based on the question, identify appropriate categories:
+   - If risk tolerance mentioned:
+     * Low risk → Large Cap, Hybrid, Debt funds
+     * Medium risk → Flexi Cap, Multi Cap, Large & Mid Cap
+     * High risk → Mid Cap, Small Cap, Sectoral
+
+   - If investment horizon mentioned:
+     * Short term (1-3 years) → Large Cap, Hybrid, Debt
+     * Medium term (3-5 years) → Flexi Cap, Multi Cap, Large & Mid Cap
+     * Long term (5+ years) → Small Cap, Mid Cap, Sectoral, Momentum
+
+   - If goals mentioned:
+     * Wealth creation → Flexi Cap, Multi Cap, Small Cap
+     * Steady returns → Large Cap, Value/Dividend
+     * Aggressive growth → Small Cap, Momentum, Sectoral
+     * Balanced → Large & Mid Cap, Flexi Cap
+
+3. **Investment Profile** extracted:
+   - Risk: low/medium/high (if mentioned)
+   - Horizon: short/medium/long (if mentioned)
+   - Goal: wealth/steady/aggressive/balanced (if inferred)
+
+Return ONLY a JSON object like:
+{
+    "names": [...],
+    "categories": [...],
+    "risk": "low/medium/high or null",
+    "horizon": "short/medium/long or null",
+    "goal": "wealth/steady/aggressive/balanced or null"
+}
+
+Examples:
+- "5 years, medium risk" → categories: ["flexi cap", "multi cap", "large & mid cap"]
+- "high risk, long term" → categories: ["small cap", "mid cap", "momentum"]
+- "conservative investor" → categories: ["large cap", "hybrid"]
+"""
 
-    IMPORTANT: 
-    - Even vague MF queries like "tell me good funds" or "5 years medium risk" should be classified as "mf"
-    - Mark as "unknown" ONLY if truly not related to finance
-    - If it mentions risk/horizon/goals without specific fund names, still classify as "mf"
+MF_ANALYST_SYSTEM = """You are a mutual fund research analyst providing PRECISE recommendations.
+The user turn contains the user's question, the target categories and the analysed funds with their data.
 
-    For the given question, return a JSON object **only** (no extra commentary) with the following keys:
-    - category: one of the four categories above
-    - confidence: a float from 0.0 to 1.0 (how confident you are)
-    - missing_info: For MF queries, ask for: "specific investment goals, risk tolerance, or investment horizon" if none mentioned. For other categories, note what's missing or null.
-    - reasoning: a 1-2 sentence explanation for your classification
+**Instructions:**
+1. ALWAYS mention the EXACT fund names in your response
+2. Compare the specific funds listed with their actual data
+3. Explain WHY these funds suit the user's risk/horizon/goal
+4. Provide clear ranking: Best → Good → Average
+5. Give actionable recommendation with specific fund name(s)
+6. Mention key metrics (NAV, returns, AUM) for each fund
+7. Be concise but data-driven
 
-    Question: "{state["question"]}"
+**Output Format:**
+📊 **Analysis of [first target category, or "Selected"] Funds:**
 
-    Respond only with valid JSON.
-    """
+🥇 **Top Pick:** [Exact Fund Name]
+- NAV: [value] | 1Y: [%] | 3Y: [%] | 5Y: [%]
+- Why: [specific reasons - relates to user's risk/horizon/goal]
+
+🥈 **Runner-up:** [Exact Fund Name]
+- NAV: [value] | 1Y: [%] | 3Y: [%] | 5Y: [%]
+- Why: [specific reasons]
+
+💡 **Final Recommendation:**
+Invest in [Exact Fund Name(s)] because [clear reasoning that addresses user's investment profile]
 
-    resp = llm.invoke(prompt)
-    text = resp.content.strip()
+**Risk Note:** [Brief risk assessment matching user's risk tolerance]
+"""
+
+def _cached_system(text: str) -> SystemMessage:
+    """Static system block marked as a provider prompt-cache breakpoint."""
+    return SystemMessage(content=[{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}])
+
+def _invoke(node: str, prompt: str, system: Optional[str] = None):
+    """llm.invoke with an optional cached system prefix; records token usage per node."""
+    messages = [_cached_system(system), HumanMessage(content=prompt)] if system else prompt
+    return llm_gateway.invoke(node, llm, messages)
+
+def _cached_text(node: str, prompt: str, system: Optional[str] = None) -> str:
+    """_invoke through the response cache (llm runs at temperature 0)."""
+    def call():
+        resp = _invoke(node, prompt, system)
+        return resp.content.strip(), _usage(resp)
+    key = [system, prompt] if system else prompt
+    return llm_cache.get_or_call(node, LLM_MODEL, key, call, params={"temperature": 0})
+
+def _route(question: str) -> dict:
+    messages = [_cached_system(ROUTER_SYSTEM), HumanMessage(content=f'Question: "{question}"')]
+    def call():
+        out = llm_gateway.invoke("classifier", router_llm, messages)
+        if not out.get("parsed"):
+            raise ValueError(f"unparsable router output: {out.get('parsing_error')}")
+        return out["parsed"], _usage(out.get("raw"))
+    return llm_cache.get_or_call("classifier", LLM_MODEL, [ROUTER_SYSTEM, question], call,
+                                 params={"temperature": 0, "schema": ROUTE_SCHEMA["title"]})
+
+def classifier_node(state: AgentState) -> AgentState:
+    fast = fast_classifier.classify(state["question"])
+    if fast:
+        state["category"] = fast["category"]
+        state["confidence"] = fast["confidence"]
+        state["missing_info"] = None if state.get("clarification_used") else fast["missing_info"]
+        state["reasoning"] = fast["reasoning"]
+        if fast["symbol"]:
+            state["symbol"] = fast["symbol"]
+        state["entities_extracted"] = False
+
+        state["events"].append({
+            "type": "result",
+            "title": "Classifier",
+            "message": f"Category: {state['category']}, missing info: {state['missing_info']} (rule-based)"
+        })
+        return state
 
-    # Try to parse JSON
     try:
-        data = json.loads(text)
-    except Exception:
-        start = text.find('{')
-        end = text.rfind('}')
-        if start != -1 and end != -1:
-            try:
-                data = json.loads(text[start:end+1])
-            except Exception:
-                data = {}
-        else:
-            data = {}
+        data = _route(state["question"]) or {}
+    except Exception as e:
+        print("Router call failed:", e)
+        data = {}
 
     state["category"] = data.get("category", "unknown")
     state["confidence"] = data.get("confidence", 0.0)
@@ -212,6 +370,18 @@ def classifier_node(state: AgentState) -> AgentState:
         state["missing_info"] = None
     state["reasoning"] = data.get("reasoning", "")
 
+    symbol = (data.get("symbol") or "").strip().upper()
+    if symbol and symbol != "NONE" and len(symbol) <= 15:
+        state["symbol"] = symbol
+    state["mf_names"] = data.get("fund_names") or []
+    state["mf_categories"] = data.get("fund_categories") or []
+    state["mf_profile"] = {
+        "risk": data.get("risk"),
+        "horizon": data.get("horizon"),
+        "goal": data.get("goal"),
+    }
+    state["entities_extracted"] = bool(data)
+
     state["events"].append({
         "type": "result",
         "title": "Classifier",
@@ -304,7 +474,7 @@ def general_finance_handler(state: AgentState) -> AgentState:
     Question: "{state['question']}"
     """
     
-    result = finance_agent.invoke({
+    result = llm_gateway.invoke("general_finance_agent", finance_agent, {
         "messages": [{"role": "user", "content": prompt}]
     })
     
@@ -319,53 +489,9 @@ def general_finance_handler(state: AgentState) -> AgentState:
     })
     return state
 
-def extract_mf_name(state: AgentState) -> AgentState:
-    prompt = f"""
-    You are a mutual fund category expert. Analyze the user's question and extract:
-
-    1. **Mutual fund NAMES** (if mentioned) - extract full names like "HDFC Flexi Cap Fund", "Parag Parikh Flexi Cap"
-    
-    2. **Mutual fund CATEGORIES** - Based on the question, identify appropriate categories:
-       - If risk tolerance mentioned:
-         * Low risk → Large Cap, Hybrid, Debt funds
-         * Medium risk → Flexi Cap, Multi Cap, Large & Mid Cap
-         * High risk → Mid Cap, Small Cap, Sectoral
-       
-       - If investment horizon mentioned:
-         * Short term (1-3 years) → Large Cap, Hybrid, Debt
-         * Medium term (3-5 years) → Flexi Cap, Multi Cap, Large & Mid Cap
-         * Long term (5+ years) → Small Cap, Mid Cap, Sectoral, Momentum
-       
-       - If goals mentioned:
-         * Wealth creation → Flexi Cap, Multi Cap, Small Cap
-         * Steady returns → Large Cap, Value/Dividend
-         * Aggressive growth → Small Cap, Momentum, Sectoral
-         * Balanced → Large & Mid Cap, Flexi Cap
-
-    3. **Investment Profile** extracted:
-       - Risk: low/medium/high (if mentioned)
-       - Horizon: short/medium/long (if mentioned)
-       - Goal: wealth/steady/aggressive/balanced (if inferred)
-
-    Return ONLY a JSON object like:
-    {{
-        "names": [...],
-        "categories": [...],
-        "risk": "low/medium/high or null",
-        "horizon": "short/medium/long or null",
-        "goal": "wealth/steady/aggressive/balanced or null"
-    }}
-
-    Examples:
-    - "5 years, medium risk" → categories: ["flexi cap", "multi cap", "large & mid cap"]
-    - "high risk, long term" → categories: ["small cap", "mid cap", "momentum"]
-    - "conservative investor" → categories: ["large cap", "hybrid"]
-
-    Question: "{state['question']}"
-    """
-
-    resp = llm.invoke(prompt)
-    raw = resp.content.strip()
+def _extract_mf_entities(question: str) -> tuple[list, list, Optional[str], Optional[str], Optional[str]]:
+    """Standalone LLM extraction, used when the router did not run (rule-based classification)."""
+    raw = _cached_text("mf_extract", f'Question: "{question}"', system=MF_EXTRACT_SYSTEM)
     if raw.startswith("```"):
         raw = raw.strip("`")
         raw = raw.replace("json", "", 1).strip()
@@ -385,6 +511,19 @@ def extract_mf_name(state: AgentState) -> AgentState:
         horizon = None
         goal = None
 
+    return mf_names, mf_categories, risk_profile, horizon, goal
+
+def extract_mf_name(state: AgentState) -> AgentState:
+    if state.get("entities_extracted"):
+        profile = state.get("mf_profile") or {}
+        mf_names = state.get("mf_names") or []
+        mf_categories = state.get("mf_categories") or []
+        risk_profile = profile.get("risk")
+        horizon = profile.get("horizon")
+        goal = profile.get("goal")
+    else:
+        mf_names, mf_categories, risk_profile, horizon, goal = _extract_mf_entities(state["question"])
+
     # Auto-suggest categories if none extracted but risk/horizon/goal present
     if not mf_categories and (risk_profile or horizon or goal):
         mf_categories = auto_suggest_categories(risk_profile, horizon, goal)
@@ -535,43 +674,17 @@ I couldn't find specific mutual funds matching your query.
         fund_details.append(detail)
 
     funds_summary = "\n".join(fund_details)
-    category_context = f" for {', '.join(categories)}" if categories else ""
+    category_text = ", ".join(categories) if categories else "Selected"
 
-    prompt = f"""
-    You are a mutual fund research analyst providing PRECISE recommendations{category_context}.
-
-    User question: "{query}"
-
-    **Analyzed Funds:**
-    {funds_summary}
-
-    **Instructions:**
-    1. ALWAYS mention the EXACT fund names in your response
-    2. Compare the specific funds listed above with their actual data
-    3. Explain WHY these funds suit the user's risk/horizon/goal
-    4. Provide clear ranking: Best → Good → Average
-    5. Give actionable recommendation with specific fund name(s)
-    6. Mention key metrics (NAV, returns, AUM) for each fund
-    7. Be concise but data-driven
-
-    **Output Format:**
-    📊 **Analysis of {categories[0] if categories else 'Selected'} Funds:**
-
-    🥇 **Top Pick:** [Exact Fund Name]
-    - NAV: [value] | 1Y: [%] | 3Y: [%] | 5Y: [%]
-    - Why: [specific reasons - relates to user's risk/horizon/goal]
+    prompt = f"""User question: "{query}"
 
-    🥈 **Runner-up:** [Exact Fund Name]  
-    - NAV: [value] | 1Y: [%] | 3Y: [%] | 5Y: [%]
-    - Why: [specific reasons]
+Target categories: {category_text}
 
-    💡 **Final Recommendation:** 
-    Invest in [Exact Fund Name(s)] because [clear reasoning that addresses user's investment profile]
-
-    **Risk Note:** [Brief risk assessment matching user's risk tolerance]
-    """
+**Analyzed Funds:**
+{funds_summary}
+"""
 
-    resp = llm.invoke(prompt)
+    resp = _invoke("mf_handler", prompt, system=MF_ANALYST_SYSTEM)
     state["answer"] = resp.content.strip()
     
     state["events"].append({
@@ -583,6 +696,18 @@ I couldn't find specific mutual funds matching your query.
 
 # Stock handlers remain the same...
 def symbol_extractor(state: AgentState) -> AgentState:
+    if state.get("symbol"):
+        state["events"].append({
+            "type": "result",
+            "title": "Symbol Extractor",
+            "message": f"Extracted symbol: {state['symbol']}"
+        })
+        return state
+
+    if state.get("entities_extracted"):
+        state["missing_info"] = "Which stock symbol are you referring to?"
+        return state
+
     prompt = f"""
     You are an AI whose job is to extract the Stock Ticker Symbol from a user question, usually based on Indian stock market.
     Only reply with the symbol itself (e.g. TMPV, ADANIPOWER, RELIANCE).
@@ -591,8 +716,7 @@ def symbol_extractor(state: AgentState) -> AgentState:
     Question: "{state['question']}"
     """
 
-    resp = llm.invoke(prompt)
-    symbol = resp.content.strip().upper()
+    symbol = _cached_text("symbol_extractor", prompt).upper()
 
     if symbol == "NONE" or len(symbol) > 15: 
         state["missing_info"] = "Which stock symbol are you referring to?"
@@ -642,8 +766,7 @@ def bull_handler(state: AgentState) -> dict:
     Provide a bullish Buy recommendation if justified. Keep the output super concise under 100 words.
     """
 
-    resp = llm.invoke(prompt)
-    state["bull_analysis"] = resp.content.strip()
+    state["bull_analysis"] = _cached_text("bull_handler", prompt)
     bull_text = state["bull_analysis"]
     state["events"].append({
         "type": "result",
@@ -668,8 +791,7 @@ def bear_handler(state: AgentState) -> dict:
     Provide a Sell recommendation if justified. Keep the output super concise under 100 words.
     """
 
-    resp = llm.invoke(prompt)
-    state["bear_analysis"] = resp.content.strip()
+    state["bear_analysis"] = _cached_text("bear_handler", prompt)
     bear_text = state["bear_analysis"]
     state["events"].append({
         "type": "result",
@@ -707,7 +829,7 @@ def stock_handler(state: AgentState) -> AgentState:
     }}
     """
 
-    resp = llm.invoke(prompt)
+    resp = llm_gateway.invoke("stock_handler", llm, prompt)
     raw = resp.content.strip()
 
     # --- Robust JSON extraction ---
@@ -804,26 +926,7 @@ if __name__ == "__main__":
     question_input = input("\n\nEnter your question: ")
 
     graph = build_graph()
-    initial_state: AgentState = {
-        "question": question_input,
-        "category": "",
-        "missing_info": None,
-        "confidence": 0.0,
-        "reasoning": "",
-        "clarification_used": False,
-        "answer": "",
-        "status": "RUNNING",
-        "events": [],
-        "symbol": None,
-        "stock_sentiment": None,
-        "bull_analysis": None,
-        "bear_analysis": None,
-        "mf_matches": None,
-        "mf_categories": None,
-        "mf_scraped_data": None,
-        "should_scrape": False,
-        "trade_signal": None
-    }
+    initial_state = new_agent_state(question_input)
 
     result = graph.invoke(initial_state)
     print("\n\n✅ Final Answer:\n")
@@ -1,25 +1,67 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from flask_swagger_ui import get_swaggerui_blueprint
-from asgiref.wsgi import WsgiToAsgi
+import asyncio
+import json
 import uuid
 import threading
 import time
 import datetime
 import concurrent.futures
 import os
+from typing import Optional
 
-from trading_lang import build_graph, AgentState
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.openapi.docs import get_swagger_ui_html
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
+from trading_lang import build_async_graph, build_graph, new_agent_state
 
-flask_app = Flask(__name__)
-CORS(flask_app, resources={r"/*": {"origins": "*"}})
+
+class CompatJSONResponse(JSONResponse):
+    """Lenient serialisation like the old Flask jsonify (NaN allowed, unknown types as str)."""
+
+    def render(self, content) -> bytes:
+        return json.dumps(content, default=str).encode("utf-8")
+
+
+app = FastAPI(title="Finance Agent API", docs_url=None, redoc_url=None, openapi_url=None,
+              default_response_class=CompatJSONResponse)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+def jsonify(payload, status_code: int = 200) -> CompatJSONResponse:
+    return CompatJSONResponse(payload, status_code=status_code)
+
+
+async def _json_body(request: Request) -> Optional[dict]:
+    """Request JSON or None (missing / invalid body), like Flask's silent get_json."""
+    try:
+        data = await request.json()
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
 
 
 graph = build_graph()
 TASKS = {}
+
+# Questions run as coroutines on one event loop thread (async graph) unless
+# ASYNC_GRAPH=0, which falls back to one thread per question with the sync graph.
+# The graph loop is kept separate from the server loop so CPU-bound node work
+# (rule matching, HTML parsing) never stalls request handling or SSE streams.
+ASYNC_GRAPH = os.getenv("ASYNC_GRAPH", "1") == "1"
+async_graph = build_async_graph() if ASYNC_GRAPH else None
+_graph_loop = asyncio.new_event_loop() if ASYNC_GRAPH else None
+if _graph_loop:
+    threading.Thread(target=_graph_loop.run_forever, name="graph-loop", daemon=True).start()
 _market_cache: dict = {}
 
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Connection": "keep-alive",
+}
+
 
 # =============================
 # Swagger Configuration
@@ -30,24 +72,13 @@ SWAGGER_URL = "/docs"
 API_URL = "/swagger.json"
 
 
-swaggerui_blueprint = get_swaggerui_blueprint(
-    SWAGGER_URL,
-    API_URL,
-    config={
-        "app_name": "Finance Agent API"
-    }
-)
-
-
-flask_app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
-
-
-
+@app.get(SWAGGER_URL, include_in_schema=False)
+async def swagger_ui():
+    return get_swagger_ui_html(openapi_url=API_URL, title="Finance Agent API")
 
 
-
-@flask_app.route("/swagger.json")
-def swagger_spec():
+@app.get(API_URL, include_in_schema=False)
+async def swagger_spec():
     return jsonify({
         "openapi": "3.0.0",
         "info": {
@@ -133,9 +164,6 @@ def swagger_spec():
 
 
 
-
-
-
 # -----------------------------
 # Helpers
 # -----------------------------
@@ -144,87 +172,73 @@ def swagger_spec():
 def run_graph(task_id: str):
     state = TASKS[task_id]["state"]
     try:
-        final_state = graph.invoke(state)
-        final_state["status"] = "COMPLETED"
-        TASKS[task_id]["state"] = final_state
+        _complete_task(task_id, graph.invoke(state))
+    except Exception as e:
+        _fail_task(task_id, state, e)
 
 
+async def arun_graph(task_id: str):
+    state = TASKS[task_id]["state"]
+    try:
+        _complete_task(task_id, await async_graph.ainvoke(state))
     except Exception as e:
-        if str(e) == "WAITING_FOR_CLARIFICATION":
-            state["status"] = "WAITING"
-            TASKS[task_id]["state"] = state
-        else:
-            state["status"] = "FAILED"
-            state["events"].append({
-                "type": "error",
-                "message": str(e)
-            })
-            TASKS[task_id]["state"] = state
+        _fail_task(task_id, state, e)
+
+
+def _complete_task(task_id: str, final_state: dict):
+    final_state["status"] = "COMPLETED"
+    TASKS[task_id]["state"] = final_state
 
 
+def _fail_task(task_id: str, state: dict, e: Exception):
+    if str(e) == "WAITING_FOR_CLARIFICATION":
+        state["status"] = "WAITING"
+        TASKS[task_id]["state"] = state
+    else:
+        state["status"] = "FAILED"
+        state["events"].append({
+            "type": "error",
+            "message": str(e)
+        })
+        TASKS[task_id]["state"] = state
 
 
 def start_background_task(task_id: str):
+    if _graph_loop:
+        asyncio.run_coroutine_threadsafe(arun_graph(task_id), _graph_loop)
+        return
     thread = threading.Thread(target=run_graph, args=(task_id,))
     thread.daemon = True
     thread.start()
 
 
-
-
 # -----------------------------
 # Routes
 # -----------------------------
 
 
-@flask_app.route("/ask", methods=["POST"])
-def ask_agent():
-    data = request.get_json()
+@app.post("/ask")
+async def ask_agent(request: Request):
+    data = await _json_body(request)
     if not data or "question" not in data:
-        return jsonify({"success": False, "error": "Missing question"}), 400
-
+        return jsonify({"success": False, "error": "Missing question"}, 400)
 
     task_id = str(uuid.uuid4())
-
-
-    initial_state: AgentState = {
-        "question": data["question"],
-        "category": "",
-        "missing_info": None,
-        "confidence": 0.0,
-        "reasoning": "",
-        "clarification_used": False,
-        "answer": "",
-        "status": "RUNNING",
-        "events": [],
-        "symbol": None,
-        "stock_sentiment": None,
-        "bull_analysis": None,
-        "bear_analysis": None,
-        "mf_matches": None,
-        "mf_categories": None,
-        "mf_scraped_data": None,
-        "should_scrape": False
-    }
-
+    initial_state = new_agent_state(data["question"])
 
     TASKS[task_id] = {"state": initial_state}
     start_background_task(task_id)
 
-
     return jsonify({
         "task_id": task_id,
         "success": True
     })
 
 
-
-
-@flask_app.route("/get/<task_id>", methods=["GET"])
-def get_task_status(task_id):
+@app.get("/get/{task_id}")
+async def get_task_status(task_id: str):
     if task_id not in TASKS:
-        return jsonify({"error": "Task not found"}), 404
-
+        return jsonify({"error": "Task not found"}, 404)
 
     state = TASKS[task_id]["state"]
     return jsonify({
@@ -235,95 +249,85 @@ def get_task_status(task_id):
     })
 
 
-
-
-@flask_app.route("/clarify", methods=["POST"])
-def send_clarifier():
-    data = request.get_json()
+@app.post("/clarify")
+async def send_clarifier(request: Request):
+    data = await _json_body(request)
     if not data or "task_id" not in data or "answer" not in data:
-        return jsonify({"success": False, "error": "Invalid request"}), 400
-
+        return jsonify({"success": False, "error": "Invalid request"}, 400)
 
     task_id = data["task_id"]
     answer = data["answer"]
 
-
     task = TASKS.get(task_id)
     if not task:
-        return jsonify({"error": "Task not found"}), 404
-
+        return jsonify({"error": "Task not found"}, 404)
 
     state = task["state"]
     state["question"] = state["question"] + " | " + answer
     state["clarification_used"] = True
     state["status"] = "RUNNING"
 
-
     TASKS[task_id]["state"] = state
     start_background_task(task_id)
 
-
     return jsonify({"success": True})
 
 
-
-
 # -----------------------------
 # Portfolio Routes
 # -----------------------------
+# Service calls (yfinance, scraping, sync SDKs) are blocking; they run in the
+# threadpool so the event loop stays free for streams and fast routes.
 
 
-@flask_app.route("/portfolio/groww/holdings", methods=["GET"])
-def groww_holdings():
+@app.get("/portfolio/groww/holdings")
+async def groww_holdings():
     from portfolio_service import fetch_groww_holdings
-    return jsonify(fetch_groww_holdings())
-
-
+    return jsonify(await run_in_threadpool(fetch_groww_holdings))
 
 
-@flask_app.route("/portfolio/groww/mf", methods=["GET"])
-def groww_mf():
+@app.get("/portfolio/groww/mf")
+async def groww_mf():
     from portfolio_service import fetch_groww_mf
-    return jsonify(fetch_groww_mf())
+    return jsonify(await run_in_threadpool(fetch_groww_mf))
 
 
-
-
-@flask_app.route("/portfolio/price/<symbol>", methods=["GET"])
-def stock_price(symbol):
+@app.get("/portfolio/price/{symbol}")
+async def stock_price(symbol: str):
     from portfolio_service import fetch_live_price
-    return jsonify(fetch_live_price(symbol))
-
+    return jsonify(await run_in_threadpool(fetch_live_price, symbol))
 
 
-
-@flask_app.route("/portfolio/prices", methods=["POST"])
-def bulk_prices():
+@app.post("/portfolio/prices")
+async def bulk_prices(request: Request):
     from portfolio_service import fetch_bulk_prices
-    data = request.get_json()
+    data = await _json_body(request)
     symbols = data.get("symbols", []) if data else []
     if not symbols:
-        return jsonify({"success": False, "error": "No symbols provided"}), 400
-    return jsonify(fetch_bulk_prices(symbols))
-
+        return jsonify({"success": False, "error": "No symbols provided"}, 400)
+    return jsonify(await run_in_threadpool(fetch_bulk_prices, symbols))
 
 
-
-@flask_app.route("/api/portfolio/deep-analyse", methods=["POST"])
-def portfolio_deep_analyse():
+@app.post("/api/portfolio/deep-analyse")
+async def portfolio_deep_analyse(request: Request):
     from portfolio_analysis import compute_portfolio_metrics
-    data = request.get_json() or {}
+    data = await _json_body(request) or {}
     try:
-        result = compute_portfolio_metrics(
+        result = await run_in_threadpool(
+            compute_portfolio_metrics,
             stocks=data.get("stocks", []),
             mutual_funds=data.get("mutualFunds", []),
             benchmark=data.get("benchmark", "nifty50"),
         )
         return jsonify(result)
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+        return jsonify({"success": False, "error": str(e)}, 500)
 
 
+@app.get("/api/portfolio/deep-analyse/stats")
+async def portfolio_deep_analyse_stats():
+    from portfolio_analysis import get_stats
+    return jsonify(await run_in_threadpool(get_stats))
 
 
 # -----------------------------
@@ -331,51 +335,48 @@ def portfolio_deep_analyse():
 # -----------------------------
 
 
-@flask_app.route("/global/market-data", methods=["GET"])
-def global_market_data():
+@app.get("/global/market-data")
+async def global_market_data():
     from global_market_service import fetch_global_market_data
-    return jsonify(fetch_global_market_data())
-
+    return jsonify(await run_in_threadpool(fetch_global_market_data))
 
 
-
-@flask_app.route("/global/fii-dii", methods=["GET"])
-def fii_dii_data():
+@app.get("/global/fii-dii")
+async def fii_dii_data():
     from global_market_service import fetch_fii_dii
-    return jsonify(fetch_fii_dii())
-
-
+    return jsonify(await run_in_threadpool(fetch_fii_dii))
 
 
 # -----------------------------
 # Research Routes
 # -----------------------------
 
-@flask_app.route("/api/research/pulse", methods=["GET"])
-def research_pulse():
+@app.get("/api/research/pulse")
+async def research_pulse():
     from research_service import get_pulse_data
     try:
-        return jsonify(get_pulse_data())
+        return jsonify(await run_in_threadpool(get_pulse_data))
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+        return jsonify({"success": False, "error": str(e)}, 500)
 
 
-@flask_app.route("/api/research/analyse", methods=["POST"])
-def research_analyse():
+@app.post("/api/research/analyse")
+async def research_analyse(request: Request):
     from research_service import analyse_stock
-    data   = request.get_json() or {}
+    data   = await _json_body(request) or {}
     symbol = data.get("symbol", "").strip()
     if not symbol:
-        return jsonify({"success": False, "error": "No symbol provided"}), 400
-    return jsonify(analyse_stock(symbol))
+        return jsonify({"success": False, "error": "No symbol provided"}, 400)
+    return jsonify(await run_in_threadpool(analyse_stock, symbol))
 
 
-@flask_app.route("/api/research/suggest", methods=["POST"])
-def research_suggest():
+@app.post("/api/research/suggest")
+async def research_suggest(request: Request):
     from research_service import suggest_stocks
-    data = request.get_json() or {}
+    data = await _json_body(request) or {}
     try:
-        result = suggest_stocks(
+        result = await run_in_threadpool(
+            suggest_stocks,
             amount          = int(data.get("amount", 50000)),
             horizon         = data.get("horizon", "Medium"),
             risk            = data.get("risk", "Moderate"),
@@ -385,32 +386,32 @@ def research_suggest():
         )
         return jsonify({"success": True, "suggestions": result})
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+        return jsonify({"success": False, "error": str(e)}, 500)
 
 
-
-@flask_app.route("/api/research/mf/pulse", methods=["GET"])
-def research_mf_pulse():
+@app.get("/api/research/mf/pulse")
+async def research_mf_pulse():
     from mf_service import get_mf_pulse_data
-    return jsonify(get_mf_pulse_data())
+    return jsonify(await run_in_threadpool(get_mf_pulse_data))
 
 
-@flask_app.route("/api/research/mf/analyse", methods=["POST"])
-def research_mf_analyse():
+@app.post("/api/research/mf/analyse")
+async def research_mf_analyse(request: Request):
     from mf_service import analyse_mf
-    data  = request.get_json() or {}
+    data  = await _json_body(request) or {}
     query = data.get("query", "").strip()
     if not query:
-        return jsonify({"success": False, "error": "No query provided"}), 400
-    return jsonify(analyse_mf(query))
+        return jsonify({"success": False, "error": "No query provided"}, 400)
+    return jsonify(await run_in_threadpool(analyse_mf, query))
 
 
-@flask_app.route("/api/research/mf/suggest", methods=["POST"])
-def research_mf_suggest():
+@app.post("/api/research/mf/suggest")
+async def research_mf_suggest(request: Request):
     from mf_service import suggest_mfs
-    data = request.get_json() or {}
+    data = await _json_body(request) or {}
     try:
-        result = suggest_mfs(
+        result = await run_in_threadpool(
+            suggest_mfs,
             amount          = int(data.get("amount", 50000)),
             horizon         = data.get("horizon", "Medium"),
             risk            = data.get("risk", "Moderate"),
@@ -420,7 +421,7 @@ def research_mf_suggest():
         )
         return jsonify({"success": True, "suggestions": result})
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+        return jsonify({"success": False, "error": str(e)}, 500)
 
 
 # -----------------------------
@@ -473,24 +474,27 @@ def _fetch_one(item: dict) -> dict:
         return {**item, "price": 0.0, "change": 0.0, "changePct": 0.0, "error": str(e)}
 
 
-@flask_app.route("/api/markets", methods=["GET"])
-def market_data():
-    global _market_cache
-    now = time.time()
-    if _market_cache.get("data") and (now - _market_cache.get("ts", 0)) < 300:
-        return jsonify(_market_cache["data"])
-
+def _market_payload() -> dict:
     all_items = _INDICES + _COMMODITIES
     with concurrent.futures.ThreadPoolExecutor(max_workers=10) as ex:
         results = list(ex.map(_fetch_one, all_items))
 
     n = len(_INDICES)
-    payload = {
+    return {
         "success":    True,
         "indices":    results[:n],
         "commodities": results[n:],
         "timestamp":  datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z"),
     }
+
+
+@app.get("/api/markets")
+async def market_data():
+    now = time.time()
+    if _market_cache.get("data") and (now - _market_cache.get("ts", 0)) < 300:
+        return jsonify(_market_cache["data"])
+
+    payload = await run_in_threadpool(_market_payload)
     _market_cache["data"] = payload
     _market_cache["ts"]   = now
     return jsonify(payload)
@@ -500,221 +504,264 @@ def market_data():
 # Agent Routes
 # -----------------------------
 
-@flask_app.route("/api/agent/status", methods=["GET"])
-def agent_status():
+@app.get("/api/agent/status")
+async def agent_status(email: str = ""):
     from agent_service import get_agent_status
-    email = request.args.get("email", "").strip().lower()
+    email = email.strip().lower()
     if not email:
-        return jsonify({"status": "error", "detail": "email param required"}), 400
-    return jsonify(get_agent_status(email))
+        return jsonify({"status": "error", "detail": "email param required"}, 400)
+    return jsonify(await run_in_threadpool(get_agent_status, email))
 
 
-@flask_app.route("/api/agent/onboard", methods=["POST"])
-def agent_onboard():
+@app.post("/api/agent/onboard")
+async def agent_onboard(request: Request):
     from agent_service import onboard_user
-    data     = request.get_json() or {}
+    data     = await _json_body(request) or {}
     email    = (data.get("email") or "").strip().lower()
     holdings = data.get("holdings", {})
     profile  = data.get("profile", {})
     if not email:
-        return jsonify({"success": False, "error": "email required"}), 400
-    return jsonify(onboard_user(email, holdings, profile))
+        return jsonify({"success": False, "error": "email required"}, 400)
+    return jsonify(await run_in_threadpool(onboard_user, email, holdings, profile))
 
 
-@flask_app.route("/api/agent/dashboard", methods=["GET"])
-def agent_dashboard():
+@app.get("/api/agent/dashboard")
+async def agent_dashboard(email: str = ""):
     from agent_service import get_dashboard
-    email = request.args.get("email", "").strip().lower()
+    email = email.strip().lower()
     if not email:
-        return jsonify({"success": False, "error": "email required"}), 400
-    return jsonify(get_dashboard(email))
+        return jsonify({"success": False, "error": "email required"}, 400)
+    return jsonify(await run_in_threadpool(get_dashboard, email))
 
 
-@flask_app.route("/api/agent/stream", methods=["GET"])
-def agent_stream():
-    from flask import Response, stream_with_context
+@app.get("/api/agent/stream")
+async def agent_stream(request: Request, email: str = "", lastEventId: str = ""):
     from agent_service import subscribe_sse, unsubscribe_sse
-    import json as _json
+    from sse_hub import parse_last_event_id
 
-    email = request.args.get("email", "").strip().lower()
+    email = email.strip().lower()
     if not email:
-        return jsonify({"error": "email required"}), 400
+        return jsonify({"error": "email required"}, 400)
 
-    q = subscribe_sse(email)
+    # Browsers send Last-Event-ID on automatic reconnects; the query param covers manual ones
+    last_id = parse_last_event_id(request.headers.get("last-event-id") or lastEventId)
+    sub = subscribe_sse(email, last_id)
 
-    def event_stream():
+    async def event_stream():
         # heartbeat first
         yield "data: {\"type\":\"connected\"}\n\n"
         try:
             while True:
-                try:
-                    event = q.get(timeout=25)
-                    yield f"data: {_json.dumps(event)}\n\n"
-                except Exception:
+                frames = await sub.next(timeout=25)
+                if frames:
+                    yield "".join(frames)
+                else:
                     # send keepalive ping
                     yield "data: {\"type\":\"ping\"}\n\n"
-        except GeneratorExit:
-            pass
         finally:
-            unsubscribe_sse(email, q)
-
-    return Response(
-        stream_with_context(event_stream()),
-        mimetype="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-        },
-    )
+            unsubscribe_sse(sub)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/api/agent/activity")
+async def agent_activity(email: str = "", after: Optional[int] = None, before: Optional[int] = None,
+                         limit: int = 50):
+    from agent_service import get_activity
+    email = email.strip().lower()
+    if not email:
+        return jsonify({"success": False, "error": "email required"}, 400)
+    return jsonify(await run_in_threadpool(get_activity, email, after, before, limit))
 
 
-@flask_app.route("/api/agent/analyse", methods=["POST"])
-def agent_analyse():
+@app.post("/api/agent/analyse")
+async def agent_analyse(request: Request):
     from agent_service import trigger_analyse
-    data  = request.get_json() or {}
+    data  = await _json_body(request) or {}
     email = (data.get("email") or "").strip().lower()
     if not email:
-        return jsonify({"success": False, "error": "email required"}), 400
-    return jsonify(trigger_analyse(email))
+        return jsonify({"success": False, "error": "email required"}, 400)
+    return jsonify(await run_in_threadpool(trigger_analyse, email))
 
 
-@flask_app.route("/api/agent/report/send", methods=["POST"])
-def agent_report_send():
-    from agent_service import get_dashboard, _load_index, _load_user
+@app.post("/api/agent/report/send")
+async def agent_report_send(request: Request):
+    import user_store
     from agent_email import send_report
-    data  = request.get_json() or {}
+    data  = await _json_body(request) or {}
     email = (data.get("email") or "").strip().lower()
     if not email:
-        return jsonify({"success": False, "error": "email required"}), 400
+        return jsonify({"success": False, "error": "email required"}, 400)
     try:
-        index = _load_index()
-        if email not in index or not index[email].get("isDataPresent"):
-            return jsonify({"success": False, "error": "not onboarded"}), 400
-        user = _load_user(index[email]["dataFile"])
+        meta = user_store.get_meta(email)
+        if meta is None or not meta["isDataPresent"]:
+            return jsonify({"success": False, "error": "not onboarded"}, 400)
+        user = user_store.load_user(email)
         if not user:
-            return jsonify({"success": False, "error": "user data missing"}), 404
-        send_report(email, user)
+            return jsonify({"success": False, "error": "user data missing"}, 404)
+        await run_in_threadpool(send_report, email, user)
         return jsonify({"success": True})
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+        return jsonify({"success": False, "error": str(e)}, 500)
 
 
-@flask_app.route("/api/agent/chat", methods=["POST"])
-def agent_chat():
+@app.post("/api/agent/chat")
+async def agent_chat(request: Request):
     from agent_service import extract_profile_with_llm
-    data       = request.get_json() or {}
+    data       = await _json_body(request) or {}
     transcript = data.get("transcript", "")
     if not transcript:
-        return jsonify({"success": False, "error": "transcript required"}), 400
-    profile = extract_profile_with_llm(transcript)
+        return jsonify({"success": False, "error": "transcript required"}, 400)
+    profile = await run_in_threadpool(extract_profile_with_llm, transcript)
     return jsonify({"success": True, "profile": profile})
 
 
-@flask_app.route("/api/agent/history", methods=["GET"])
-def agent_price_history():
+def _price_history(symbol: str):
+    import yfinance as yf
+    hist = yf.Ticker(symbol + ".NS").history(period="1mo", interval="1d")
+    return [
+        {"date": str(idx.date()), "close": round(float(row["Close"]), 2)}
+        for idx, row in hist.iterrows()
+    ]
+
+
+@app.get("/api/agent/history")
+async def agent_price_history(symbol: str = ""):
     """Returns 30-day daily close prices for a given NSE stock symbol."""
-    symbol = request.args.get("symbol", "").strip().upper()
+    symbol = symbol.strip().upper()
     if not symbol:
-        return jsonify({"success": False, "error": "symbol required"}), 400
+        return jsonify({"success": False, "error": "symbol required"}, 400)
     try:
-        import yfinance as yf
-        ns   = symbol + ".NS"
-        hist = yf.Ticker(ns).history(period="1mo", interval="1d")
-        if hist.empty:
-            return jsonify({"success": False, "error": "no data"}), 404
-        data = [
-            {"date": str(idx.date()), "close": round(float(row["Close"]), 2)}
-            for idx, row in hist.iterrows()
-        ]
+        data = await run_in_threadpool(_price_history, symbol)
+        if not data:
+            return jsonify({"success": False, "error": "no data"}, 404)
         return jsonify({"success": True, "symbol": symbol, "data": data})
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+        return jsonify({"success": False, "error": str(e)}, 500)
+
 
+CHAT_SYSTEM_PROMPT = "\n".join([
+    "You are an expert AI investment advisor specializing in Indian equity markets (NSE/BSE), mutual funds, bonds, ETFs, SIPs/SWPs, portfolio management and global financial markets.",
+    "",
+    "STRICT RULES:",
+    "1. ONLY answer questions about: stocks, mutual funds, bonds, portfolio analysis, asset allocation, financial planning, market trends, company fundamentals, technical analysis, IPOs, SIPs, SWPs, LTCG/STCG tax, economic indicators and financial instruments.",
+    "2. For ANY off-topic question respond exactly: \"I'm your dedicated investment assistant. I can only help with investment and finance-related queries. What would you like to know about your portfolio or the markets?\"",
+    "3. Always note that responses are educational analysis, not personalized financial advice.",
+    "4. Use Indian market context when relevant - INR, SEBI regulations, NSE/BSE conventions, Indian tax rules (LTCG 12.5% above ₹1.25L, STCG 20%).",
+    "5. Be concise and structured. Use bullet points for complex answers. Lead with the most actionable insight.",
+])
 
-@flask_app.route("/api/chat", methods=["POST"])
-def investment_chat():
-    import json as _json
-    from flask import stream_with_context, Response as FlaskResponse
 
-    data         = request.get_json() or {}
+@app.post("/api/chat")
+async def investment_chat(request: Request):
+    import llm_gateway
+
+    data         = await _json_body(request) or {}
     messages     = data.get("messages", [])
     context_text = data.get("context", "")
 
     if not messages:
-        return jsonify({"error": "messages required"}), 400
-
-    api_key  = os.getenv("ANTHROPIC_API_KEY", "")
-    resource = os.getenv("ANTHROPIC_FOUNDRY_RESOURCE", "")
-
-    system_lines = [
-        "You are an expert AI investment advisor specializing in Indian equity markets (NSE/BSE), mutual funds, bonds, ETFs, SIPs/SWPs, portfolio management and global financial markets.",
-        "",
-        "STRICT RULES:",
-        "1. ONLY answer questions about: stocks, mutual funds, bonds, portfolio analysis, asset allocation, financial planning, market trends, company fundamentals, technical analysis, IPOs, SIPs, SWPs, LTCG/STCG tax, economic indicators and financial instruments.",
-        "2. For ANY off-topic question respond exactly: \"I'm your dedicated investment assistant. I can only help with investment and finance-related queries. What would you like to know about your portfolio or the markets?\"",
-        "3. Always note that responses are educational analysis, not personalized financial advice.",
-        "4. Use Indian market context when relevant - INR, SEBI regulations, NSE/BSE conventions, Indian tax rules (LTCG 12.5% above ₹1.25L, STCG 20%).",
-        "5. Be concise and structured. Use bullet points for complex answers. Lead with the most actionable insight.",
-    ]
-    if context_text:
-        system_lines += [
-            "",
-            "PORTFOLIO CONTEXT (use this for personalized, relevant answers):",
-            context_text,
-        ]
+        return jsonify({"error": "messages required"}, 400)
 
-    system = "\n".join(system_lines)
-
-    def generate():
+    system = [{"type": "text", "text": CHAT_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+    if context_text:
+        # Second breakpoint: the portfolio context is stable across the turns of a conversation
+        system.append({
+            "type": "text",
+            "text": "PORTFOLIO CONTEXT (use this for personalized, relevant answers):\n" + context_text,
+            "cache_control": {"type": "ephemeral"},
+        })
+
+    async def generate():
         try:
-            import anthropic as _anthropic
-            client = (
-                _anthropic.AnthropicFoundry(api_key=api_key, resource=resource)
-                if resource else _anthropic.Anthropic(api_key=api_key)
-            )
-            with client.messages.stream(
+            async with llm_gateway.astream(
+                "chat",
                 model="claude-sonnet-4-6",
                 max_tokens=1024,
                 system=system,
                 messages=messages,
             ) as stream:
-                for text in stream.text_stream:
-                    yield f"data: {_json.dumps({'text': text})}\n\n"
+                async for text in stream.text_stream:
+                    yield f"data: {json.dumps({'text': text})}\n\n"
             yield "data: [DONE]\n\n"
         except Exception as exc:
-            yield f"data: {_json.dumps({'error': str(exc)})}\n\n"
+            yield f"data: {json.dumps({'error': str(exc)})}\n\n"
             yield "data: [DONE]\n\n"
 
-    return FlaskResponse(
-        stream_with_context(generate()),
-        content_type="text/event-stream",
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@flask_app.route("/api/agent/reset", methods=["PUT"])
-def agent_reset():
+@app.put("/api/agent/reset")
+async def agent_reset(request: Request):
     from agent_service import reset_user
-    data  = request.get_json() or {}
+    data  = await _json_body(request) or {}
     email = (data.get("email") or "").strip().lower()
     if not email:
-        return jsonify({"success": False, "error": "email required"}), 400
-    return jsonify(reset_user(email))
+        return jsonify({"success": False, "error": "email required"}, 400)
+    return jsonify(await run_in_threadpool(reset_user, email))
+
+
+@app.get("/api/agent/stream-stats")
+async def agent_stream_stats():
+    import event_bus
+    from sse_hub import hub
+    return jsonify({**hub.get_stats(), "bus": event_bus.get_stats()})
+
+
+@app.get("/api/agent/scheduler-stats")
+async def agent_scheduler_stats():
+    from agent_service import get_scheduler_stats
+    return jsonify(get_scheduler_stats())
+
+
+@app.get("/api/agent/mail-stats")
+async def agent_mail_stats():
+    from agent_email import get_mail_stats
+    return jsonify(await run_in_threadpool(get_mail_stats))
+
+
+# -----------------------------
+# LLM Routes
+# -----------------------------
+
+@app.get("/api/llm/cache-stats")
+async def llm_cache_stats():
+    from llm_cache import get_stats
+    return jsonify(get_stats())
+
+
+@app.get("/api/llm/usage")
+async def llm_usage_stats():
+    from llm_usage import get_usage
+    return jsonify(get_usage())
+
+
+@app.get("/api/llm/gateway-stats")
+async def llm_gateway_stats():
+    from llm_gateway import get_stats
+    return jsonify(get_stats())
 
 
 # -----------------------------
 # Entry Point
 # -----------------------------
 
-# Start autonomous agent loop
-from agent_service import start_agent_loop
-start_agent_loop()
+# Receive agent events from every publisher (this process or agent_worker.py)
+import event_bus
+from sse_hub import hub as _sse_hub
+event_bus.attach(_sse_hub.publish)
 
-# Wrap Flask app with ASGI adapter for uvicorn
-app = WsgiToAsgi(flask_app)
+# Start autonomous agent loop; set AGENT_LOOP_ENABLED=0 on API workers when
+# agent_worker.py runs the loop in its own process
+if os.getenv("AGENT_LOOP_ENABLED", "1") == "1":
+    from agent_service import start_agent_loop
+    start_agent_loop()
 
 
 if __name__ == "__main__":
-    flask_app.run(host="0.0.0.0", port=8000, debug=True)
-
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
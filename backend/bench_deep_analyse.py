@@ -0,0 +1,90 @@
+"""
+bench_deep_analyse.py - Latency of /api/portfolio/deep-analyse by portfolio size.
+
+Primes a throwaway price_history cache (AGENT_HISTORY_DB in a temp dir) with
+HISTORY_DAYS of synthetic closes for the benchmark and every symbol, so no
+network is touched, then times compute_portfolio_metrics() for each size:
+  warm  - history served from the SQLite cache (the normal path once a
+          symbol has been fetched within AGENT_HISTORY_TTL)
+  cold  - first call for a universe: also misses the risk_analytics
+          covariance cache
+
+Usage:
+    python bench_deep_analyse.py [--sizes 15,50,100,250] [--repeat 20]
+Output:
+    p50 / p95 / max seconds per size, cold and warm
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+os.environ.setdefault("AGENT_HISTORY_DB", os.path.join(tempfile.mkdtemp(prefix="bench-deep-"), "history.db"))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import portfolio_analysis  # noqa: E402
+import price_history  # noqa: E402
+import risk_analytics  # noqa: E402
+
+
+def _prime(symbols: list[str], benchmark: str, seed: int = 7) -> None:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=datetime.date.today(), periods=int(portfolio_analysis.HISTORY_DAYS * 5 / 7))
+    market = rng.normal(0.0004, 0.01, len(dates))
+    series = {benchmark: pd.Series(100 * np.exp(np.cumsum(market)), index=dates)}
+    for sym in symbols:
+        beta = rng.uniform(0.5, 1.5)
+        path = np.cumsum(beta * market + rng.normal(0, 0.015, len(dates)))
+        series[sym + ".NS"] = pd.Series(rng.uniform(100, 3000) * np.exp(path), index=dates)
+    start = datetime.date.today() - datetime.timedelta(days=portfolio_analysis.HISTORY_DAYS)
+    price_history._store(series, {t: start for t in series})
+
+
+def _stocks(symbols: list[str], seed: int) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today()
+    return [{"symbol": s, "name": s, "qty": int(rng.integers(1, 200)),
+             "avgBuyPrice": round(float(rng.uniform(100, 3000)), 2),
+             "currentValue": round(float(rng.uniform(1e4, 5e5)), 2),
+             "buyDate": (today - datetime.timedelta(days=int(rng.integers(30, 900)))).isoformat()}
+            for s in symbols]
+
+
+def _summary(samples: list[float]) -> str:
+    s = sorted(samples)
+    return (f"p50 {s[len(s) // 2]:7.3f}s  p95 {s[min(len(s) - 1, int(len(s) * 0.95))]:7.3f}s"
+            f"  max {s[-1]:7.3f}s")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="15,50,100,250")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    sizes = [int(n) for n in args.sizes.split(",")]
+
+    benchmark = portfolio_analysis.BENCHMARK_SYMBOLS["nifty50"]
+    universe = [f"SYM{i:03d}" for i in range(max(sizes) * 2)]
+    _prime(universe, benchmark)
+
+    print(f"deep-analyse latency, {args.repeat} runs per size (synthetic cache, no network)")
+    for n in sizes:
+        cold, warm = [], []
+        for r in range(args.repeat):
+            picked = list(np.random.default_rng(r).choice(universe, n, replace=False))
+            stocks = _stocks(picked, r)
+            for bucket in (cold, warm):          # first run misses the covariance cache, second hits it
+                t0 = time.perf_counter()
+                out = portfolio_analysis.compute_portfolio_metrics(stocks, [], "nifty50")
+                bucket.append(time.perf_counter() - t0)
+                assert out["success"] and out["risk"] is not None, out.get("error")
+        print(f"  {n:>4} stocks  cold {_summary(cold)}   warm {_summary(warm)}")
+    print(f"  covariance cache: {risk_analytics.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+bench_general_finance.py - Latency / token benchmark for the general finance handler.
+
+Runs a fixed question set through both answer paths of trading_lang:
+  retrieval  - retrieve first, answer in one LLM call (general_finance_fast)
+  agent      - ReAct loop with get_finance_info as a tool (general_finance_agent)
+
+Usage:
+    python bench_general_finance.py [--rounds 2]
+Output:
+    per-question table + per-path summary (mean / p95 latency, tokens, LLM calls)
+"""
+
+import argparse
+import statistics
+import time
+
+from trading_lang import (
+    GENERAL_FINANCE_MIN_RELEVANCE,
+    general_finance_agent,
+    general_finance_fast,
+    retrieve_finance_context,
+)
+
+QUESTIONS = [
+    "How much emergency fund should I keep?",
+    "What is the difference between old and new tax regime?",
+    "How does term insurance differ from endowment plans?",
+    "What is a demat account and how do I open one?",
+    "How should I split my salary between saving and spending?",
+    "What are the tax benefits under section 80C?",
+    "Is it better to prepay a home loan or invest the surplus?",
+    "What does NSDL do for investors?",
+]
+
+
+def _p95(values: list[float]) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+def run(rounds: int) -> None:
+    rows = []
+    totals = {"retrieval": [], "agent": []}
+
+    for _ in range(rounds):
+        for q in QUESTIONS:
+            t0 = time.perf_counter()
+            chunks, relevance = retrieve_finance_context(q)
+            _, fast_usage = general_finance_fast(q, chunks)
+            fast_ms = (time.perf_counter() - t0) * 1000
+
+            t0 = time.perf_counter()
+            _, agent_usage = general_finance_agent(q)
+            agent_ms = (time.perf_counter() - t0) * 1000
+
+            totals["retrieval"].append((fast_ms, fast_usage))
+            totals["agent"].append((agent_ms, agent_usage))
+            rows.append((q, relevance, fast_ms, fast_usage, agent_ms, agent_usage))
+
+    print(f"\nRelevance threshold for fast path: {GENERAL_FINANCE_MIN_RELEVANCE}\n")
+    print(f"{'question':<58} {'rel':>5} {'fast ms':>9} {'fast tok':>9} {'agent ms':>9} {'agent tok':>10}")
+    for q, rel, f_ms, f_u, a_ms, a_u in rows:
+        f_tok = f_u["input_tokens"] + f_u["output_tokens"]
+        a_tok = a_u["input_tokens"] + a_u["output_tokens"]
+        print(f"{q[:58]:<58} {rel:>5.2f} {f_ms:>9.0f} {f_tok:>9} {a_ms:>9.0f} {a_tok:>10}")
+
+    print()
+    for path, samples in totals.items():
+        lat = [ms for ms, _ in samples]
+        tok_in = sum(u["input_tokens"] for _, u in samples)
+        tok_out = sum(u["output_tokens"] for _, u in samples)
+        calls = sum(u["llm_calls"] for _, u in samples)
+        print(
+            f"{path:<10} mean {statistics.mean(lat):>7.0f} ms | p95 {_p95(lat):>7.0f} ms | "
+            f"tokens in/out {tok_in}/{tok_out} | LLM calls {calls} ({calls / len(samples):.1f}/question)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=1)
+    run(parser.parse_args().rounds)
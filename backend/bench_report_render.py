@@ -0,0 +1,88 @@
+"""
+bench_report_render.py - Throughput benchmark for the daily report renderer.
+
+Generates N synthetic users (random stocks / mutual funds / alerts, like the
+agentState the analysis loop stores) and times:
+  single  - _build_html() per user, as send_report() does
+  bulk    - render_reports() over the whole batch, shared sections once
+  message - bulk render plus MIME message assembly (what queue_reports()
+            writes to the outbox)
+
+Usage:
+    python bench_report_render.py [--users 5000] [--repeat 3]
+Output:
+    total seconds and reports / second for each path, best of --repeat
+"""
+
+import argparse
+import random
+import time
+
+import agent_email
+
+SYMBOLS = ["RELIANCE", "TCS", "INFY", "HDFCBANK", "ICICIBANK", "SBIN", "ITC", "LT", "AXISBANK", "MARUTI",
+           "BHARTIARTL", "KOTAKBANK", "HINDUNILVR", "ASIANPAINT", "TITAN", "WIPRO"]
+
+
+def _user(i: int) -> tuple[str, dict]:
+    r = random.Random(i)
+    stocks = [{"symbol": s, "name": f"{s} Ltd", "qty": r.randint(1, 200),
+               "avgBuyPrice": round(r.uniform(100, 3000), 2), "currentValue": round(r.uniform(1e3, 5e5), 2)}
+              for s in r.sample(SYMBOLS, r.randint(1, 12))]
+    mfs = [{"fundName": f"Index Fund {j}", "investedAmount": r.uniform(1e4, 2e5), "currentValue": r.uniform(1e4, 2e5)}
+           for j in range(r.randint(0, 6))]
+    state = {
+        "lastPrices":     {s["symbol"]: {"price": round(r.uniform(100, 3000), 2),
+                                         "change_pct": round(r.uniform(-6, 6), 2)} for s in stocks},
+        "verdict":        r.choice(["All Good", "Caution", "Immediate Action"]),
+        "verdictReason":  "2 holding(s) worth monitoring closely.",
+        "overallSummary": "The agent is tracking a mild decline in two banking holdings.",
+        "topAlerts":      [{"holding": s["symbol"], "issue": "Down 3.4% today",
+                            "action": "Being monitored"} for s in stocks[:r.randint(0, 3)]],
+        "lastChecked":    "2026-03-02T15:31:04.120034",
+    }
+    email = f"user{i}@example.com"
+    return email, {"name": f"User {i}", "holdings": {"stocks": stocks, "mutualFunds": mfs}, "agentState": state}
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    users = [_user(i) for i in range(args.users)]
+    market: dict = {}
+    for _, u in users:
+        market.update(u["agentState"]["lastPrices"])
+
+    def single():
+        for email, u in users:
+            agent_email._build_html(email, u)
+
+    def bulk():
+        agent_email.render_reports(users, market=market)
+
+    def message():
+        htmls = agent_email.render_reports(users, market=market)
+        envelope = agent_email._envelope()
+        for (email, _), html in zip(users, htmls):
+            agent_email._build_message(email, html, agent_email.daily_key(email), envelope)
+
+    print(f"{args.users} reports, best of {args.repeat}")
+    for name, fn in (("single", single), ("bulk", bulk), ("message", message)):
+        t = _best(fn, args.repeat)
+        print(f"  {name:<8} {t:8.3f}s  {args.users / t:10.0f} reports/s")
+
+
+if __name__ == "__main__":
+    main()
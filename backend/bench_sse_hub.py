@@ -0,0 +1,123 @@
+"""
+bench_sse_hub.py - Memory / CPU benchmark for the agent SSE hub.
+
+Connects N async subscribers spread over T topics (users with several tabs),
+publishes a price_update / activity_log mix from a background thread like the
+analysis loop does, and lets a share of clients read slowly to exercise the
+bounded buffers and price_update coalescing.
+
+Usage:
+    python bench_sse_hub.py [--clients 5000] [--topics 500] [--seconds 10]
+                            [--rate 2000] [--slow-share 0.1]
+Output:
+    memory per client, CPU time per published / delivered frame, delivery
+    latency p50 / p99, and the hub's dropped / coalesced counters
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import statistics
+import threading
+import time
+import tracemalloc
+
+from sse_hub import SSEHub
+
+SYMBOLS = ["RELIANCE", "TCS", "INFY", "HDFCBANK", "ICICIBANK", "SBIN", "ITC", "LT", "AXISBANK", "MARUTI"]
+
+
+def _p(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def _publisher(hub: SSEHub, topics: int, rate: int, stop: threading.Event) -> None:
+    interval = 1.0 / rate
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        topic = f"user{random.randrange(topics)}@example.com"
+        if random.random() < 0.8:
+            event = {"type": "price_update", "symbol": random.choice(SYMBOLS),
+                     "price": round(random.uniform(100, 3000), 2), "change1d": 0.0}
+        else:
+            event = {"type": "activity_log", "entry": {"msg": "Scanning news", "level": "info"}}
+        event["ts"] = time.time()
+        hub.publish(topic, event)
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+async def _client(hub: SSEHub, topic: str, slow: bool, stop: asyncio.Event, latencies: list) -> None:
+    sub = hub.subscribe(topic)
+    try:
+        while not stop.is_set():
+            frames = await sub.next(timeout=0.5)
+            if frames:
+                # one parse per wake-up keeps the measurement from dominating CPU
+                data = frames[-1].split("data: ", 1)[1]
+                latencies.append((time.time() - json.loads(data)["ts"]) * 1000)
+            if slow:
+                await asyncio.sleep(2.0)
+    finally:
+        hub.unsubscribe(sub)
+
+
+async def run(clients: int, topics: int, seconds: float, rate: int, slow_share: float) -> None:
+    hub = SSEHub()
+    stop = asyncio.Event()
+    latencies: list[float] = []
+
+    tracemalloc.start()
+    base_mem = tracemalloc.get_traced_memory()[0]
+    tasks = [
+        asyncio.create_task(_client(hub, f"user{i % topics}@example.com",
+                                    random.random() < slow_share, stop, latencies))
+        for i in range(clients)
+    ]
+    await asyncio.sleep(0.5)
+    idle_mem = tracemalloc.get_traced_memory()[0] - base_mem
+    # tracemalloc slows every allocation; measure the load phase without it
+    tracemalloc.stop()
+
+    stop_pub = threading.Event()
+    publisher = threading.Thread(target=_publisher, args=(hub, topics, rate, stop_pub), daemon=True)
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    publisher.start()
+    await asyncio.sleep(seconds)
+    stop_pub.set()
+    publisher.join()
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    stats = hub.get_stats()
+
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    print(f"\nclients {clients} | topics {topics} | publish rate {rate}/s | slow share {slow_share:.0%}\n")
+    print(f"idle memory        {idle_mem / 1024 / 1024:8.1f} MiB ({idle_mem / clients:.0f} B/client)")
+    print(f"peak RSS           {peak_rss:8.1f} MiB (whole process)")
+    print(f"CPU                {cpu:8.2f} s over {wall:.1f} s wall ({cpu / wall:.0%} of one core)")
+    print(f"published          {stats['published']:8d} ({cpu / max(1, stats['published']) * 1e6:.0f} us CPU/frame)")
+    print(f"delivered          {stats['delivered']:8d} ({cpu / max(1, stats['delivered']) * 1e6:.0f} us CPU/frame)")
+    print(f"coalesced          {stats['coalesced']:8d}")
+    print(f"dropped            {stats['dropped']:8d}")
+    print(f"buffered at stop   {stats['buffered']:8d}")
+    if latencies:
+        print(f"latency ms         p50 {_p(latencies, 0.5):.1f} | p99 {_p(latencies, 0.99):.1f} | "
+              f"mean {statistics.mean(latencies):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rate", type=int, default=2000)
+    parser.add_argument("--slow-share", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.topics, args.seconds, args.rate, args.slow_share))
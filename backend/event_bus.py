@@ -0,0 +1,424 @@
+"""
+event_bus.py - Cross-process pub/sub for agent SSE events.
+
+The analysis loop publishes with event_bus.publish(email, event); every API
+process attaches its SSE hub with event_bus.attach(sse_hub.hub.publish) and
+receives the events of all publishers, so the loop can run in its own worker
+(agent_worker.py) behind any number of uvicorn workers.
+
+Transports (AGENT_EVENT_BUS):
+  inprocess  - default; direct call into the attached handler, single process
+  unix       - newline-delimited JSON through a broker on AGENT_EVENT_SOCKET;
+               the broker runs in agent_worker.py or `python event_bus.py`
+  redis      - PUBLISH / PSUBSCRIBE on AGENT_EVENT_REDIS_URL; memory:// uses
+               MemoryRedis, an in-process stand-in for tests and local runs
+
+Each event is stamped with its SSE id once, at publish time, so every worker
+replays the same ids for Last-Event-ID.
+
+get_stats() exports published / received / dropped / malformed counters per
+transport; a malformed message is logged and skipped, the reader keeps going.
+"""
+
+import asyncio
+import fnmatch
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from sse_hub import new_event_id
+
+EVENT_BUS        = os.getenv("AGENT_EVENT_BUS", "inprocess").lower()
+EVENT_SOCKET     = os.getenv("AGENT_EVENT_SOCKET", "/tmp/diversifi-agent-events.sock")
+EVENT_REDIS_URL  = os.getenv("AGENT_EVENT_REDIS_URL", "redis://localhost:6379/0")
+EVENT_CHANNEL    = os.getenv("AGENT_EVENT_CHANNEL", "agent-events:")
+PENDING_LIMIT    = int(os.getenv("AGENT_EVENT_PENDING_LIMIT", "1000"))
+BROKER_MAX_QUEUE = 1 << 20       # bytes buffered per broker client before it is cut off
+RECONNECT_DELAY  = 1.0           # seconds, doubled up to RECONNECT_MAX
+RECONNECT_MAX    = 15.0
+
+Handler = Callable[[str, dict, int], None]    # (topic, event, event_id)
+
+
+def _encode(topic: str, event: dict, event_id: int) -> bytes:
+    return json.dumps({"topic": topic, "id": event_id, "event": event}, default=str).encode("utf-8")
+
+
+def _decode(raw) -> tuple[str, dict, int]:
+    msg = json.loads(raw)
+    return msg["topic"], msg["event"], msg["id"]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Transports
+# ─────────────────────────────────────────────────────────────────────────────
+
+class EventBus:
+    """Base transport: publish() from any thread, attach() a handler to receive."""
+
+    name = "base"
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+        self._stats = {"published": 0, "received": 0, "dropped": 0, "malformed": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _deliver(self, topic: str, event: dict, event_id: int) -> None:
+        handler = self._handler
+        if handler is None:
+            return
+        self._count("received")
+        try:
+            handler(topic, event, event_id)
+        except Exception as e:
+            print(f"[event_bus] handler error: {e}")
+
+    def _deliver_raw(self, raw) -> None:
+        try:
+            message = _decode(raw)
+        except (ValueError, KeyError, TypeError) as e:      # bad JSON / UTF-8, or missing fields
+            self._count("malformed")
+            print(f"[event_bus] skipping malformed message: {e!r}")
+            return
+        self._deliver(*message)
+
+    def attach(self, handler: Handler) -> None:
+        self._handler = handler
+
+    def publish(self, topic: str, event: dict) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self._handler = None
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {"transport": self.name, **self._stats}
+
+
+class InProcessBus(EventBus):
+    name = "inprocess"
+
+    def publish(self, topic: str, event: dict) -> int:
+        event_id = new_event_id()
+        self._count("published")
+        self._deliver(topic, event, event_id)
+        return event_id
+
+
+class UnixSocketBus(EventBus):
+    """
+    Client of the Unix-socket broker. One connection per process carries both
+    directions; a reader thread reconnects with backoff, and events published
+    while disconnected wait in a bounded pending queue.
+    """
+
+    name = "unix"
+
+    def __init__(self, path: str = EVENT_SOCKET):
+        super().__init__()
+        self.path     = path
+        self._sock:   Optional[socket.socket] = None
+        self._wlock   = threading.Lock()
+        self._pending: deque = deque()
+        self._closed  = False
+        self._reader  = threading.Thread(target=self._read_loop, daemon=True, name="event-bus-unix")
+        self._reader.start()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        with self._wlock:
+            self._sock = sock
+            while self._pending:
+                sock.sendall(self._pending.popleft())
+        print(f"[event_bus] connected to broker {self.path}")
+        return sock
+
+    def _read_loop(self) -> None:
+        delay = RECONNECT_DELAY
+        while not self._closed:
+            try:
+                sock = self._connect()
+                delay = RECONNECT_DELAY
+                with sock.makefile("rb") as stream:
+                    for line in stream:
+                        self._deliver_raw(line)
+            except OSError:
+                pass
+            with self._wlock:
+                self._sock = None
+            if not self._closed:
+                time.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX)
+
+    def publish(self, topic: str, event: dict) -> int:
+        event_id = new_event_id()
+        line = _encode(topic, event, event_id) + b"\n"
+        with self._wlock:
+            sent = False
+            if self._sock is not None:
+                try:
+                    self._sock.sendall(line)
+                    sent = True
+                except OSError:
+                    self._sock = None
+            if not sent:
+                if len(self._pending) >= PENDING_LIMIT:
+                    self._pending.popleft()
+                    self._count("dropped")
+                self._pending.append(line)
+        self._count("published")
+        return event_id
+
+    def close(self) -> None:
+        super().close()
+        self._closed = True
+        with self._wlock:
+            if self._sock is not None:
+                try:
+                    self._sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self._sock.close()
+                self._sock = None
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        with self._wlock:
+            stats["connected"] = self._sock is not None
+            stats["pending"]   = len(self._pending)
+        return stats
+
+
+class RedisBus(EventBus):
+    """PUBLISH per topic on EVENT_CHANNEL + topic, one PSUBSCRIBE reader thread per process."""
+
+    name = "redis"
+
+    def __init__(self, url: str = EVENT_REDIS_URL, client=None):
+        super().__init__()
+        if client is None:
+            if url.startswith("memory://"):
+                client = MemoryRedis.shared()
+            else:
+                import redis    # optional dependency, only needed for this transport
+                client = redis.Redis.from_url(url)
+        self.client  = client
+        self._pubsub = None
+        self._closed = False
+
+    def attach(self, handler: Handler) -> None:
+        super().attach(handler)
+        if self._pubsub is None:
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.psubscribe(EVENT_CHANNEL + "*")
+            threading.Thread(target=self._read_loop, daemon=True, name="event-bus-redis").start()
+
+    def _read_loop(self) -> None:
+        while not self._closed:
+            try:
+                msg = self._pubsub.get_message(timeout=1.0)
+            except Exception as e:
+                print(f"[event_bus] redis read error: {e}")
+                time.sleep(RECONNECT_DELAY)
+                continue
+            if msg and msg.get("type") in ("message", "pmessage"):
+                self._deliver_raw(msg["data"])
+
+    def publish(self, topic: str, event: dict) -> int:
+        event_id = new_event_id()
+        try:
+            self.client.publish(EVENT_CHANNEL + topic, _encode(topic, event, event_id))
+            self._count("published")
+        except Exception as e:
+            self._count("dropped")
+            print(f"[event_bus] redis publish error: {e}")
+        return event_id
+
+    def close(self) -> None:
+        super().close()
+        self._closed = True
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# In-memory Redis stand-in
+# ─────────────────────────────────────────────────────────────────────────────
+
+class MemoryRedis:
+    """The publish / pubsub subset of redis.Redis that RedisBus uses, in one process."""
+
+    _shared: Optional["MemoryRedis"] = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: list["_MemoryPubSub"] = []
+
+    @classmethod
+    def shared(cls) -> "MemoryRedis":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def publish(self, channel: str, data) -> int:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self._lock:
+            subs = list(self._subs)
+        return sum(sub._offer(channel, data) for sub in subs)
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> "_MemoryPubSub":
+        sub = _MemoryPubSub(self)
+        with self._lock:
+            self._subs.append(sub)
+        return sub
+
+    def _remove(self, sub: "_MemoryPubSub") -> None:
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+
+class _MemoryPubSub:
+    def __init__(self, server: MemoryRedis):
+        self._server   = server
+        self._patterns: list[str] = []
+        self._channels: set[str] = set()
+        self._queue: queue.Queue = queue.Queue()
+
+    def subscribe(self, *channels: str) -> None:
+        self._channels.update(channels)
+
+    def psubscribe(self, *patterns: str) -> None:
+        self._patterns.extend(patterns)
+
+    def _offer(self, channel: str, data: bytes) -> int:
+        if channel in self._channels:
+            self._queue.put({"type": "message", "pattern": None, "channel": channel, "data": data})
+            return 1
+        for pattern in self._patterns:
+            if fnmatch.fnmatchcase(channel, pattern):
+                self._queue.put({"type": "pmessage", "pattern": pattern, "channel": channel, "data": data})
+                return 1
+        return 0
+
+    def get_message(self, timeout: float = 0.0) -> Optional[dict]:
+        try:
+            return self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self._server._remove(self)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Unix-socket broker
+# ─────────────────────────────────────────────────────────────────────────────
+
+async def _serve_broker(path: str, ready: Optional[threading.Event] = None) -> None:
+    clients: set[asyncio.StreamWriter] = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        clients.add(writer)
+        try:
+            while line := await reader.readline():
+                for client in list(clients):
+                    # a client that stopped reading is cut off instead of growing the broker
+                    if client.transport.get_write_buffer_size() > BROKER_MAX_QUEUE:
+                        print("[event_bus] broker dropping slow client")
+                        clients.discard(client)
+                        client.close()
+                        continue
+                    client.write(line)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            clients.discard(writer)
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path=path, limit=BROKER_MAX_QUEUE)
+    print(f"[event_bus] broker listening on {path}")
+    if ready is not None:
+        ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def _broker_running(path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def start_broker(path: str = EVENT_SOCKET) -> bool:
+    """Run the broker on a daemon thread unless one already listens on `path`."""
+    if _broker_running(path):
+        return False
+    ready = threading.Event()
+    threading.Thread(target=asyncio.run, args=(_serve_broker(path, ready),),
+                     daemon=True, name="event-bus-broker").start()
+    ready.wait(5)
+    return True
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Public API
+# ─────────────────────────────────────────────────────────────────────────────
+
+_bus: Optional[EventBus] = None
+_bus_lock = threading.Lock()
+
+
+def _create(transport: str) -> EventBus:
+    if transport == "unix":
+        return UnixSocketBus(EVENT_SOCKET)
+    if transport == "redis":
+        return RedisBus(EVENT_REDIS_URL)
+    if transport != "inprocess":
+        print(f"[event_bus] unknown AGENT_EVENT_BUS={transport!r}, using inprocess")
+    return InProcessBus()
+
+
+def get_bus() -> EventBus:
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = _create(EVENT_BUS)
+    return _bus
+
+
+def publish(topic: str, event: dict) -> int:
+    return get_bus().publish(topic, event)
+
+
+def attach(handler: Handler) -> None:
+    """Receive every event published on the bus (by any process) in `handler`."""
+    get_bus().attach(handler)
+
+
+def get_stats() -> dict:
+    return get_bus().get_stats()
+
+
+if __name__ == "__main__":
+    asyncio.run(_serve_broker(EVENT_SOCKET))
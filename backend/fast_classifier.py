@@ -0,0 +1,238 @@
+"""
+fast_classifier.py - Deterministic pre-classifier that runs before the LLM classifier_node.
+
+Pipeline (no LLM call):
+  1. Ticker dictionary  - research_service.WATCHLIST + algo_llm.symbols_stack.NIFTY_200
+                          symbols and company names
+  2. MF dictionary      - fund names from mf_data.json + MF keyword rules
+  3. Keyword rules      - general finance topics and clearly out-of-scope chatter
+  4. Nearest centroid   - optional, over sentence embeddings (see enable_embeddings)
+
+classify(question) returns {category, confidence, missing_info, reasoning, symbol}
+when it is confident, otherwise None and the caller falls back to the LLM.
+"""
+
+import json
+import math
+import os
+import re
+from typing import Callable, Optional
+
+from helper_func import normalize_fund_name
+
+MIN_CONFIDENCE = float(os.getenv("FAST_CLASSIFIER_MIN_CONFIDENCE", "0.85"))
+
+MF_MISSING_INFO = "specific investment goals, risk tolerance, or investment horizon"
+
+_MF_RE = re.compile(
+    r"\b(mutual\s+funds?|mfs?|sips?|nav|elss|index\s+funds?|debt\s+funds?|hybrid\s+funds?|"
+    r"(flexi|multi|large|mid|small)\s?cap|large\s*(&|and)\s*mid|best\s+funds?|good\s+funds?|"
+    r"top\s+funds?|funds?\s+to\s+invest)\b",
+    re.I,
+)
+_STOCK_RE = re.compile(
+    r"\b(stocks?|shares?|equity|ticker|target\s+price|price\s+target|buy|sell|hold|"
+    r"intraday|technical\s+analysis|rsi|macd|breakout|support|resistance)\b",
+    re.I,
+)
+_GENERAL_RE = re.compile(
+    r"\b(budget(ing)?|save\s+money|saving|savings|insurance|term\s+plan|tax(es|ation)?|80c|"
+    r"itr|loan|emi|credit\s+(score|card)|emergency\s+fund|retirement\s+planning|ppf|epf|nps|"
+    r"fixed\s+deposit|fd|inflation|demat|compounding|diversification|asset\s+allocation|"
+    r"personal\s+finance|net\s+worth)\b",
+    re.I,
+)
+_OFF_TOPIC_RE = re.compile(
+    r"^\s*(hi|hello|hey|yo|thanks|thank\s+you|ok|okay|good\s+(morning|evening|night))\W*$|"
+    r"\b(weather|joke|recipe|movie|song|cricket\s+score|football)\b",
+    re.I,
+)
+_PROFILE_RE = re.compile(
+    r"\b((low|medium|moderate|high)\s+risk|conservative|aggressive|"
+    r"\d+\s*(years?|yrs?)|(short|medium|long)[\s-]term|wealth|retire(ment)?|steady|growth|balanced)\b",
+    re.I,
+)
+_TICKER_RE = re.compile(r"^[A-Z0-9&-]+$")
+_UPPER_TOKEN_RE = re.compile(r"\b[A-Z][A-Z0-9&-]{1,14}\b")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Dictionaries
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _build_ticker_index() -> tuple[set[str], dict[str, str]]:
+    """Returns (tickers, lower-case company alias -> ticker)."""
+    from research_service import WATCHLIST
+    from algo_llm.symbols_stack import NIFTY_200
+
+    tickers: set[str] = set()
+    aliases: dict[str, str] = {}
+    for item in WATCHLIST:
+        sym = item["symbol"].replace(".NS", "")
+        tickers.add(sym)
+        aliases[item["name"].lower()] = sym
+    for sym in NIFTY_200:
+        if _TICKER_RE.match(sym):
+            tickers.add(sym)
+    return tickers, aliases
+
+
+def _build_fund_index() -> list[str]:
+    path = os.path.join(os.path.dirname(__file__), "mf_data.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [normalize_fund_name(e["mutual_fund_name"]) for e in json.load(f)]
+    except Exception:
+        return []
+
+
+TICKERS, COMPANY_ALIASES = _build_ticker_index()
+FUND_NAMES = _build_fund_index()
+
+# Aliases ordered longest first so "tata motors" wins over "tata"
+_ALIAS_RE = re.compile(
+    r"\b(" + "|".join(re.escape(a) for a in sorted(COMPANY_ALIASES, key=len, reverse=True)) + r")\b",
+    re.I,
+) if COMPANY_ALIASES else None
+
+
+def _find_symbol(question: str) -> tuple[Optional[str], bool]:
+    """Returns (symbol, explicit) where explicit means an upper-case ticker was written."""
+    for tok in _UPPER_TOKEN_RE.findall(question):
+        if tok in TICKERS:
+            return tok, True
+    if _ALIAS_RE:
+        m = _ALIAS_RE.search(question)
+        if m:
+            return COMPANY_ALIASES[m.group(1).lower()], False
+    return None, False
+
+
+def _find_fund(question: str) -> Optional[str]:
+    norm = normalize_fund_name(question)
+    for name in FUND_NAMES:
+        if name and name in norm:
+            return name
+    return None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Optional nearest-centroid model
+# ─────────────────────────────────────────────────────────────────────────────
+
+CENTROID_EXAMPLES = {
+    "mf": [
+        "suggest good mutual funds", "best flexi cap funds for 5 years",
+        "which SIP should I start for aggressive growth", "medium risk funds for long term",
+        "compare two mutual funds", "what is the NAV of this fund",
+    ],
+    "general_finance": [
+        "how to save money every month", "tax planning tips for salaried employees",
+        "how much insurance cover do I need", "should I prepay my home loan",
+        "how to build an emergency fund", "what is asset allocation",
+    ],
+    "unknown": [
+        "hello", "what's the weather today", "tell me a joke",
+        "recommend a movie", "how do I cook pasta", "who won the match yesterday",
+    ],
+}
+CENTROID_MIN_SIMILARITY = 0.45
+CENTROID_MIN_MARGIN = 0.08
+
+_embed_fn: Optional[Callable[[list[str]], list[list[float]]]] = None
+_centroids: dict[str, list[float]] = {}
+
+
+def _normalise(vec: list[float]) -> list[float]:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+def enable_embeddings(embed_fn: Callable[[list[str]], list[list[float]]]) -> None:
+    """Build per-category centroids with `embed_fn` (e.g. HuggingFaceEmbeddings.embed_documents)."""
+    global _embed_fn, _centroids
+    centroids = {}
+    for category, examples in CENTROID_EXAMPLES.items():
+        vecs = [_normalise(v) for v in embed_fn(examples)]
+        mean = [sum(col) / len(vecs) for col in zip(*vecs)]
+        centroids[category] = _normalise(mean)
+    _embed_fn, _centroids = embed_fn, centroids
+
+
+def _centroid_classify(question: str) -> Optional[tuple[str, float]]:
+    if not _embed_fn or not _centroids:
+        return None
+    vec = _normalise(_embed_fn([question])[0])
+    sims = sorted(
+        ((sum(a * b for a, b in zip(vec, c)), cat) for cat, c in _centroids.items()),
+        reverse=True,
+    )
+    (best, cat), (second, _) = sims[0], sims[1]
+    if best < CENTROID_MIN_SIMILARITY or best - second < CENTROID_MIN_MARGIN:
+        return None
+    return cat, min(0.95, 0.75 + (best - second))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Public API
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _result(category: str, confidence: float, reasoning: str,
+            symbol: Optional[str] = None, missing_info: Optional[str] = None) -> dict:
+    return {
+        "category": category,
+        "confidence": confidence,
+        "missing_info": missing_info,
+        "reasoning": reasoning,
+        "symbol": symbol,
+    }
+
+
+def _rule_classify(question: str) -> Optional[dict]:
+    symbol, explicit = _find_symbol(question)
+    fund = _find_fund(question)
+    mf_hit = bool(_MF_RE.search(question))
+    stock_hit = bool(_STOCK_RE.search(question))
+    general_hit = bool(_GENERAL_RE.search(question))
+    profile_hit = bool(_PROFILE_RE.search(question))
+
+    if fund:
+        return _result("mf", 0.95, f"Mentions the fund '{fund}'.")
+
+    if symbol and not mf_hit:
+        conf = 0.95 if (stock_hit or explicit) else 0.85
+        return _result("stock", conf, f"Mentions the listed company {symbol}.", symbol=symbol)
+
+    if mf_hit and not (symbol or stock_hit or general_hit):
+        missing = None if profile_hit else MF_MISSING_INFO
+        return _result("mf", 0.9, "Mutual fund / SIP question.", missing_info=missing)
+
+    if general_hit and not (symbol or mf_hit or stock_hit):
+        return _result("general_finance", 0.88, "Personal finance topic.")
+
+    if _OFF_TOPIC_RE.search(question) and not (symbol or mf_hit or stock_hit or general_hit):
+        return _result("unknown", 0.9, "Out of scope for a finance helpdesk.")
+
+    return None
+
+
+def classify(question: str) -> Optional[dict]:
+    """Classify without an LLM; returns None when not confident enough."""
+    if not question or not question.strip():
+        return None
+
+    result = _rule_classify(question)
+    if result is None:
+        try:
+            hit = _centroid_classify(question)
+        except Exception as e:
+            print(f"[fast_classifier] centroid error: {e}")
+            hit = None
+        if hit:
+            category, conf = hit
+            missing = MF_MISSING_INFO if category == "mf" and not _PROFILE_RE.search(question) else None
+            result = _result(category, conf, "Nearest-centroid match.", missing_info=missing)
+
+    if result is None or result["confidence"] < MIN_CONFIDENCE:
+        return None
+    return result
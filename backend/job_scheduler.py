@@ -0,0 +1,208 @@
+"""
+job_scheduler.py - Cron-like daily jobs with persisted run markers.
+
+  Schedule  - add(name, hour, minute, run, days, tz) fires run(run_date) once
+              per matching local day at hh:mm in `tz` (IST by default) on the
+              scheduler's own thread, away from the analysis cycle
+  Markers   - one job_runs row per (job, run_date) in the user store database;
+              a run is claimed inside an IMMEDIATE transaction, so each job
+              runs once per day across restarts and processes
+  Catch-up  - a process that starts (or wakes) after the due time still runs
+              the day's job within AGENT_JOB_CATCHUP seconds of it
+  Recovery  - a 'running' marker older than AGENT_JOB_LEASE is a crashed run
+              and is claimed again; a failed run is retried after
+              AGENT_JOB_RETRY seconds, at most AGENT_JOB_ATTEMPTS times.
+              Jobs must therefore be idempotent (the report job relies on the
+              mail outbox's per-day keys)
+"""
+
+import datetime
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, Optional
+from zoneinfo import ZoneInfo
+
+from user_store import STORE_DB
+
+JOB_CATCHUP  = float(os.getenv("AGENT_JOB_CATCHUP", str(6 * 3600)))
+JOB_LEASE    = float(os.getenv("AGENT_JOB_LEASE", "1800"))
+JOB_RETRY    = float(os.getenv("AGENT_JOB_RETRY", "300"))
+JOB_ATTEMPTS = int(os.getenv("AGENT_JOB_ATTEMPTS", "3"))
+IDLE_CHECK   = 60.0                      # re-check at least this often (clock changes, missed wakeups)
+
+WEEKDAYS = (0, 1, 2, 3, 4)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_runs (
+    job         TEXT NOT NULL,
+    run_date    TEXT NOT NULL,
+    status      TEXT NOT NULL,           -- running | done | failed
+    owner       TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 1,
+    started_at  REAL,
+    finished_at REAL,
+    detail      TEXT,
+    PRIMARY KEY (job, run_date)
+) WITHOUT ROWID;
+"""
+
+
+class _Job:
+    def __init__(self, name: str, hour: int, minute: int, run: Callable[[datetime.date], object],
+                 days: Iterable[int], tz: datetime.tzinfo):
+        self.name   = name
+        self.hour   = hour
+        self.minute = minute
+        self.run    = run
+        self.days   = frozenset(days)
+        self.tz     = tz
+
+    def due_at(self, day: datetime.date) -> datetime.datetime:
+        return datetime.datetime.combine(day, datetime.time(self.hour, self.minute), self.tz)
+
+    def due_day(self, now: datetime.datetime, catchup: float) -> Optional[datetime.date]:
+        """The scheduled day whose run is due at `now` (within the catch-up window), if any."""
+        today = now.astimezone(self.tz).date()
+        for day in (today, today - datetime.timedelta(days=1)):
+            if day.weekday() not in self.days:
+                continue
+            due = self.due_at(day)
+            if due <= now < due + datetime.timedelta(seconds=catchup):
+                return day
+        return None
+
+    def next_due(self, now: datetime.datetime) -> datetime.datetime:
+        day = now.astimezone(self.tz).date()
+        for i in range(8):
+            d = day + datetime.timedelta(days=i)
+            if d.weekday() in self.days and self.due_at(d) > now:
+                return self.due_at(d)
+        return now + datetime.timedelta(days=1)
+
+
+class JobScheduler:
+    def __init__(self, db_path: str = STORE_DB, catchup: float = JOB_CATCHUP, lease: float = JOB_LEASE,
+                 retry: float = JOB_RETRY, attempts: int = JOB_ATTEMPTS):
+        self.db_path  = db_path
+        self.catchup  = catchup
+        self.lease    = lease
+        self.retry    = retry
+        self.attempts = attempts
+        self.owner    = f"{socket.gethostname()}:{os.getpid()}"
+        self._jobs:   dict[str, _Job] = {}
+        self._local   = threading.local()
+        self._wake    = threading.Event()
+        self._stop    = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, name: str, hour: int, minute: int, run: Callable[[datetime.date], object],
+            days: Iterable[int] = WEEKDAYS, tz: str = "Asia/Kolkata") -> None:
+        self._jobs[name] = _Job(name, hour, minute, run, days, ZoneInfo(tz))
+        self._wake.set()
+
+    def due_at(self, name: str, day: datetime.date) -> datetime.datetime:
+        return self._jobs[name].due_at(day)
+
+    # ── Markers ──────────────────────────────────────────────────────────────
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _claim(self, job: str, run_date: str) -> bool:
+        now = time.time()
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT status, attempts, started_at, finished_at FROM job_runs"
+                               " WHERE job = ? AND run_date = ?", (job, run_date)).fetchone()
+            if row is None:
+                conn.execute("INSERT INTO job_runs (job, run_date, status, owner, started_at)"
+                             " VALUES (?, ?, 'running', ?, ?)", (job, run_date, self.owner, now))
+                claimed = True
+            else:
+                status, attempts, started, finished = row
+                claimed = attempts < self.attempts and (
+                    (status == "running" and now - (started or 0) > self.lease) or
+                    (status == "failed" and now - (finished or 0) > self.retry))
+                if claimed:
+                    conn.execute("UPDATE job_runs SET status = 'running', owner = ?, attempts = attempts + 1,"
+                                 " started_at = ?, finished_at = NULL WHERE job = ? AND run_date = ?",
+                                 (self.owner, now, job, run_date))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return claimed
+
+    def _finish(self, job: str, run_date: str, status: str, detail: Optional[str]) -> None:
+        self._db().execute("UPDATE job_runs SET status = ?, finished_at = ?, detail = ?"
+                           " WHERE job = ? AND run_date = ? AND owner = ?",
+                           (status, time.time(), detail, job, run_date, self.owner))
+
+    # ── Running ──────────────────────────────────────────────────────────────
+
+    def run_due(self, now: Optional[datetime.datetime] = None) -> list[str]:
+        """Run every job that is due and not yet claimed for its day; returns the names run."""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        ran = []
+        for job in list(self._jobs.values()):
+            day = job.due_day(now, self.catchup)
+            if day is None or not self._claim(job.name, day.isoformat()):
+                continue
+            t0 = time.time()
+            try:
+                result = job.run(day)
+            except Exception as e:
+                self._finish(job.name, day.isoformat(), "failed", f"{type(e).__name__}: {str(e)[:300]}")
+                print(f"[job_scheduler] {job.name} {day} failed: {e}")
+                continue
+            self._finish(job.name, day.isoformat(), "done", None if result is None else str(result)[:300])
+            print(f"[job_scheduler] {job.name} {day} done in {time.time() - t0:.1f}s")
+            ran.append(job.name)
+        return ran
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_due()
+            except sqlite3.Error as e:
+                print(f"[job_scheduler] marker store error: {e}")
+            now = datetime.datetime.now(datetime.timezone.utc)
+            wait = min([IDLE_CHECK] + [(j.next_due(now) - now).total_seconds() for j in self._jobs.values()])
+            self._wake.clear()
+            self._wake.wait(max(1.0, wait))
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="job-scheduler")
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread = None
+
+    def get_stats(self) -> dict:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        conn = self._db()
+        jobs = {}
+        for name, job in self._jobs.items():
+            row = conn.execute("SELECT run_date, status, owner, attempts, started_at, finished_at, detail"
+                               " FROM job_runs WHERE job = ? ORDER BY run_date DESC LIMIT 1", (name,)).fetchone()
+            jobs[name] = {
+                "at":      f"{job.hour:02d}:{job.minute:02d}",
+                "nextDue": job.next_due(now).isoformat(),
+                "lastRun": dict(zip(("runDate", "status", "owner", "attempts", "startedAt", "finishedAt",
+                                     "detail"), row)) if row else None,
+            }
+        return {"owner": self.owner, "catchup": self.catchup, "lease": self.lease, "jobs": jobs}
@@ -0,0 +1,236 @@
+"""
+llm_cache.py - Response cache for deterministic (temperature 0) LLM nodes.
+
+Tiers:
+  1. In-memory LRU   - LLM_CACHE_MEMORY_SIZE entries, per process
+  2. SQLite on disk  - LLM_CACHE_DB, survives restarts and is shared by processes
+
+Key   = sha256(model | params | prompt)
+TTL   = per node (NODE_TTLS), e.g. classifier answers live a day, bull/bear
+        takes on the same headlines live 15 minutes
+Prune = expired SQLite rows are deleted on write, at most once every
+        LLM_CACHE_PRUNE_INTERVAL seconds, so per-profile and per-tick keys
+        do not grow the file without bound
+Opt-out: LLM_CACHE_DISABLED=1, or use_cache=False per call
+
+get_stats() exports hit/miss counts and the tokens saved per node.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+CACHE_DB       = os.getenv("LLM_CACHE_DB", os.path.join(os.path.dirname(__file__), "llm_cache.db"))
+MEMORY_SIZE    = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "2048"))
+CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "0") == "1"
+PRUNE_INTERVAL = float(os.getenv("LLM_CACHE_PRUNE_INTERVAL", "600"))
+
+DEFAULT_TTL = 600
+NODE_TTLS = {
+    "classifier":       86400,
+    "symbol_extractor": 86400,
+    "mf_extract":       86400,
+    "bull_handler":     900,
+    "bear_handler":     900,
+    "stock_reasons":    1800,
+    "mf_reasons":       1800,
+}
+
+_lock   = threading.Lock()
+_memory: "OrderedDict[str, tuple[float, Any, dict]]" = OrderedDict()
+_conn:   Optional[sqlite3.Connection] = None
+_stats:  dict[str, dict] = {}
+_pruned = {"at": 0.0, "rows": 0}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Storage helpers
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _db() -> Optional[sqlite3.Connection]:
+    """Lazily open the SQLite tier; returns None if the file cannot be used."""
+    global _conn
+    if _conn is None:
+        try:
+            conn = sqlite3.connect(CACHE_DB, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, node TEXT, value TEXT,"
+                " input_tokens INTEGER, output_tokens INTEGER,"
+                " created_at REAL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires ON llm_cache (expires_at)")
+            conn.commit()
+            _conn = conn
+        except Exception as e:
+            print(f"[llm_cache] sqlite tier disabled: {e}")
+            return None
+    return _conn
+
+
+def make_key(model: str, prompt: Any, params: Optional[dict] = None) -> str:
+    payload = json.dumps([model, params or {}, prompt], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _node_stats(node: str) -> dict:
+    return _stats.setdefault(node, {
+        "hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0,
+        "saved_input_tokens": 0, "saved_output_tokens": 0,
+    })
+
+
+def _lookup(key: str, now: float) -> Optional[tuple[Any, dict, str]]:
+    entry = _memory.get(key)
+    if entry:
+        expires_at, value, usage = entry
+        if expires_at > now:
+            _memory.move_to_end(key)
+            return value, usage, "memory"
+        del _memory[key]
+
+    conn = _db()
+    if conn is None:
+        return None
+    row = conn.execute(
+        "SELECT value, input_tokens, output_tokens, expires_at FROM llm_cache WHERE key = ?",
+        (key,),
+    ).fetchone()
+    if not row or row[3] <= now:
+        return None
+    value = json.loads(row[0])
+    usage = {"input_tokens": row[1] or 0, "output_tokens": row[2] or 0}
+    _remember(key, row[3], value, usage)
+    return value, usage, "disk"
+
+
+def _remember(key: str, expires_at: float, value: Any, usage: dict) -> None:
+    _memory[key] = (expires_at, value, usage)
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_SIZE:
+        _memory.popitem(last=False)
+
+
+def _store(key: str, node: str, value: Any, usage: dict, ttl: float, now: float) -> None:
+    _remember(key, now + ttl, value, usage)
+    conn = _db()
+    if conn is None:
+        return
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, node, json.dumps(value, default=str),
+             usage.get("input_tokens", 0), usage.get("output_tokens", 0), now, now + ttl),
+        )
+        if now - _pruned["at"] >= PRUNE_INTERVAL:
+            _pruned["at"] = now
+            _pruned["rows"] += conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+        conn.commit()
+    except Exception as e:
+        print(f"[llm_cache] store error: {e}")
+
+
+_MISS = object()
+
+
+def _get(node: str, key: str) -> Any:
+    with _lock:
+        hit = _lookup(key, time.time())
+        stats = _node_stats(node)
+        if not hit:
+            stats["misses"] += 1
+            return _MISS
+        value, usage, tier = hit
+        stats["hits"] += 1
+        stats[f"{tier}_hits"] += 1
+        stats["saved_input_tokens"] += usage.get("input_tokens", 0)
+        stats["saved_output_tokens"] += usage.get("output_tokens", 0)
+        return value
+
+
+def _put(node: str, key: str, value: Any, usage: Optional[dict]) -> None:
+    with _lock:
+        _store(key, node, value, usage or {}, NODE_TTLS.get(node, DEFAULT_TTL), time.time())
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Public API
+# ─────────────────────────────────────────────────────────────────────────────
+
+def get_or_call(node: str, model: str, prompt: Any, call: Callable[[], tuple[Any, dict]],
+                params: Optional[dict] = None, use_cache: bool = True) -> Any:
+    """
+    Return the cached response for (model, params, prompt) or run `call`.
+
+    `call` must return (value, usage) where value is JSON-serialisable and
+    usage carries input_tokens / output_tokens of the real LLM call.
+    """
+    if CACHE_DISABLED or not use_cache:
+        value, _ = call()
+        return value
+
+    key = make_key(model, prompt, params)
+    hit = _get(node, key)
+    if hit is not _MISS:
+        return hit
+
+    value, usage = call()
+    _put(node, key, value, usage)
+    return value
+
+
+async def aget_or_call(node: str, model: str, prompt: Any, call: Callable[[], Awaitable[tuple[Any, dict]]],
+                       params: Optional[dict] = None, use_cache: bool = True) -> Any:
+    """get_or_call for coroutine producers; lookups stay synchronous (local and sub-millisecond)."""
+    if CACHE_DISABLED or not use_cache:
+        value, _ = await call()
+        return value
+
+    key = make_key(model, prompt, params)
+    hit = _get(node, key)
+    if hit is not _MISS:
+        return hit
+
+    value, usage = await call()
+    _put(node, key, value, usage)
+    return value
+
+
+def get_stats() -> dict:
+    """Hit/miss and saved-token counters per node, plus totals."""
+    with _lock:
+        nodes = {k: dict(v) for k, v in _stats.items()}
+        size = len(_memory)
+        pruned = _pruned["rows"]
+    totals = {"hits": 0, "misses": 0, "saved_input_tokens": 0, "saved_output_tokens": 0}
+    for v in nodes.values():
+        for k in totals:
+            totals[k] += v[k]
+    lookups = totals["hits"] + totals["misses"]
+    totals["hit_rate"] = round(totals["hits"] / lookups, 3) if lookups else 0.0
+    return {"enabled": not CACHE_DISABLED, "memory_entries": size, "pruned_rows": pruned,
+            "totals": totals, "nodes": nodes}
+
+
+def clear(expired_only: bool = False) -> None:
+    """Drop cached entries (all, or only expired ones) from both tiers."""
+    now = time.time()
+    with _lock:
+        if expired_only:
+            for k in [k for k, (exp, _, _) in _memory.items() if exp <= now]:
+                del _memory[k]
+        else:
+            _memory.clear()
+        conn = _db()
+        if conn is not None:
+            if expired_only:
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            else:
+                conn.execute("DELETE FROM llm_cache")
+            conn.commit()
@@ -0,0 +1,582 @@
+"""
+llm_gateway.py - Process-wide access point for every Anthropic call.
+
+  Clients      - one pooled `anthropic` client (shared httpx connection pool /
+                 TLS sessions) and one ChatAnthropic per configuration
+  Concurrency  - global semaphore, LLM_MAX_CONCURRENCY in-flight calls; a
+                 stream gives its slot back at the first chunk, so long chat
+                 streams do not starve the verdict / classifier calls
+  Token budget - sliding 60 s window, LLM_TOKENS_PER_MINUTE (0 = unlimited);
+                 callers wait for room instead of bursting into 429s
+  Retries      - full-jitter exponential backoff on 429 / 5xx / 529 /
+                 connection errors, capped by a retry budget that refills at
+                 LLM_RETRY_RATIO per request so an outage is not amplified
+  Metrics      - latency and token histograms per caller (get_stats), and
+                 token usage forwarded to llm_usage
+
+Usage:
+    msg = llm_gateway.create_message("claude_verdict", model=..., messages=[...])
+    batch = llm_gateway.create_batch("claude_verdict_batch", [{"custom_id": ..., "params": {...}}])
+    with llm_gateway.stream("chat", model=..., messages=[...]) as s: ...
+    async with llm_gateway.astream("chat", model=..., messages=[...]) as s: ...
+    out = llm_gateway.invoke("classifier", router_llm, messages)
+    out = await llm_gateway.ainvoke("classifier", router_llm, messages)
+
+The async variants share the same semaphore, budget and retry budget, so
+threads and the event loop together never exceed LLM_MAX_CONCURRENCY.
+"""
+
+import asyncio
+import bisect
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Optional
+
+import anthropic
+import httpx
+
+import llm_usage
+
+DEFAULT_MODEL = "claude-sonnet-4-6"
+
+MAX_CONCURRENCY   = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+MAX_CONNECTIONS   = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+MAX_ATTEMPTS      = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+RETRY_RATIO       = float(os.getenv("LLM_RETRY_RATIO", "0.2"))
+RETRY_BUDGET_CAP  = float(os.getenv("LLM_RETRY_BUDGET_CAP", "10"))
+BACKOFF_BASE      = 0.5
+BACKOFF_CAP       = 20.0
+
+LATENCY_BUCKETS_MS = [100, 250, 500, 1000, 2000, 5000, 10000, 30000]
+TOKEN_BUCKETS      = [100, 250, 500, 1000, 2000, 4000, 8000]
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+_client_lock = threading.Lock()
+_client: Optional[anthropic.Anthropic] = None
+_async_client: Optional[anthropic.AsyncAnthropic] = None
+_chat_models: dict[tuple, Any] = {}
+
+_semaphore = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+_budget_cond   = threading.Condition()
+_budget_window: deque = deque()          # [timestamp, tokens] per reservation
+
+_stats_lock    = threading.Lock()
+_retry_tokens  = RETRY_BUDGET_CAP
+_callers: dict[str, dict] = {}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Clients
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _credentials() -> tuple[str, str]:
+    from dotenv import load_dotenv, find_dotenv
+    load_dotenv(find_dotenv())
+    return os.getenv("ANTHROPIC_API_KEY", ""), os.getenv("ANTHROPIC_FOUNDRY_RESOURCE", "")
+
+
+def get_client() -> anthropic.Anthropic:
+    """Shared SDK client; SDK retries are off because the gateway retries."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_key, resource = _credentials()
+            http_client = anthropic.DefaultHttpxClient(
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                    max_keepalive_connections=MAX_CONNECTIONS),
+            )
+            if resource:
+                _client = anthropic.AnthropicFoundry(api_key=api_key, resource=resource,
+                                                     max_retries=0, http_client=http_client)
+            else:
+                _client = anthropic.Anthropic(api_key=api_key, max_retries=0,
+                                              http_client=http_client)
+        return _client
+
+
+def get_async_client() -> anthropic.AsyncAnthropic:
+    """Shared async SDK client for coroutine callers (bound to no particular loop)."""
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            api_key, resource = _credentials()
+            http_client = anthropic.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                    max_keepalive_connections=MAX_CONNECTIONS),
+            )
+            if resource:
+                _async_client = anthropic.AsyncAnthropicFoundry(api_key=api_key, resource=resource,
+                                                                max_retries=0, http_client=http_client)
+            else:
+                _async_client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0,
+                                                         http_client=http_client)
+        return _async_client
+
+
+def get_chat_model(model: str = DEFAULT_MODEL, **kwargs):
+    """Shared ChatAnthropic per (model, kwargs); call it through invoke()."""
+    from langchain_anthropic import ChatAnthropic
+
+    key = (model, tuple(sorted(kwargs.items())))
+    with _client_lock:
+        if key not in _chat_models:
+            api_key, resource = _credentials()
+            url = (
+                f"https://{resource}.services.ai.azure.com/anthropic" if resource
+                else "https://api.anthropic.com"
+            )
+            headers = {"Authorization": f"Bearer {api_key}"} if resource else {}
+            _chat_models[key] = ChatAnthropic(
+                model=model,
+                anthropic_api_key=api_key,
+                anthropic_api_url=url,
+                default_headers=headers,
+                max_retries=0,
+                **kwargs,
+            )
+        return _chat_models[key]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Token budget
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _estimate_tokens(payload: Any, max_tokens: int = 0) -> int:
+    # ~4 characters per token is close enough for admission control
+    return len(str(payload)) // 4 + max_tokens
+
+
+def _reserve(tokens: int) -> Optional[list]:
+    if TOKENS_PER_MINUTE <= 0:
+        return None
+    tokens = min(tokens, TOKENS_PER_MINUTE)
+    with _budget_cond:
+        while True:
+            now = time.time()
+            while _budget_window and _budget_window[0][0] <= now - 60:
+                _budget_window.popleft()
+            used = sum(t for _, t in _budget_window)
+            if used + tokens <= TOKENS_PER_MINUTE:
+                entry = [now, tokens]
+                _budget_window.append(entry)
+                return entry
+            wait = _budget_window[0][0] + 60 - now if _budget_window else 0.1
+            _budget_cond.wait(timeout=max(0.05, wait))
+
+
+def _settle(entry: Optional[list], actual: Optional[int]) -> None:
+    """Replace the estimate with the real token count once it is known."""
+    if entry is None or actual is None:
+        return
+    with _budget_cond:
+        entry[1] = actual
+        _budget_cond.notify_all()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Retries
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (anthropic.APIConnectionError, anthropic.RateLimitError,
+                        anthropic.InternalServerError)):
+        return True
+    if isinstance(exc, anthropic.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS
+    return False
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _take_retry_token(caller: str) -> bool:
+    global _retry_tokens
+    with _stats_lock:
+        stats = _caller_stats(caller)
+        if _retry_tokens < 1:
+            stats["retries_denied"] += 1
+            return False
+        _retry_tokens -= 1
+        stats["retries"] += 1
+        return True
+
+
+def _backoff(attempt: int, exc: Exception) -> float:
+    hinted = _retry_after(exc)
+    if hinted is not None:
+        return min(BACKOFF_CAP, hinted)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Metrics
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _caller_stats(caller: str) -> dict:
+    return _callers.setdefault(caller, {
+        "calls": 0, "errors": 0, "retries": 0, "retries_denied": 0,
+        "queue_wait_ms_total": 0.0, "latency_ms_total": 0.0,
+        "input_tokens": 0, "output_tokens": 0,
+        "latency_hist": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+        "token_hist":   [0] * (len(TOKEN_BUCKETS) + 1),
+    })
+
+
+def _observe(caller: str, latency_ms: float, wait_ms: float,
+             input_tokens: int, output_tokens: int, failed: bool) -> None:
+    global _retry_tokens
+    with _stats_lock:
+        stats = _caller_stats(caller)
+        stats["calls"] += 1
+        stats["errors"] += int(failed)
+        stats["queue_wait_ms_total"] += wait_ms
+        stats["latency_ms_total"] += latency_ms
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+        stats["latency_hist"][bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        if not failed:
+            stats["token_hist"][bisect.bisect_left(TOKEN_BUCKETS, input_tokens + output_tokens)] += 1
+        _retry_tokens = min(RETRY_BUDGET_CAP, _retry_tokens + RETRY_RATIO)
+
+
+def _anthropic_tokens(usage: Any) -> tuple[int, int]:
+    if usage is None:
+        return 0, 0
+    prompt = (getattr(usage, "input_tokens", 0) or 0) \
+        + (getattr(usage, "cache_read_input_tokens", 0) or 0) \
+        + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+    return prompt, getattr(usage, "output_tokens", 0) or 0
+
+
+def _langchain_tokens(message: Any) -> tuple[int, int]:
+    meta = getattr(message, "usage_metadata", None) or {}
+    return meta.get("input_tokens", 0) or 0, meta.get("output_tokens", 0) or 0
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Public API
+# ─────────────────────────────────────────────────────────────────────────────
+
+def call(caller: str, fn: Callable[[], Any], estimated_tokens: int = 0,
+         tokens_of: Optional[Callable[[Any], tuple[int, int]]] = None) -> Any:
+    """
+    Run `fn` under the concurrency limit, token budget and retry policy.
+    `tokens_of(result)` returns (input_tokens, output_tokens) for metrics.
+    """
+    attempt = 0
+    while True:
+        reservation = _reserve(estimated_tokens)
+        queued = time.perf_counter()
+        _semaphore.acquire()
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except BaseException as exc:
+            _semaphore.release()
+            _observe(caller, (time.perf_counter() - started) * 1000,
+                     (started - queued) * 1000, 0, 0, failed=True)
+            _settle(reservation, 0)
+            attempt += 1
+            if (not isinstance(exc, Exception) or attempt >= MAX_ATTEMPTS or not _is_retryable(exc)
+                    or not _take_retry_token(caller)):
+                raise
+            time.sleep(_backoff(attempt, exc))
+            continue
+        _semaphore.release()
+        tok_in, tok_out = tokens_of(result) if tokens_of else (0, 0)
+        _observe(caller, (time.perf_counter() - started) * 1000,
+                 (started - queued) * 1000, tok_in, tok_out, failed=False)
+        _settle(reservation, tok_in + tok_out)
+        return result
+
+
+def create_message(caller: str, **kwargs) -> Any:
+    """client.messages.create through the gateway; kwargs go to the SDK unchanged."""
+    client = get_client()
+    estimate = _estimate_tokens([kwargs.get("system"), kwargs.get("messages")],
+                                kwargs.get("max_tokens", 0))
+    msg = call(caller, lambda: client.messages.create(**kwargs), estimate,
+               tokens_of=lambda m: _anthropic_tokens(m.usage))
+    llm_usage.record_anthropic(caller, msg.usage)
+    return msg
+
+
+def create_batch(caller: str, requests: list[dict]) -> Any:
+    """
+    Submit [{custom_id, params}] to the Message Batches API. Results arrive
+    asynchronously (poll with batch_results); they are billed at batch rates
+    and outside the per-minute limits, so no token budget is reserved here.
+    """
+    client = get_client()
+    return call(caller, lambda: client.messages.batches.create(requests=requests))
+
+
+def batch_results(caller: str, batch_id: str) -> Optional[list]:
+    """Results of an ended batch ([] entries with .custom_id / .result), or None while it runs."""
+    client = get_client()
+    batch = call(caller, lambda: client.messages.batches.retrieve(batch_id))
+    if batch.processing_status != "ended":
+        return None
+    results = list(call(caller, lambda: client.messages.batches.results(batch_id)))
+    for r in results:
+        if r.result.type == "succeeded":
+            llm_usage.record_anthropic(caller, r.result.message.usage)
+    return results
+
+
+def invoke(caller: str, runnable: Any, payload: Any) -> Any:
+    """runnable.invoke(payload) through the gateway (ChatAnthropic and wrappers)."""
+    def _message(result):
+        # with_structured_output(include_raw=True) returns {"raw": AIMessage, ...}
+        return result.get("raw") if isinstance(result, dict) else result
+
+    result = call(caller, lambda: runnable.invoke(payload), _estimate_tokens(payload),
+                  tokens_of=lambda r: _langchain_tokens(_message(r)))
+    llm_usage.record_langchain(caller, _message(result))
+    return result
+
+
+async def _acquire_slot() -> None:
+    # Poll the shared thread semaphore without blocking the event loop
+    delay = 0.005
+    while not _semaphore.acquire(blocking=False):
+        await asyncio.sleep(delay)
+        delay = min(0.2, delay * 2)
+
+
+async def acall(caller: str, fn: Callable[[], Any], estimated_tokens: int = 0,
+                tokens_of: Optional[Callable[[Any], tuple[int, int]]] = None) -> Any:
+    """Async call(): `fn` returns an awaitable; waits never block the event loop."""
+    attempt = 0
+    while True:
+        reservation = await asyncio.to_thread(_reserve, estimated_tokens) if TOKENS_PER_MINUTE > 0 else None
+        queued = time.perf_counter()
+        await _acquire_slot()
+        started = time.perf_counter()
+        try:
+            result = await fn()
+        except BaseException as exc:         # a cancelled task must hand its slot back too
+            _semaphore.release()
+            _observe(caller, (time.perf_counter() - started) * 1000,
+                     (started - queued) * 1000, 0, 0, failed=True)
+            _settle(reservation, 0)
+            attempt += 1
+            if (not isinstance(exc, Exception) or attempt >= MAX_ATTEMPTS or not _is_retryable(exc)
+                    or not _take_retry_token(caller)):
+                raise
+            await asyncio.sleep(_backoff(attempt, exc))
+            continue
+        _semaphore.release()
+        tok_in, tok_out = tokens_of(result) if tokens_of else (0, 0)
+        _observe(caller, (time.perf_counter() - started) * 1000,
+                 (started - queued) * 1000, tok_in, tok_out, failed=False)
+        _settle(reservation, tok_in + tok_out)
+        return result
+
+
+async def ainvoke(caller: str, runnable: Any, payload: Any) -> Any:
+    """runnable.ainvoke(payload) through the gateway."""
+    def _message(result):
+        return result.get("raw") if isinstance(result, dict) else result
+
+    result = await acall(caller, lambda: runnable.ainvoke(payload), _estimate_tokens(payload),
+                         tokens_of=lambda r: _langchain_tokens(_message(r)))
+    llm_usage.record_langchain(caller, _message(result))
+    return result
+
+
+class _Slot:
+    """A held semaphore slot, released at most once (first chunk or stream end)."""
+
+    def __init__(self):
+        self._held = True
+
+    def release(self) -> None:
+        if self._held:
+            self._held = False
+            _semaphore.release()
+
+
+class _TimedStream:
+    """Wraps a MessageStream to measure time to first token and free its slot there."""
+
+    def __init__(self, stream: Any, started: float, slot: _Slot):
+        self._stream = stream
+        self._started = started
+        self._slot = slot
+        self.ttft_ms: Optional[float] = None
+
+    @property
+    def text_stream(self):
+        for text in self._stream.text_stream:
+            if self.ttft_ms is None:
+                self.ttft_ms = (time.perf_counter() - self._started) * 1000
+                self._slot.release()
+            yield text
+
+    def get_final_message(self) -> Any:
+        return self._stream.get_final_message()
+
+
+@contextmanager
+def stream(caller: str, **kwargs):
+    """
+    client.messages.stream through the gateway. Opening the stream is retried;
+    once tokens have been yielded a failure is surfaced to the caller. The
+    concurrency slot is held until the first chunk, not for the whole stream.
+    """
+    client = get_client()
+    estimate = _estimate_tokens([kwargs.get("system"), kwargs.get("messages")],
+                                kwargs.get("max_tokens", 0))
+    attempt = 0
+    while True:
+        reservation = _reserve(estimate)
+        queued = time.perf_counter()
+        _semaphore.acquire()
+        started = time.perf_counter()
+        try:
+            manager = client.messages.stream(**kwargs)
+            raw = manager.__enter__()
+            break
+        except BaseException as exc:
+            _semaphore.release()
+            _observe(caller, (time.perf_counter() - started) * 1000,
+                     (started - queued) * 1000, 0, 0, failed=True)
+            _settle(reservation, 0)
+            attempt += 1
+            if (not isinstance(exc, Exception) or attempt >= MAX_ATTEMPTS or not _is_retryable(exc)
+                    or not _take_retry_token(caller)):
+                raise
+            time.sleep(_backoff(attempt, exc))
+
+    slot = _Slot()
+    timed = _TimedStream(raw, started, slot)
+    failed, usage = False, None
+    try:
+        yield timed
+        usage = raw.get_final_message().usage
+    except Exception:
+        failed = True
+        raise
+    finally:
+        manager.__exit__(None, None, None)
+        slot.release()
+        tok_in, tok_out = _anthropic_tokens(usage)
+        _observe(caller, (time.perf_counter() - started) * 1000,
+                 (started - queued) * 1000, tok_in, tok_out, failed=failed)
+        _settle(reservation, tok_in + tok_out)
+        if usage is not None:
+            llm_usage.record_anthropic(caller, usage, timed.ttft_ms)
+
+
+class _ATimedStream:
+    """Async _TimedStream."""
+
+    def __init__(self, stream: Any, started: float, slot: _Slot):
+        self._stream = stream
+        self._started = started
+        self._slot = slot
+        self.ttft_ms: Optional[float] = None
+
+    @property
+    async def text_stream(self):
+        async for text in self._stream.text_stream:
+            if self.ttft_ms is None:
+                self.ttft_ms = (time.perf_counter() - self._started) * 1000
+                self._slot.release()
+            yield text
+
+    async def get_final_message(self) -> Any:
+        return await self._stream.get_final_message()
+
+
+@asynccontextmanager
+async def astream(caller: str, **kwargs):
+    """Async stream(): same retry-on-open semantics, never blocks the event loop."""
+    client = get_async_client()
+    estimate = _estimate_tokens([kwargs.get("system"), kwargs.get("messages")],
+                                kwargs.get("max_tokens", 0))
+    attempt = 0
+    while True:
+        reservation = await asyncio.to_thread(_reserve, estimate) if TOKENS_PER_MINUTE > 0 else None
+        queued = time.perf_counter()
+        await _acquire_slot()
+        started = time.perf_counter()
+        try:
+            manager = client.messages.stream(**kwargs)
+            raw = await manager.__aenter__()
+            break
+        except BaseException as exc:
+            _semaphore.release()
+            _observe(caller, (time.perf_counter() - started) * 1000,
+                     (started - queued) * 1000, 0, 0, failed=True)
+            _settle(reservation, 0)
+            attempt += 1
+            if (not isinstance(exc, Exception) or attempt >= MAX_ATTEMPTS or not _is_retryable(exc)
+                    or not _take_retry_token(caller)):
+                raise
+            await asyncio.sleep(_backoff(attempt, exc))
+
+    slot = _Slot()
+    timed = _ATimedStream(raw, started, slot)
+    failed, usage = False, None
+    try:
+        yield timed
+        usage = (await raw.get_final_message()).usage
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        await manager.__aexit__(None, None, None)
+        slot.release()
+        tok_in, tok_out = _anthropic_tokens(usage)
+        _observe(caller, (time.perf_counter() - started) * 1000,
+                 (started - queued) * 1000, tok_in, tok_out, failed=failed)
+        _settle(reservation, tok_in + tok_out)
+        if usage is not None:
+            llm_usage.record_anthropic(caller, usage, timed.ttft_ms)
+
+
+def usage_of(msg: Any) -> dict:
+    """SDK Message usage as the plain dict llm_cache stores."""
+    tok_in, tok_out = _anthropic_tokens(getattr(msg, "usage", None))
+    return {"input_tokens": tok_in, "output_tokens": tok_out}
+
+
+def get_stats() -> dict:
+    """Per-caller latency / token histograms, retry counters and budget state."""
+    with _stats_lock:
+        callers = {k: {**v, "latency_hist": list(v["latency_hist"]),
+                       "token_hist": list(v["token_hist"])} for k, v in _callers.items()}
+        retry_tokens = _retry_tokens
+    with _budget_cond:
+        now = time.time()
+        window_tokens = sum(t for ts, t in _budget_window if ts > now - 60)
+
+    for stats in callers.values():
+        calls = stats["calls"] or 1
+        stats["mean_latency_ms"] = round(stats.pop("latency_ms_total") / calls, 1)
+        stats["mean_queue_wait_ms"] = round(stats.pop("queue_wait_ms_total") / calls, 1)
+        stats["latency_hist"] = dict(zip([f"<={b}" for b in LATENCY_BUCKETS_MS] + ["inf"],
+                                         stats["latency_hist"]))
+        stats["token_hist"] = dict(zip([f"<={b}" for b in TOKEN_BUCKETS] + ["inf"],
+                                       stats["token_hist"]))
+    return {
+        "max_concurrency": MAX_CONCURRENCY,
+        "tokens_per_minute": TOKENS_PER_MINUTE,
+        "tokens_last_minute": window_tokens,
+        "retry_budget": round(retry_tokens, 2),
+        "callers": callers,
+    }
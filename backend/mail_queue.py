@@ -0,0 +1,379 @@
+"""
+mail_queue.py - Persistent, rate-limited outbound mail queue.
+
+  Outbox      - messages are rows in the `outbox` table of the user store
+                database (USER_STORE_DB); enqueue() returns immediately
+  Idempotency - each message has a key (e.g. "daily:<email>:<date>");
+                enqueueing a key twice is a no-op, and a sent row is never
+                claimed again, so restarts neither lose nor repeat reports
+                (callers derive the Message-ID from the key via message_id(),
+                so even a crash between the server's 250 and the 'sent'
+                update yields a duplicate the mail client can recognise)
+  Leases      - a worker claims a row for AGENT_MAIL_LEASE seconds; rows left
+                'sending' by a crashed process are picked up again once the
+                lease expires, so several processes can share one outbox
+  Connection  - one authenticated SMTP session is reused for up to
+                AGENT_MAIL_PER_CONNECTION messages and closed after
+                AGENT_MAIL_IDLE seconds without work
+  Rate limit  - at most AGENT_MAIL_PER_MINUTE messages per minute per worker
+  Retries     - 4xx replies, dropped connections and network errors back off
+                AGENT_MAIL_BACKOFF * 2^attempt seconds (capped at 1 h) up to
+                AGENT_MAIL_MAX_ATTEMPTS; 5xx replies fail immediately
+
+SMTP settings: AGENT_SMTP_HOST / AGENT_SMTP_PORT, AGENT_SMTP_STARTTLS
+(default on), AGENT_SMTP_SSL (implicit TLS, e.g. port 465) and
+AGENT_SMTP_EMAIL / AGENT_SMTP_PASSWORD (login is skipped without a password,
+e.g. against a local aiosmtpd stand-in).
+"""
+
+import hashlib
+import os
+import re
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from user_store import STORE_DB
+
+SMTP_HOST          = os.getenv("AGENT_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT          = int(os.getenv("AGENT_SMTP_PORT", "587"))
+SMTP_STARTTLS      = os.getenv("AGENT_SMTP_STARTTLS", "1") == "1"
+SMTP_SSL           = os.getenv("AGENT_SMTP_SSL", "0") == "1"
+SMTP_EMAIL         = os.getenv("AGENT_SMTP_EMAIL", "")
+SMTP_PASSWORD      = os.getenv("AGENT_SMTP_PASSWORD", "")
+MAIL_PER_MINUTE    = float(os.getenv("AGENT_MAIL_PER_MINUTE", "30"))
+MAIL_PER_CONNECTION = int(os.getenv("AGENT_MAIL_PER_CONNECTION", "100"))
+MAIL_IDLE          = float(os.getenv("AGENT_MAIL_IDLE", "30"))
+MAIL_MAX_ATTEMPTS  = int(os.getenv("AGENT_MAIL_MAX_ATTEMPTS", "5"))
+MAIL_BACKOFF       = float(os.getenv("AGENT_MAIL_BACKOFF", "30"))
+MAIL_LEASE         = float(os.getenv("AGENT_MAIL_LEASE", "120"))
+MAX_BACKOFF        = 3600.0
+
+_EOL = re.compile(r"\r\n|\r|\n")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id           INTEGER PRIMARY KEY,
+    key          TEXT NOT NULL UNIQUE,
+    sender       TEXT NOT NULL,
+    recipient    TEXT NOT NULL,
+    message      TEXT NOT NULL,          -- full RFC 5322 message
+    status       TEXT NOT NULL DEFAULT 'pending',   -- pending | sending | sent | failed
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error   TEXT,
+    created_at   REAL NOT NULL,
+    sent_at      REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+"""
+
+
+class PermanentMailError(Exception):
+    """The server rejected the message for good (5xx)."""
+
+
+def _wire(message: str) -> bytes:
+    # sendmail() only normalises line endings for str input; SMTP wants CRLF
+    return _EOL.sub("\r\n", message).encode("utf-8")
+
+
+def message_id(key: str, domain: str = "diversifi") -> str:
+    return f"<{hashlib.sha1(key.encode('utf-8')).hexdigest()}@{domain}>"
+
+
+def smtp_connect(host: str = SMTP_HOST, port: int = SMTP_PORT, user: str = SMTP_EMAIL,
+                 password: str = SMTP_PASSWORD, starttls: bool = SMTP_STARTTLS,
+                 ssl: bool = SMTP_SSL, timeout: float = 30.0) -> smtplib.SMTP:
+    server = smtplib.SMTP_SSL(host, port, timeout=timeout) if ssl else smtplib.SMTP(host, port, timeout=timeout)
+    try:
+        server.ehlo()
+        if starttls and not ssl:
+            server.starttls()
+            server.ehlo()
+        if password:
+            server.login(user, password)
+    except BaseException:
+        server.close()
+        raise
+    return server
+
+
+class MailQueue:
+    def __init__(self, db_path: str = STORE_DB, connect: Callable[[], smtplib.SMTP] = smtp_connect,
+                 per_minute: float = MAIL_PER_MINUTE, per_connection: int = MAIL_PER_CONNECTION,
+                 idle: float = MAIL_IDLE, max_attempts: int = MAIL_MAX_ATTEMPTS,
+                 backoff: float = MAIL_BACKOFF, lease: float = MAIL_LEASE,
+                 on_sent: Optional[Callable[[str, str], None]] = None):
+        self.db_path        = db_path
+        self.connect        = connect
+        self.interval       = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.per_connection = per_connection
+        self.idle           = idle
+        self.max_attempts   = max_attempts
+        self.backoff        = backoff
+        self.lease          = lease
+        self.on_sent        = on_sent              # on_sent(key, recipient) after delivery
+        self._local         = threading.local()
+        self._lock          = threading.Lock()
+        self._wake          = threading.Event()
+        self._stop          = threading.Event()
+        self._thread:       Optional[threading.Thread] = None
+        self._server:       Optional[smtplib.SMTP] = None
+        self._server_sent   = 0
+        self._last_send     = 0.0
+        self._stats         = {"enqueued": 0, "duplicates": 0, "sent": 0, "retries": 0,
+                               "failed": 0, "connections": 0}
+
+    # ── Storage ──────────────────────────────────────────────────────────────
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    def enqueue(self, sender: str, recipient: str, message: str, key: Optional[str] = None) -> tuple[int, bool]:
+        """
+        Queue a fully formatted message. Returns (outbox id, created); created
+        is False when `key` was already queued or sent.
+        """
+        key = key or f"adhoc:{uuid.uuid4().hex}"
+        now = time.time()
+        conn = self._db()
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO outbox (key, sender, recipient, message, next_attempt, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)", (key, sender, recipient, message, now, now))
+        created = cur.rowcount > 0
+        row_id = cur.lastrowid if created else conn.execute(
+            "SELECT id FROM outbox WHERE key = ?", (key,)).fetchone()[0]
+        self._count("enqueued" if created else "duplicates")
+        if created:
+            self.start()
+            self._wake.set()
+        return row_id, created
+
+    def enqueue_many(self, sender: str, messages: list[tuple[str, str, str]]) -> int:
+        """(recipient, message, key) triples in one transaction; returns how many were new."""
+        now = time.time()
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (key, sender, recipient, message, next_attempt, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, sender, recipient, message, now, now) for recipient, message, key in messages])
+            created = conn.total_changes - before
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._count("enqueued", created)
+        self._count("duplicates", len(messages) - created)
+        if created:
+            self.start()
+            self._wake.set()
+        return created
+
+    def existing(self, keys: list[str]) -> set[str]:
+        """The subset of `keys` already in the outbox (any status)."""
+        conn, found = self._db(), set()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            found.update(k for (k,) in conn.execute(
+                f"SELECT key FROM outbox WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+        return found
+
+    def status(self, row_id: int) -> Optional[dict]:
+        row = self._db().execute(
+            "SELECT key, recipient, status, attempts, last_error, sent_at FROM outbox WHERE id = ?",
+            (row_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("key", "recipient", "status", "attempts", "lastError", "sentAt"), row))
+
+    def wait(self, row_id: int, timeout: float = 60.0) -> Optional[dict]:
+        """Poll until the message is sent or failed; returns its status (possibly still pending)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            st = self.status(row_id)
+            if st is None or st["status"] in ("sent", "failed") or time.monotonic() >= deadline:
+                return st
+            time.sleep(0.25)
+
+    def _claim(self) -> Optional[tuple]:
+        """Take the next due row (or one whose lease ran out) for this worker."""
+        now = time.time()
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, key, sender, recipient, message, attempts FROM outbox"
+                " WHERE status IN ('pending', 'sending') AND next_attempt <= ?"
+                " ORDER BY next_attempt LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                # while sending, next_attempt doubles as the lease expiry
+                conn.execute("UPDATE outbox SET status = 'sending', next_attempt = ? WHERE id = ?",
+                             (now + self.lease, row[0]))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return row
+
+    def _next_due(self) -> Optional[float]:
+        row = self._db().execute(
+            "SELECT MIN(next_attempt) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()
+        return row[0]
+
+    def _mark(self, row_id: int, status: str, attempts: int, error: Optional[str] = None,
+              next_attempt: Optional[float] = None) -> None:
+        now = time.time()
+        self._db().execute(
+            "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, next_attempt = ?, sent_at = ?"
+            " WHERE id = ?",
+            (status, attempts, error, next_attempt if next_attempt is not None else now,
+             now if status == "sent" else None, row_id))
+
+    # ── SMTP session ─────────────────────────────────────────────────────────
+
+    def _session(self) -> smtplib.SMTP:
+        if self._server is not None and self._server_sent >= self.per_connection:
+            self._close()
+        if self._server is None:
+            self._server = self.connect()
+            self._server_sent = 0
+            self._count("connections")
+        return self._server
+
+    def _close(self) -> None:
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+
+    def _throttle(self) -> None:
+        delay = self._last_send + self.interval - time.monotonic()
+        if delay > 0:
+            self._stop.wait(delay)
+        self._last_send = time.monotonic()
+
+    def _deliver(self, sender: str, recipient: str, message: str) -> None:
+        for fresh in (False, True):
+            server = self._session()
+            try:
+                refused = server.sendmail(sender, [recipient], _wire(message))
+            except smtplib.SMTPServerDisconnected:
+                # a pooled session the server closed while idle: reconnect once
+                self._close()
+                if fresh:
+                    raise
+                continue
+            except smtplib.SMTPRecipientsRefused as e:
+                code, resp = next(iter(e.recipients.values()))
+                raise (PermanentMailError(f"{code} {resp!r}") if code >= 500 else e)
+            except smtplib.SMTPResponseException as e:
+                # sendmail() has already RSET the session, which stays usable
+                if e.smtp_code >= 500:
+                    raise PermanentMailError(f"{e.smtp_code} {e.smtp_error!r}") from e
+                raise
+            self._server_sent += 1
+            if refused:
+                code, resp = next(iter(refused.values()))
+                raise PermanentMailError(f"{code} {resp!r}")
+            return
+
+    def _send_one(self, row: tuple) -> None:
+        row_id, key, sender, recipient, message, attempts = row
+        attempts += 1
+        self._throttle()
+        try:
+            self._deliver(sender, recipient, message)
+        except PermanentMailError as e:
+            self._mark(row_id, "failed", attempts, str(e)[:500])
+            self._count("failed")
+            print(f"[mail_queue] {key} to {recipient} rejected: {e}")
+            return
+        except (smtplib.SMTPException, OSError) as e:
+            self._close()
+            err = f"{type(e).__name__}: {str(e)[:300]}"
+            if attempts >= self.max_attempts:
+                self._mark(row_id, "failed", attempts, err)
+                self._count("failed")
+                print(f"[mail_queue] {key} to {recipient} failed after {attempts} attempts: {err}")
+            else:
+                delay = min(MAX_BACKOFF, self.backoff * 2 ** (attempts - 1))
+                self._mark(row_id, "pending", attempts, err, time.time() + delay)
+                self._count("retries")
+                print(f"[mail_queue] {key} to {recipient} attempt {attempts} failed ({err}), retry in {delay:.0f}s")
+            return
+
+        self._mark(row_id, "sent", attempts)
+        self._count("sent")
+        if self.on_sent is not None:
+            try:
+                self.on_sent(key, recipient)
+            except Exception as e:
+                print(f"[mail_queue] on_sent error for {key}: {e}")
+
+    # ── Worker ───────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True, name="mail-queue")
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                print(f"[mail_queue] outbox error: {e}")
+                row = None
+                self._stop.wait(5)
+            if row is not None:
+                try:
+                    self._send_one(row)
+                except Exception as e:
+                    # never let one bad row stop the worker
+                    self._close()
+                    self._mark(row[0], "failed", row[5] + 1, f"{type(e).__name__}: {str(e)[:300]}")
+                    self._count("failed")
+                    print(f"[mail_queue] {row[1]} failed: {e}")
+                continue
+
+            due = self._next_due()
+            wait = self.idle if due is None else max(0.0, min(self.idle, due - time.time()))
+            if not self._wake.wait(wait) and self._server is not None and (due is None or due > time.time()):
+                self._close()       # idle: release the session rather than let the server drop it
+        self._close()
+
+    def get_stats(self) -> dict:
+        counts = dict(self._db().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(outbox=counts, perMinute=round(60.0 / self.interval, 2) if self.interval else None,
+                     perConnection=self.per_connection, connected=self._server is not None)
+        return stats
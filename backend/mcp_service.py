@@ -37,9 +37,7 @@ Run standalone (SSE on port 8001):
     python mcp_service.py
 """
 
-import json
 import math
-import os
 from typing import Any
 
 import yfinance as yf
@@ -71,20 +69,14 @@ def _safe_float(v: Any) -> float | None:
 
 
 def _load_user_data(email: str) -> dict | str:
-    """Load a user's portfolio JSON; return dict or an error string."""
-    holdings_path = os.path.join(os.path.dirname(__file__), "holdings.json")
-    if not os.path.exists(holdings_path):
-        return "Holdings store not found."
-    with open(holdings_path) as f:
-        index = json.load(f)
-    data_file = index.get("users", {}).get(email)
-    if not data_file:
+    """Load a user's portfolio document; return dict or an error string."""
+    import user_store
+    if user_store.get_meta(email) is None:
         return f"No portfolio found for {email}"
-    user_path = os.path.join(os.path.dirname(__file__), data_file)
-    if not os.path.exists(user_path):
-        return "User portfolio file missing."
-    with open(user_path) as f:
-        return json.load(f)
+    user = user_store.load_user(email)
+    if not user:
+        return "User portfolio not set up yet."
+    return user
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -1,18 +1,31 @@
 import requests
+import httpx
 from bs4 import BeautifulSoup
 import json
 import re
 
 URL = "https://www.tickertape.in/mutualfunds/hdfc-flexi-cap-fund-M_HDCEQ"
 
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                         "AppleWebKit/537.36 (KHTML, like Gecko) "
+                         "Chrome/100.0.4896.88 Safari/537.36"}
+
 def scrape_mf(url):
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                             "AppleWebKit/537.36 (KHTML, like Gecko) "
-                             "Chrome/100.0.4896.88 Safari/537.36"}
-    
-    resp = requests.get(url, headers=headers)
+    resp = requests.get(url, headers=HEADERS)
+    resp.raise_for_status()
+    return parse_mf_page(resp.text)
+
+async def ascrape_mf(url, client: httpx.AsyncClient = None):
+    """Async scrape_mf; pass a shared AsyncClient to reuse connections across funds."""
+    if client is None:
+        async with httpx.AsyncClient(headers=HEADERS, follow_redirects=True, timeout=20) as own:
+            return await ascrape_mf(url, own)
+    resp = await client.get(url, headers=HEADERS)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    return parse_mf_page(resp.text)
+
+def parse_mf_page(html):
+    soup = BeautifulSoup(html, "html.parser")
 
     data = {}
 
@@ -12,7 +12,6 @@ import math
 import time
 import concurrent.futures
 import requests
-import os
 from typing import Optional
 
 
@@ -111,6 +110,9 @@ MF_RISK_CATEGORIES = {
 _mf_pulse_cache: dict = {}
 _CACHE_TTL = 1800  # 30 minutes
 
+REASON_WORKERS      = 3  # concurrent LLM calls for the top-3 explanations
+REASON_SCORE_BUCKET = 5  # signal-score width sharing one cached explanation
+
 
 def _nav(data: list, idx: int) -> float:
     return float(data[min(idx, len(data) - 1)]["nav"].replace(",", ""))
@@ -275,12 +277,40 @@ def analyse_mf(query: str) -> dict:
         return {"success": False, "error": str(e)}
 
 
+def _mf_reasons(mf: dict, risk: str, horizon: str, invest_ctx: str) -> str:
+    """Two LLM bullet points for one fund, cached per (fund, score bucket, profile)."""
+    import llm_cache
+    import llm_gateway
+
+    ret1y = mf.get("ret_1y")
+    prompt = (
+        f"You are a concise Indian mutual fund analyst. Write exactly 2 short bullet points (each starting with •) "
+        f"explaining why {mf['name']} ({mf['category']} fund by {mf['amc']}) suits a {risk} investor "
+        f"with a {horizon}-term horizon investing {invest_ctx}. "
+        f"Data: Signal {mf['signal_score']}/100 | 1M: {mf['ret_1m']}% | 3M: {mf['ret_3m']}% | "
+        f"6M: {mf['ret_6m']}%" + (f" | 1Y: {ret1y}%" if ret1y is not None else "") + ". "
+        f"Write only the 2 bullets, nothing else."
+    )
+
+    def call():
+        msg = llm_gateway.create_message("suggest_mfs", model="claude-sonnet-4-6", max_tokens=256,
+                                         messages=[{"role": "user", "content": prompt}])
+        return msg.content[0].text.strip(), llm_gateway.usage_of(msg)
+
+    key = [mf["name"], int(mf["signal_score"] // REASON_SCORE_BUCKET), risk, horizon, invest_ctx]
+    try:
+        return llm_cache.get_or_call("mf_reasons", "claude-sonnet-4-6", key, call)
+    except Exception:
+        return (
+            f"• Signal score of {mf['signal_score']}/100 with "
+            f"{'strong' if mf['signal_score'] >= 65 else 'steady'} return consistency.\n"
+            f"• 3-month return of {mf['ret_3m']}%"
+            + (f" and 1-year return of {ret1y}% reflect solid long-term performance." if ret1y else ".")
+        )
+
+
 def suggest_mfs(amount: int, horizon: str, risk: str, category: str | None,
                 investment_type: str = "lumpsum", duration_years: int = 0) -> list:
-    from dotenv import load_dotenv, find_dotenv
-    load_dotenv(find_dotenv())
-    import anthropic
-
     pulse   = get_mf_pulse_data()
     all_mfs = pulse.get("all", [])
 
@@ -294,37 +324,13 @@ def suggest_mfs(amount: int, horizon: str, risk: str, category: str | None,
 
     top3 = sorted(candidates, key=lambda x: x["signal_score"], reverse=True)[:3]
 
-    api_key  = os.getenv("ANTHROPIC_API_KEY", "")
-    resource = os.getenv("ANTHROPIC_FOUNDRY_RESOURCE", "")
-    client   = anthropic.AnthropicFoundry(api_key=api_key, resource=resource) if resource else anthropic.Anthropic(api_key=api_key)
-
     if investment_type == "sip":
         invest_ctx = f"₹{amount:,}/month SIP for {duration_years} year{'s' if duration_years != 1 else ''}"
     else:
         invest_ctx = f"₹{amount:,} lumpsum"
 
-    suggestions = []
-    for i, mf in enumerate(top3):
-        ret1y = mf.get("ret_1y")
-        prompt = (
-            f"You are a concise Indian mutual fund analyst. Write exactly 2 short bullet points (each starting with •) "
-            f"explaining why {mf['name']} ({mf['category']} fund by {mf['amc']}) suits a {risk} investor "
-            f"with a {horizon}-term horizon investing {invest_ctx}. "
-            f"Data: Signal {mf['signal_score']}/100 | 1M: {mf['ret_1m']}% | 3M: {mf['ret_3m']}% | "
-            f"6M: {mf['ret_6m']}%" + (f" | 1Y: {ret1y}%" if ret1y is not None else "") + ". "
-            f"Write only the 2 bullets, nothing else."
-        )
-        try:
-            msg     = client.messages.create(model="claude-sonnet-4-6", max_tokens=256,
-                                             messages=[{"role": "user", "content": prompt}])
-            reasons = msg.content[0].text.strip()
-        except Exception:
-            reasons = (
-                f"• Signal score of {mf['signal_score']}/100 with "
-                f"{'strong' if mf['signal_score'] >= 65 else 'steady'} return consistency.\n"
-                f"• 3-month return of {mf['ret_3m']}%"
-                + (f" and 1-year return of {ret1y}% reflect solid long-term performance." if ret1y else ".")
-            )
-        suggestions.append({**mf, "rank": i + 1, "reasons": reasons})
+    with concurrent.futures.ThreadPoolExecutor(max_workers=REASON_WORKERS) as ex:
+        reasons = list(ex.map(lambda f: _mf_reasons(f, risk, horizon, invest_ctx), top3))
 
+    suggestions = [{**mf, "rank": i + 1, "reasons": r} for i, (mf, r) in enumerate(zip(top3, reasons))]
     return suggestions
@@ -1,4 +1,6 @@
+import asyncio
 import requests
+import httpx
 from typing import List, Dict
 import logging
 from bs4 import BeautifulSoup
@@ -31,33 +33,37 @@ class NewsService:
             response = requests.get(url, headers=self.headers, timeout=15)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            news_items = []
-            
-            # Finviz news table
-            news_table = soup.find('table', class_='fullview-news-outer')
-            if news_table:
-                rows = news_table.find_all('tr')[:limit]
-                
-                for row in rows:
-                    cells = row.find_all('td')
-                    if len(cells) >= 2:
-                        title_cell = cells[1]
-                        link = title_cell.find('a')
-                        if link:
-                            title = link.get_text(strip=True)
-                            if title and len(title) > 10:
-                                news_items.append({
-                                    'title': title,
-                                    'source': 'Finviz'
-                                })
-            
-            return news_items
+            return self._parse_finviz(response.content, limit)
             
         except Exception as e:
             # logger.error(f"Error scraping Finviz: {e}")
             return []
 
+    @staticmethod
+    def _parse_finviz(content: bytes, limit: int) -> List[Dict[str, str]]:
+        soup = BeautifulSoup(content, 'html.parser')
+        news_items = []
+        
+        # Finviz news table
+        news_table = soup.find('table', class_='fullview-news-outer')
+        if news_table:
+            rows = news_table.find_all('tr')[:limit]
+            
+            for row in rows:
+                cells = row.find_all('td')
+                if len(cells) >= 2:
+                    title_cell = cells[1]
+                    link = title_cell.find('a')
+                    if link:
+                        title = link.get_text(strip=True)
+                        if title and len(title) > 10:
+                            news_items.append({
+                                'title': title,
+                                'source': 'Finviz'
+                            })
+        
+        return news_items
+
     def scrape_seeking_alpha_news(self, symbol: str, limit: int = 3) -> List[Dict[str, str]]:
         """
         Scrape news headlines from Seeking Alpha RSS feed for a given stock symbol.
@@ -71,21 +77,7 @@ class NewsService:
             response = requests.get(url, headers=self.headers, timeout=10)
             
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'xml')
-                news_items = []
-                
-                items = soup.find_all('item')[:limit]
-                for item in items:
-                    title_tag = item.find('title')
-                    if title_tag:
-                        title = title_tag.get_text(strip=True)
-                        if title:
-                            news_items.append({
-                                'title': title,
-                                'source': 'Seeking Alpha'
-                            })
-                
-                return news_items
+                return self._parse_seeking_alpha(response.content, limit)
             
         except Exception as e:
             # logger.error(f"Error scraping Seeking Alpha: {e}")
@@ -99,26 +91,48 @@ class NewsService:
             response = requests.get(url, headers=self.headers, timeout=10)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            news_items = []
-            
-            # Simple Google News search results
-            headlines = soup.find_all('h3')[:limit]
-            
-            for headline in headlines:
-                title = headline.get_text(strip=True)
-                if title and len(title) > 15:
-                    news_items.append({
-                        'title': title,
-                        'source': 'Web Search'
-                    })
-            
-            return news_items
+            return self._parse_web_search(response.content, limit)
             
         except Exception as e:
             # logger.error(f"Error with web search fallback: {e}")
             return []
 
+    @staticmethod
+    def _parse_seeking_alpha(content: bytes, limit: int) -> List[Dict[str, str]]:
+        soup = BeautifulSoup(content, 'xml')
+        news_items = []
+        
+        items = soup.find_all('item')[:limit]
+        for item in items:
+            title_tag = item.find('title')
+            if title_tag:
+                title = title_tag.get_text(strip=True)
+                if title:
+                    news_items.append({
+                        'title': title,
+                        'source': 'Seeking Alpha'
+                    })
+        
+        return news_items
+
+    @staticmethod
+    def _parse_web_search(content: bytes, limit: int) -> List[Dict[str, str]]:
+        soup = BeautifulSoup(content, 'html.parser')
+        news_items = []
+        
+        # Simple Google News search results
+        headlines = soup.find_all('h3')[:limit]
+        
+        for headline in headlines:
+            title = headline.get_text(strip=True)
+            if title and len(title) > 15:
+                news_items.append({
+                    'title': title,
+                    'source': 'Web Search'
+                })
+        
+        return news_items
+
     def scrape_marketwatch_news(self, symbol: str, limit: int = 3) -> List[Dict[str, str]]:
         """
         Scrape news headlines from MarketWatch for a given stock symbol.
@@ -177,6 +191,49 @@ class NewsService:
 
         return self.fetch_mock_news(symbol, limit)
 
+    async def _ascrape_finviz_news(self, client: httpx.AsyncClient, symbol: str, limit: int) -> List[Dict[str, str]]:
+        try:
+            await asyncio.sleep(random.uniform(1, 2))
+            response = await client.get(f"https://finviz.com/quote.ashx?t={symbol}", timeout=15)
+            response.raise_for_status()
+            return self._parse_finviz(response.content, limit)
+        except Exception:
+            return []
+
+    async def _ascrape_seeking_alpha_news(self, client: httpx.AsyncClient, symbol: str, limit: int) -> List[Dict[str, str]]:
+        try:
+            await asyncio.sleep(random.uniform(1, 2))
+            response = await client.get(f"https://seekingalpha.com/api/sa/combined/{symbol}.xml", timeout=10)
+            if response.status_code == 200:
+                return self._parse_seeking_alpha(response.content, limit)
+        except Exception:
+            return []
+
+        try:
+            query = quote_plus(f"{symbol} stock news")
+            response = await client.get(f"https://www.google.com/search?q={query}&tbm=nws", timeout=10)
+            response.raise_for_status()
+            return self._parse_web_search(response.content, limit)
+        except Exception:
+            return []
+
+    async def afetch_stock_news(self, symbol: str, limit: int = 3) -> List[Dict[str, str]]:
+        """
+        Async fetch_stock_news: Finviz and Seeking Alpha are requested concurrently
+        and merged in the same priority order (Finviz first, then Seeking Alpha).
+        """
+        async with httpx.AsyncClient(headers=self.headers, follow_redirects=True) as client:
+            finviz_news, sa_news = await asyncio.gather(
+                self._ascrape_finviz_news(client, symbol, limit),
+                self._ascrape_seeking_alpha_news(client, symbol, limit),
+            )
+
+        all_news = (finviz_news + sa_news)[:limit]
+        if all_news:
+            return all_news
+
+        return self.fetch_mock_news(symbol, limit)
+
     def fetch_mock_news(self, symbol: str, limit: int = 3) -> List[Dict[str, str]]:
         """
         Fetch mock news headlines for a given stock symbol.
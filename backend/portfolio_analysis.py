@@ -6,16 +6,24 @@ Risk-free rate: 6.5% (India 91-day T-bill proxy, FY2025-26)
 Tax rates (equity, FY2025-26): LTCG 12.5% (above ₹1.25L exemption), STCG 20%
 """
 
-import math
 import datetime
+import threading
+import time
 import numpy as np
-import yfinance as yf
+
+import price_history
+import risk_analytics
+from return_engine import PortfolioReturns, ROLLING, WINDOWS
 
 RISK_FREE_RATE = 0.065  # 6.5% India 91-day T-bill proxy
 LTCG_RATE = 0.125       # 12.5%
 STCG_RATE = 0.20        # 20%
 LTCG_THRESHOLD_DAYS = 365
-MAX_STOCKS = 15         # limit yfinance calls to avoid timeout
+HISTORY_DAYS = 380      # ~1 year of daily closes (1Y chart; metrics use the last 6M)
+THREE_M, SIX_M, ONE_Y = WINDOWS["3m"], WINDOWS["6m"], WINDOWS["1y"]
+MIN_COVERAGE = 0.9      # share of benchmark sessions a stock needs to be included
+FILL_LIMIT   = 5        # sessions a missing close is carried forward
+SIZE_BUCKETS = (15, 50, 100, 250)   # latency is reported per portfolio-size bucket
 
 BENCHMARK_SYMBOLS = {
     "nifty50": "^NSEI",
@@ -118,133 +126,98 @@ def _build_holdings(stocks: list[dict], mutual_funds: list[dict]) -> list[dict]:
 def _compute_risk_and_chart(
     stocks: list[dict],
     benchmark_sym: str,
-) -> tuple[dict | None, list[dict]]:
+) -> tuple[dict | None, list[dict], list[dict], list[dict], dict]:
     """
-    Returns (risk_metrics_dict_or_None, chart_data_6m_list, chart_data_3m_list).
-    Fetches 180 days of daily closes for up to MAX_STOCKS stocks.
+    Returns (risk_metrics_dict_or_None, chart_6m, chart_3m, chart_1y, extras).
+    Daily closes for the benchmark and every stock come from price_history in
+    one batched, cached call (no per-portfolio cap); all windows, rolling
+    metrics and drawdowns come from one return_engine pass.
+    extras = {rolling: [...], drawdown: [...]} chart series plus
+    {risk: {...}}, the risk_analytics suite (VaR / CVaR, drawdown durations,
+    correlation clusters, per-holding risk contribution) over the 6M window.
     """
-    stock_pool = [s for s in stocks if s.get("symbol") and s.get("currentValue")]
-    stock_pool = stock_pool[:MAX_STOCKS]
-
-    if not stock_pool:
-        return None, [], [], []
-
-    total_stock_value = sum(float(s.get("currentValue", 0)) for s in stock_pool)
-    if total_stock_value <= 0:
-        return None, [], [], []
-
-    # Fetch benchmark
-    try:
-        bench_hist = yf.Ticker(benchmark_sym).history(period="6mo", interval="1d")
-        if bench_hist.empty:
-            return None, [], [], []
-        bench_closes = bench_hist["Close"].dropna()
-    except Exception:
-        return None, [], []
-
-    # Fetch each stock; weight by current value
-    stock_series = {}
-    weights = {}
-    for s in stock_pool:
-        sym = s["symbol"].strip().upper() + ".NS"
-        weight = float(s.get("currentValue", 0)) / total_stock_value
-        try:
-            hist = yf.Ticker(sym).history(period="6mo", interval="1d")
-            if hist.empty:
-                continue
-            closes = hist["Close"].dropna()
-            if len(closes) < 20:
-                continue
-            stock_series[s["symbol"]] = closes
-            weights[s["symbol"]] = weight
-        except Exception:
-            continue
-
-    if len(stock_series) < 5:
-        return None, [], []
-
-    # Re-normalise weights for stocks that have data
-    w_total = sum(weights.values())
-    if w_total <= 0:
-        return None, [], []
-    weights = {k: v / w_total for k, v in weights.items()}
-
-    # Align all series to common dates
     import pandas as pd
 
-    all_series = {"_bench": bench_closes}
-    for sym, s in stock_series.items():
-        all_series[sym] = s
-
-    df = pd.DataFrame(all_series).dropna()
-    if len(df) < 20:
-        return None, [], []
-
-    bench_ret = df["_bench"].pct_change().dropna()
-
-    # Weighted portfolio daily returns
-    port_ret = pd.Series(0.0, index=bench_ret.index)
-    for sym, w in weights.items():
-        if sym in df.columns:
-            r = df[sym].pct_change().dropna()
-            r = r.reindex(bench_ret.index, fill_value=0.0)
-            port_ret += w * r
-
-    if len(port_ret) < 10:
-        return None, [], []
-
-    # Annualised stats
-    port_annual  = float(port_ret.mean() * 252)
-    bench_annual = float(bench_ret.mean() * 252)
-    port_std     = float(port_ret.std())
-
-    cov_matrix = np.cov(port_ret.values, bench_ret.values)
-    beta = float(cov_matrix[0, 1] / cov_matrix[1, 1]) if cov_matrix[1, 1] != 0 else None
-
-    sharpe = round((port_annual - RISK_FREE_RATE) / (port_std * math.sqrt(252)), 2) if port_std > 0 else None
+    empty = (None, [], [], [], {})
 
-    # Cumulative return % series (starts at 0, not 100)
-    port_cum  = ((1 + port_ret).cumprod() - 1) * 100
-    bench_cum = ((1 + bench_ret).cumprod() - 1) * 100
-
-    port_6m_return  = round(float(port_cum.iloc[-1]), 2)
-    bench_6m_return = round(float(bench_cum.iloc[-1]), 2)
-
-    # Alpha = simple 6M excess return (portfolio outperformance vs benchmark)
-    alpha = round(port_6m_return - bench_6m_return, 2)
+    # Weight by current value; a symbol held twice is one position
+    values: dict[str, float] = {}
+    for s in stocks:
+        if s.get("symbol") and s.get("currentValue"):
+            sym = s["symbol"].strip().upper()
+            values[sym] = values.get(sym, 0.0) + float(s.get("currentValue", 0))
+    if not values or sum(values.values()) <= 0:
+        return empty
+
+    closes = price_history.get_closes([benchmark_sym] + [sym + ".NS" for sym in values], days=HISTORY_DAYS)
+    bench_closes = closes.get(benchmark_sym)
+    if bench_closes is None or len(bench_closes) < 20:
+        return empty
+
+    # Align on benchmark sessions; short gaps are carried forward. Coverage is
+    # judged over the 6M metric window: a stock listed 8 months ago still
+    # counts, and simply joins the 1Y series once it trades
+    frame = pd.DataFrame({sym: closes[sym + ".NS"] for sym in values if sym + ".NS" in closes})
+    frame = frame.reindex(bench_closes.index).ffill(limit=FILL_LIMIT)
+    recent = frame.iloc[-(SIX_M + 1):]
+    frame = frame.loc[:, recent.notna().mean() >= MIN_COVERAGE]
+    if frame.shape[1] < 5 or len(frame) < 20:
+        return empty
+
+    engine = PortfolioReturns(
+        frame.index, frame.to_numpy(dtype=float), bench_closes.to_numpy(dtype=float),
+        np.array([values[sym] for sym in frame.columns]), risk_free=RISK_FREE_RATE,
+    )
+    six_m = engine.stats(SIX_M)
+    if six_m["sessions"] < 10:
+        return empty
+    dd_6m = engine.drawdown_stats(SIX_M)
+    dd_1y = engine.drawdown_stats()
+
+    port_6m_return  = round(six_m["port_return"] * 100, 2)
+    bench_6m_return = round(six_m["bench_return"] * 100, 2)
 
     risk_metrics = {
-        "beta":             round(beta, 4) if beta is not None else None,
-        "alpha":            alpha,
-        "sharpe":           sharpe,
-        "port_annual":      round(port_annual * 100, 2),
-        "bench_annual":     round(bench_annual * 100, 2),
+        "beta":             round(six_m["beta"], 4) if six_m["beta"] is not None else None,
+        # Alpha = simple 6M excess return (portfolio outperformance vs benchmark)
+        "alpha":            round(port_6m_return - bench_6m_return, 2),
+        "sharpe":           round(six_m["sharpe"], 2) if six_m["sharpe"] is not None else None,
+        "port_annual":      round(six_m["port_annual"] * 100, 2),
+        "bench_annual":     round(six_m["bench_annual"] * 100, 2),
         "port_6m_return":   port_6m_return,
         "bench_6m_return":  bench_6m_return,
+        "volatility":       round(six_m["volatility"] * 100, 2),
+        "max_drawdown":     round(dd_6m["max_drawdown"] * 100, 2),
+        "current_drawdown": round(dd_6m["current_drawdown"] * 100, 2),
+        "max_drawdown_1y":  round(dd_1y["max_drawdown"] * 100, 2),
+        "port_1y_return":   round(engine.stats()["port_return"] * 100, 2) if len(engine) >= ONE_Y - 10 else None,
+        "stocks_analysed":  int(frame.shape[1]),
     }
 
-    # 6M chart — downsampled every 5 trading days
-    combined = pd.DataFrame({"portfolio": port_cum, "benchmark": bench_cum}).dropna()
-    sampled  = combined.iloc[::5]
-    chart_data = [
-        {"date": str(idx.date()), "portfolio": round(float(row["portfolio"]), 2), "benchmark": round(float(row["benchmark"]), 2)}
-        for idx, row in sampled.iterrows()
+    # Charts - downsampled every 5 trading days; each window rebased from 0
+    chart_data    = engine.chart(SIX_M)
+    chart_data_3m = engine.chart(THREE_M)
+    chart_data_1y = engine.chart(ONE_Y)
+
+    roll  = engine.rolling(ROLLING)
+    dates = engine.dates[ROLLING - 1:]
+    rolling = [
+        {"date": str(dates[i])[:10],
+         "volatility": round(float(roll["volatility"][i]) * 100, 2),
+         "beta":       None if np.isnan(roll["beta"][i]) else round(float(roll["beta"][i]), 3),
+         "sharpe":     None if np.isnan(roll["sharpe"][i]) else round(float(roll["sharpe"][i]), 2)}
+        for i in range(0, len(dates), 5)
     ]
+    dd = engine.drawdown(ONE_Y)
+    dd_dates = engine.dates[-len(dd):]
+    drawdown = [{"date": str(dd_dates[i])[:10], "drawdown": round(float(dd[i]) * 100, 2)}
+                for i in range(0, len(dd), 5)]
 
-    # 3M chart — last ~63 trading days, rebased from 0
-    THREE_M = 63
-    port_ret_3m  = port_ret.iloc[-THREE_M:]
-    bench_ret_3m = bench_ret.iloc[-THREE_M:]
-    port_cum_3m  = ((1 + port_ret_3m).cumprod() - 1) * 100
-    bench_cum_3m = ((1 + bench_ret_3m).cumprod() - 1) * 100
-    combined_3m  = pd.DataFrame({"portfolio": port_cum_3m, "benchmark": bench_cum_3m}).dropna()
-    sampled_3m   = combined_3m.iloc[::5]
-    chart_data_3m = [
-        {"date": str(idx.date()), "portfolio": round(float(row["portfolio"]), 2), "benchmark": round(float(row["benchmark"]), 2)}
-        for idx, row in sampled_3m.iterrows()
-    ]
+    risk = risk_analytics.analyse(engine, list(frame.columns), sum(values[sym] for sym in frame.columns),
+                                  window=SIX_M)
 
-    return risk_metrics, chart_data, chart_data_3m
+    return risk_metrics, chart_data, chart_data_3m, chart_data_1y, {"rolling": rolling, "drawdown": drawdown,
+                                                                    "risk": risk}
 
 
 # ---------------------------------------------------------------------------
@@ -359,6 +332,43 @@ def _portfolio_cagr(holdings: list[dict]) -> float | None:
     return _cagr(total_cost, total_cv, avg_days)
 
 
+# ---------------------------------------------------------------------------
+# Latency by portfolio size
+# ---------------------------------------------------------------------------
+
+_latency_lock = threading.Lock()
+_latency: dict[str, list[float]] = {}
+LATENCY_SAMPLES = 200
+
+
+def _size_bucket(n: int) -> str:
+    lo = 1
+    for hi in SIZE_BUCKETS:
+        if n <= hi:
+            return f"{lo}-{hi}"
+        lo = hi + 1
+    return f"{lo}+"
+
+
+def _record_latency(n_stocks: int, seconds: float) -> None:
+    with _latency_lock:
+        samples = _latency.setdefault(_size_bucket(n_stocks), [])
+        samples.append(seconds)
+        del samples[:-LATENCY_SAMPLES]
+
+
+def get_stats() -> dict:
+    """Risk/chart latency per portfolio-size bucket (last LATENCY_SAMPLES runs each) + history / covariance cache stats."""
+    with _latency_lock:
+        snapshot = {k: sorted(v) for k, v in _latency.items()}
+    by_size = {
+        bucket: {"runs": len(v), "p50": round(v[len(v) // 2], 3),
+                 "p95": round(v[min(len(v) - 1, int(len(v) * 0.95))], 3), "max": round(v[-1], 3)}
+        for bucket, v in snapshot.items()
+    }
+    return {"latencyBySize": by_size, "history": price_history.get_stats(), "covariance": risk_analytics.get_stats()}
+
+
 # ---------------------------------------------------------------------------
 # Public entry point
 # ---------------------------------------------------------------------------
@@ -385,7 +395,10 @@ def compute_portfolio_metrics(
         port_cagr      = _portfolio_cagr(holdings)
 
         # 3. Risk metrics + chart (stocks only)
-        risk_metrics, chart_data, chart_data_3m = _compute_risk_and_chart(stocks, benchmark_sym)
+        t0 = time.time()
+        risk_metrics, chart_data, chart_data_3m, chart_data_1y, extras = _compute_risk_and_chart(stocks, benchmark_sym)
+        n_stocks = len({s["symbol"] for s in stocks if s.get("symbol")})
+        _record_latency(n_stocks, time.time() - t0)
 
         bench_cagr      = None
         alpha           = None
@@ -421,6 +434,11 @@ def compute_portfolio_metrics(
                 "alpha":            alpha,
                 "beta":             beta,
                 "sharpe":           sharpe,
+                "volatility":       (risk_metrics or {}).get("volatility"),
+                "max_drawdown":     (risk_metrics or {}).get("max_drawdown"),
+                "current_drawdown": (risk_metrics or {}).get("current_drawdown"),
+                "max_drawdown_1y":  (risk_metrics or {}).get("max_drawdown_1y"),
+                "port_1y_return":   (risk_metrics or {}).get("port_1y_return"),
                 "total_invested":   round(total_invested, 2),
                 "total_current":    round(total_current, 2),
                 "total_pnl":        round(total_pnl, 2),
@@ -428,6 +446,10 @@ def compute_portfolio_metrics(
             "holdings":      public_holdings,
             "chart_data":    chart_data,
             "chart_data_3m": chart_data_3m,
+            "chart_data_1y": chart_data_1y,
+            "rolling":       extras.get("rolling", []),
+            "drawdown":      extras.get("drawdown", []),
+            "risk":          extras.get("risk"),
             "tax":           tax,
         }
 
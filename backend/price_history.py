@@ -0,0 +1,214 @@
+"""
+price_history.py - Batched, cached daily close history (yfinance).
+
+  Cache      - daily closes live in SQLite (AGENT_HISTORY_DB, WAL) with a
+               per-symbol fetch marker; a symbol fetched within
+               AGENT_HISTORY_TTL seconds is served without a network call
+  Refresh    - stale symbols only fetch from their last cached bar (minus a
+               few days for revisions) instead of the whole window
+  Batching   - misses go out as yf.download() calls of up to
+               AGENT_HISTORY_BATCH tickers, each fetching its tickers on
+               AGENT_HISTORY_WORKERS threads; the calls themselves run one at
+               a time, since yf.download keeps per-call state in module globals
+  Budget     - get_closes() returns after AGENT_HISTORY_BUDGET seconds with
+               whatever has arrived; late symbols fall back to stale cached
+               bars (if any) and land in the cache for the next call
+
+get_closes() takes yfinance tickers (".NS" suffix already applied) and
+returns {ticker: pandas.Series of closes indexed by date}.
+"""
+
+import concurrent.futures
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import yfinance as yf
+
+HISTORY_DB      = os.getenv("AGENT_HISTORY_DB", os.path.join(os.path.dirname(__file__), "price_history.db"))
+HISTORY_TTL     = float(os.getenv("AGENT_HISTORY_TTL", "3600"))
+HISTORY_BATCH   = int(os.getenv("AGENT_HISTORY_BATCH", "40"))
+HISTORY_WORKERS = int(os.getenv("AGENT_HISTORY_WORKERS", "8"))
+HISTORY_BUDGET  = float(os.getenv("AGENT_HISTORY_BUDGET", "20"))
+REFRESH_OVERLAP = 5                      # days re-fetched before the last cached bar
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS closes (
+    symbol TEXT NOT NULL,
+    date   TEXT NOT NULL,
+    close  REAL NOT NULL,
+    PRIMARY KEY (symbol, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fetches (
+    symbol     TEXT PRIMARY KEY,
+    start_date TEXT NOT NULL,            -- earliest date requested from upstream
+    last_date  TEXT,                     -- newest bar stored
+    fetched_at REAL NOT NULL
+);
+"""
+
+_local         = threading.local()
+_pool          = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="price-history")
+_download_lock = threading.Lock()
+_lock          = threading.Lock()
+_stats         = {"requests": 0, "symbols": 0, "hits": 0, "refreshed": 0, "fetched": 0, "missing": 0,
+                  "late": 0, "batches": 0, "batch_errors": 0}
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(HISTORY_DB, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _count(**deltas: int) -> None:
+    with _lock:
+        for k, v in deltas.items():
+            _stats[k] += v
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Upstream
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _download(tickers: list[str], start: datetime.date) -> dict[str, pd.Series]:
+    """One yf.download() for `tickers` from `start`; tickers without data are absent."""
+    with _download_lock:
+        df = yf.download(tickers, start=start.isoformat(), interval="1d", group_by="column",
+                         auto_adjust=True, threads=min(HISTORY_WORKERS, len(tickers)), progress=False)
+    if df is None or df.empty:
+        return {}
+    closes = df["Close"]
+    if isinstance(closes, pd.Series):            # single ticker, flat columns
+        closes = closes.to_frame(tickers[0])
+    out = {}
+    for t in tickers:
+        if t in closes.columns:
+            s = closes[t].dropna()
+            if not s.empty:
+                out[t] = s
+    return out
+
+
+def _store(series: dict[str, pd.Series], requested: dict[str, datetime.date]) -> None:
+    """Persist fetched bars; every requested ticker gets a fetch marker (even without data)."""
+    now = time.time()
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for t, s in series.items():
+            conn.executemany("INSERT OR REPLACE INTO closes (symbol, date, close) VALUES (?, ?, ?)",
+                             [(t, idx.date().isoformat(), float(v)) for idx, v in s.items()])
+        for t, start in requested.items():
+            last = series[t].index[-1].date().isoformat() if t in series else None
+            conn.execute(
+                "INSERT INTO fetches (symbol, start_date, last_date, fetched_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(symbol) DO UPDATE SET start_date = MIN(start_date, excluded.start_date),"
+                " last_date = COALESCE(MAX(last_date, excluded.last_date), last_date, excluded.last_date),"
+                " fetched_at = excluded.fetched_at",
+                (t, start.isoformat(), last, now))
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _fetch_batch(tickers: list[str], start: datetime.date, requested: dict[str, datetime.date]) -> int:
+    try:
+        series = _download(tickers, start)
+    except Exception as e:
+        _count(batches=1, batch_errors=1)
+        print(f"[price_history] download of {len(tickers)} tickers failed: {e}")
+        return 0
+    _store(series, {t: requested[t] for t in tickers})
+    _count(batches=1)
+    return len(series)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Public API
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _read(tickers: list[str], start: datetime.date) -> dict[str, pd.Series]:
+    conn, out = _conn(), {}
+    for i in range(0, len(tickers), 500):
+        chunk = tickers[i:i + 500]
+        rows = conn.execute(
+            f"SELECT symbol, date, close FROM closes WHERE date >= ? AND symbol IN ({','.join('?' * len(chunk))})"
+            " ORDER BY symbol, date", (start.isoformat(), *chunk)).fetchall()
+        by_sym: dict[str, tuple[list, list]] = {}
+        for sym, d, c in rows:
+            dates, vals = by_sym.setdefault(sym, ([], []))
+            dates.append(d)
+            vals.append(c)
+        for sym, (dates, vals) in by_sym.items():
+            out[sym] = pd.Series(vals, index=pd.to_datetime(dates), name=sym)
+    return out
+
+
+def get_closes(tickers: list[str], days: int = 183, budget: float = HISTORY_BUDGET) -> dict[str, pd.Series]:
+    """
+    Daily closes for the last `days` calendar days of each ticker. Fresh
+    cache entries are used as is; the rest are fetched in batches in the
+    background and the call waits at most `budget` seconds for them.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    start = datetime.date.today() - datetime.timedelta(days=days)
+    now = time.time()
+
+    conn = _conn()
+    marks = {}
+    for i in range(0, len(tickers), 500):
+        chunk = tickers[i:i + 500]
+        marks.update((sym, (s, l, f)) for sym, s, l, f in conn.execute(
+            f"SELECT symbol, start_date, last_date, fetched_at FROM fetches"
+            f" WHERE symbol IN ({','.join('?' * len(chunk))})", chunk))
+
+    full, refresh = [], {}
+    for t in tickers:
+        mark = marks.get(t)
+        if mark is None or mark[0] > start.isoformat():
+            full.append(t)                                   # never fetched, or not this far back
+        elif now - mark[2] >= HISTORY_TTL:
+            last = datetime.date.fromisoformat(mark[1]) if mark[1] else start
+            refresh[t] = max(start, last - datetime.timedelta(days=REFRESH_OVERLAP))
+    _count(requests=1, symbols=len(tickers), hits=len(tickers) - len(full) - len(refresh),
+           refreshed=len(refresh), fetched=len(full))
+
+    # one batch list per start date: full fetches share `start`, refreshes share their earliest gap
+    requested = {t: start for t in full}
+    requested.update(refresh)
+    batches = [(full[i:i + HISTORY_BATCH], start) for i in range(0, len(full), HISTORY_BATCH)]
+    refresh_syms = sorted(refresh, key=refresh.get)
+    for i in range(0, len(refresh_syms), HISTORY_BATCH):
+        chunk = refresh_syms[i:i + HISTORY_BATCH]
+        batches.append((chunk, refresh[chunk[0]]))
+
+    if batches:
+        futures = [_pool.submit(_fetch_batch, chunk, batch_start, requested) for chunk, batch_start in batches]
+        done, late = concurrent.futures.wait(futures, timeout=budget)
+        if late:
+            _count(late=sum(len(batches[futures.index(f)][0]) for f in late))
+            print(f"[price_history] {len(late)}/{len(futures)} batches still running after {budget:.0f}s budget")
+
+    out = _read(tickers, start)
+    _count(missing=len(tickers) - len(out))
+    return out
+
+
+def get_stats() -> dict:
+    conn = _conn()
+    cached = conn.execute("SELECT COUNT(*) FROM fetches").fetchone()[0]
+    with _lock:
+        stats = dict(_stats)
+    stats.update(cachedSymbols=cached, ttl=HISTORY_TTL, batch=HISTORY_BATCH, workers=HISTORY_WORKERS,
+                 budget=HISTORY_BUDGET)
+    return stats
@@ -8,7 +8,6 @@ Pipeline:
   4. Expose query_finance_kb(question) -> str for answer retrieval
 """
 
-import os
 from pathlib import Path
 
 from langchain_community.document_loaders import PyPDFLoader
@@ -16,7 +15,8 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain.chains import RetrievalQA
-from langchain_anthropic import ChatAnthropic
+
+import llm_gateway
 
 PDF_PATH = Path(__file__).parent / "finance_pdfs" / "NSDL_Finance.pdf"
 # CHROMA_DIR = Path(__file__).parent / "finance_db" / "nsdl_chroma"
@@ -63,19 +63,7 @@ def query_finance_kb(question: str, k: int = 4) -> str:
     vectorstore = get_vectorstore()
     retriever = vectorstore.as_retriever(search_kwargs={"k": k})
 
-    _api_key = os.getenv("ANTHROPIC_API_KEY", "")
-    _resource = os.getenv("ANTHROPIC_FOUNDRY_RESOURCE", "")
-    _url = (
-        f"https://{_resource}.services.ai.azure.com/anthropic" if _resource else "https://api.anthropic.com"
-    )
-    _headers = {"Authorization": f"Bearer {_api_key}"} if _resource else {}
-
-    llm = ChatAnthropic(
-        model=ANTHROPIC_MODEL,
-        anthropic_api_key=_api_key,
-        anthropic_api_url=_url,
-        default_headers=_headers,
-    )
+    llm = llm_gateway.get_chat_model(ANTHROPIC_MODEL)
 
     chain = RetrievalQA.from_chain_type(
         llm=llm,
@@ -84,7 +72,7 @@ def query_finance_kb(question: str, k: int = 4) -> str:
         return_source_documents=False,
     )
 
-    result = chain.invoke({"query": question})
+    result = llm_gateway.invoke("rag_query", chain, {"query": question})
     return result.get("result", "No answer found.")
 
 
@@ -11,7 +11,6 @@ Signal Score (0-100):
 import math
 import time
 import concurrent.futures
-import os
 from typing import Optional
 
 from helper_func import analyze_sentiment
@@ -155,6 +154,9 @@ RISK_SECTORS = {
 _pulse_cache: dict = {}
 _CACHE_TTL = 1800  # 30 minutes
 
+REASON_WORKERS      = 3  # concurrent LLM calls for the top-3 explanations
+REASON_SCORE_BUCKET = 5  # signal-score width sharing one cached explanation
+
 
 # ── Indicator helpers ──────────────────────────────────────────────────────────
 
@@ -339,13 +341,41 @@ def analyse_stock(symbol: str) -> dict:
         return {"success": False, "error": str(e)}
 
 
+def _stock_reasons(stock: dict, risk: str, horizon: str, invest_ctx: str) -> str:
+    """Two LLM bullet points for one candidate, cached per (symbol, score bucket, profile)."""
+    import llm_cache
+    import llm_gateway
+
+    m = stock["metrics"]
+    prompt = (
+        f"You are a concise Indian stock analyst. Write exactly 2 short bullet points (each starting with •) "
+        f"explaining why {stock['name']} ({stock['symbol']}) suits a {risk} investor "
+        f"with a {horizon}-term horizon investing {invest_ctx}. "
+        f"Data: Signal {stock['signal_score']}/100 | RSI {m['rsi']} | "
+        f"5d: {m['ret_5d']}% | 30d: {m['ret_30d']}% | MACD: {'Bullish' if m['macd_bullish'] else 'Bearish'} | "
+        f"PE: {m['pe'] or 'N/A'} | Above 20DMA: {m['above_20dma']}. "
+        f"Write only the 2 bullets, nothing else."
+    )
+
+    def call():
+        msg = llm_gateway.create_message("suggest_stocks", model="claude-sonnet-4-6", max_tokens=256,
+                                         messages=[{"role": "user", "content": prompt}])
+        return msg.content[0].text.strip(), llm_gateway.usage_of(msg)
+
+    key = [stock["symbol"], int(stock["signal_score"] // REASON_SCORE_BUCKET), risk, horizon, invest_ctx]
+    try:
+        return llm_cache.get_or_call("stock_reasons", "claude-sonnet-4-6", key, call)
+    except Exception:
+        return (
+            f"• Signal score of {stock['signal_score']}/100 with "
+            f"{'bullish' if m['macd_bullish'] else 'neutral'} MACD momentum.\n"
+            f"• RSI at {m['rsi']} suggests {'a healthy entry point' if m['rsi'] < 65 else 'strong trend continuation'}."
+        )
+
+
 def suggest_stocks(amount: int, horizon: str, risk: str, sector: str | None,
                    investment_type: str = "lumpsum", duration_years: int = 0) -> list:
     """Return top-3 ranked stocks matching the profile, each with LLM-generated reasons."""
-    from dotenv import load_dotenv, find_dotenv
-    load_dotenv(find_dotenv())
-    import anthropic
-
     pulse = get_pulse_data()
     all_stocks = pulse.get("all", [])
 
@@ -359,37 +389,13 @@ def suggest_stocks(amount: int, horizon: str, risk: str, sector: str | None,
 
     top3 = sorted(candidates, key=lambda x: x["signal_score"], reverse=True)[:3]
 
-    api_key  = os.getenv("ANTHROPIC_API_KEY", "")
-    resource = os.getenv("ANTHROPIC_FOUNDRY_RESOURCE", "")
-    client   = anthropic.AnthropicFoundry(api_key=api_key, resource=resource) if resource else anthropic.Anthropic(api_key=api_key)
-
     if investment_type == "sip":
         invest_ctx = f"₹{amount:,}/month SIP for {duration_years} year{'s' if duration_years != 1 else ''}"
     else:
         invest_ctx = f"₹{amount:,} lumpsum"
 
-    suggestions = []
-    for i, stock in enumerate(top3):
-        m = stock["metrics"]
-        prompt = (
-            f"You are a concise Indian stock analyst. Write exactly 2 short bullet points (each starting with •) "
-            f"explaining why {stock['name']} ({stock['symbol']}) suits a {risk} investor "
-            f"with a {horizon}-term horizon investing {invest_ctx}. "
-            f"Data: Signal {stock['signal_score']}/100 | RSI {m['rsi']} | "
-            f"5d: {m['ret_5d']}% | 30d: {m['ret_30d']}% | MACD: {'Bullish' if m['macd_bullish'] else 'Bearish'} | "
-            f"PE: {m['pe'] or 'N/A'} | Above 20DMA: {m['above_20dma']}. "
-            f"Write only the 2 bullets, nothing else."
-        )
-        try:
-            msg     = client.messages.create(model="claude-sonnet-4-6", max_tokens=256,
-                                             messages=[{"role": "user", "content": prompt}])
-            reasons = msg.content[0].text.strip()
-        except Exception:
-            reasons = (
-                f"• Signal score of {stock['signal_score']}/100 with "
-                f"{'bullish' if m['macd_bullish'] else 'neutral'} MACD momentum.\n"
-                f"• RSI at {m['rsi']} suggests {'a healthy entry point' if m['rsi'] < 65 else 'strong trend continuation'}."
-            )
-        suggestions.append({**stock, "rank": i + 1, "reasons": reasons})
+    with concurrent.futures.ThreadPoolExecutor(max_workers=REASON_WORKERS) as ex:
+        reasons = list(ex.map(lambda st: _stock_reasons(st, risk, horizon, invest_ctx), top3))
 
+    suggestions = [{**stock, "rank": i + 1, "reasons": r} for i, (stock, r) in enumerate(zip(top3, reasons))]
     return suggestions
@@ -0,0 +1,140 @@
+"""
+return_engine.py - Vectorised portfolio / benchmark return engine.
+
+  Matrix     - R (sessions x stocks) of daily returns aligned on benchmark
+               sessions; NaN where a stock was not trading yet (or suspended)
+  Portfolio  - p = R @ w with the weights renormalised per session over the
+               stocks that have a return, so late listings only count once
+               they trade
+  One pass   - log-wealth prefix sums give every window's rebased cumulative
+               return (3M / 6M / 1Y charts), prefix sums of p, b, p*p, b*b,
+               p*b give rolling volatility / beta / Sharpe, and a running
+               maximum of wealth gives drawdowns - nothing is recomputed per
+               window
+
+Everything is numpy; callers (portfolio_analysis, risk_analytics) handle the
+pandas alignment and JSON shaping.
+"""
+
+import math
+from typing import Optional
+
+import numpy as np
+
+TRADING_DAYS = 252
+WINDOWS      = {"3m": 63, "6m": 126, "1y": 252}
+ROLLING      = 63            # sessions in the rolling-metric window
+CHART_STEP   = 5             # charts keep every 5th session
+
+
+class PortfolioReturns:
+    def __init__(self, dates: list, closes: np.ndarray, bench_closes: np.ndarray, weights: np.ndarray,
+                 risk_free: float = 0.0):
+        """
+        dates: session dates (len T + 1); closes: (T + 1) x N stock closes
+        (NaN = no price); bench_closes: T + 1 benchmark closes; weights: N
+        value weights (any scale).
+        """
+        self.dates     = list(dates[1:])
+        self.risk_free = risk_free
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.R = closes[1:] / closes[:-1] - 1.0
+            self.b = bench_closes[1:] / bench_closes[:-1] - 1.0
+        self.w = np.asarray(weights, dtype=float)
+
+        present = ~np.isnan(self.R)
+        live_w  = present @ self.w
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.p = np.where(live_w > 0, np.nan_to_num(self.R) @ self.w / live_w, 0.0)
+
+        # log-wealth prefix sums: cum[t] = log(wealth after session t), cum[-1] := 0
+        self._lp = np.concatenate(([0.0], np.cumsum(np.log1p(self.p))))
+        self._lb = np.concatenate(([0.0], np.cumsum(np.log1p(self.b))))
+
+    def __len__(self) -> int:
+        return len(self.p)
+
+    # ── Windows ──────────────────────────────────────────────────────────────
+
+    def _start(self, window: Optional[int]) -> int:
+        return 0 if window is None or window >= len(self.p) else len(self.p) - window
+
+    def cumulative(self, window: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+        """Portfolio / benchmark cumulative return (fraction) over the last `window` sessions, rebased to 0."""
+        s = self._start(window)
+        return np.expm1(self._lp[s + 1:] - self._lp[s]), np.expm1(self._lb[s + 1:] - self._lb[s])
+
+    def chart(self, window: Optional[int] = None, step: int = CHART_STEP) -> list[dict]:
+        s = self._start(window)
+        port, bench = self.cumulative(window)
+        dates = self.dates[s:]
+        return [{"date": str(dates[i])[:10], "portfolio": round(float(port[i]) * 100, 2),
+                 "benchmark": round(float(bench[i]) * 100, 2)}
+                for i in range(0, len(port), step)]
+
+    def stats(self, window: Optional[int] = None) -> dict:
+        """Annualised mean / vol, beta, Sharpe and window return for the last `window` sessions."""
+        s = self._start(window)
+        p, b = self.p[s:], self.b[s:]
+        n = len(p)
+        port_annual  = float(p.mean() * TRADING_DAYS)
+        bench_annual = float(b.mean() * TRADING_DAYS)
+        port_std     = float(p.std(ddof=1)) if n > 1 else 0.0
+        bench_var    = float(b.var(ddof=1)) if n > 1 else 0.0
+        cov          = float(((p - p.mean()) * (b - b.mean())).sum() / (n - 1)) if n > 1 else 0.0
+        port_ret     = float(math.expm1(self._lp[-1] - self._lp[s]))
+        bench_ret    = float(math.expm1(self._lb[-1] - self._lb[s]))
+        return {
+            "sessions":     n,
+            "port_annual":  port_annual,
+            "bench_annual": bench_annual,
+            "volatility":   port_std * math.sqrt(TRADING_DAYS),
+            "beta":         cov / bench_var if bench_var > 0 else None,
+            "sharpe":       (port_annual - self.risk_free) / (port_std * math.sqrt(TRADING_DAYS)) if port_std > 0 else None,
+            "port_return":  port_ret,
+            "bench_return": bench_ret,
+            "alpha":        port_ret - bench_ret,        # simple excess return over the window
+        }
+
+    # ── Rolling metrics ──────────────────────────────────────────────────────
+
+    def rolling(self, window: int = ROLLING) -> dict[str, np.ndarray]:
+        """
+        Rolling annualised volatility, beta and Sharpe over `window` sessions,
+        aligned with self.dates[window - 1:]. O(T) via prefix sums.
+        """
+        n = len(self.p)
+        if n < window or window < 2:
+            empty = np.array([])
+            return {"volatility": empty, "beta": empty, "sharpe": empty}
+
+        def wsum(x: np.ndarray) -> np.ndarray:
+            c = np.concatenate(([0.0], np.cumsum(x)))
+            return c[window:] - c[:-window]
+
+        sp, sb = wsum(self.p), wsum(self.b)
+        var_p  = (wsum(self.p * self.p) - sp * sp / window) / (window - 1)
+        var_b  = (wsum(self.b * self.b) - sb * sb / window) / (window - 1)
+        cov    = (wsum(self.p * self.b) - sp * sb / window) / (window - 1)
+        std_p  = np.sqrt(np.clip(var_p, 0.0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            beta   = np.where(var_b > 0, cov / var_b, np.nan)
+            sharpe = np.where(std_p > 0, (sp / window * TRADING_DAYS - self.risk_free)
+                              / (std_p * math.sqrt(TRADING_DAYS)), np.nan)
+        return {"volatility": std_p * math.sqrt(TRADING_DAYS), "beta": beta, "sharpe": sharpe}
+
+    # ── Drawdowns ────────────────────────────────────────────────────────────
+
+    def drawdown(self, window: Optional[int] = None) -> np.ndarray:
+        """Portfolio drawdown (fraction ≤ 0) from the running peak, within the last `window` sessions."""
+        s = self._start(window)
+        wealth = np.exp(self._lp[s:] - self._lp[s])          # includes the starting 1.0
+        return (wealth / np.maximum.accumulate(wealth) - 1.0)[1:]
+
+    def drawdown_stats(self, window: Optional[int] = None) -> dict:
+        dd = self.drawdown(window)
+        if not len(dd):
+            return {"max_drawdown": None, "current_drawdown": None, "max_drawdown_date": None}
+        i = int(dd.argmin())
+        return {"max_drawdown": float(dd[i]), "current_drawdown": float(dd[-1]),
+                "max_drawdown_date": str(self.dates[self._start(window) + i])[:10]}
@@ -0,0 +1,267 @@
+"""
+risk_analytics.py - Portfolio risk suite over return_engine's aligned returns matrix.
+
+  VaR / CVaR    - 1-day historical (empirical quantile / tail mean of the
+                  portfolio return series) and parametric (Gaussian, from the
+                  shrunk covariance) at 95% and 99%, as % and ₹
+  Drawdowns     - max drawdown with its peak / trough / recovery dates, the
+                  longest and the current time under water (sessions)
+  Covariance    - Ledoit-Wolf shrinkage towards a scaled identity; cached per
+                  (universe, last session, window) in an LRU of
+                  AGENT_RISK_CACHE entries, so users holding the same stocks
+                  share one estimate for the day
+  Clustering    - average-linkage hierarchical clustering on the correlation
+                  distance sqrt((1 - rho) / 2), cut at AGENT_CLUSTER_CUT; the
+                  leaf order groups correlated holdings for the matrix view
+  Contribution  - marginal (dσ/dw) and component risk contribution per holding
+
+Pure numpy: the clustering and shrinkage are a few vectorised lines each, so
+scipy / scikit-learn are not needed.
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from return_engine import PortfolioReturns, TRADING_DAYS
+
+RISK_CACHE    = int(os.getenv("AGENT_RISK_CACHE", "64"))
+CLUSTER_CUT   = float(os.getenv("AGENT_CLUSTER_CUT", "0.5"))     # distance 0.5 ≈ rho 0.5
+CORR_MAX      = int(os.getenv("AGENT_CORR_MAX", "250"))           # largest matrix returned to clients
+CONFIDENCE    = (0.95, 0.99)
+_Z            = {0.95: 1.6448536269514722, 0.99: 2.3263478740408408}
+
+_cache_lock = threading.Lock()
+_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+_stats      = {"hits": 0, "misses": 0}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Covariance + clustering (cached per universe and day)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def ledoit_wolf(X: np.ndarray) -> tuple[np.ndarray, float]:
+    """Shrunk covariance of the columns of X (T x N) and the shrinkage intensity in [0, 1]."""
+    t, n = X.shape
+    X = X - X.mean(axis=0)
+    emp = X.T @ X / t
+    mu = np.trace(emp) / n
+    X2 = X * X
+    beta_  = float((X2.T @ X2).sum())
+    delta_ = float((emp * emp).sum())                # == sum((X.T @ X) ** 2) / t ** 2
+    beta   = (beta_ / t - delta_) / (n * t)
+    delta  = (delta_ - 2 * mu * np.trace(emp) + n * mu * mu) / n
+    shrink = 0.0 if delta <= 0 else min(beta, delta) / delta
+    cov = (1 - shrink) * emp
+    cov[np.diag_indices(n)] += shrink * mu
+    return cov, float(shrink)
+
+
+def average_linkage(dist: np.ndarray) -> tuple[list[tuple[int, int, float, int]], list[int]]:
+    """
+    Agglomerative clustering, average linkage. Returns (merges, leaf_order):
+    merges are (a, b, distance, size) with scipy-style ids (n + k for the k-th
+    merge); leaf_order lists the leaves so every cluster is contiguous.
+    """
+    n = len(dist)
+    D = dist.astype(float).copy()
+    np.fill_diagonal(D, np.inf)
+    size    = np.ones(n)
+    ids     = list(range(n))                 # current cluster id held by each row
+    members = {i: [i] for i in range(n)}
+    merges  = []
+    for k in range(n - 1):
+        i, j = divmod(int(np.argmin(D)), n)
+        if i > j:
+            i, j = j, i
+        d = float(D[i, j])
+        merged = (D[i] * size[i] + D[j] * size[j]) / (size[i] + size[j])
+        D[i, :] = merged
+        D[:, i] = merged
+        D[j, :] = np.inf
+        D[:, j] = np.inf
+        D[i, i] = np.inf
+        size[i] += size[j]
+        members[i] = members[i] + members.pop(j)
+        merges.append((ids[i], ids[j], d, int(size[i])))
+        ids[i] = n + k
+    return merges, (members[min(members)] if members else [])
+
+
+def _clusters_at(merges: list, n: int, cut: float) -> list[int]:
+    """Flat cluster label per leaf: leaves joined by merges at distance <= cut share a label."""
+    parent = list(range(2 * n))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for k, (a, b, d, _) in enumerate(merges):
+        if d <= cut:
+            parent[find(a)] = n + k
+            parent[find(b)] = n + k
+    roots, labels = {}, []
+    for leaf in range(n):
+        labels.append(roots.setdefault(find(leaf), len(roots)))
+    return labels
+
+
+def _estimate(symbols: tuple, R: np.ndarray) -> dict:
+    cov, shrink = ledoit_wolf(np.nan_to_num(R))
+    std  = np.sqrt(np.clip(np.diag(cov), 1e-18, None))
+    corr = np.clip(cov / np.outer(std, std), -1.0, 1.0)
+    merges, order = average_linkage(np.sqrt(np.clip((1.0 - corr) / 2.0, 0.0, None)))
+    return {"cov": cov, "shrinkage": shrink, "std": std, "corr": corr, "merges": merges, "order": order,
+            "labels": _clusters_at(merges, len(symbols), CLUSTER_CUT)}
+
+
+def _cached_estimate(symbols: list[str], R: np.ndarray, as_of: str) -> dict:
+    """Covariance / correlation / clustering for `symbols` (columns of R), shared via the LRU."""
+    perm = sorted(range(len(symbols)), key=symbols.__getitem__)
+    key  = (tuple(symbols[i] for i in perm), as_of, R.shape[0])
+    with _cache_lock:
+        est = _cache.get(key)
+        if est is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+    if est is None:
+        est = _estimate(key[0], R[:, perm])
+        with _cache_lock:
+            _stats["misses"] += 1
+            _cache[key] = est
+            while len(_cache) > RISK_CACHE:
+                _cache.popitem(last=False)
+    # back from the cache's sorted order to the caller's column order
+    inv = np.argsort(perm)
+    return {**est, "cov": est["cov"][np.ix_(inv, inv)], "std": est["std"][inv],
+            "corr": est["corr"][np.ix_(inv, inv)], "labels": [est["labels"][j] for j in inv],
+            "order": [perm[j] for j in est["order"]]}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Measures
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _normal_pdf(z: float) -> float:
+    return math.exp(-0.5 * z * z) / math.sqrt(2 * math.pi)
+
+
+def value_at_risk(p: np.ndarray, mu: float, sigma: float) -> dict:
+    """1-day VaR / CVaR as positive loss fractions, historical and Gaussian."""
+    out = {}
+    for conf in CONFIDENCE:
+        tail_q = float(np.quantile(p, 1 - conf))
+        tail   = p[p <= tail_q]
+        z      = _Z[conf]
+        out[str(int(conf * 100))] = {
+            "historical_var":  -tail_q,
+            "historical_cvar": -float(tail.mean()) if len(tail) else -tail_q,
+            "parametric_var":  -(mu - z * sigma),
+            "parametric_cvar": -(mu - sigma * _normal_pdf(z) / (1 - conf)),
+        }
+    return out
+
+
+def drawdown_profile(engine: PortfolioReturns, window: Optional[int] = None) -> dict:
+    """Max drawdown (%) with its dates, and the longest / current spell under water in sessions."""
+    dd = engine.drawdown(window)
+    if not len(dd):
+        return {}
+    dates = engine.dates[len(engine) - len(dd):]
+    trough = int(dd.argmin())
+    peak = trough - int(np.argmax((dd[:trough + 1] == 0)[::-1])) if (dd[:trough + 1] == 0).any() else -1
+    recovered = np.flatnonzero(dd[trough:] >= 0)
+
+    # runs of consecutive sessions under water
+    under = np.concatenate(([False], dd < 0, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(under))
+    runs  = edges[1::2] - edges[0::2]
+    return {
+        "max_drawdown":      round(float(dd[trough]) * 100, 2),
+        "peak_date":         str(dates[peak])[:10] if peak >= 0 else None,
+        "trough_date":       str(dates[trough])[:10],
+        "recovery_date":     str(dates[trough + recovered[0]])[:10] if len(recovered) else None,
+        "max_duration":      int(runs.max()) if len(runs) else 0,
+        "current_duration":  int(runs[-1]) if len(runs) and dd[-1] < 0 else 0,
+        "current_drawdown":  round(float(dd[-1]) * 100, 2),
+    }
+
+
+def analyse(engine: PortfolioReturns, symbols: list[str], total_value: float,
+            window: Optional[int] = None) -> dict:
+    """
+    Risk suite for the engine's portfolio over its last `window` sessions
+    (covariance, VaR, clustering, contributions) plus drawdowns over the full
+    history. `symbols` name the engine's columns.
+    """
+    s = 0 if window is None or window >= len(engine) else len(engine) - window
+    R, p = engine.R[s:], engine.p[s:]
+    w = engine.w / engine.w.sum()
+    as_of = str(engine.dates[-1])[:10]
+
+    est   = _cached_estimate(symbols, R, as_of)
+    cov   = est["cov"]
+    mu    = float(np.nanmean(R, axis=0) @ w)
+    sigma = float(math.sqrt(max(w @ cov @ w, 0.0)))
+
+    var = value_at_risk(p, mu, sigma)
+    for levels in var.values():
+        for k in list(levels):
+            levels[k + "_inr"] = round(levels[k] * total_value, 2)
+            levels[k] = round(levels[k] * 100, 3)
+
+    # marginal: d(sigma)/d(w_i); component: w_i * marginal_i, summing to sigma
+    marginal  = cov @ w / sigma if sigma > 0 else np.zeros_like(w)
+    component = w * marginal
+    share     = component / sigma if sigma > 0 else np.zeros_like(w)
+
+    labels = est["labels"]
+    clusters: dict[int, list[int]] = {}
+    for i, lab in enumerate(labels):
+        clusters.setdefault(lab, []).append(i)
+    corr = est["corr"]
+    cluster_out = []
+    for lab, idx in clusters.items():
+        block = corr[np.ix_(idx, idx)]
+        avg = float((block.sum() - len(idx)) / (len(idx) * (len(idx) - 1))) if len(idx) > 1 else 1.0
+        cluster_out.append({"id": lab, "symbols": [symbols[i] for i in idx],
+                            "weight": round(float(w[idx].sum()) * 100, 2), "avg_corr": round(avg, 3),
+                            "risk_share": round(float(share[idx].sum()) * 100, 2)})
+    cluster_out.sort(key=lambda c: -c["weight"])
+
+    order = est["order"]
+    holdings = [{
+        "symbol":            symbols[i],
+        "weight":            round(float(w[i]) * 100, 2),
+        "volatility":        round(float(est["std"][i]) * math.sqrt(TRADING_DAYS) * 100, 2),
+        "marginal_risk":     round(float(marginal[i]) * math.sqrt(TRADING_DAYS) * 100, 3),
+        "risk_contribution": round(float(share[i]) * 100, 2),
+        "cluster":           labels[i],
+    } for i in order]
+
+    upper = corr[np.triu_indices(len(w), 1)]
+    return {
+        "as_of":           as_of,
+        "sessions":        int(len(p)),
+        "volatility":      round(sigma * math.sqrt(TRADING_DAYS) * 100, 2),
+        "var":             var,
+        "drawdown":        drawdown_profile(engine),
+        "holdings":        holdings,
+        "clusters":        cluster_out,
+        "avg_correlation": round(float(upper.mean()), 3) if len(upper) else None,
+        "correlation":     {"symbols": [symbols[i] for i in order],
+                            "matrix": np.round(corr[np.ix_(order, order)], 2).tolist()}
+                           if len(w) <= CORR_MAX else None,
+        "shrinkage":       round(est["shrinkage"], 4),
+    }
+
+
+def get_stats() -> dict:
+    with _cache_lock:
+        return {**_stats, "cached": len(_cache), "capacity": RISK_CACHE}
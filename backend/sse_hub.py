@@ -0,0 +1,218 @@
+"""
+sse_hub.py - Broadcast hub for agent SSE events with bounded per-client buffers.
+
+  Publish      - hub.publish(topic, event) from any thread; the event is
+                 serialised once and shared by every subscriber of the topic
+  Buffers      - one ring buffer per subscriber (SSE_BUFFER_SIZE); when full
+                 the oldest frame is dropped, so a stalled tab costs O(1) memory
+  Coalescing   - price_update events keep only the latest frame per symbol
+                 while it is still unsent; the newer frame moves to the tail,
+                 so a client always receives frames in id order
+  Event IDs    - microsecond clock, strictly increasing per process, so ids
+                 stay ordered across restarts and across workers fed by
+                 event_bus; the last SSE_REPLAY_SIZE frames per topic are kept
+                 so a reconnect with Last-Event-ID resumes without gaps
+  Replay rings - kept for the SSE_REPLAY_TOPICS most recently published
+                 topics, and dropped once a topic has been quiet for
+                 SSE_REPLAY_TTL seconds
+  Consumers    - async; `await sub.next(timeout)` wakes through the
+                 subscriber's event loop, no thread per connection
+
+get_stats() exports published / delivered / dropped / coalesced counters.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import NamedTuple, Optional
+
+SSE_BUFFER_SIZE = int(os.getenv("SSE_BUFFER_SIZE", "256"))
+SSE_REPLAY_SIZE = int(os.getenv("SSE_REPLAY_SIZE", "200"))
+SSE_REPLAY_TOPICS = int(os.getenv("SSE_REPLAY_TOPICS", "500"))
+SSE_REPLAY_TTL  = float(os.getenv("SSE_REPLAY_TTL", "900"))
+
+# event type -> field whose value identifies the frame that a newer one replaces
+COALESCE_FIELDS = {"price_update": "symbol"}
+
+
+class _Frame(NamedTuple):
+    id: int
+    key: Optional[str]
+    data: str
+
+
+_id_lock = threading.Lock()
+_last_id = 0
+
+
+def new_event_id() -> int:
+    """Strictly increasing id based on the wall clock in microseconds."""
+    global _last_id
+    with _id_lock:
+        _last_id = max(_last_id + 1, time.time_ns() // 1000)
+        return _last_id
+
+
+def _coalesce_key(event: dict) -> Optional[str]:
+    field = COALESCE_FIELDS.get(event.get("type"))
+    if field is None or event.get(field) is None:
+        return None
+    return f"{event['type']}:{event[field]}"
+
+
+class Subscriber:
+    """One SSE connection; created and consumed on a single event loop."""
+
+    def __init__(self, hub: "SSEHub", topic: str, maxlen: int, loop: asyncio.AbstractEventLoop):
+        self.hub       = hub
+        self.topic     = topic
+        self.maxlen    = maxlen
+        self.dropped   = 0
+        self.coalesced = 0
+        self._loop     = loop
+        self._buf: deque = deque()               # pending frames, oldest first
+        self._slots: dict[str, _Frame] = {}      # coalesce key -> its pending frame
+        self._wakeup   = asyncio.Event()
+        self._notified = False
+
+    # Called with hub._lock held
+    def _offer(self, frame: _Frame) -> None:
+        replaced = self._slots.pop(frame.key, None) if frame.key is not None else None
+        if replaced is not None:
+            # the newer frame goes to the tail rather than the old frame's place, so
+            # ids stay ascending and Last-Event-ID never skips over unsent frames
+            self._buf.remove(replaced)
+            self.coalesced += 1
+            self.hub._stats["coalesced"] += 1
+        elif len(self._buf) >= self.maxlen:
+            old = self._buf.popleft()
+            if old.key is not None and self._slots.get(old.key) is old:
+                del self._slots[old.key]
+            self.dropped += 1
+            self.hub._stats["dropped"] += 1
+        self._buf.append(frame)
+        if frame.key is not None:
+            self._slots[frame.key] = frame
+        if not self._notified:
+            self._notified = True
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def next(self, timeout: float) -> list[str]:
+        """Encoded SSE frames pending for this client; [] when `timeout` passes idle."""
+        deadline = self._loop.time() + timeout
+        while True:
+            with self.hub._lock:
+                if self._buf:
+                    frames = list(self._buf)
+                    self._buf.clear()
+                    self._slots.clear()
+                    self._wakeup.clear()
+                    self._notified = False
+                    break
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                return []
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                return []
+            self._wakeup.clear()
+
+        self.hub._delivered(len(frames))
+        return [f"id: {f.id}\ndata: {f.data}\n\n" for f in frames]
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class SSEHub:
+    def __init__(self, buffer_size: int = SSE_BUFFER_SIZE, replay_size: int = SSE_REPLAY_SIZE,
+                 replay_topics: int = SSE_REPLAY_TOPICS, replay_ttl: float = SSE_REPLAY_TTL):
+        self.buffer_size   = buffer_size
+        self.replay_size   = replay_size
+        self.replay_topics = replay_topics
+        self.replay_ttl    = replay_ttl
+        self._lock = threading.Lock()
+        self._subs: dict[str, set[Subscriber]] = {}
+        self._history: "OrderedDict[str, deque]" = OrderedDict()     # least recently published first
+        self._stats = {"published": 0, "delivered": 0, "dropped": 0, "coalesced": 0}
+
+    def publish(self, topic: str, event: dict, event_id: Optional[int] = None) -> int:
+        """
+        Fan `event` out to every subscriber of `topic`; returns its event id.
+        `event_id` is set when the event was stamped by another process (event_bus).
+        """
+        data = json.dumps(event, default=str)
+        key  = _coalesce_key(event)
+        with self._lock:
+            frame = _Frame(event_id if event_id is not None else new_event_id(), key, data)
+            history = self._history.get(topic)
+            if history is None:
+                history = self._history[topic] = deque(maxlen=self.replay_size)
+            else:
+                self._history.move_to_end(topic)
+            history.append(frame)
+            self._evict_history()
+            for sub in self._subs.get(topic, ()):
+                sub._offer(frame)
+            self._stats["published"] += 1
+        return frame.id
+
+    def subscribe(self, topic: str, last_event_id: Optional[int] = None) -> Subscriber:
+        """Register a consumer on the running loop, replaying frames after `last_event_id`."""
+        sub = Subscriber(self, topic, self.buffer_size, asyncio.get_running_loop())
+        with self._lock:
+            if last_event_id is not None:
+                for frame in self._history.get(topic, ()):
+                    if frame.id > last_event_id:
+                        sub._offer(frame)
+            self._subs.setdefault(topic, set()).add(sub)
+        return sub
+
+    # Called with _lock held
+    def _evict_history(self) -> None:
+        # ids are microsecond timestamps, so a ring's newest id tells how long the topic has been quiet
+        quiet_before = time.time_ns() // 1000 - int(self.replay_ttl * 1_000_000)
+        while self._history:
+            topic, ring = next(iter(self._history.items()))
+            if len(self._history) <= self.replay_topics and ring[-1].id >= quiet_before:
+                break
+            del self._history[topic]
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.topic]
+
+    def _delivered(self, n: int) -> None:
+        with self._lock:
+            self._stats["delivered"] += n
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            subs = [s for group in self._subs.values() for s in group]
+            return {
+                **self._stats,
+                "topics": len(self._subs),
+                "subscribers": len(subs),
+                "buffered": sum(len(s._buf) for s in subs),
+                "buffer_size": self.buffer_size,
+                "replay_size": self.replay_size,
+                "replay_topics": len(self._history),
+            }
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+hub = SSEHub()
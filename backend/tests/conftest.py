@@ -0,0 +1,18 @@
+"""
+Shared test setup: backend modules import each other flat (`import user_store`),
+so the backend directory goes on sys.path, and every SQLite store points at a
+throwaway directory before any module reads its *_DB setting.
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP_DIR     = tempfile.mkdtemp(prefix="diversifi-tests-")
+
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("USER_STORE_DB", os.path.join(TMP_DIR, "diversifi.db"))
+os.environ.setdefault("AGENT_HISTORY_DB", os.path.join(TMP_DIR, "price_history.db"))
+os.environ.setdefault("LLM_CACHE_DB", os.path.join(TMP_DIR, "llm_cache.db"))
+os.environ.setdefault("AGENT_EVENT_BUS", "inprocess")
@@ -0,0 +1,84 @@
+"""agent_scheduler: in-flight claims, cycle accounting and shutdown / restart."""
+
+import threading
+import time
+
+from agent_scheduler import AnalysisScheduler, shard_of
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_shard_of_is_stable_and_case_insensitive():
+    assert shard_of("A@x.com", 4) == shard_of(" a@x.com", 4)
+    owners = [AnalysisScheduler(lambda e, f: None, 1, shard_index=i, shard_count=3) for i in range(3)]
+    assert all(sum(s.owns(f"u{n}@x.com") for s in owners) == 1 for n in range(50))
+
+
+def test_cycle_runs_every_owned_user_once():
+    ran = []
+    sched = AnalysisScheduler(lambda e, f: ran.append(e), interval=0.2, workers=4, jitter=0)
+    users = [(f"u{i}@x.com", f"u{i}.json") for i in range(6)]
+    assert len(sched.schedule_cycle(users)) == 6
+    assert _wait_for(lambda: sched.get_stats()["cycles"])
+    report = sched.get_stats()["cycles"][-1]
+    assert (report["ran"], report["skipped"], report["failed"]) == (6, 0, 0)
+    assert sorted(ran) == sorted(e for e, _ in users)
+    sched.shutdown()
+
+
+def test_user_in_flight_is_skipped():
+    release = threading.Event()
+    sched = AnalysisScheduler(lambda e, f: release.wait(5), interval=0.1, workers=2, jitter=0)
+    assert sched.run_now("a@x.com", "a.json")
+    assert not sched.run_now("a@x.com", "a.json")
+    sched.schedule_cycle([("a@x.com", "a.json")])
+    assert _wait_for(lambda: sched.get_stats()["cycles"])
+    assert sched.get_stats()["cycles"][-1]["skipped"] == 1
+    release.set()
+    assert _wait_for(lambda: not sched.get_stats()["inFlight"])
+    sched.shutdown()
+
+
+def test_shutdown_releases_queued_users_and_stops_dispatch():
+    release = threading.Event()
+    ran = []
+
+    def run(email, data_file):
+        ran.append(email)
+        release.wait(5)
+
+    sched = AnalysisScheduler(run, interval=0.05, workers=1, jitter=0, spread_share=0)
+    users = [(f"u{i}@x.com", f"u{i}.json") for i in range(4)]
+    sched.schedule_cycle(users)                       # one runs, three queue behind it
+    assert _wait_for(lambda: len(ran) == 1 and len(sched.get_stats()["inFlight"]) == 4)
+
+    slow = AnalysisScheduler(run, interval=60, workers=1, jitter=0)
+    slow.schedule_cycle([("s1@x.com", "s1.json"), ("s2@x.com", "s2.json")])   # second start is 15 s out
+    assert _wait_for(lambda: len(ran) == 2)
+
+    sched.shutdown()
+    slow.shutdown()
+    # cancelled runs give their claim back; only the running user stays in flight
+    assert sched.get_stats()["inFlight"] == [ran[0]]
+    release.set()
+    assert _wait_for(lambda: not sched.get_stats()["inFlight"] and not slow.get_stats()["inFlight"])
+
+    # both cycles complete: the dispatcher stopped instead of sleeping into a closed pool
+    report = sched.get_stats()["cycles"][-1]
+    assert (report["ran"], report["skipped"]) == (1, 3)
+    assert _wait_for(lambda: slow.get_stats()["cycles"])
+    assert (slow.get_stats()["cycles"][-1]["ran"], slow.get_stats()["cycles"][-1]["skipped"]) == (1, 1)
+
+    # a restarted scheduler runs the previously queued users again
+    ran.clear()
+    sched.schedule_cycle(users)
+    assert _wait_for(lambda: len(sched.get_stats()["cycles"]) == 2)
+    assert sorted(ran) == sorted(e for e, _ in users)
+    sched.shutdown()
@@ -0,0 +1,189 @@
+"""agent_service: import, one end-to-end analysis run through the user store, the verdict gate and the news scan."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("yfinance")
+pytest.importorskip("textblob")
+pytest.importorskip("anthropic")
+
+import agent_service  # noqa: E402
+import user_store  # noqa: E402
+
+EMAIL     = "smoke@example.com"
+DATA_FILE = "smoke.json"
+HOLDINGS  = {
+    "stocks": [
+        {"symbol": "RELIANCE", "name": "Reliance", "qty": 10, "avgBuyPrice": 2400, "currentValue": 25000},
+        {"symbol": "INFY", "name": "Infosys", "qty": 20, "avgBuyPrice": 1500, "currentValue": 28000},
+    ],
+    "mutualFunds": [{"fundName": "Index Fund", "investedAmount": 10000, "currentValue": 11000}],
+}
+
+
+@pytest.fixture
+def market(monkeypatch):
+    """Offline quotes / news / verdict; everything else is the real code path."""
+    quotes = {"RELIANCE": {"price": 2450.0, "change_pct": -4.2}, "INFY": {"price": 1410.0, "change_pct": 0.6}}
+    monkeypatch.setattr(agent_service, "_fetch_prices", lambda symbols: {s: quotes[s] for s in symbols})
+    monkeypatch.setattr(agent_service, "_fetch_sentiments",
+                        lambda symbols: {s: dict(agent_service.NEUTRAL_SENTIMENT) for s in symbols})
+    monkeypatch.setattr(agent_service, "_request_verdict",
+                        lambda user, immediate, caution, prices, fp, emit_fn=None:
+                        agent_service._rule_verdict(immediate, caution))
+    monkeypatch.setattr(agent_service._scheduler, "run_now", lambda email, data_file: True)
+    agent_service._price_cache.clear()
+    agent_service._sentiment_cache.clear()
+    return quotes
+
+
+def test_import_exposes_agent_api():
+    for name in ("start_agent_loop", "stop_agent_loop", "get_agent_status", "onboard_user",
+                 "get_activity", "get_dashboard", "trigger_analyse", "reset_user"):
+        assert callable(getattr(agent_service, name))
+    assert agent_service.get_agent_status("nobody@example.com") == {"status": "unknown_user"}
+
+
+def test_one_analysis_run(market):
+    user_store.save_index({EMAIL: {"dataFile": DATA_FILE, "isDataPresent": False}})
+    assert agent_service.get_agent_status(EMAIL) == {"status": "needs_onboarding"}
+    assert agent_service.onboard_user(EMAIL, HOLDINGS, {"name": "Smoke", "risk": "moderate"}) == {"success": True}
+
+    agent_service._analyse_user(EMAIL, DATA_FILE)
+
+    status = agent_service.get_agent_status(EMAIL)
+    assert status["status"] == "active" and status["isAnalysisPresent"]
+
+    dash = agent_service.get_dashboard(EMAIL)
+    assert dash["success"]
+    state = dash["agentState"]
+    assert state["lastPrices"]["RELIANCE"]["price"] == 2450.0
+    assert state["verdict"] in agent_service.VERDICT_LABELS
+    assert {s["symbol"]: s["livePrice"] for s in dash["holdings"]["stocks"]} == {"RELIANCE": 2450.0, "INFY": 1410.0}
+
+    activity = agent_service.get_activity(EMAIL)
+    assert activity["success"]
+    messages = [e["message"] for e in activity["entries"]]
+    assert any("Starting portfolio analysis" in m for m in messages)
+    assert any("Analysis complete" in m for m in messages)
+
+
+def test_gated_verdict_counts(monkeypatch):
+    user = {"email": EMAIL, "holdings": HOLDINGS, "profile": {}, "agentState": {}}
+    before = agent_service.get_verdict_stats()
+
+    monkeypatch.setattr(agent_service, "_request_verdict",
+                        lambda *a, **kw: {**agent_service._rule_verdict([], []), "pending": True})
+    queued = agent_service._gated_verdict(user, [], [], {}, {})
+    assert queued["verdictFingerprint"] is None and "pending" not in queued
+
+    reply = {"verdict": "All Good", "verdictReason": "Steady.", "overallSummary": "", "topAlerts": []}
+    monkeypatch.setattr(agent_service, "_request_verdict", lambda *a, **kw: dict(reply))
+    fresh = agent_service._gated_verdict(user, [], [], {}, {})
+    user["agentState"] = {**fresh, "verdictFingerprint": fresh["verdictFingerprint"]}
+    agent_service._gated_verdict(user, [], [], {}, {})
+
+    after = agent_service.get_verdict_stats()
+    # the off-hours batch path queues a request but makes no LLM call
+    assert after["batch_queued"] - before["batch_queued"] == 1
+    assert after["llm_calls"] - before["llm_calls"] == 1
+    assert after["reused"] - before["reused"] == 1
+
+
+def _fp(user=None, immediate=(), caution=(), prices=None, news=None):
+    user = user or {"holdings": HOLDINGS, "profile": {"risk": "moderate"}}
+    return agent_service._verdict_fingerprint(user, list(immediate), list(caution),
+                                              prices if prices is not None else {"INFY": {"change_pct": -4.2}},
+                                              news if news is not None else {"INFY": {"label": "Neutral"}})
+
+
+def test_verdict_fingerprint_ignores_noise_but_not_material_changes():
+    base = _fp()
+    # same 1% bucket, other fields of the quote / news, key order: unchanged
+    assert _fp(prices={"INFY": {"change_pct": -4.9, "price": 1400}}) == base
+    assert _fp(news={"INFY": {"label": "Neutral", "score": 0.01}}) == base
+    reordered = {"holdings": {"mutualFunds": HOLDINGS["mutualFunds"], "stocks": HOLDINGS["stocks"][::-1]},
+                 "profile": {"risk": "moderate"}}
+    assert _fp(user=reordered) == base
+
+    more = {"holdings": {**HOLDINGS, "stocks": [{**HOLDINGS["stocks"][0], "qty": 11}] + HOLDINGS["stocks"][1:]},
+            "profile": {"risk": "moderate"}}
+    changed = [
+        _fp(prices={"INFY": {"change_pct": -5.1}}),
+        _fp(caution=[{"symbol": "INFY"}]),
+        _fp(immediate=[{"symbol": "INFY"}]),
+        _fp(news={"INFY": {"label": "Negative"}}),
+        _fp(user=more),
+        _fp(user={"holdings": HOLDINGS, "profile": {"risk": "high"}}),
+    ]
+    assert base not in changed and len(set(changed)) == len(changed)
+
+
+def test_gated_verdict_reuses_until_max_age(monkeypatch):
+    calls = []
+    reply = {"verdict": "Caution", "verdictReason": "Weak IT.", "overallSummary": "s", "topAlerts": []}
+
+    def request(*a, **kw):
+        calls.append(1)
+        return dict(reply)
+
+    monkeypatch.setattr(agent_service, "_request_verdict", request)
+    prices = {"INFY": {"change_pct": -4.2}}
+    user = {"email": EMAIL, "holdings": HOLDINGS, "profile": {}, "agentState": {}}
+    first = agent_service._gated_verdict(user, [], [], prices, {})
+    user["agentState"] = dict(first)
+    before = agent_service.get_verdict_stats()
+
+    again = agent_service._gated_verdict(user, [], [], prices, {})
+    assert len(calls) == 1 and again["verdict"] == "Caution" and again["verdictAt"] == first["verdictAt"]
+
+    user["agentState"]["verdictAt"] = first["verdictAt"] - agent_service.VERDICT_MAX_AGE    # too old
+    stale = agent_service._gated_verdict(user, [], [], prices, {})
+    assert len(calls) == 2 and stale["verdictAt"] > first["verdictAt"]
+
+    user["agentState"] = dict(stale)
+    agent_service._gated_verdict(user, [], [], {"INFY": {"change_pct": -7.0}}, {})   # moved two buckets
+    assert len(calls) == 3
+
+    after = agent_service.get_verdict_stats()
+    assert (after["reused"] - before["reused"], after["refreshed_stale"] - before["refreshed_stale"]) == (1, 1)
+
+    # an error fallback is stored without a fingerprint, so the next run asks again
+    monkeypatch.setattr(agent_service, "_request_verdict", lambda *a, **kw: {**reply, "fallback": True})
+    assert agent_service._gated_verdict(user, [], [], {}, {})["verdictFingerprint"] is None
+
+
+def test_news_scan_drops_failed_and_slow_symbols_and_does_not_cache_them(monkeypatch):
+    release, calls = threading.Event(), []
+
+    def news(sym):
+        calls.append(sym)
+        if sym == "BAD":
+            raise ConnectionError("feed down")
+        if sym == "SLOW" and not release.is_set():
+            release.wait(5)
+        return {"label": "Bullish", "score": 0.3, "headlines": [f"{sym} up"]}
+
+    monkeypatch.setattr(agent_service, "_news_sentiment", news)
+    monkeypatch.setattr(agent_service, "NEWS_TIMEOUT", 0.2)
+    monkeypatch.setattr(agent_service, "_sentiment_cache", {})
+    failures = agent_service.get_market_stats()["sentiment_failures"]
+
+    first = agent_service._get_sentiments(["OK", "BAD", "SLOW"])
+    assert set(first) == {"OK"} and set(agent_service._sentiment_cache) == {"OK"}
+    assert agent_service.get_market_stats()["sentiment_failures"] == failures + 2
+
+    release.set()
+    second = agent_service._get_sentiments(["OK", "BAD", "SLOW"])
+    assert set(second) == {"OK", "SLOW"}
+    assert sorted(calls) == ["BAD", "BAD", "OK", "SLOW", "SLOW"]      # OK came from the cache
+
+
+def test_news_sentiment_labels(monkeypatch):
+    news = {"GOOD.NS": [{"content": {"title": "Profits soar to a great record high"}}],
+            "NONE.NS": []}
+    monkeypatch.setattr(agent_service.yf, "Ticker", lambda ns: SimpleNamespace(news=news[ns]))
+    assert agent_service._news_sentiment("good")["label"] == "Bullish"
+    assert agent_service._news_sentiment("none") == agent_service.NEUTRAL_SENTIMENT
@@ -0,0 +1,94 @@
+"""alert_engine: tier escalation on ticks, once per tier per day, state kept across re-indexing."""
+
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import alert_engine
+from alert_engine import AlertEngine, PollingQuoteFeed, Thresholds, thresholds_for
+
+
+def _user(stocks, horizon="3 years", trend=None) -> dict:
+    return {"profile": {"horizon": horizon},
+            "holdings": {"stocks": [{"symbol": s, "name": s.title(), "qty": 10} for s in stocks]},
+            "agentState": {"trendState": {s: {"down_count": n} for s, n in (trend or {}).items()}}}
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    day = [datetime.date(2026, 3, 2)]
+    monkeypatch.setattr(alert_engine, "datetime", SimpleNamespace(date=SimpleNamespace(today=lambda: day[0])))
+    alerts = []
+    eng = AlertEngine(lambda email, alert: alerts.append((email, alert["symbol"], alert["tier"])))
+    return SimpleNamespace(eng=eng, alerts=alerts, day=day)
+
+
+def test_thresholds_follow_the_horizon():
+    assert thresholds_for({"horizon": "10 years"}) == Thresholds(-15, 10, -8, 5)
+    assert thresholds_for({"horizon": "long term"}) == Thresholds(-15, 10, -8, 5)
+    assert thresholds_for({"horizon": "3 years"}) == thresholds_for(None) == Thresholds(-8, 4, -3, 2)
+
+
+def test_tiers_escalate_once_per_day(engine):
+    eng, alerts = engine.eng, engine.alerts
+    eng.upsert_user("a@x.com", _user(["TCS", "ITC"]))
+    eng.upsert_user("b@x.com", _user(["TCS"], horizon="10 years"))
+
+    assert eng.on_tick("TCS", 3500, -1.0) == 0
+    assert eng.on_tick("TCS", 3400, -4.0) == 1                       # caution for the short horizon only
+    assert eng.on_tick("TCS", 3390, -4.5) == 0                       # same tier again today: silent
+    assert eng.on_tick("TCS", 3100, -9.0) == 2                       # a: immediate, b: caution
+    assert eng.on_tick("TCS", 3000, -16.0) == 1                      # b: immediate
+    assert eng.on_tick("TCS", 3300, -5.0) == 0                       # de-escalation never re-fires
+    assert alerts == [("a@x.com", "TCS", "caution"), ("a@x.com", "TCS", "immediate"),
+                      ("b@x.com", "TCS", "caution"), ("b@x.com", "TCS", "immediate")]
+
+    engine.day[0] += datetime.timedelta(days=1)                      # new day: tiers reset
+    assert eng.on_tick("TCS", 3250, -5.0) == 1 and alerts[-1] == ("a@x.com", "TCS", "caution")
+    assert eng.get_stats()["fired"] == 5
+
+
+def test_trend_alerts_need_a_down_tick(engine):
+    eng, alerts = engine.eng, engine.alerts
+    eng.upsert_user("a@x.com", _user(["ITC"], trend={"ITC": 2}))
+    assert eng.on_tick("ITC", 410, 0.5) == 0
+    assert eng.on_tick("ITC", 405, -0.2) == 1 and alerts == [("a@x.com", "ITC", "caution")]
+
+
+def test_reindexing_keeps_fired_tiers_of_kept_holdings(engine):
+    eng, alerts = engine.eng, engine.alerts
+    eng.upsert_user("a@x.com", _user(["TCS", "ITC"]))
+    eng.on_tick("TCS", 3400, -4.0)
+    eng.on_tick("ITC", 400, -4.0)
+
+    eng.upsert_user("a@x.com", _user(["TCS", "INFY"]))               # ITC sold, INFY bought
+    assert sorted(eng.symbols()) == ["INFY", "TCS"]
+    assert eng.on_tick("TCS", 3390, -4.5) == 0                       # already fired today
+    assert eng.on_tick("ITC", 390, -9.0) == 0                        # no longer held
+    eng.upsert_user("a@x.com", _user(["TCS", "INFY", "ITC"]))        # bought back: fresh holding
+    assert eng.on_tick("ITC", 390, -4.0) == 1
+    assert alerts == [("a@x.com", "TCS", "caution"), ("a@x.com", "ITC", "caution"),
+                      ("a@x.com", "ITC", "caution")]
+
+    eng.remove_user("a@x.com")
+    assert eng.symbols() == [] and eng.get_stats()["users"] == 0
+
+
+def test_alert_payload_and_failing_callback(engine):
+    got = []
+    eng = AlertEngine(lambda email, alert: got.append(alert) or 1 / 0)
+    eng.upsert_user("a@x.com", _user(["TCS"]))
+    assert eng.on_tick("TCS", 3000.0, -10.0) == 1                    # callback error is logged, not raised
+    assert got[0]["current_value"] == 30000.0 and got[0]["live"] and got[0]["tier"] == "immediate"
+
+
+def test_polling_feed_ticks_only_moved_prices(engine):
+    eng = engine.eng
+    eng.upsert_user("a@x.com", _user(["TCS", "ITC"]))
+    quotes = {"TCS": {"price": 3400, "change_pct": -4.0}, "ITC": {"price": 400, "change_pct": 0.1}}
+    feed = PollingQuoteFeed(eng, lambda symbols: {s: quotes[s] for s in symbols})
+    assert feed.poll_once() == 2
+    assert feed.poll_once() == 0
+    quotes["ITC"] = {"price": 380, "change_pct": -5.0}
+    assert feed.poll_once() == 1 and engine.alerts[-1] == ("a@x.com", "ITC", "caution")
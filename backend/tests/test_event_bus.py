@@ -0,0 +1,122 @@
+"""event_bus: every transport delivers (topic, event, id) to attached handlers in all 'processes'."""
+
+import os
+import socket
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import event_bus
+from event_bus import EVENT_CHANNEL, InProcessBus, MemoryRedis, RedisBus, UnixSocketBus, _encode
+
+
+class _Inbox:
+    def __init__(self):
+        self.items: list[tuple] = []
+        self.cond = threading.Condition()
+
+    def __call__(self, topic, event, event_id):
+        with self.cond:
+            self.items.append((topic, event, event_id))
+            self.cond.notify_all()
+
+    def wait_for(self, n: int = 1, timeout: float = 5.0, item: Optional[tuple] = None) -> list[tuple]:
+        with self.cond:
+            self.cond.wait_for(lambda: item in self.items if item else len(self.items) >= n, timeout)
+            return list(self.items)
+
+
+def test_inprocess_delivers_and_survives_handler_errors():
+    bus = InProcessBus()
+    inbox = _Inbox()
+    bus.attach(inbox)
+    event_id = bus.publish("a@x.com", {"type": "analysis_start"})
+    assert inbox.items == [("a@x.com", {"type": "analysis_start"}, event_id)]
+
+    bus.attach(lambda *a: 1 / 0)
+    bus.publish("a@x.com", {"type": "x"})                    # logged, not raised
+    assert bus.get_stats() == {"transport": "inprocess", "published": 2, "received": 2, "dropped": 0, "malformed": 0}
+
+
+def test_redis_bus_reaches_every_subscriber_with_the_publishers_id():
+    server = MemoryRedis()
+    publisher, api_a, api_b = RedisBus(client=server), RedisBus(client=server), RedisBus(client=server)
+    inbox_a, inbox_b = _Inbox(), _Inbox()
+    api_a.attach(inbox_a)
+    api_b.attach(inbox_b)
+    try:
+        event_id = publisher.publish("u@x.com", {"type": "verdict_update", "verdict": "Caution"})
+        for inbox in (inbox_a, inbox_b):
+            assert inbox.wait_for(1) == [("u@x.com", {"type": "verdict_update", "verdict": "Caution"}, event_id)]
+    finally:
+        for bus in (publisher, api_a, api_b):
+            bus.close()
+
+
+def test_unix_bus_through_broker_and_pending_queue():
+    path = os.path.join(tempfile.mkdtemp(prefix="bus-"), "events.sock")
+    worker = UnixSocketBus(path)                             # no broker yet: publishes wait in pending
+    early = worker.publish("u@x.com", {"type": "activity_log", "n": 0})
+    assert worker.get_stats()["pending"] == 1
+
+    assert event_bus.start_broker(path)
+    assert not event_bus.start_broker(path)                  # a second broker is not started
+    api = UnixSocketBus(path)
+    inbox = _Inbox()
+    api.attach(inbox)
+    try:
+        deadline = time.time() + 10
+        while not (worker.get_stats()["connected"] and api.get_stats()["connected"]) and time.time() < deadline:
+            time.sleep(0.05)
+        late = worker.publish("u@x.com", {"type": "activity_log", "n": 1})
+        expected = ("u@x.com", {"type": "activity_log", "n": 1}, late)
+        assert expected in inbox.wait_for(item=expected)
+        assert worker.get_stats()["pending"] == 0
+        assert early < late
+    finally:
+        worker.close()
+        api.close()
+
+
+GARBAGE = [b"not json", b'{"topic": "u@x.com"}', b"[1, 2]", b"\xff\xfe"]
+
+
+def test_redis_reader_skips_malformed_messages():
+    server = MemoryRedis()
+    api = RedisBus(client=server)
+    inbox = _Inbox()
+    api.attach(inbox)
+    try:
+        for raw in GARBAGE:
+            server.publish(EVENT_CHANNEL + "u@x.com", raw)
+        server.publish(EVENT_CHANNEL + "u@x.com", _encode("u@x.com", {"type": "ok"}, 7))
+        assert inbox.wait_for(1) == [("u@x.com", {"type": "ok"}, 7)]
+        assert api.get_stats()["malformed"] == len(GARBAGE)
+    finally:
+        api.close()
+
+
+def test_unix_reader_skips_malformed_lines():
+    path = os.path.join(tempfile.mkdtemp(prefix="bus-"), "events.sock")
+    assert event_bus.start_broker(path)
+    api = UnixSocketBus(path)
+    inbox = _Inbox()
+    api.attach(inbox)
+    raw = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        deadline = time.time() + 10
+        while not api.get_stats()["connected"] and time.time() < deadline:
+            time.sleep(0.05)
+        raw.connect(path)
+        raw.sendall(b"\n".join(GARBAGE) + b"\n" + _encode("u@x.com", {"type": "ok"}, 9) + b"\n")
+        expected = ("u@x.com", {"type": "ok"}, 9)
+        assert inbox.wait_for(item=expected) == [expected]
+        assert api.get_stats()["malformed"] == len(GARBAGE)
+
+        later = api.publish("u@x.com", {"type": "still listening"})
+        expected = ("u@x.com", {"type": "still listening"}, later)
+        assert expected in inbox.wait_for(item=expected)
+    finally:
+        raw.close()
+        api.close()
@@ -0,0 +1,55 @@
+"""fast_classifier: rule cases that skip the LLM, and the cases it must hand back (None)."""
+
+import pytest
+
+import fast_classifier
+from fast_classifier import MF_MISSING_INFO, classify
+
+
+@pytest.mark.parametrize("question, category, symbol, confidence", [
+    ("Should I buy TCS?",                         "stock",           "TCS",        0.95),
+    ("tcs share price",                           "stock",           "TCS",        0.95),
+    ("what do you think about asian paints",      "stock",           "ASIANPAINT", 0.85),
+    ("Is Parag Parikh Flexi Cap good?",           "mf",              None,         0.95),
+    ("what is the nav of sbi small cap",          "mf",              None,         0.95),
+    ("how do I build an emergency fund",          "general_finance", None,         0.88),
+    ("hello!",                                    "unknown",         None,         0.9),
+    ("How is the weather today?",                 "unknown",         None,         0.9),
+])
+def test_confident_rule_matches(question, category, symbol, confidence):
+    result = classify(question)
+    assert (result["category"], result["symbol"], result["confidence"]) == (category, symbol, confidence)
+
+
+def test_mf_questions_ask_for_a_profile_only_when_missing():
+    assert classify("suggest good mutual funds")["missing_info"] == MF_MISSING_INFO
+    assert classify("suggest mutual funds for long term, high risk")["missing_info"] is None
+
+
+@pytest.mark.parametrize("question", ["", "   ", "mutual funds or stocks?", "tell me a joke about stocks",
+                                      "what should I do next?"])
+def test_mixed_or_unclear_questions_go_to_the_llm(question):
+    assert classify(question) is None
+
+
+def test_confidence_floor(monkeypatch):
+    monkeypatch.setattr(fast_classifier, "MIN_CONFIDENCE", 0.9)
+    assert classify("what do you think about asian paints") is None        # alias only: 0.85
+    assert classify("Should I buy TCS?")["symbol"] == "TCS"
+
+
+def test_nearest_centroid_fallback(monkeypatch):
+    vocab = ["fund", "sip", "save", "tax", "weather", "joke"]
+
+    def embed(texts):
+        return [[float(w in t.lower()) + 0.01 for w in vocab] for t in texts]
+
+    monkeypatch.setattr(fast_classifier, "_embed_fn", None)
+    monkeypatch.setattr(fast_classifier, "_centroids", {})
+    assert classify("put a little in a fund each month") is None                      # no rule, no model
+    fast_classifier.enable_embeddings(embed)
+    result = classify("put a little in a fund each month")
+    assert result["category"] == "mf" and result["missing_info"] == MF_MISSING_INFO
+
+    monkeypatch.setattr(fast_classifier, "_embed_fn", lambda texts: 1 / 0)
+    assert classify("put a little in a fund each month") is None                      # model errors fall back
@@ -0,0 +1,90 @@
+"""job_scheduler: once-per-day claims across schedulers, catch-up window, lease recovery and retries."""
+
+import datetime
+import time
+
+import pytest
+
+from job_scheduler import JobScheduler
+
+MONDAY = datetime.date(2026, 1, 5)
+
+
+def _at(day: datetime.date, hour: int, minute: int = 0) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time(hour, minute), datetime.timezone.utc)
+
+
+def _scheduler(tmp_path, run, **kw) -> JobScheduler:
+    s = JobScheduler(db_path=str(tmp_path / "jobs.db"), **kw)
+    s.add("report", 8, 30, run, tz="UTC")
+    return s
+
+
+def test_runs_once_per_day_across_schedulers(tmp_path):
+    calls = []
+    a = _scheduler(tmp_path, calls.append)
+    b = _scheduler(tmp_path, calls.append)
+    b.owner = "other-host:1"
+
+    assert a.run_due(_at(MONDAY, 8, 29)) == []                     # not due yet
+    assert a.run_due(_at(MONDAY, 8, 30)) == ["report"]
+    assert a.run_due(_at(MONDAY, 9)) == [] and b.run_due(_at(MONDAY, 9)) == []
+    assert calls == [MONDAY]
+    # the next day's run is a separate marker
+    assert b.run_due(_at(MONDAY + datetime.timedelta(days=1), 8, 31)) == ["report"]
+    assert a.get_stats()["jobs"]["report"]["lastRun"]["owner"] == "other-host:1"
+
+
+def test_catchup_window_and_weekdays(tmp_path):
+    calls = []
+    s = _scheduler(tmp_path, calls.append, catchup=3600)
+    assert s.run_due(_at(MONDAY, 10)) == []                        # 90 min late > 1h catch-up
+    assert s.run_due(_at(MONDAY - datetime.timedelta(days=2), 8, 45)) == []     # Saturday
+    # a process waking shortly after midnight still runs yesterday's late-evening job
+    s.add("late", 23, 50, calls.append, tz="UTC")
+    assert s.run_due(_at(MONDAY + datetime.timedelta(days=1), 0, 10)) == ["late"]
+    assert calls == [MONDAY]
+
+
+def test_failed_run_retried_up_to_attempts(tmp_path):
+    calls = []
+
+    def flaky(day):
+        calls.append(day)
+        raise RuntimeError("smtp down")
+
+    s = _scheduler(tmp_path, flaky, retry=0.05, attempts=2)
+    now = _at(MONDAY, 8, 30)
+    assert s.run_due(now) == []
+    assert s.run_due(now) == [] and len(calls) == 1                 # inside the retry delay
+    time.sleep(0.06)
+    s.run_due(now)
+    time.sleep(0.06)
+    s.run_due(now)
+    last = s.get_stats()["jobs"]["report"]["lastRun"]
+    assert len(calls) == 2 and (last["status"], last["attempts"]) == ("failed", 2)
+    assert last["detail"] == "RuntimeError: smtp down"
+
+
+def test_stale_running_marker_is_reclaimed(tmp_path):
+    calls = []
+    crashed = _scheduler(tmp_path, calls.append, lease=0.05)
+    assert crashed._claim("report", MONDAY.isoformat())            # claimed, then the process died
+
+    other = _scheduler(tmp_path, calls.append, lease=0.05)
+    other.owner = "other-host:1"
+    assert other.run_due(_at(MONDAY, 8, 30)) == []                 # lease still held
+    time.sleep(0.06)
+    assert other.run_due(_at(MONDAY, 8, 30)) == ["report"] and calls == [MONDAY]
+    last = other.get_stats()["jobs"]["report"]["lastRun"]
+    assert (last["status"], last["owner"], last["attempts"]) == ("done", "other-host:1", 2)
+
+
+def test_zones_are_resolved_by_name(tmp_path):
+    s = JobScheduler(db_path=str(tmp_path / "jobs.db"))
+    s.add("ist", 15, 35, lambda day: None)
+    s.add("london", 8, 30, lambda day: None, tz="Europe/London")
+    assert s.due_at("ist", MONDAY) == _at(MONDAY, 10, 5)
+    assert s.due_at("london", datetime.date(2026, 7, 6)) == _at(datetime.date(2026, 7, 6), 7, 30)   # BST
+    with pytest.raises(KeyError):
+        s.add("typo", 8, 0, lambda day: None, tz="Asia/Kolkatta")
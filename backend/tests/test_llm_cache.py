@@ -0,0 +1,102 @@
+"""llm_cache: TTL expiry, promotion from SQLite to memory, async producers and pruning of expired rows."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+
+USAGE = {"input_tokens": 100, "output_tokens": 20}
+
+
+@pytest.fixture
+def clock(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    monkeypatch.setattr(llm_cache, "CACHE_DB", str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(llm_cache, "CACHE_DISABLED", False)
+    monkeypatch.setattr(llm_cache, "_conn", None)
+    monkeypatch.setattr(llm_cache, "_memory", llm_cache.OrderedDict())
+    monkeypatch.setattr(llm_cache, "_stats", {})
+    monkeypatch.setattr(llm_cache, "_pruned", {"at": now[0], "rows": 0})
+    yield now
+    if llm_cache._conn is not None:
+        llm_cache._conn.close()
+
+
+def _producer(calls: list, value):
+    def call():
+        calls.append(value)
+        return value, USAGE
+    return call
+
+
+def _rows() -> int:
+    return llm_cache._db().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+def test_entries_expire_after_the_node_ttl(clock):
+    calls = []
+    ask = lambda: llm_cache.get_or_call("bull_handler", "m", ["TCS", "headlines"], _producer(calls, {"take": "up"}))
+    assert ask() == {"take": "up"} and ask() == {"take": "up"} and len(calls) == 1
+
+    clock[0] += llm_cache.NODE_TTLS["bull_handler"] - 1
+    ask()
+    assert len(calls) == 1
+    clock[0] += 1                                            # expires_at is exclusive
+    ask()
+    assert len(calls) == 2
+
+    nodes = llm_cache.get_stats()["nodes"]["bull_handler"]
+    assert (nodes["hits"], nodes["misses"], nodes["saved_input_tokens"]) == (2, 2, 200)
+
+
+def test_disk_hit_is_promoted_to_memory(clock):
+    calls = []
+    ask = lambda: llm_cache.get_or_call("classifier", "m", "what is an ETF?", _producer(calls, "GENERAL"))
+    ask()
+    llm_cache._memory.clear()                                # a fresh process sharing the same file
+    assert ask() == "GENERAL" and ask() == "GENERAL" and len(calls) == 1
+    nodes = llm_cache.get_stats()["nodes"]["classifier"]
+    assert (nodes["disk_hits"], nodes["memory_hits"]) == (1, 1)
+
+    # promoted entries keep the stored expiry rather than a fresh TTL
+    clock[0] += llm_cache.NODE_TTLS["classifier"]
+    ask()
+    assert len(calls) == 2
+
+
+def test_aget_or_call(clock):
+    calls = []
+
+    async def call():
+        await asyncio.sleep(0)
+        calls.append(1)
+        return {"category": "STOCK"}, USAGE
+
+    async def run():
+        first = await llm_cache.aget_or_call("classifier", "m", "buy TCS?", call)
+        second = await llm_cache.aget_or_call("classifier", "m", "buy TCS?", call)
+        other = await llm_cache.aget_or_call("classifier", "m", "buy TCS?", call, params={"temperature": 0})
+        bypass = await llm_cache.aget_or_call("classifier", "m", "buy TCS?", call, use_cache=False)
+        return first, second, other, bypass
+
+    first, second, other, bypass = asyncio.run(run())
+    assert first == second == other == bypass == {"category": "STOCK"}
+    assert len(calls) == 3                                   # miss, miss (new params), bypass
+
+
+def test_expired_rows_are_pruned_on_write(clock, monkeypatch):
+    monkeypatch.setattr(llm_cache, "PRUNE_INTERVAL", 3600)
+    for i in range(5):
+        llm_cache.get_or_call("stock_reasons", "m", f"profile-{i}", _producer([], f"reason {i}"))
+    assert _rows() == 5
+
+    clock[0] += llm_cache.NODE_TTLS["stock_reasons"]         # all five expired
+    llm_cache.get_or_call("classifier", "m", "q1", _producer([], "GENERAL"))
+    assert _rows() == 6                                      # within the prune interval: untouched
+
+    clock[0] += 3600 - llm_cache.NODE_TTLS["stock_reasons"]
+    llm_cache.get_or_call("classifier", "m", "q2", _producer([], "GENERAL"))
+    assert _rows() == 2 and llm_cache.get_stats()["pruned_rows"] == 5
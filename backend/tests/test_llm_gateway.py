@@ -0,0 +1,151 @@
+"""llm_gateway: a stream holds its concurrency slot only until the first chunk; cancelled calls free theirs."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("anthropic")
+
+import llm_gateway  # noqa: E402
+
+USAGE = SimpleNamespace(input_tokens=10, output_tokens=3)
+
+
+class _Stream:
+    def __init__(self, held):
+        self._held = held
+
+    @property
+    def text_stream(self):
+        for chunk in ("a", "b", "c"):
+            self._held.append(llm_gateway.MAX_CONCURRENCY - llm_gateway._semaphore._value)
+            yield chunk
+
+    def get_final_message(self):
+        return SimpleNamespace(usage=USAGE)
+
+
+class _Manager:
+    def __init__(self, held):
+        self._held = held
+
+    def __enter__(self):
+        return _Stream(self._held)
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _AStream(_Stream):
+    @property
+    async def text_stream(self):
+        for chunk in super().text_stream:
+            yield chunk
+
+    async def get_final_message(self):
+        return SimpleNamespace(usage=USAGE)
+
+
+class _AManager(_Manager):
+    async def __aenter__(self):
+        return _AStream(self._held)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _client(manager):
+    return SimpleNamespace(messages=SimpleNamespace(stream=lambda **kw: manager))
+
+
+def test_stream_frees_slot_after_first_chunk(monkeypatch):
+    held = []
+    monkeypatch.setattr(llm_gateway, "get_client", lambda: _client(_Manager(held)))
+    monkeypatch.setattr(llm_gateway.llm_usage, "record_anthropic", lambda *a, **kw: None)
+    with llm_gateway.stream("test_stream", model="m", max_tokens=5, messages=[]) as s:
+        assert "".join(s.text_stream) == "abc"
+    # slot taken while waiting for the first chunk, free for the rest of the stream
+    assert held == [1, 0, 0]
+    assert llm_gateway._semaphore._value == llm_gateway.MAX_CONCURRENCY
+
+
+def test_stream_without_chunks_releases_once(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "get_client", lambda: _client(_Manager([])))
+    monkeypatch.setattr(llm_gateway.llm_usage, "record_anthropic", lambda *a, **kw: None)
+    with llm_gateway.stream("test_stream", model="m", max_tokens=5, messages=[]) as s:
+        s.get_final_message()
+    assert llm_gateway._semaphore._value == llm_gateway.MAX_CONCURRENCY
+
+
+def test_astream_frees_slot_after_first_chunk(monkeypatch):
+    held = []
+    monkeypatch.setattr(llm_gateway, "get_async_client", lambda: _client(_AManager(held)))
+    monkeypatch.setattr(llm_gateway.llm_usage, "record_anthropic", lambda *a, **kw: None)
+
+    async def run():
+        async with llm_gateway.astream("test_astream", model="m", max_tokens=5, messages=[]) as s:
+            return [c async for c in s.text_stream]
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+    assert held == [1, 0, 0]
+    assert llm_gateway._semaphore._value == llm_gateway.MAX_CONCURRENCY
+
+
+class _HangingAManager(_AManager):
+    async def __aenter__(self):
+        await asyncio.Event().wait()
+
+
+def _cancel_in_flight(make_coro, n=3):
+    """Start `n` calls, cancel them once they hold a slot; returns the free slots afterwards."""
+    async def run():
+        tasks = [asyncio.create_task(make_coro()) for _ in range(n)]
+        while llm_gateway._semaphore._value > llm_gateway.MAX_CONCURRENCY - n:
+            await asyncio.sleep(0.001)
+        for t in tasks:
+            t.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(r, asyncio.CancelledError) for r in results)
+        return llm_gateway._semaphore._value
+
+    return asyncio.run(run())
+
+
+def test_cancelled_acall_releases_its_slot():
+    free = _cancel_in_flight(lambda: llm_gateway.acall("test_acall", lambda: asyncio.Event().wait()))
+    assert free == llm_gateway.MAX_CONCURRENCY
+
+
+def test_cancelled_astream_releases_its_slot(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "get_async_client", lambda: _client(_HangingAManager([])))
+
+    async def opening():
+        async with llm_gateway.astream("test_astream", model="m", max_tokens=5, messages=[]):
+            pass
+
+    assert _cancel_in_flight(opening) == llm_gateway.MAX_CONCURRENCY
+
+    # cancelled while waiting for the first chunk
+    async def first_chunk_never_comes(s):
+        await asyncio.Event().wait()
+        yield ""
+
+    class _Silent(_AStream):
+        @property
+        def text_stream(self):
+            return first_chunk_never_comes(self)
+
+    class _SilentManager(_AManager):
+        async def __aenter__(self):
+            return _Silent([])
+
+    monkeypatch.setattr(llm_gateway, "get_async_client", lambda: _client(_SilentManager([])))
+    monkeypatch.setattr(llm_gateway.llm_usage, "record_anthropic", lambda *a, **kw: None)
+
+    async def reading():
+        async with llm_gateway.astream("test_astream", model="m", max_tokens=5, messages=[]) as s:
+            async for _ in s.text_stream:
+                pass
+
+    assert _cancel_in_flight(reading) == llm_gateway.MAX_CONCURRENCY
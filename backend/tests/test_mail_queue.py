@@ -0,0 +1,115 @@
+"""mail_queue: idempotent keys, retries / permanent failures, leases and pooled SMTP sessions."""
+
+import smtplib
+import time
+
+from mail_queue import MailQueue, message_id
+
+MESSAGE = "Subject: Daily report\nTo: u@example.com\n\nHello\n"
+
+
+class FakeSMTP:
+    """Records sendmail calls; `replies` scripts exceptions per call (None = accepted)."""
+
+    def __init__(self, log: list, replies: list):
+        self.log, self.replies, self.closed = log, replies, False
+
+    def sendmail(self, sender, recipients, message):
+        reply = self.replies.pop(0) if self.replies else None
+        if reply is not None:
+            raise reply
+        self.log.append((sender, recipients, message))
+        return {}
+
+    def quit(self):
+        self.closed = True
+
+    close = quit
+
+
+def _queue(tmp_path, replies=None, **kw):
+    log, sent_keys = [], []
+    q = MailQueue(db_path=str(tmp_path / "outbox.db"), connect=lambda: FakeSMTP(log, replies or []),
+                  per_minute=0, backoff=0.01, idle=0.2, on_sent=lambda key, rcpt: sent_keys.append(key), **kw)
+    return q, log, sent_keys
+
+
+def test_same_key_is_sent_once(tmp_path):
+    q, log, sent_keys = _queue(tmp_path)
+    try:
+        row_id, created = q.enqueue("me@x.com", "u@example.com", MESSAGE, key="daily:u@example.com:2026-01-02")
+        again, created_again = q.enqueue("me@x.com", "u@example.com", MESSAGE, key="daily:u@example.com:2026-01-02")
+        assert created and not created_again and again == row_id
+        assert q.wait(row_id, timeout=5)["status"] == "sent"
+        assert q.enqueue("me@x.com", "u@example.com", MESSAGE, key="daily:u@example.com:2026-01-02")[1] is False
+        time.sleep(0.1)
+        assert len(log) == 1 and sent_keys == ["daily:u@example.com:2026-01-02"]
+        # CRLF on the wire
+        assert log[0][2] == MESSAGE.replace("\n", "\r\n").encode()
+        assert q.get_stats()["duplicates"] == 2
+    finally:
+        q.stop()
+
+
+def test_transient_errors_retry_and_5xx_fails_immediately(tmp_path):
+    replies = [smtplib.SMTPResponseException(451, b"try later"), smtplib.SMTPServerDisconnected(),
+               smtplib.SMTPServerDisconnected(), None,
+               smtplib.SMTPResponseException(550, b"no such user")]
+    q, log, _ = _queue(tmp_path, replies)
+    try:
+        ok, _ = q.enqueue("me@x.com", "u@example.com", MESSAGE, key="a")
+        st = q.wait(ok, timeout=5)
+        # 451 -> retry; dropped session twice -> reconnect, then retry; then accepted
+        assert (st["status"], st["attempts"]) == ("sent", 3)
+
+        bad, _ = q.enqueue("me@x.com", "nobody@example.com", MESSAGE, key="b")
+        st = q.wait(bad, timeout=5)
+        assert (st["status"], st["attempts"]) == ("failed", 1) and st["lastError"].startswith("550")
+        assert q.get_stats()["retries"] == 2
+    finally:
+        q.stop()
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    q, log, sent_keys = _queue(tmp_path, [smtplib.SMTPResponseException(421, b"busy")] * 3, max_attempts=3)
+    try:
+        row_id, _ = q.enqueue("me@x.com", "u@example.com", MESSAGE, key="c")
+        st = q.wait(row_id, timeout=5)
+        assert (st["status"], st["attempts"]) == ("failed", 3) and not log and not sent_keys
+    finally:
+        q.stop()
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    db = str(tmp_path / "outbox.db")
+    crashed = MailQueue(db_path=db, connect=None, lease=0.2)
+    now = time.time()
+    crashed._db().execute("INSERT INTO outbox (key, sender, recipient, message, next_attempt, created_at)"
+                          " VALUES ('k', 's', 'r', 'm', ?, ?)", (now, now))
+    assert crashed._claim()[1] == "k"
+
+    other = MailQueue(db_path=db, connect=None, lease=0.2)
+    assert other._claim() is None                     # still leased by the first worker
+    time.sleep(0.25)
+    assert other._claim()[1] == "k"
+
+
+def test_session_reused_up_to_per_connection(tmp_path):
+    q, log, _ = _queue(tmp_path, per_connection=2)
+    try:
+        created = q.enqueue_many("me@x.com", [(f"u{i}@example.com", MESSAGE, f"k{i}") for i in range(5)])
+        assert created == 5
+        assert q.enqueue_many("me@x.com", [("u0@example.com", MESSAGE, "k0")]) == 0
+        deadline = time.time() + 5
+        while len(log) < 5 and time.time() < deadline:
+            time.sleep(0.02)
+        assert len(log) == 5 and q.get_stats()["connections"] == 3
+        assert q.existing(["k0", "k4", "zz"]) == {"k0", "k4"}
+    finally:
+        q.stop()
+
+
+def test_message_id_is_stable_per_key():
+    assert message_id("daily:a:2026-01-02") == message_id("daily:a:2026-01-02") != message_id("daily:a:2026-01-03")
+    assert message_id("x").endswith("@diversifi>")
+
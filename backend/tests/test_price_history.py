@@ -0,0 +1,87 @@
+"""price_history: cache hits, refresh from the last cached bar and the wait budget (stubbed download)."""
+
+import datetime
+import threading
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("yfinance")
+
+import price_history  # noqa: E402
+
+
+def _closes(tickers: list[str], start: datetime.date, end: datetime.date) -> dict:
+    dates = pd.bdate_range(start, end)
+    return {t: pd.Series([100.0 + i for i in range(len(dates))], index=dates) for t in tickers}
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    calls = []
+
+    def download(tickers, start):
+        calls.append((sorted(tickers), start))
+        return _closes(tickers, start, datetime.date.today())
+
+    monkeypatch.setattr(price_history, "_download", download)
+    return calls
+
+
+def test_fresh_symbols_come_from_the_cache(downloads):
+    first = price_history.get_closes(["HIT1.NS", "HIT2.NS"], days=30)
+    start = datetime.date.today() - datetime.timedelta(days=30)
+    assert downloads == [(["HIT1.NS", "HIT2.NS"], start)]
+    assert set(first) == {"HIT1.NS", "HIT2.NS"} and first["HIT1.NS"].index[0].date() >= start
+
+    hits = price_history.get_stats()["hits"]
+    again = price_history.get_closes(["HIT2.NS", "HIT1.NS", "HIT1.NS"], days=30)
+    assert len(downloads) == 1 and price_history.get_stats()["hits"] == hits + 2
+    pd.testing.assert_series_equal(again["HIT1.NS"], first["HIT1.NS"], check_names=False)
+
+    price_history.get_closes(["HIT1.NS"], days=60)                  # further back than cached: full fetch
+    assert downloads[-1] == (["HIT1.NS"], datetime.date.today() - datetime.timedelta(days=60))
+
+
+def test_stale_symbols_refresh_from_their_last_bar(downloads, monkeypatch):
+    last = datetime.date.today() - datetime.timedelta(days=20)
+    start = datetime.date.today() - datetime.timedelta(days=60)
+    price_history._store(_closes(["OLD.NS"], start, last), {"OLD.NS": start})
+    monkeypatch.setattr(price_history, "HISTORY_TTL", 0)
+
+    out = price_history.get_closes(["OLD.NS"], days=60)
+    refresh_from = pd.bdate_range(start, last)[-1].date() - datetime.timedelta(days=price_history.REFRESH_OVERLAP)
+    assert downloads == [(["OLD.NS"], refresh_from)]
+    assert out["OLD.NS"].index[0].date() >= start and out["OLD.NS"].index[-1].date() > last
+
+
+def test_budget_returns_stale_bars_and_late_batches_fill_the_cache(monkeypatch):
+    release, stored = threading.Event(), threading.Semaphore(0)
+    start = datetime.date.today() - datetime.timedelta(days=30)
+    stale_end = datetime.date.today() - datetime.timedelta(days=10)
+    price_history._store(_closes(["SLOW.NS"], start, stale_end), {"SLOW.NS": start})
+    monkeypatch.setattr(price_history, "HISTORY_TTL", 0)
+
+    def slow(tickers, batch_start):
+        release.wait(5)
+        return _closes(tickers, batch_start, datetime.date.today())
+
+    real_store = price_history._store
+
+    def store(series, requested):
+        real_store(series, requested)
+        stored.release()
+
+    monkeypatch.setattr(price_history, "_download", slow)
+    monkeypatch.setattr(price_history, "_store", store)
+    late = price_history.get_stats()["late"]
+
+    out = price_history.get_closes(["SLOW.NS", "NEW.NS"], days=30, budget=0.1)
+    assert set(out) == {"SLOW.NS"} and out["SLOW.NS"].index[-1].date() <= stale_end
+    assert price_history.get_stats()["late"] == late + 2
+
+    release.set()
+    assert stored.acquire(timeout=5) and stored.acquire(timeout=5)      # one batch per start date
+    monkeypatch.setattr(price_history, "HISTORY_TTL", 3600)
+    filled = price_history.get_closes(["SLOW.NS", "NEW.NS"], days=30, budget=0.1)
+    assert set(filled) == {"SLOW.NS", "NEW.NS"} and filled["SLOW.NS"].index[-1].date() > stale_end
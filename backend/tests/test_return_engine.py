@@ -0,0 +1,69 @@
+"""return_engine: every window / rolling / drawdown figure against a direct pandas computation."""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from return_engine import TRADING_DAYS, PortfolioReturns
+
+T, N = 300, 6
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(11)
+    dates = pd.bdate_range("2025-01-01", periods=T + 1)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0.0004, 0.015, (T + 1, N)), axis=0))
+    bench = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, T + 1)))
+    weights = rng.uniform(1, 10, N)
+    engine = PortfolioReturns(dates, closes, bench, weights, risk_free=0.065)
+    R = pd.DataFrame(closes, index=dates).pct_change().iloc[1:]
+    p = R @ (weights / weights.sum())
+    b = pd.Series(bench, index=dates).pct_change().iloc[1:]
+    return engine, p, b
+
+
+def test_cumulative_and_stats_match_pandas(data):
+    engine, p, b = data
+    for window in (63, 126, None):
+        tail_p = p if window is None else p.iloc[-window:]
+        tail_b = b if window is None else b.iloc[-window:]
+        port, bench = engine.cumulative(window)
+        assert np.allclose(port, (1 + tail_p).cumprod() - 1)
+        assert np.allclose(bench, (1 + tail_b).cumprod() - 1)
+
+        stats = engine.stats(window)
+        assert stats["sessions"] == len(tail_p)
+        assert stats["volatility"] == pytest.approx(tail_p.std() * math.sqrt(TRADING_DAYS))
+        assert stats["beta"] == pytest.approx(tail_p.cov(tail_b) / tail_b.var())
+        assert stats["port_return"] == pytest.approx((1 + tail_p).prod() - 1)
+        assert stats["sharpe"] == pytest.approx(
+            (tail_p.mean() * TRADING_DAYS - 0.065) / (tail_p.std() * math.sqrt(TRADING_DAYS)))
+
+
+def test_rolling_matches_pandas(data):
+    engine, p, b = data
+    roll = engine.rolling(63)
+    assert len(roll["volatility"]) == T - 62
+    assert np.allclose(roll["volatility"], (p.rolling(63).std() * math.sqrt(TRADING_DAYS)).dropna())
+    assert np.allclose(roll["beta"], (p.rolling(63).cov(b) / b.rolling(63).var()).dropna())
+
+
+def test_drawdown_matches_running_peak(data):
+    engine, p, _ = data
+    wealth = np.concatenate(([1.0], (1 + p.iloc[-126:]).cumprod()))
+    expected = (wealth / np.maximum.accumulate(wealth) - 1)[1:]
+    assert np.allclose(engine.drawdown(126), expected)
+    stats = engine.drawdown_stats(126)
+    assert stats["max_drawdown"] == pytest.approx(expected.min())
+    assert stats["current_drawdown"] == pytest.approx(expected[-1])
+
+
+def test_late_listing_only_counts_once_it_trades():
+    dates = pd.bdate_range("2025-01-01", periods=5)
+    closes = np.array([[100, np.nan], [101, np.nan], [102, 50], [103, 55], [104, 55]], float)
+    engine = PortfolioReturns(dates, closes, np.full(5, 10.0), np.array([1.0, 1.0]))
+    assert np.allclose(engine.p[:2], [0.01, 102 / 101 - 1])
+    assert engine.p[2] == pytest.approx((103 / 102 - 1 + 0.1) / 2)
@@ -0,0 +1,105 @@
+"""risk_analytics: shrinkage, clustering, VaR and the cached estimate's column mapping."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import risk_analytics
+from return_engine import PortfolioReturns
+
+
+def _engine(returns: np.ndarray, weights) -> PortfolioReturns:
+    t = len(returns)
+    closes = 100 * np.vstack([np.ones(returns.shape[1]), np.cumprod(1 + returns, axis=0)])
+    bench = 100 * np.concatenate(([1.0], np.cumprod(1 + returns.mean(axis=1))))
+    return PortfolioReturns(pd.bdate_range("2025-01-01", periods=t + 1), closes, bench, np.asarray(weights, float))
+
+
+def _two_groups(t: int = 250, seed: int = 0) -> np.ndarray:
+    """Columns ZA1, AB2, ZA3, AB4, ZA5: the ZA names share one factor, the AB names another."""
+    rng = np.random.default_rng(seed)
+    za, ab = rng.normal(0, 0.01, t), rng.normal(0, 0.01, t)
+    noise = rng.normal(0, 0.002, (t, 5))
+    return np.column_stack([za, ab, za, ab, za]) + noise
+
+
+@pytest.fixture(autouse=True)
+def _empty_cache():
+    risk_analytics._cache.clear()
+
+
+def test_ledoit_wolf_is_between_sample_and_target():
+    X = np.random.default_rng(1).normal(0, 0.01, (40, 30))
+    cov, shrink = risk_analytics.ledoit_wolf(X)
+    assert 0 < shrink < 1
+    sample = np.cov(X, rowvar=False, bias=True)
+    target = np.trace(sample) / 30 * np.eye(30)
+    assert np.allclose(cov, (1 - shrink) * sample + shrink * target)
+
+
+def test_average_linkage_contiguous_order():
+    d = np.array([[0, 1, 9, 9], [1, 0, 9, 9], [9, 9, 0, 2], [9, 9, 2, 0]], float)
+    merges, order = risk_analytics.average_linkage(d)
+    assert [m[2] for m in merges] == [1.0, 2.0, 9.0]
+    assert merges[-1][3] == 4
+    assert {frozenset(order[:2]), frozenset(order[2:])} == {frozenset({0, 1}), frozenset({2, 3})}
+    assert risk_analytics._clusters_at(merges, 4, 5.0) == [0, 0, 1, 1]
+
+
+def test_unsorted_symbols_cluster_by_co_movement():
+    symbols = ["ZA1", "AB2", "ZA3", "AB4", "ZA5"]
+    out = risk_analytics.analyse(_engine(_two_groups(), [1, 1, 1, 1, 1]), symbols, 1e5)
+
+    groups = {frozenset(c["symbols"]) for c in out["clusters"]}
+    assert groups == {frozenset({"ZA1", "ZA3", "ZA5"}), frozenset({"AB2", "AB4"})}
+    assert all(c["avg_corr"] > 0.9 for c in out["clusters"])
+
+    # leaf order keeps each cluster contiguous, and holdings follow it
+    order = out["correlation"]["symbols"]
+    assert [h["symbol"] for h in out["holdings"]] == order
+    prefixes = [s[:2] for s in order]
+    assert prefixes in (["ZA"] * 3 + ["AB"] * 2, ["AB"] * 2 + ["ZA"] * 3)
+    labels = {h["symbol"]: h["cluster"] for h in out["holdings"]}
+    assert labels["ZA1"] == labels["ZA3"] == labels["ZA5"] != labels["AB2"] == labels["AB4"]
+
+
+def test_cached_estimate_matches_fresh_one_in_any_column_order():
+    returns = _two_groups(seed=3)
+    symbols = ["ZA1", "AB2", "ZA3", "AB4", "ZA5"]
+    weights = [5, 1, 2, 3, 4]
+    first = risk_analytics.analyse(_engine(returns, weights), symbols, 1e5)
+
+    perm = [4, 2, 0, 3, 1]
+    second = risk_analytics.analyse(_engine(returns[:, perm], [weights[i] for i in perm]),
+                                    [symbols[i] for i in perm], 1e5)
+    assert risk_analytics.get_stats()["hits"] >= 1
+
+    by_sym = lambda out: {h["symbol"]: h for h in out["holdings"]}  # noqa: E731
+    a, b = by_sym(first), by_sym(second)
+    for s in symbols:
+        assert a[s]["risk_contribution"] == pytest.approx(b[s]["risk_contribution"])
+        assert a[s]["volatility"] == pytest.approx(b[s]["volatility"])
+    assert {frozenset(c["symbols"]): c["risk_share"] for c in first["clusters"]} == \
+           pytest.approx({frozenset(c["symbols"]): c["risk_share"] for c in second["clusters"]})
+
+
+def test_contributions_sum_to_volatility_and_var_ordering():
+    rng = np.random.default_rng(7)
+    out = risk_analytics.analyse(_engine(rng.normal(0.0005, 0.012, (250, 8)), rng.uniform(1, 5, 8)),
+                                 [f"S{i}" for i in range(8)], 1e6, window=126)
+    assert sum(h["risk_contribution"] for h in out["holdings"]) == pytest.approx(100, abs=0.1)
+    v95, v99 = out["var"]["95"], out["var"]["99"]
+    assert 0 < v95["historical_var"] <= v95["historical_cvar"]
+    assert v95["parametric_var"] < v99["parametric_var"] < v99["parametric_cvar"]
+    assert v95["historical_var_inr"] == pytest.approx(v95["historical_var"] / 100 * 1e6, rel=1e-3)
+    assert out["sessions"] == 126
+
+
+def test_drawdown_profile_durations():
+    p = np.array([0.01, -0.02, -0.01, 0.04, -0.01, -0.01])
+    engine = _engine(np.column_stack([p, p]), [1, 1])
+    dd = risk_analytics.drawdown_profile(engine)
+    assert dd["max_duration"] == 2 and dd["current_duration"] == 2
+    assert dd["trough_date"] == str(engine.dates[2])[:10]
+    assert dd["recovery_date"] == str(engine.dates[3])[:10]
+    assert dd["max_drawdown"] == pytest.approx((0.98 * 0.99 - 1) * 100, abs=0.01)
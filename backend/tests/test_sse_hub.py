@@ -0,0 +1,129 @@
+"""sse_hub: fan-out, bounded buffers, price_update coalescing, Last-Event-ID replay and replay-ring eviction."""
+
+import asyncio
+import json
+import threading
+import time
+
+from sse_hub import SSEHub, new_event_id, parse_last_event_id
+
+
+def _events(frames: list[str]) -> list[dict]:
+    return [json.loads(f.split("data: ", 1)[1]) for f in frames]
+
+
+def _ids(frames: list[str]) -> list[int]:
+    return [int(f.split("\n", 1)[0][len("id: "):]) for f in frames]
+
+
+def test_event_ids_strictly_increase_across_threads():
+    ids: list[int] = []
+    lock = threading.Lock()
+
+    def stamp():
+        batch = [new_event_id() for _ in range(500)]
+        with lock:
+            ids.extend(batch)
+
+    threads = [threading.Thread(target=stamp) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(ids)) == len(ids)
+
+
+def test_fan_out_only_to_topic_subscribers():
+    async def run():
+        hub = SSEHub()
+        a1, a2, b = hub.subscribe("a"), hub.subscribe("a"), hub.subscribe("b")
+        hub.publish("a", {"type": "activity_log", "n": 1})
+        got = [await s.next(0.5) for s in (a1, a2)]
+        assert all(_events(g) == [{"type": "activity_log", "n": 1}] for g in got)
+        assert await b.next(0.05) == []
+        stats = hub.get_stats()
+        assert (stats["published"], stats["delivered"], stats["subscribers"]) == (1, 2, 3)
+        a1.close()
+        assert hub.get_stats()["subscribers"] == 2
+
+    asyncio.run(run())
+
+
+def test_wakes_on_publish_from_another_thread():
+    async def run():
+        hub = SSEHub()
+        sub = hub.subscribe("u")
+        threading.Timer(0.05, hub.publish, args=("u", {"type": "analysis_start"})).start()
+        frames = await sub.next(2.0)
+        assert _events(frames) == [{"type": "analysis_start"}]
+
+    asyncio.run(run())
+
+
+def test_full_buffer_drops_oldest_and_prices_coalesce():
+    async def run():
+        hub = SSEHub(buffer_size=3)
+        sub = hub.subscribe("u")
+        for n in range(5):
+            hub.publish("u", {"type": "activity_log", "n": n})
+        for price in (10, 11, 12):
+            hub.publish("u", {"type": "price_update", "symbol": "TCS", "price": price})
+        events = _events(await sub.next(0.5))
+        # 5 logs + 1 coalesced price slot into 3 slots: the 3 oldest logs dropped
+        assert events == [{"type": "activity_log", "n": 3}, {"type": "activity_log", "n": 4},
+                          {"type": "price_update", "symbol": "TCS", "price": 12}]
+        assert (sub.dropped, sub.coalesced) == (3, 2)
+
+    asyncio.run(run())
+
+
+def test_coalesced_frame_moves_behind_newer_frames():
+    async def run():
+        hub = SSEHub()
+        sub = hub.subscribe("u")
+        hub.publish("u", {"type": "price_update", "symbol": "TCS", "price": 10})
+        log_id = hub.publish("u", {"type": "activity_log", "n": 1})
+        hub.publish("u", {"type": "price_update", "symbol": "TCS", "price": 11})
+        frames = await sub.next(0.5)
+        assert _ids(frames) == sorted(_ids(frames)) and _ids(frames)[0] == log_id
+        assert _events(frames) == [{"type": "activity_log", "n": 1},
+                                   {"type": "price_update", "symbol": "TCS", "price": 11}]
+
+        # a reconnect from the first frame's id still gets the price
+        again = hub.subscribe("u", last_event_id=log_id)
+        assert _events(await again.next(0.5))[-1]["price"] == 11
+
+    asyncio.run(run())
+
+
+def test_reconnect_replays_after_last_event_id():
+    async def run():
+        hub = SSEHub(replay_size=10)
+        ids = [hub.publish("u", {"type": "activity_log", "n": n}) for n in range(5)]
+        sub = hub.subscribe("u", last_event_id=ids[1])
+        frames = await sub.next(0.5)
+        assert _ids(frames) == ids[2:]
+        assert [e["n"] for e in _events(frames)] == [2, 3, 4]
+        # ids stamped by another process (event_bus) are kept as given
+        assert hub.publish("u", {"type": "x"}, event_id=ids[-1] + 7) == ids[-1] + 7
+
+    asyncio.run(run())
+
+
+def test_parse_last_event_id():
+    assert parse_last_event_id("42") == 42
+    assert parse_last_event_id("") is None and parse_last_event_id("abc") is None
+
+
+def test_replay_rings_are_capped_and_expire():
+    hub = SSEHub(replay_topics=3, replay_ttl=60)
+    for n in range(5):
+        hub.publish(f"user{n}", {"type": "activity_log"})
+    hub.publish("user2", {"type": "activity_log"})            # recently published topics survive
+    assert list(hub._history) == ["user3", "user4", "user2"]
+    assert hub.get_stats()["replay_topics"] == 3
+
+    hub.replay_ttl = 0.05                                     # quiet topics go on the next publish
+    time.sleep(0.1)
+    hub.publish("fresh", {"type": "activity_log"})
+    assert list(hub._history) == ["fresh"]
@@ -0,0 +1,76 @@
+"""Suggestion reasons: cached per (name, score bucket, profile); the fallback text is never cached."""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("anthropic")
+
+import llm_cache  # noqa: E402
+import llm_gateway  # noqa: E402
+import mf_service  # noqa: E402
+import research_service  # noqa: E402
+
+STOCK = {"symbol": "TCS", "name": "TCS", "signal_score": 71,
+         "metrics": {"rsi": 55, "ret_5d": 1.2, "ret_30d": 4.0, "macd_bullish": True, "pe": 28, "above_20dma": True}}
+FUND = {"name": "Index Fund", "category": "Index", "amc": "Some AMC", "signal_score": 66,
+        "ret_1m": 1.0, "ret_3m": 3.0, "ret_6m": 6.0, "ret_1y": 12.0}
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_DB", str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(llm_cache, "CACHE_DISABLED", False)
+    monkeypatch.setattr(llm_cache, "_conn", None)
+    monkeypatch.setattr(llm_cache, "_memory", llm_cache.OrderedDict())
+    state = SimpleNamespace(calls=[], fail=False)
+
+    def create_message(caller, **kwargs):
+        state.calls.append(caller)
+        if state.fail:
+            raise ConnectionError("provider down")
+        return SimpleNamespace(content=[SimpleNamespace(text=f" • reason {len(state.calls)}\n• more ")])
+
+    monkeypatch.setattr(llm_gateway, "create_message", create_message)
+    monkeypatch.setattr(llm_gateway, "usage_of", lambda msg: {"input_tokens": 50, "output_tokens": 20})
+    yield state
+    if llm_cache._conn is not None:
+        llm_cache._conn.close()
+
+
+def test_stock_reasons_cache_key(llm):
+    reasons = lambda stock, risk="medium", ctx="₹1,00,000 lumpsum": research_service._stock_reasons(
+        stock, risk, "long", ctx)
+    first = reasons(STOCK)
+    assert first == "• reason 1\n• more"
+    assert reasons({**STOCK, "signal_score": 74}) == first           # same 5-point bucket
+    assert len(llm.calls) == 1
+
+    reasons({**STOCK, "signal_score": 75})                           # next bucket
+    reasons(STOCK, risk="high")                                      # another profile
+    reasons(STOCK, ctx="₹5,000/month SIP for 3 years")
+    reasons({**STOCK, "symbol": "INFY", "name": "Infosys"})
+    assert llm.calls == ["suggest_stocks"] * 5
+
+
+def test_fallback_reasons_are_not_cached(llm):
+    llm.fail = True
+    fallback = research_service._stock_reasons(STOCK, "medium", "long", "₹1,00,000 lumpsum")
+    assert fallback.startswith("• Signal score of 71/100")
+    mf_fallback = mf_service._mf_reasons(FUND, "medium", "long", "₹1,00,000 lumpsum")
+    assert mf_fallback.startswith("• Signal score of 66/100")
+
+    llm.fail = False
+    assert research_service._stock_reasons(STOCK, "medium", "long", "₹1,00,000 lumpsum").startswith("• reason")
+    assert mf_service._mf_reasons(FUND, "medium", "long", "₹1,00,000 lumpsum").startswith("• reason")
+    assert llm.calls == ["suggest_stocks", "suggest_mfs", "suggest_stocks", "suggest_mfs"]
+    rows = llm_cache._db().execute("SELECT node, value FROM llm_cache ORDER BY node").fetchall()
+    assert [node for node, _ in rows] == ["mf_reasons", "stock_reasons"]
+    assert not any("Signal score" in value for _, value in rows)
+
+
+def test_mf_reasons_cache_key(llm):
+    mf_service._mf_reasons(FUND, "low", "long", "₹1,00,000 lumpsum")
+    mf_service._mf_reasons({**FUND, "signal_score": 69}, "low", "long", "₹1,00,000 lumpsum")
+    mf_service._mf_reasons(FUND, "low", "short", "₹1,00,000 lumpsum")
+    assert llm.calls == ["suggest_mfs", "suggest_mfs"]
@@ -0,0 +1,110 @@
+"""user_store: activity ring cursors and diff-only saves that keep concurrent writers' fields."""
+
+import pytest
+
+import user_store
+
+
+def _new_user(email: str, **state) -> dict:
+    user_store.save_index({email: {"dataFile": email.split("@")[0] + ".json", "isDataPresent": True}})
+    doc = {
+        "email": email, "name": "Test", "onboardedAt": "2026-01-01T09:00:00", "profile": {"risk": "low"},
+        "holdings": {"stocks": [{"symbol": "TCS", "qty": 1}, {"symbol": "ITC", "qty": 5}],
+                     "mutualFunds": [{"fundName": "Index", "investedAmount": 100}]},
+        "agentState": {"verdict": "All Good", "activityLog": [],
+                       "trendState": {"TCS": {"down_count": 1, "last_date": "2026-01-01"}}, **state},
+    }
+    user_store.save_user(email, doc, replace=True)
+    return doc
+
+
+def _entry(n: int) -> dict:
+    return {"timestamp": f"10:00:{n:02d}", "icon": "i", "message": f"m{n}", "level": "info"}
+
+
+def test_activity_ring_keeps_the_newest_cap_entries():
+    email = "ring@example.com"
+    _new_user(email)
+    cap = user_store.ACTIVITY_CAP
+    total = cap * 2 + 7
+    for n in range(1, total + 1, 10):
+        last = user_store.append_activity(email, [_entry(i) for i in range(n, min(n + 10, total + 1))])
+    assert last == total
+
+    page = user_store.read_activity(email)
+    assert page["head"] == total and page["oldest"] == total - cap + 1
+    assert [e["seq"] for e in page["entries"]] == list(range(total, total - cap, -1))
+    assert page["entries"][0]["message"] == f"m{total}"
+
+    rows = user_store._conn().execute("SELECT COUNT(*) FROM activity_log WHERE email = ?", (email,)).fetchone()[0]
+    assert rows == cap                                   # slots are reused, never added
+
+
+def test_activity_cursors():
+    email = "cursor@example.com"
+    _new_user(email)
+    user_store.append_activity(email, [_entry(i) for i in range(1, 21)])
+
+    newer = user_store.read_activity(email, after=15)
+    assert [e["seq"] for e in newer["entries"]] == [16, 17, 18, 19, 20]
+    older = user_store.read_activity(email, before=6, limit=3)
+    assert [e["seq"] for e in older["entries"]] == [5, 4, 3]
+    # a cursor older than the ring resumes from the oldest kept entry
+    assert user_store.read_activity(email, after=0, limit=1)["entries"][0]["seq"] == 1
+    with pytest.raises(KeyError):
+        user_store.append_activity("nobody@example.com", [_entry(1)])
+
+
+def test_saves_from_stale_copies_keep_each_others_changes():
+    email = "diff@example.com"
+    _new_user(email)
+    # two runs load the same version, then each saves its own change
+    a, a_base = user_store.load_user(email), user_store.load_user(email)
+    b, b_base = user_store.load_user(email), user_store.load_user(email)
+
+    a["agentState"]["verdict"] = "Caution"
+    user_store.save_user(email, a, base=a_base)
+    b["holdings"]["stocks"].append({"symbol": "SBIN", "qty": 3})
+    user_store.save_user(email, b, base=b_base)
+
+    merged = user_store.load_user(email)
+    assert merged["agentState"]["verdict"] == "Caution"
+    assert [s["symbol"] for s in merged["holdings"]["stocks"]] == ["TCS", "ITC", "SBIN"]
+
+
+def test_save_writes_only_changed_rows_and_removes_dropped_ones():
+    email = "rows@example.com"
+    _new_user(email)
+    base = user_store.load_user(email)
+    doc = user_store.load_user(email)
+    doc["holdings"]["stocks"] = doc["holdings"]["stocks"][:1]
+    doc["agentState"]["trendState"] = {"ITC": {"down_count": 2, "last_date": "2026-01-02"}}
+
+    writes = []
+    conn = user_store._conn()
+    conn.set_trace_callback(writes.append)
+    try:
+        user_store.save_user(email, doc, base=base)
+    finally:
+        conn.set_trace_callback(None)
+
+    changed = [w for w in writes if w.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE"))]
+    assert not any("agent_state" in w for w in changed)          # verdict etc. unchanged
+    assert not any("UPDATE users" in w for w in changed)
+    saved = user_store.load_user(email)
+    assert [s["symbol"] for s in saved["holdings"]["stocks"]] == ["TCS"]
+    assert saved["agentState"]["trendState"] == {"ITC": {"down_count": 2, "last_date": "2026-01-02"}}
+
+
+def test_replace_and_state_helpers():
+    email = "state@example.com"
+    _new_user(email, lastReportSentAt=None)
+    user_store.append_activity(email, [_entry(1)])
+    user_store.update_state(email, lastReportSentAt="2026-01-01T15:35:00")
+    assert user_store.read_state("lastReportSentAt", [email, "x@example.com"]) == {email: "2026-01-01T15:35:00"}
+
+    _new_user(email)                                             # onboarding again replaces everything
+    saved = user_store.load_user(email)
+    assert "lastReportSentAt" not in saved["agentState"]
+    assert user_store.read_activity(email)["entries"] == []
+    assert user_store.get_meta(email)["isDataPresent"] is True
@@ -1,12 +1,17 @@
+import asyncio
 import json
 import warnings
-from mf_scrapper import scrape_mf
+import httpx
+from mf_scrapper import HEADERS as MF_HEADERS, ascrape_mf, scrape_mf
 from helper_func import analyze_sentiment, normalize_fund_name
 from news_service import NewsService
+import fast_classifier
+import llm_cache
+import llm_gateway
 warnings.simplefilter(action='ignore', category=FutureWarning)
-from langchain_anthropic import ChatAnthropic
 from dotenv import find_dotenv, load_dotenv
 from langgraph.graph import StateGraph, END
+from langchain_core.messages import HumanMessage, SystemMessage
 from typing import Dict, Optional, TypedDict, List
 from langchain.tools import tool
 from langchain_community.vectorstores import Chroma 
@@ -96,6 +101,45 @@ def auto_suggest_categories(risk: str, horizon: str, goal: str) -> list:
     # Remove duplicates and return
     return list(set(categories))
 
+# Minimum relevance (0-1, higher = closer) of the best chunk for the single-shot
+# general finance path; below this the ReAct agent loop is used instead.
+GENERAL_FINANCE_MIN_RELEVANCE = float(os.getenv("GENERAL_FINANCE_MIN_RELEVANCE", "0.35"))
+
+_vectordb = None
+
+def get_vectordb() -> Chroma:
+    """Return the process-wide Chroma handle (opened once, reused per query)."""
+    global _vectordb
+    if _vectordb is None:
+        _vectordb = Chroma(
+            persist_directory=CHROMA_DB,
+            embedding_function=embeddings
+        )
+    return _vectordb
+
+def retrieve_finance_context(query: str, k: int = 4) -> tuple[list[str], float]:
+    """Return (chunks, best_relevance) for a query against the finance knowledge base."""
+    try:
+        scored = get_vectordb().similarity_search_with_relevance_scores(query, k=k)
+    except Exception as e:
+        print(f"Finance KB retrieval failed: {e}")
+        return [], 0.0
+    return _scored_chunks(scored)
+
+async def aretrieve_finance_context(query: str, k: int = 4) -> tuple[list[str], float]:
+    """Async retrieve_finance_context."""
+    try:
+        scored = await get_vectordb().asimilarity_search_with_relevance_scores(query, k=k)
+    except Exception as e:
+        print(f"Finance KB retrieval failed: {e}")
+        return [], 0.0
+    return _scored_chunks(scored)
+
+def _scored_chunks(scored) -> tuple[list[str], float]:
+    chunks = [doc.page_content for doc, _ in scored]
+    best = max((score for _, score in scored), default=0.0)
+    return chunks, float(best)
+
 @tool
 def get_finance_info(query: str) -> str:
     """
@@ -103,12 +147,7 @@ def get_finance_info(query: str) -> str:
     Returns the top relevant chunks.
     """
     print("TOOL USED\n")
-    vectordb = Chroma(
-        persist_directory=CHROMA_DB,
-        embedding_function=embeddings
-    )
-
-    results = vectordb.similarity_search(query, k=4)
+    results = get_vectordb().similarity_search(query, k=4)
 
     if not results:
         return "No relevant finance info found in knowledge base."
@@ -135,74 +174,246 @@ class AgentState(TypedDict):
     mf_categories: Optional[list]
     mf_scraped_data: Optional[list]
     should_scrape: bool
+    mf_names: Optional[list]
+    mf_profile: Optional[dict]
+    entities_extracted: bool
+
+def new_agent_state(question: str) -> AgentState:
+    """Fresh graph state for a user question."""
+    return {
+        "question": question,
+        "category": "",
+        "missing_info": None,
+        "confidence": 0.0,
+        "reasoning": "",
+        "clarification_used": False,
+        "answer": "",
+        "status": "RUNNING",
+        "events": [],
+        "symbol": None,
+        "stock_sentiment": None,
+        "bull_analysis": None,
+        "bear_analysis": None,
+        "mf_matches": None,
+        "mf_categories": None,
+        "mf_scraped_data": None,
+        "should_scrape": False,
+        "mf_names": None,
+        "mf_profile": None,
+        "entities_extracted": False,
+    }
 
-_api_key = os.getenv("ANTHROPIC_API_KEY", "")
-_resource = os.getenv("ANTHROPIC_FOUNDRY_RESOURCE", "")
-_anthropic_url = (
-    f"https://{_resource}.services.ai.azure.com/anthropic" if _resource else "https://api.anthropic.com"
-)
-_anthropic_headers = {"Authorization": f"Bearer {_api_key}"} if _resource else {}
-
-llm = ChatAnthropic(
-    model="claude-sonnet-4-6",
-    temperature=0,
-    anthropic_api_key=_api_key,
-    anthropic_api_url=_anthropic_url,
-    default_headers=_anthropic_headers,
-)
+LLM_MODEL = "claude-sonnet-4-6"
+
+llm = llm_gateway.get_chat_model(LLM_MODEL, temperature=0)
 
 tools = [get_finance_info]
 finance_agent = create_react_agent(llm, tools=tools)
 
-def classifier_node(state: AgentState) -> AgentState:
-    prompt = f"""
-    You are a classification assistant for a finance helpdesk. Classify the user's question into one of the following categories exactly: "mf", "stock", "general_finance", "unknown".
+if os.getenv("FAST_CLASSIFIER_EMBEDDINGS", "0") == "1":
+    fast_classifier.enable_embeddings(embeddings.embed_documents)
+
+# Single structured call that classifies the question and extracts every
+# entity the downstream handlers need (symbol for stocks, fund names /
+# categories / profile for MFs), sent as a tool schema.
+ROUTE_SCHEMA = {
+    "title": "route_question",
+    "description": "Classify a finance helpdesk question and extract its entities.",
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": ["mf", "stock", "general_finance", "unknown"]},
+        "confidence": {"type": "number", "description": "0.0 to 1.0"},
+        "missing_info": {"type": ["string", "null"]},
+        "reasoning": {"type": "string", "description": "1-2 sentence explanation"},
+        "symbol": {"type": ["string", "null"], "description": "NSE ticker for stock questions, else null"},
+        "fund_names": {"type": "array", "items": {"type": "string"}},
+        "fund_categories": {"type": "array", "items": {"type": "string"}},
+        "risk": {"type": ["string", "null"], "enum": ["low", "medium", "high", None]},
+        "horizon": {"type": ["string", "null"], "enum": ["short", "medium", "long", None]},
+        "goal": {"type": ["string", "null"], "enum": ["wealth", "steady", "aggressive", "balanced", None]},
+    },
+    "required": ["category", "confidence", "missing_info", "reasoning", "symbol",
+                 "fund_names", "fund_categories", "risk", "horizon", "goal"],
+}
+router_llm = llm.with_structured_output(ROUTE_SCHEMA, include_raw=True)
+
+def _usage(message) -> dict:
+    meta = getattr(message, "usage_metadata", None) or {}
+    return {"input_tokens": meta.get("input_tokens", 0), "output_tokens": meta.get("output_tokens", 0)}
+
+# Static instruction blocks are sent as a cached system prefix and only the
+# question / data goes in the user turn, so the provider can reuse the prefix.
+ROUTER_SYSTEM = """You are a classification and extraction assistant for a finance helpdesk. Classify the user's question into one of the following categories exactly: "mf", "stock", "general_finance", "unknown".
+
+- "mf" = Mutual fund / SIP / NAV / SIP amount / SIP performance / fund recommendations / risk-based fund queries.
+  * Examples: "suggest good mutual funds", "5 years medium risk", "best flexi cap funds", "SIP for aggressive growth"
+
+- "stock" = Stock / shares / ticker / price target / technical analysis questions.
+  * Examples: "should I buy TCS", "RELIANCE analysis", "stock recommendation"
+
+- "general_finance" = Personal Finance, Budgeting, insurance, tax, loans, general investing concepts (not a specific fund or stock).
+  * Examples: "how to save money", "tax planning tips", "insurance guide"
+
+- "unknown" = The question doesn't fit or lacks clarity OR is completely out of scope (like weather, recipes, general chat).
+  * Examples: "hello", "what's the weather", "tell me a joke"
+
+IMPORTANT: 
+- Even vague MF queries like "tell me good funds" or "5 years medium risk" should be classified as "mf"
+- Mark as "unknown" ONLY if truly not related to finance
+- If it mentions risk/horizon/goals without specific fund names, still classify as "mf"
+
+Fill every field of the route_question tool:
+- category, confidence (0.0-1.0) and reasoning (1-2 sentences) as described above.
+- missing_info: For MF queries, ask for: "specific investment goals, risk tolerance, or investment horizon" if none mentioned. For other categories, note what's missing or null.
+- symbol: for "stock" questions, the Indian stock ticker symbol only (e.g. TMPV, ADANIPOWER, RELIANCE); null if none is named or for other categories.
+- fund_names: full mutual fund names mentioned, e.g. "HDFC Flexi Cap Fund", "Parag Parikh Flexi Cap". Empty list if none.
+- fund_categories: for "mf" questions, the fitting categories:
+    * Low risk / short term (1-3 years) / steady returns → Large Cap, Hybrid, Value/Dividend
+    * Medium risk / medium term (3-5 years) / balanced → Flexi Cap, Multi Cap, Large & Mid Cap
+    * High risk / long term (5+ years) / aggressive growth → Mid Cap, Small Cap, Sectoral, Momentum
+    * Wealth creation → Flexi Cap, Multi Cap, Small Cap
+- risk (low/medium/high), horizon (short/medium/long), goal (wealth/steady/aggressive/balanced): only if mentioned or clearly inferable, else null.
+"""
 
-    - "mf" = Mutual fund / SIP / NAV / SIP amount / SIP performance / fund recommendations / risk-based fund queries.
-      * Examples: "suggest good mutual funds", "5 years medium risk", "best flexi cap funds", "SIP for aggressive growth"
-    
-    - "stock" = Stock / shares / ticker / price target / technical analysis questions.
-      * Examples: "should I buy TCS", "RELIANCE analysis", "stock recommendation"
-    
-    - "general_finance" = Personal Finance, Budgeting, insurance, tax, loans, general investing concepts (not a specific fund or stock).
-      * Examples: "how to save money", "tax planning tips", "insurance guide"
-    
-    - "unknown" = The question doesn't fit or lacks clarity OR is completely out of scope (like weather, recipes, general chat).
-      * Examples: "hello", "what's the weather", "tell me a joke"
+MF_EXTRACT_SYSTEM = """You are a mutual fund category expert. Analyze the user's question and extract:
+
+1. **Mutual fund NAMES** (if mentioned) - extract full names like "HDFC Flexi Cap Fund", "Parag Parikh Flexi Cap"
+
+2. **Mutual fund CATEGORIES** - Based on the question, identify appropriate categories:
+   - If risk tolerance mentioned:
+     * Low risk → Large Cap, Hybrid, Debt funds
+     * Medium risk → Flexi Cap, Multi Cap, Large & Mid Cap
+     * High risk → Mid Cap, Small Cap, Sectoral
+
+   - If investment horizon mentioned:
+     * Short term (1-3 years) → Large Cap, Hybrid, Debt
+     * Medium term (3-5 years) → Flexi Cap, Multi Cap, Large & Mid Cap
+     * Long term (5+ years) → Small Cap, Mid Cap, Sectoral, Momentum
+
+   - If goals mentioned:
+     * Wealth creation → Flexi Cap, Multi Cap, Small Cap
+     * Steady returns → Large Cap, Value/Dividend
+     * Aggressive growth → Small Cap, Momentum, Sectoral
+     * Balanced → Large & Mid Cap, Flexi Cap
+
+3. **Investment Profile** extracted:
+   - Risk: low/medium/high (if mentioned)
+   - Horizon: short/medium/long (if mentioned)
+   - Goal: wealth/steady/aggressive/balanced (if inferred)
+
+Return ONLY a JSON object like:
+{
+    "names": [...],
+    "categories": [...],
+    "risk": "low/medium/high or null",
+    "horizon": "short/medium/long or null",
+    "goal": "wealth/steady/aggressive/balanced or null"
+}
+
+Examples:
+- "5 years, medium risk" → categories: ["flexi cap", "multi cap", "large & mid cap"]
+- "high risk, long term" → categories: ["small cap", "mid cap", "momentum"]
+- "conservative investor" → categories: ["large cap", "hybrid"]
+"""
 
-    IMPORTANT: 
-    - Even vague MF queries like "tell me good funds" or "5 years medium risk" should be classified as "mf"
-    - Mark as "unknown" ONLY if truly not related to finance
-    - If it mentions risk/horizon/goals without specific fund names, still classify as "mf"
+MF_ANALYST_SYSTEM = """You are a mutual fund research analyst providing PRECISE recommendations.
+The user turn contains the user's question, the target categories and the analysed funds with their data.
 
-    For the given question, return a JSON object **only** (no extra commentary) with the following keys:
-    - category: one of the four categories above
-    - confidence: a float from 0.0 to 1.0 (how confident you are)
-    - missing_info: For MF queries, ask for: "specific investment goals, risk tolerance, or investment horizon" if none mentioned. For other categories, note what's missing or null.
-    - reasoning: a 1-2 sentence explanation for your classification
+**Instructions:**
+1. ALWAYS mention the EXACT fund names in your response
+2. Compare the specific funds listed with their actual data
+3. Explain WHY these funds suit the user's risk/horizon/goal
+4. Provide clear ranking: Best → Good → Average
+5. Give actionable recommendation with specific fund name(s)
+6. Mention key metrics (NAV, returns, AUM) for each fund
+7. Be concise but data-driven
 
-    Question: "{state["question"]}"
+**Output Format:**
+📊 **Analysis of [first target category, or "Selected"] Funds:**
 
-    Respond only with valid JSON.
-    """
+🥇 **Top Pick:** [Exact Fund Name]
+- NAV: [value] | 1Y: [%] | 3Y: [%] | 5Y: [%]
+- Why: [specific reasons - relates to user's risk/horizon/goal]
 
-    resp = llm.invoke(prompt)
-    text = resp.content.strip()
+🥈 **Runner-up:** [Exact Fund Name]
+- NAV: [value] | 1Y: [%] | 3Y: [%] | 5Y: [%]
+- Why: [specific reasons]
 
-    # Try to parse JSON
-    try:
-        data = json.loads(text)
-    except Exception:
-        start = text.find('{')
-        end = text.rfind('}')
-        if start != -1 and end != -1:
-            try:
-                data = json.loads(text[start:end+1])
-            except Exception:
-                data = {}
-        else:
-            data = {}
+💡 **Final Recommendation:**
+Invest in [Exact Fund Name(s)] because [clear reasoning that addresses user's investment profile]
 
+**Risk Note:** [Brief risk assessment matching user's risk tolerance]
+"""
+
+def _cached_system(text: str) -> SystemMessage:
+    """Static system block marked as a provider prompt-cache breakpoint."""
+    return SystemMessage(content=[{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}])
+
+def _invoke(node: str, prompt: str, system: Optional[str] = None):
+    """llm.invoke with an optional cached system prefix; records token usage per node."""
+    messages = [_cached_system(system), HumanMessage(content=prompt)] if system else prompt
+    return llm_gateway.invoke(node, llm, messages)
+
+def _cached_text(node: str, prompt: str, system: Optional[str] = None) -> str:
+    """_invoke through the response cache (llm runs at temperature 0)."""
+    def call():
+        resp = _invoke(node, prompt, system)
+        return resp.content.strip(), _usage(resp)
+    key = [system, prompt] if system else prompt
+    return llm_cache.get_or_call(node, LLM_MODEL, key, call, params={"temperature": 0})
+
+async def _ainvoke(node: str, prompt: str, system: Optional[str] = None):
+    """Async _invoke."""
+    messages = [_cached_system(system), HumanMessage(content=prompt)] if system else prompt
+    return await llm_gateway.ainvoke(node, llm, messages)
+
+async def _acached_text(node: str, prompt: str, system: Optional[str] = None) -> str:
+    """Async _cached_text."""
+    async def call():
+        resp = await _ainvoke(node, prompt, system)
+        return resp.content.strip(), _usage(resp)
+    key = [system, prompt] if system else prompt
+    return await llm_cache.aget_or_call(node, LLM_MODEL, key, call, params={"temperature": 0})
+
+ROUTE_CACHE_PARAMS = {"temperature": 0, "schema": ROUTE_SCHEMA["title"]}
+
+def _route_messages(question: str) -> list:
+    return [_cached_system(ROUTER_SYSTEM), HumanMessage(content=f'Question: "{question}"')]
+
+def _route_result(out: dict) -> tuple[dict, dict]:
+    if not out.get("parsed"):
+        raise ValueError(f"unparsable router output: {out.get('parsing_error')}")
+    return out["parsed"], _usage(out.get("raw"))
+
+def _route(question: str) -> dict:
+    def call():
+        return _route_result(llm_gateway.invoke("classifier", router_llm, _route_messages(question)))
+    return llm_cache.get_or_call("classifier", LLM_MODEL, [ROUTER_SYSTEM, question], call,
+                                 params=ROUTE_CACHE_PARAMS)
+
+async def _aroute(question: str) -> dict:
+    async def call():
+        return _route_result(await llm_gateway.ainvoke("classifier", router_llm, _route_messages(question)))
+    return await llm_cache.aget_or_call("classifier", LLM_MODEL, [ROUTER_SYSTEM, question], call,
+                                        params=ROUTE_CACHE_PARAMS)
+
+def _apply_fast_classification(state: AgentState, fast: dict) -> AgentState:
+    state["category"] = fast["category"]
+    state["confidence"] = fast["confidence"]
+    state["missing_info"] = None if state.get("clarification_used") else fast["missing_info"]
+    state["reasoning"] = fast["reasoning"]
+    if fast["symbol"]:
+        state["symbol"] = fast["symbol"]
+    state["entities_extracted"] = False
+
+    state["events"].append({
+        "type": "result",
+        "title": "Classifier",
+        "message": f"Category: {state['category']}, missing info: {state['missing_info']} (rule-based)"
+    })
+    return state
+
+def _apply_route(state: AgentState, data: dict) -> AgentState:
     state["category"] = data.get("category", "unknown")
     state["confidence"] = data.get("confidence", 0.0)
     if not state.get("clarification_used"):
@@ -211,6 +422,18 @@ def classifier_node(state: AgentState) -> AgentState:
         state["missing_info"] = None
     state["reasoning"] = data.get("reasoning", "")
 
+    symbol = (data.get("symbol") or "").strip().upper()
+    if symbol and symbol != "NONE" and len(symbol) <= 15:
+        state["symbol"] = symbol
+    state["mf_names"] = data.get("fund_names") or []
+    state["mf_categories"] = data.get("fund_categories") or []
+    state["mf_profile"] = {
+        "risk": data.get("risk"),
+        "horizon": data.get("horizon"),
+        "goal": data.get("goal"),
+    }
+    state["entities_extracted"] = bool(data)
+
     state["events"].append({
         "type": "result",
         "title": "Classifier",
@@ -219,6 +442,30 @@ def classifier_node(state: AgentState) -> AgentState:
 
     return state
 
+def classifier_node(state: AgentState) -> AgentState:
+    fast = fast_classifier.classify(state["question"])
+    if fast:
+        return _apply_fast_classification(state, fast)
+
+    try:
+        data = _route(state["question"]) or {}
+    except Exception as e:
+        print("Router call failed:", e)
+        data = {}
+    return _apply_route(state, data)
+
+async def aclassifier_node(state: AgentState) -> AgentState:
+    fast = fast_classifier.classify(state["question"])
+    if fast:
+        return _apply_fast_classification(state, fast)
+
+    try:
+        data = await _aroute(state["question"]) or {}
+    except Exception as e:
+        print("Router call failed:", e)
+        data = {}
+    return _apply_route(state, data)
+
 def clarifier_node(state: AgentState) -> AgentState:
     missing = state.get("missing_info")
 
@@ -294,77 +541,107 @@ Please ask a finance-related question and I'll be happy to assist!"""
     })
     return state
 
-def general_finance_handler(state: AgentState) -> AgentState:
+def _usage_tokens(messages) -> dict:
+    """Sum input/output token usage over the AI messages of an LLM exchange."""
+    usage = {"input_tokens": 0, "output_tokens": 0, "llm_calls": 0}
+    for msg in messages:
+        meta = getattr(msg, "usage_metadata", None)
+        if not meta:
+            continue
+        usage["input_tokens"] += meta.get("input_tokens", 0)
+        usage["output_tokens"] += meta.get("output_tokens", 0)
+        usage["llm_calls"] += 1
+    return usage
+
+def _general_finance_prompt(question: str, chunks: list[str]) -> str:
+    context = "\n\n---\n".join(chunks)
+    return f"""
+    You are a financial advisor focused on personal finance topics like budgeting,
+    savings, insurance, tax planning and general investment strategy.
+    Provide a simplified and short explanation.
+
+    Use the reference material below where it is relevant. If it does not cover
+    the question, answer from general financial knowledge.
+
+    Reference material:
+    {context}
+
+    Question: "{question}"
+    """
+
+def general_finance_fast(question: str, chunks: list[str]) -> tuple[str, dict]:
+    """Single LLM call that answers from already-retrieved knowledge base chunks."""
+    resp = llm_gateway.invoke("general_finance", llm, _general_finance_prompt(question, chunks))
+    return resp.content.strip(), _usage_tokens([resp])
+
+async def ageneral_finance_fast(question: str, chunks: list[str]) -> tuple[str, dict]:
+    resp = await llm_gateway.ainvoke("general_finance", llm, _general_finance_prompt(question, chunks))
+    return resp.content.strip(), _usage_tokens([resp])
+
+def _general_finance_agent_input(question: str) -> dict:
     prompt = f"""
     You are a financial advisor focused on personal finance topics like budgeting,
     savings, insurance, tax planning and general investment strategy.
     Provide a simplified and short explanation.
 
-    Question: "{state['question']}"
+    Question: "{question}"
     """
-    
-    result = finance_agent.invoke({
-        "messages": [{"role": "user", "content": prompt}]
-    })
-    
+    return {"messages": [{"role": "user", "content": prompt}]}
+
+def _agent_answer(result: dict) -> tuple[str, dict]:
     final_message = result["messages"][-1]
     answer = final_message.content if hasattr(final_message, 'content') else str(final_message)
-    
-    state["answer"] = answer.strip()
+    return answer.strip(), _usage_tokens(result["messages"])
+
+def general_finance_agent(question: str) -> tuple[str, dict]:
+    """ReAct agent loop with the knowledge base exposed as a tool (fallback path)."""
+    return _agent_answer(llm_gateway.invoke(
+        "general_finance_agent", finance_agent, _general_finance_agent_input(question)))
+
+async def ageneral_finance_agent(question: str) -> tuple[str, dict]:
+    return _agent_answer(await llm_gateway.ainvoke(
+        "general_finance_agent", finance_agent, _general_finance_agent_input(question)))
+
+def general_finance_handler(state: AgentState) -> AgentState:
+    chunks, relevance = retrieve_finance_context(state["question"])
+
+    if chunks and relevance >= GENERAL_FINANCE_MIN_RELEVANCE:
+        answer, _ = general_finance_fast(state["question"], chunks)
+        path = "retrieval"
+    else:
+        answer, _ = general_finance_agent(state["question"])
+        path = "agent"
+    return _apply_general_finance(state, answer, path, relevance)
+
+async def ageneral_finance_handler(state: AgentState) -> AgentState:
+    chunks, relevance = await aretrieve_finance_context(state["question"])
+
+    if chunks and relevance >= GENERAL_FINANCE_MIN_RELEVANCE:
+        answer, _ = await ageneral_finance_fast(state["question"], chunks)
+        path = "retrieval"
+    else:
+        answer, _ = await ageneral_finance_agent(state["question"])
+        path = "agent"
+    return _apply_general_finance(state, answer, path, relevance)
+
+def _apply_general_finance(state: AgentState, answer: str, path: str, relevance: float) -> AgentState:
+    state["answer"] = answer
     state["events"].append({
         "type": "result",
         "title": "General Finance",
         "message": state["answer"]
     })
+    print(f"General finance answered via {path} path (relevance {relevance:.2f})")
     return state
 
-def extract_mf_name(state: AgentState) -> AgentState:
-    prompt = f"""
-    You are a mutual fund category expert. Analyze the user's question and extract:
-
-    1. **Mutual fund NAMES** (if mentioned) - extract full names like "HDFC Flexi Cap Fund", "Parag Parikh Flexi Cap"
-    
-    2. **Mutual fund CATEGORIES** - Based on the question, identify appropriate categories:
-       - If risk tolerance mentioned:
-         * Low risk → Large Cap, Hybrid, Debt funds
-         * Medium risk → Flexi Cap, Multi Cap, Large & Mid Cap
-         * High risk → Mid Cap, Small Cap, Sectoral
-       
-       - If investment horizon mentioned:
-         * Short term (1-3 years) → Large Cap, Hybrid, Debt
-         * Medium term (3-5 years) → Flexi Cap, Multi Cap, Large & Mid Cap
-         * Long term (5+ years) → Small Cap, Mid Cap, Sectoral, Momentum
-       
-       - If goals mentioned:
-         * Wealth creation → Flexi Cap, Multi Cap, Small Cap
-         * Steady returns → Large Cap, Value/Dividend
-         * Aggressive growth → Small Cap, Momentum, Sectoral
-         * Balanced → Large & Mid Cap, Flexi Cap
-
-    3. **Investment Profile** extracted:
-       - Risk: low/medium/high (if mentioned)
-       - Horizon: short/medium/long (if mentioned)
-       - Goal: wealth/steady/aggressive/balanced (if inferred)
-
-    Return ONLY a JSON object like:
-    {{
-        "names": [...],
-        "categories": [...],
-        "risk": "low/medium/high or null",
-        "horizon": "short/medium/long or null",
-        "goal": "wealth/steady/aggressive/balanced or null"
-    }}
-
-    Examples:
-    - "5 years, medium risk" → categories: ["flexi cap", "multi cap", "large & mid cap"]
-    - "high risk, long term" → categories: ["small cap", "mid cap", "momentum"]
-    - "conservative investor" → categories: ["large cap", "hybrid"]
+def _extract_mf_entities(question: str) -> tuple[list, list, Optional[str], Optional[str], Optional[str]]:
+    """Standalone LLM extraction, used when the router did not run (rule-based classification)."""
+    return _parse_mf_entities(_cached_text("mf_extract", f'Question: "{question}"', system=MF_EXTRACT_SYSTEM))
 
-    Question: "{state['question']}"
-    """
+async def _aextract_mf_entities(question: str) -> tuple[list, list, Optional[str], Optional[str], Optional[str]]:
+    return _parse_mf_entities(await _acached_text("mf_extract", f'Question: "{question}"', system=MF_EXTRACT_SYSTEM))
 
-    resp = llm.invoke(prompt)
-    raw = resp.content.strip()
+def _parse_mf_entities(raw: str) -> tuple[list, list, Optional[str], Optional[str], Optional[str]]:
     if raw.startswith("```"):
         raw = raw.strip("`")
         raw = raw.replace("json", "", 1).strip()
@@ -384,6 +661,29 @@ def extract_mf_name(state: AgentState) -> AgentState:
         horizon = None
         goal = None
 
+    return mf_names, mf_categories, risk_profile, horizon, goal
+
+def _router_mf_entities(state: AgentState) -> tuple[list, list, Optional[str], Optional[str], Optional[str]]:
+    profile = state.get("mf_profile") or {}
+    return (state.get("mf_names") or [], state.get("mf_categories") or [],
+            profile.get("risk"), profile.get("horizon"), profile.get("goal"))
+
+def extract_mf_name(state: AgentState) -> AgentState:
+    if state.get("entities_extracted"):
+        entities = _router_mf_entities(state)
+    else:
+        entities = _extract_mf_entities(state["question"])
+    return _match_mf_entities(state, *entities)
+
+async def aextract_mf_name(state: AgentState) -> AgentState:
+    if state.get("entities_extracted"):
+        entities = _router_mf_entities(state)
+    else:
+        entities = await _aextract_mf_entities(state["question"])
+    return _match_mf_entities(state, *entities)
+
+def _match_mf_entities(state: AgentState, mf_names: list, mf_categories: list,
+                       risk_profile: Optional[str], horizon: Optional[str], goal: Optional[str]) -> AgentState:
     # Auto-suggest categories if none extracted but risk/horizon/goal present
     if not mf_categories and (risk_profile or horizon or goal):
         mf_categories = auto_suggest_categories(risk_profile, horizon, goal)
@@ -449,26 +749,39 @@ def mf_scrape_node(state: AgentState) -> AgentState:
         state["mf_scraped_data"] = []
         return state
 
-    matches = state.get("mf_matches", [])
     scraped_list = []
-
-    for m in matches:
+    for m in state.get("mf_matches", []):
         try:
-            data = scrape_mf(m["url"])
-            scraped_list.append({
-                "name": m["name"],
-                "url": m["url"],
-                "category": m.get("category", ""),
-                "data": data
-            })
+            scraped_list.append(_scraped_entry(m, scrape_mf(m["url"])))
         except Exception as e:
-            scraped_list.append({
-                "name": m["name"],
-                "url": m["url"],
-                "category": m.get("category", ""),
-                "data": {"error": f"Scraping failed: {str(e)}"}
-            })
+            scraped_list.append(_scraped_entry(m, {"error": f"Scraping failed: {str(e)}"}))
+    return _apply_mf_scrape(state, scraped_list)
 
+async def amf_scrape_node(state: AgentState) -> AgentState:
+    if not state.get("should_scrape"):
+        state["mf_scraped_data"] = []
+        return state
+
+    matches = state.get("mf_matches", [])
+    async with httpx.AsyncClient(headers=MF_HEADERS, follow_redirects=True, timeout=20) as client:
+        results = await asyncio.gather(*(ascrape_mf(m["url"], client) for m in matches),
+                                       return_exceptions=True)
+
+    scraped_list = [
+        _scraped_entry(m, {"error": f"Scraping failed: {str(r)}"} if isinstance(r, Exception) else r)
+        for m, r in zip(matches, results)
+    ]
+    return _apply_mf_scrape(state, scraped_list)
+
+def _scraped_entry(match: dict, data: dict) -> dict:
+    return {
+        "name": match["name"],
+        "url": match["url"],
+        "category": match.get("category", ""),
+        "data": data
+    }
+
+def _apply_mf_scrape(state: AgentState, scraped_list: list) -> AgentState:
     state["mf_scraped_data"] = scraped_list
     state["events"].append({
         "type": "result",
@@ -479,6 +792,21 @@ def mf_scrape_node(state: AgentState) -> AgentState:
 
 def mf_handler(state: AgentState) -> AgentState:
     """Enhanced MF handler with precise fund name recommendations"""
+    prompt = _mf_prompt(state)
+    if prompt is None:
+        return state
+    resp = _invoke("mf_handler", prompt, system=MF_ANALYST_SYSTEM)
+    return _apply_mf_answer(state, resp.content.strip())
+
+async def amf_handler(state: AgentState) -> AgentState:
+    prompt = _mf_prompt(state)
+    if prompt is None:
+        return state
+    resp = await _ainvoke("mf_handler", prompt, system=MF_ANALYST_SYSTEM)
+    return _apply_mf_answer(state, resp.content.strip())
+
+def _mf_prompt(state: AgentState) -> Optional[str]:
+    """Analyst prompt for the scraped funds, or None after writing the no-match guidance."""
     extracted = state.get("mf_scraped_data", [])
     query = state.get("question", "")
     categories = state.get("mf_categories", [])
@@ -514,7 +842,7 @@ I couldn't find specific mutual funds matching your query.
             "title": "MF Answer",
             "message": "No funds matched - provided guidance"
         })
-        return state
+        return None
 
     # Build detailed summary with fund names
     fund_details = []
@@ -534,44 +862,18 @@ I couldn't find specific mutual funds matching your query.
         fund_details.append(detail)
 
     funds_summary = "\n".join(fund_details)
-    category_context = f" for {', '.join(categories)}" if categories else ""
-
-    prompt = f"""
-    You are a mutual fund research analyst providing PRECISE recommendations{category_context}.
-
-    User question: "{query}"
-
-    **Analyzed Funds:**
-    {funds_summary}
-
-    **Instructions:**
-    1. ALWAYS mention the EXACT fund names in your response
-    2. Compare the specific funds listed above with their actual data
-    3. Explain WHY these funds suit the user's risk/horizon/goal
-    4. Provide clear ranking: Best → Good → Average
-    5. Give actionable recommendation with specific fund name(s)
-    6. Mention key metrics (NAV, returns, AUM) for each fund
-    7. Be concise but data-driven
+    category_text = ", ".join(categories) if categories else "Selected"
 
-    **Output Format:**
-    📊 **Analysis of {categories[0] if categories else 'Selected'} Funds:**
+    return f"""User question: "{query}"
 
-    🥇 **Top Pick:** [Exact Fund Name]
-    - NAV: [value] | 1Y: [%] | 3Y: [%] | 5Y: [%]
-    - Why: [specific reasons - relates to user's risk/horizon/goal]
+Target categories: {category_text}
 
-    🥈 **Runner-up:** [Exact Fund Name]  
-    - NAV: [value] | 1Y: [%] | 3Y: [%] | 5Y: [%]
-    - Why: [specific reasons]
-
-    💡 **Final Recommendation:** 
-    Invest in [Exact Fund Name(s)] because [clear reasoning that addresses user's investment profile]
-
-    **Risk Note:** [Brief risk assessment matching user's risk tolerance]
-    """
+**Analyzed Funds:**
+{funds_summary}
+"""
 
-    resp = llm.invoke(prompt)
-    state["answer"] = resp.content.strip()
+def _apply_mf_answer(state: AgentState, answer: str) -> AgentState:
+    state["answer"] = answer
     
     state["events"].append({
         "type": "result",
@@ -581,8 +883,23 @@ I couldn't find specific mutual funds matching your query.
     return state
 
 # Stock handlers remain the same...
-def symbol_extractor(state: AgentState) -> AgentState:
-    prompt = f"""
+def _symbol_known(state: AgentState) -> bool:
+    """True when no LLM extraction is needed (symbol already set, or the router found none)."""
+    if state.get("symbol"):
+        state["events"].append({
+            "type": "result",
+            "title": "Symbol Extractor",
+            "message": f"Extracted symbol: {state['symbol']}"
+        })
+        return True
+
+    if state.get("entities_extracted"):
+        state["missing_info"] = "Which stock symbol are you referring to?"
+        return True
+    return False
+
+def _symbol_prompt(state: AgentState) -> str:
+    return f"""
     You are an AI whose job is to extract the Stock Ticker Symbol from a user question, usually based on Indian stock market.
     Only reply with the symbol itself (e.g. TMPV, ADANIPOWER, RELIANCE).
     If no symbol exists in the question, reply with "NONE".
@@ -590,9 +907,17 @@ def symbol_extractor(state: AgentState) -> AgentState:
     Question: "{state['question']}"
     """
 
-    resp = llm.invoke(prompt)
-    symbol = resp.content.strip().upper()
+def symbol_extractor(state: AgentState) -> AgentState:
+    if _symbol_known(state):
+        return state
+    return _apply_symbol(state, _cached_text("symbol_extractor", _symbol_prompt(state)).upper())
+
+async def asymbol_extractor(state: AgentState) -> AgentState:
+    if _symbol_known(state):
+        return state
+    return _apply_symbol(state, (await _acached_text("symbol_extractor", _symbol_prompt(state))).upper())
 
+def _apply_symbol(state: AgentState, symbol: str) -> AgentState:
     if symbol == "NONE" or len(symbol) > 15: 
         state["missing_info"] = "Which stock symbol are you referring to?"
         return state  
@@ -606,9 +931,15 @@ def symbol_extractor(state: AgentState) -> AgentState:
     return state
 
 def stock_sentiment(state: AgentState) -> AgentState:
-    symbol = state.get("symbol", "")
-    news_service = NewsService()
-    news_items = news_service.fetch_stock_news(symbol, limit=5)
+    news_items = NewsService().fetch_stock_news(state.get("symbol", ""), limit=5)
+    return _apply_sentiment(state, news_items)
+
+async def astock_sentiment(state: AgentState) -> AgentState:
+    news_items = await NewsService().afetch_stock_news(state.get("symbol", ""), limit=5)
+    # TextBlob scoring is CPU-bound; keep it off the event loop
+    return await asyncio.to_thread(_apply_sentiment, state, news_items)
+
+def _apply_sentiment(state: AgentState, news_items: list) -> AgentState:
     headlines = [item['title'] for item in news_items]
     
     sentiment_summary = analyze_sentiment(headlines)
@@ -625,12 +956,12 @@ def stock_sentiment(state: AgentState) -> AgentState:
     
     return state
 
-def bull_handler(state: AgentState) -> dict:
+def _bull_prompt(state: AgentState) -> str:
     sentiment_data = state.get('stock_sentiment', {})
     headlines = sentiment_data.get('headlines', [])
     sentiment_summary = sentiment_data.get('news_sentiment', {})
 
-    prompt = f"""
+    return f"""
     You are a bullish stock analyst. User asked: "{state['question']}".
     Analyze from a positive/bullish perspective only.
 
@@ -641,9 +972,14 @@ def bull_handler(state: AgentState) -> dict:
     Provide a bullish Buy recommendation if justified. Keep the output super concise under 100 words.
     """
 
-    resp = llm.invoke(prompt)
-    state["bull_analysis"] = resp.content.strip()
-    bull_text = state["bull_analysis"]
+def bull_handler(state: AgentState) -> dict:
+    return _apply_bull(state, _cached_text("bull_handler", _bull_prompt(state)))
+
+async def abull_handler(state: AgentState) -> dict:
+    return _apply_bull(state, await _acached_text("bull_handler", _bull_prompt(state)))
+
+def _apply_bull(state: AgentState, bull_text: str) -> dict:
+    state["bull_analysis"] = bull_text
     state["events"].append({
         "type": "result",
         "title": "Bullish Review",
@@ -651,12 +987,12 @@ def bull_handler(state: AgentState) -> dict:
     })
     return {"bull_analysis": bull_text}
 
-def bear_handler(state: AgentState) -> dict:
+def _bear_prompt(state: AgentState) -> str:
     sentiment_data = state.get('stock_sentiment', {})
     headlines = sentiment_data.get('headlines', [])
     sentiment_summary = sentiment_data.get('news_sentiment', {})
 
-    prompt = f"""
+    return f"""
     You are a bearish stock analyst. User asked: "{state['question']}".
     Analyze from a negative/bearish perspective only.
 
@@ -667,9 +1003,14 @@ def bear_handler(state: AgentState) -> dict:
     Provide a Sell recommendation if justified. Keep the output super concise under 100 words.
     """
 
-    resp = llm.invoke(prompt)
-    state["bear_analysis"] = resp.content.strip()
-    bear_text = state["bear_analysis"]
+def bear_handler(state: AgentState) -> dict:
+    return _apply_bear(state, _cached_text("bear_handler", _bear_prompt(state)))
+
+async def abear_handler(state: AgentState) -> dict:
+    return _apply_bear(state, await _acached_text("bear_handler", _bear_prompt(state)))
+
+def _apply_bear(state: AgentState, bear_text: str) -> dict:
+    state["bear_analysis"] = bear_text
     state["events"].append({
         "type": "result",
         "title": "Bearish Review",
@@ -677,11 +1018,11 @@ def bear_handler(state: AgentState) -> dict:
     })
     return {"bear_analysis": bear_text}
 
-def stock_handler(state: AgentState) -> AgentState:
+def _stock_prompt(state: AgentState) -> str:
     bull = state.get("bull_analysis", "No bullish analysis available")
     bear = state.get("bear_analysis", "No bearish analysis available")
 
-    prompt = f"""
+    return f"""
     You are a balanced financial advisor. Summarize the bullish and bearish perspectives
     below and provide a final actionable recommendation.
 
@@ -696,8 +1037,16 @@ def stock_handler(state: AgentState) -> AgentState:
     If user asks for suggestions like which stocks funds to buy. Then return with actual stock suggestions and not just sectors.
     """
 
-    resp = llm.invoke(prompt)
-    state["answer"] = resp.content.strip()
+def stock_handler(state: AgentState) -> AgentState:
+    resp = llm_gateway.invoke("stock_handler", llm, _stock_prompt(state))
+    return _apply_stock_answer(state, resp.content.strip())
+
+async def astock_handler(state: AgentState) -> AgentState:
+    resp = await llm_gateway.ainvoke("stock_handler", llm, _stock_prompt(state))
+    return _apply_stock_answer(state, resp.content.strip())
+
+def _apply_stock_answer(state: AgentState, answer: str) -> AgentState:
+    state["answer"] = answer
     final_ans = state["answer"]
 
     state["events"].append({
@@ -707,23 +1056,23 @@ def stock_handler(state: AgentState) -> AgentState:
     })
     return state
 
-def build_graph():
+def _build_workflow(nodes: dict) -> StateGraph:
     workflow = StateGraph(AgentState)
-    workflow.add_node("classifier", classifier_node)
-    workflow.add_node("clarifier", clarifier_node)
-    workflow.add_node("unknown_handler", unknown_handler)  # NEW
+    workflow.add_node("classifier", nodes["classifier"])
+    workflow.add_node("clarifier", nodes["clarifier"])
+    workflow.add_node("unknown_handler", nodes["unknown_handler"])  # NEW
 
-    workflow.add_node("stock_sentiment", stock_sentiment)
-    workflow.add_node("stock_handler", stock_handler)
-    workflow.add_node("bull_handler", bull_handler)
-    workflow.add_node("bear_handler", bear_handler)
-    workflow.add_node("symbol_extractor", symbol_extractor)
+    workflow.add_node("stock_sentiment", nodes["stock_sentiment"])
+    workflow.add_node("stock_handler", nodes["stock_handler"])
+    workflow.add_node("bull_handler", nodes["bull_handler"])
+    workflow.add_node("bear_handler", nodes["bear_handler"])
+    workflow.add_node("symbol_extractor", nodes["symbol_extractor"])
 
-    workflow.add_node("mf_extract", extract_mf_name)
-    workflow.add_node("mf_scrape", mf_scrape_node)
-    workflow.add_node("mf_handler", mf_handler)
+    workflow.add_node("mf_extract", nodes["mf_extract"])
+    workflow.add_node("mf_scrape", nodes["mf_scrape"])
+    workflow.add_node("mf_handler", nodes["mf_handler"])
 
-    workflow.add_node("general_finance_handler", general_finance_handler)
+    workflow.add_node("general_finance_handler", nodes["general_finance_handler"])
 
     workflow.set_entry_point("classifier")
 
@@ -759,31 +1108,56 @@ def build_graph():
     )
     workflow.add_edge("mf_scrape", "mf_handler")
 
-    return workflow.compile()
+    return workflow
+
+SYNC_NODES = {
+    "classifier": classifier_node,
+    "clarifier": clarifier_node,
+    "unknown_handler": unknown_handler,
+    "stock_sentiment": stock_sentiment,
+    "stock_handler": stock_handler,
+    "bull_handler": bull_handler,
+    "bear_handler": bear_handler,
+    "symbol_extractor": symbol_extractor,
+    "mf_extract": extract_mf_name,
+    "mf_scrape": mf_scrape_node,
+    "mf_handler": mf_handler,
+    "general_finance_handler": general_finance_handler,
+}
+
+async def aclarifier_node(state: AgentState) -> AgentState:
+    return clarifier_node(state)
+
+async def aunknown_handler(state: AgentState) -> AgentState:
+    return unknown_handler(state)
+
+ASYNC_NODES = {
+    "classifier": aclassifier_node,
+    "clarifier": aclarifier_node,
+    "unknown_handler": aunknown_handler,
+    "stock_sentiment": astock_sentiment,
+    "stock_handler": astock_handler,
+    "bull_handler": abull_handler,
+    "bear_handler": abear_handler,
+    "symbol_extractor": asymbol_extractor,
+    "mf_extract": aextract_mf_name,
+    "mf_scrape": amf_scrape_node,
+    "mf_handler": amf_handler,
+    "general_finance_handler": ageneral_finance_handler,
+}
+
+def build_graph():
+    return _build_workflow(SYNC_NODES).compile()
+
+def build_async_graph():
+    """Same topology with coroutine nodes; run with `await graph.ainvoke(state)` on one event loop."""
+    return _build_workflow(ASYNC_NODES).compile()
 
 if __name__ == "__main__":
     question_input = input("\n\nEnter your question: ")
 
     graph = build_graph()
-    initial_state: AgentState = {
-        "question": question_input,
-        "category": "",
-        "missing_info": None,
-        "confidence": 0.0,
-        "reasoning": "",
-        "clarification_used": False,
-        "answer": "",
-        "status": "RUNNING",
-        "events": [],
-        "symbol": None,
-        "stock_sentiment": None,
-        "bull_analysis": None,
-        "bear_analysis": None,
-        "mf_matches": None,
-        "mf_categories": None,
-        "mf_scraped_data": None,
-        "should_scrape": False
-    }
+    initial_state = new_agent_state(question_input)
 
     result = graph.invoke(initial_state)
     print("\n\n✅ Final Answer:\n")
@@ -0,0 +1,455 @@
+"""
+user_store.py - Transactional SQLite store for agent users (WAL mode).
+
+Replaces holdings.json + one pretty-printed JSON file per user.
+
+Tables:
+  users         one row per allowed email: flags (isDataPresent /
+                isAnalysisPresent), dataFile, name, onboardedAt, profile
+  holdings      one row per stock / mutual fund position
+  agent_state   one row per agentState key (verdict, alerts, lastPrices, ...)
+  activity_log  per-user ring of ACTIVITY_CAP slots; entry n lands in slot
+                n % ACTIVITY_CAP, so appends are O(new entries) and never
+                rewrite history (the oldest slot is simply overwritten)
+  trend_state   one row per (user, symbol) down-day counter
+
+save_user() writes only what differs from the version the caller loaded
+(or, without one, from the stored rows), inside one IMMEDIATE transaction,
+so concurrent onboarding / analysis / report runs no longer overwrite each
+other's fields. load_user() returns the same dict shape as the JSON files.
+
+On first open the existing holdings.json and user files are imported; emails
+added to holdings.json later are picked up on the next start.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+DATA_DIR       = os.path.dirname(__file__)
+STORE_DB       = os.getenv("USER_STORE_DB", os.path.join(DATA_DIR, "diversifi.db"))
+INDEX_FILE     = os.path.join(DATA_DIR, "holdings.json")
+ACTIVITY_CAP   = int(os.getenv("AGENT_ACTIVITY_CAP", "50"))
+
+# agentState keys stored in their own tables instead of agent_state rows
+_OWN_TABLE_KEYS = ("activityLog", "trendState")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email               TEXT PRIMARY KEY,
+    data_file           TEXT UNIQUE,
+    name                TEXT,
+    onboarded_at        TEXT,
+    profile             TEXT,
+    is_data_present     INTEGER NOT NULL DEFAULT 0,
+    is_analysis_present INTEGER NOT NULL DEFAULT 0,
+    activity_seq        INTEGER NOT NULL DEFAULT 0,   -- seq of the newest activity entry
+    updated_at          REAL
+);
+CREATE TABLE IF NOT EXISTS holdings (
+    email    TEXT NOT NULL,
+    kind     TEXT NOT NULL,              -- 'stocks' | 'mutualFunds'
+    position INTEGER NOT NULL,
+    symbol   TEXT,
+    data     TEXT NOT NULL,
+    PRIMARY KEY (email, kind, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS holdings_symbol ON holdings (symbol);
+CREATE TABLE IF NOT EXISTS agent_state (
+    email TEXT NOT NULL,
+    key   TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (email, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS activity_log (
+    email     TEXT NOT NULL,
+    slot      INTEGER NOT NULL,
+    seq       INTEGER NOT NULL,
+    timestamp TEXT,
+    icon      TEXT,
+    message   TEXT,
+    level     TEXT,
+    PRIMARY KEY (email, slot)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS activity_log_seq ON activity_log (email, seq);
+CREATE TABLE IF NOT EXISTS trend_state (
+    email      TEXT NOT NULL,
+    symbol     TEXT NOT NULL,
+    down_count INTEGER NOT NULL DEFAULT 0,
+    last_date  TEXT,
+    PRIMARY KEY (email, symbol)
+) WITHOUT ROWID;
+"""
+
+_local     = threading.local()
+_init_lock = threading.Lock()
+_ready     = False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Connection helpers
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _conn() -> sqlite3.Connection:
+    """One connection per thread; WAL lets readers run while a writer commits."""
+    global _ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(STORE_DB, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        _local.conn = conn
+    if not _ready:
+        with _init_lock:
+            if not _ready:
+                _upgrade(conn)
+                conn.executescript(_SCHEMA)
+                _import_json(conn)
+                _ready = True
+    return conn
+
+
+@contextmanager
+def _tx() -> Iterator[sqlite3.Connection]:
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+def _loads(value: Optional[str]) -> Any:
+    return json.loads(value) if value else None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Migrations
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _upgrade(conn: sqlite3.Connection) -> None:
+    """Convert the first store layout (capped activity_log list) to the ring."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(activity_log)")}
+    if "batch" not in cols:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("ALTER TABLE users ADD COLUMN activity_seq INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE activity_log RENAME TO activity_log_old")
+        conn.execute("DROP INDEX IF EXISTS activity_log_email")
+        conn.execute(
+            "CREATE TABLE activity_log (email TEXT NOT NULL, slot INTEGER NOT NULL, seq INTEGER NOT NULL,"
+            " timestamp TEXT, icon TEXT, message TEXT, level TEXT, PRIMARY KEY (email, slot)) WITHOUT ROWID"
+        )
+        by_user: dict[str, list] = {}
+        for row in conn.execute("SELECT email, timestamp, icon, message, level FROM activity_log_old"
+                                " ORDER BY batch DESC, id ASC"):
+            by_user.setdefault(row[0], []).append(
+                {"timestamp": row[1], "icon": row[2], "message": row[3], "level": row[4]})
+        for email, entries in by_user.items():
+            append_activity(email, entries[::-1], conn)        # stored newest first
+        conn.execute("DROP TABLE activity_log_old")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    print("[user_store] converted activity_log to ring layout")
+
+
+def _import_json(conn: sqlite3.Connection) -> None:
+    """Import emails from holdings.json (and their user files) that are not in the store yet."""
+    if not os.path.exists(INDEX_FILE):
+        return
+    try:
+        with open(INDEX_FILE) as f:
+            index = json.load(f)
+    except Exception as e:
+        print(f"[user_store] cannot read {INDEX_FILE}: {e}")
+        return
+
+    known = {row[0] for row in conn.execute("SELECT email FROM users")}
+    new = [(email, meta) for email, meta in index.items() if email not in known]
+    if not new:
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for email, meta in new:
+            conn.execute(
+                "INSERT INTO users (email, data_file, is_data_present, is_analysis_present, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (email, meta.get("dataFile"), int(bool(meta.get("isDataPresent"))),
+                 int(bool(meta.get("isAnalysisPresent"))), time.time()),
+            )
+            path = os.path.join(DATA_DIR, meta.get("dataFile") or "")
+            if meta.get("dataFile") and os.path.exists(path):
+                with open(path) as f:
+                    _write_user(conn, email, json.load(f), base=None)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    print(f"[user_store] imported {len(new)} users from {os.path.basename(INDEX_FILE)}")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reads
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _flags(row) -> dict:
+    return {"isDataPresent": bool(row[1]), "dataFile": row[0], "isAnalysisPresent": bool(row[2])}
+
+
+def load_index() -> dict:
+    """{email: {isDataPresent, dataFile, isAnalysisPresent}}, the holdings.json shape."""
+    rows = _conn().execute(
+        "SELECT email, data_file, is_data_present, is_analysis_present FROM users ORDER BY rowid"
+    ).fetchall()
+    return {r[0]: _flags(r[1:]) for r in rows}
+
+
+def get_meta(email: str) -> Optional[dict]:
+    row = _conn().execute(
+        "SELECT data_file, is_data_present, is_analysis_present FROM users WHERE email = ?", (email,)
+    ).fetchone()
+    return _flags(row) if row else None
+
+
+def email_for_file(data_file: str) -> Optional[str]:
+    row = _conn().execute("SELECT email FROM users WHERE data_file = ?", (data_file,)).fetchone()
+    return row[0] if row else None
+
+
+def read_activity(email: str, after: Optional[int] = None, before: Optional[int] = None,
+                  limit: int = ACTIVITY_CAP, conn: Optional[sqlite3.Connection] = None) -> dict:
+    """
+    Cursor read of the activity ring.
+
+    after=seq   entries newer than seq, oldest first (SSE resume / polling)
+    before=seq  entries older than seq, newest first (dashboard paging)
+    neither     the newest `limit` entries, newest first
+
+    Returns {entries: [{seq, timestamp, icon, message, level}], head, oldest}
+    where head is the newest seq; pass it back as `after` to continue.
+    """
+    conn = conn or _conn()
+    row = conn.execute("SELECT activity_seq FROM users WHERE email = ?", (email,)).fetchone()
+    head = row[0] if row else 0
+    oldest = max(1, head - ACTIVITY_CAP + 1)
+    limit = max(1, min(limit, ACTIVITY_CAP))
+    if after is not None:
+        sql, args = " AND seq > ? ORDER BY seq ASC LIMIT ?", (max(after, oldest - 1), limit)
+    elif before is not None:
+        sql, args = " AND seq < ? ORDER BY seq DESC LIMIT ?", (before, limit)
+    else:
+        sql, args = " ORDER BY seq DESC LIMIT ?", (limit,)
+    rows = conn.execute(
+        "SELECT seq, timestamp, icon, message, level FROM activity_log WHERE email = ? AND seq >= ?" + sql,
+        (email, oldest, *args),
+    ).fetchall()
+    entries = [{"seq": r[0], "timestamp": r[1], "icon": r[2], "message": r[3], "level": r[4]} for r in rows]
+    return {"entries": entries, "head": head, "oldest": oldest if head else 0}
+
+
+def load_holdings(email: str, conn: Optional[sqlite3.Connection] = None) -> dict[str, list]:
+    holdings: dict[str, list] = {"stocks": [], "mutualFunds": []}
+    for kind, data in (conn or _conn()).execute(
+        "SELECT kind, data FROM holdings WHERE email = ? ORDER BY kind, position", (email,)
+    ):
+        holdings.setdefault(kind, []).append(json.loads(data))
+    return holdings
+
+
+def load_user(email: str) -> Optional[dict]:
+    """The user document ({email, name, onboardedAt, profile, holdings, agentState}) or None."""
+    conn = _conn()
+    row = conn.execute(
+        "SELECT name, onboarded_at, profile, is_data_present FROM users WHERE email = ?", (email,)
+    ).fetchone()
+    if not row or (row[1] is None and not row[3]):
+        return None                    # allowed email that never onboarded
+
+    holdings = load_holdings(email, conn)
+
+    state = {k: _loads(v) for k, v in conn.execute(
+        "SELECT key, value FROM agent_state WHERE email = ?", (email,))}
+    state["activityLog"] = read_activity(email, conn=conn)["entries"]
+    state["trendState"]  = {
+        sym: {"down_count": dc, "last_date": ld or ""}
+        for sym, dc, ld in conn.execute(
+            "SELECT symbol, down_count, last_date FROM trend_state WHERE email = ?", (email,))
+    }
+    return {
+        "email":       email,
+        "name":        row[0] or "",
+        "onboardedAt": row[1],
+        "profile":     _loads(row[2]) or {},
+        "holdings":    holdings,
+        "agentState":  state,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Writes
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _write_holdings(conn: sqlite3.Connection, email: str, kind: str, new: list, old: list) -> None:
+    for pos, item in enumerate(new):
+        if pos < len(old) and old[pos] == item:
+            continue
+        conn.execute(
+            "INSERT OR REPLACE INTO holdings (email, kind, position, symbol, data) VALUES (?, ?, ?, ?, ?)",
+            (email, kind, pos, item.get("symbol") or item.get("name"), _dumps(item)),
+        )
+    if len(old) > len(new):
+        conn.execute("DELETE FROM holdings WHERE email = ? AND kind = ? AND position >= ?",
+                     (email, kind, len(new)))
+
+
+def _write_user(conn: sqlite3.Connection, email: str, data: dict, base: Optional[dict]) -> None:
+    base = base or {}
+    cols = {}
+    for key, col in (("name", "name"), ("onboardedAt", "onboarded_at")):
+        if key in data and data[key] != base.get(key):
+            cols[col] = data[key]
+    if "profile" in data and data["profile"] != base.get("profile"):
+        cols["profile"] = _dumps(data["profile"])
+    if cols:
+        sets = ", ".join(f"{c} = ?" for c in cols)
+        conn.execute(f"UPDATE users SET {sets}, updated_at = ? WHERE email = ?",
+                     (*cols.values(), time.time(), email))
+
+    new_h, old_h = data.get("holdings") or {}, base.get("holdings") or {}
+    for kind in set(new_h) | set(old_h):
+        if new_h.get(kind) != old_h.get(kind):
+            _write_holdings(conn, email, kind, new_h.get(kind) or [], old_h.get(kind) or [])
+
+    new_s, old_s = data.get("agentState") or {}, base.get("agentState") or {}
+    for key, value in new_s.items():
+        if key not in _OWN_TABLE_KEYS and (key not in old_s or old_s[key] != value):
+            conn.execute("INSERT OR REPLACE INTO agent_state (email, key, value) VALUES (?, ?, ?)",
+                         (email, key, _dumps(value)))
+
+    if not base and new_s.get("activityLog"):
+        # only full writes (import / onboarding) carry a log; runs append as they go
+        append_activity(email, new_s["activityLog"][::-1], conn)
+
+    new_t, old_t = new_s.get("trendState"), old_s.get("trendState") or {}
+    if new_t is not None:
+        for sym, t in new_t.items():
+            if old_t.get(sym) != t:
+                conn.execute(
+                    "INSERT OR REPLACE INTO trend_state (email, symbol, down_count, last_date) VALUES (?, ?, ?, ?)",
+                    (email, sym, int(t.get("down_count", 0)), t.get("last_date", "")),
+                )
+        for sym in set(old_t) - set(new_t):
+            conn.execute("DELETE FROM trend_state WHERE email = ? AND symbol = ?", (email, sym))
+
+
+def save_user(email: str, data: dict, base: Optional[dict] = None, replace: bool = False) -> None:
+    """
+    Persist `data` for `email`. Only fields that differ from `base` (the document
+    as the caller loaded it; the stored rows when omitted) are written.
+    replace=True drops the stored holdings / state / log first (onboarding).
+    """
+    with _tx() as conn:
+        if replace:
+            for table in ("holdings", "agent_state", "activity_log", "trend_state"):
+                conn.execute(f"DELETE FROM {table} WHERE email = ?", (email,))
+            base = {}
+        elif base is None:
+            base = load_user(email) or {}
+        _write_user(conn, email, data, base)
+
+
+def append_activity(email: str, entries: list[dict], conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    Append `entries` (oldest first) to the user's ring; returns the seq of the
+    last one. Each entry costs one slot write, nothing else is touched.
+    """
+    if not entries:
+        return 0
+    if conn is None:
+        with _tx() as conn:
+            return append_activity(email, entries, conn)
+    row = conn.execute(
+        "UPDATE users SET activity_seq = activity_seq + ? WHERE email = ? RETURNING activity_seq",
+        (len(entries), email),
+    ).fetchone()
+    if row is None:
+        raise KeyError(email)
+    first = row[0] - len(entries) + 1
+    conn.executemany(
+        "INSERT OR REPLACE INTO activity_log (email, slot, seq, timestamp, icon, message, level)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(email, (first + i) % ACTIVITY_CAP, first + i,
+          e.get("timestamp"), e.get("icon"), e.get("message"), e.get("level"))
+         for i, e in enumerate(entries)],
+    )
+    return row[0]
+
+
+def update_state(email: str, **fields: Any) -> None:
+    """Set individual agentState keys, e.g. update_state(email, lastReportSentAt=...)."""
+    with _tx() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO agent_state (email, key, value) VALUES (?, ?, ?)",
+            [(email, k, _dumps(v)) for k, v in fields.items()],
+        )
+
+
+def read_state(key: str, emails: list[str]) -> dict[str, Any]:
+    """One agentState key for many users without loading their documents."""
+    conn, out = _conn(), {}
+    for i in range(0, len(emails), 500):
+        chunk = emails[i:i + 500]
+        rows = conn.execute(f"SELECT email, value FROM agent_state WHERE key = ? AND email IN "
+                            f"({','.join('?' * len(chunk))})", (key, *chunk))
+        out.update((email, _loads(value)) for email, value in rows)
+    return out
+
+
+def set_flags(email: str, is_data_present: Optional[bool] = None,
+              is_analysis_present: Optional[bool] = None) -> bool:
+    """Update the index flags of one user; False if the email is unknown."""
+    cols = {}
+    if is_data_present is not None:
+        cols["is_data_present"] = int(is_data_present)
+    if is_analysis_present is not None:
+        cols["is_analysis_present"] = int(is_analysis_present)
+    with _tx() as conn:
+        if not cols:
+            return conn.execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone() is not None
+        sets = ", ".join(f"{c} = ?" for c in cols)
+        cur = conn.execute(f"UPDATE users SET {sets}, updated_at = ? WHERE email = ?",
+                           (*cols.values(), time.time(), email))
+        return cur.rowcount > 0
+
+
+def save_index(index: dict) -> None:
+    """holdings.json-style writer: upserts the rows whose flags changed."""
+    current = load_index()
+    with _tx() as conn:
+        for email, meta in index.items():
+            if current.get(email) == _flags((meta.get("dataFile"), meta.get("isDataPresent"),
+                                             meta.get("isAnalysisPresent"))):
+                continue
+            conn.execute(
+                "INSERT INTO users (email, data_file, is_data_present, is_analysis_present, updated_at)"
+                " VALUES (?, ?, ?, ?, ?) ON CONFLICT(email) DO UPDATE SET"
+                " data_file = excluded.data_file, is_data_present = excluded.is_data_present,"
+                " is_analysis_present = excluded.is_analysis_present, updated_at = excluded.updated_at",
+                (email, meta.get("dataFile"), int(bool(meta.get("isDataPresent"))),
+                 int(bool(meta.get("isAnalysisPresent"))), time.time()),
+            )
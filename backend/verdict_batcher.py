@@ -0,0 +1,234 @@
+"""
+verdict_batcher.py - Groups concurrent per-user verdict requests into shared LLM calls.
+
+  Window     - requests arriving within AGENT_VERDICT_BATCH_WINDOW seconds are
+               collected (flushed early once AGENT_VERDICT_BATCH_SIZE are pending)
+  Grouping   - greedy by holdings overlap: a request joins the first group
+               whose symbol union it overlaps by AGENT_VERDICT_BATCH_OVERLAP
+               (Jaccard) until the group is full; singletons go out alone
+  Fallback   - a group reply that fails to parse, or misses a user, sends those
+               users through single-user calls
+  Latency    - callers wait at most window + AGENT_VERDICT_BATCH_WAIT; after
+               that they get None and use their own fallback
+  Off-hours  - ProviderBatchQueue submits requests through the provider's
+               batch API and delivers results by callback when they are ready
+
+The batcher is transport-agnostic: run_group(requests) -> {key: result} and
+run_single(request) -> result are supplied by the caller (agent_service).
+"""
+
+import concurrent.futures
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+BATCH_WINDOW  = float(os.getenv("AGENT_VERDICT_BATCH_WINDOW", "3"))
+BATCH_SIZE    = int(os.getenv("AGENT_VERDICT_BATCH_SIZE", "8"))
+BATCH_OVERLAP = float(os.getenv("AGENT_VERDICT_BATCH_OVERLAP", "0.3"))
+BATCH_WAIT    = float(os.getenv("AGENT_VERDICT_BATCH_WAIT", "90"))
+
+
+class VerdictRequest:
+    __slots__ = ("key", "symbols", "payload", "future")
+
+    def __init__(self, key: str, symbols: set[str], payload: Any):
+        self.key     = key
+        self.symbols = symbols
+        self.payload = payload
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+
+def group_by_overlap(requests: list[VerdictRequest], max_size: int = BATCH_SIZE,
+                     min_overlap: float = BATCH_OVERLAP) -> list[list[VerdictRequest]]:
+    groups: list[tuple[set[str], list[VerdictRequest]]] = []
+    for req in sorted(requests, key=lambda r: len(r.symbols), reverse=True):
+        for union, members in groups:
+            if len(members) >= max_size:
+                continue
+            common = len(req.symbols & union)
+            if common and common / len(req.symbols | union) >= min_overlap:
+                members.append(req)
+                union |= req.symbols
+                break
+        else:
+            groups.append((set(req.symbols), [req]))
+    return [members for _, members in groups]
+
+
+class VerdictBatcher:
+    def __init__(self, run_group: Callable[[list[VerdictRequest]], dict],
+                 run_single: Callable[[VerdictRequest], Any],
+                 window: float = BATCH_WINDOW, max_size: int = BATCH_SIZE,
+                 min_overlap: float = BATCH_OVERLAP, workers: int = 8):
+        self.run_group   = run_group
+        self.run_single  = run_single
+        self.window      = window
+        self.max_size    = max_size
+        self.min_overlap = min_overlap
+        self._cond       = threading.Condition()
+        self._pending:   list[VerdictRequest] = []
+        self._pool       = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                                 thread_name_prefix="verdict-batch")
+        self._thread:    Optional[threading.Thread] = None
+        self._stats      = {"requests": 0, "groups": 0, "grouped_users": 0, "singles": 0,
+                            "group_failures": 0, "timeouts": 0}
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._cond:
+            self._stats[key] += n
+
+    def submit(self, key: str, symbols: set[str], payload: Any) -> Optional[Any]:
+        """Block until this request's verdict is ready; None if it timed out or failed."""
+        req = VerdictRequest(key, symbols, payload)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True, name="verdict-batcher")
+                self._thread.start()
+            self._pending.append(req)
+            self._stats["requests"] += 1
+            self._cond.notify()
+        try:
+            return req.future.result(timeout=self.window + BATCH_WAIT)
+        except concurrent.futures.TimeoutError:
+            self._count("timeouts")
+            return None
+        except Exception as e:
+            print(f"[verdict_batcher] {key}: {e}")
+            return None
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+            for group in group_by_overlap(batch, self.max_size, self.min_overlap):
+                self._pool.submit(self._run, group)
+
+    def _run(self, group: list[VerdictRequest]) -> None:
+        results: dict = {}
+        if len(group) > 1:
+            self._count("groups")
+            try:
+                results = self.run_group(group) or {}
+            except Exception as e:
+                print(f"[verdict_batcher] group of {len(group)} failed: {e}")
+            if len(results) < len(group):
+                self._count("group_failures")
+            self._count("grouped_users", sum(1 for r in group if r.key in results))
+
+        for req in group:
+            if req.key in results:
+                req.future.set_result(results[req.key])
+            else:
+                # in parallel, so a failed group costs one extra call latency, not n
+                self._pool.submit(self._single, req)
+
+    def _single(self, req: VerdictRequest) -> None:
+        self._count("singles")
+        try:
+            req.future.set_result(self.run_single(req))
+        except Exception as e:
+            req.future.set_exception(e)
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+        stats.update(window=self.window, max_size=self.max_size, min_overlap=self.min_overlap)
+        return stats
+
+
+class ProviderBatchQueue:
+    """
+    Off-hours path: requests collected for `window` seconds are submitted as
+    one provider batch (create(requests) -> batch id) and polled every `poll`
+    seconds (fetch(batch_id) -> results or None while running); each result is
+    handed to the on_result callback registered with its request.
+    """
+
+    def __init__(self, create: Callable[[list[dict]], str], fetch: Callable[[str], Optional[list]],
+                 window: float = 30.0, poll: float = 60.0):
+        self.create   = create
+        self.fetch    = fetch
+        self.window   = window
+        self.poll     = poll
+        self._lock    = threading.Lock()
+        self._seq     = 0
+        self._pending: list[dict] = []
+        self._waiting: dict[str, Callable[[Any], None]] = {}
+        self._batches: set[str] = set()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._poller: Optional[threading.Thread] = None
+        self._stats   = {"submitted": 0, "batches": 0, "results": 0, "submit_failures": 0}
+
+    def submit(self, params: dict, on_result: Callable[[Any], None]) -> str:
+        with self._lock:
+            self._seq += 1
+            custom_id = f"req-{int(time.time())}-{self._seq}"
+            self._pending.append({"custom_id": custom_id, "params": params})
+            self._waiting[custom_id] = on_result
+            self._stats["submitted"] += 1
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.window, self._flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        return custom_id
+
+    def _flush(self) -> None:
+        with self._lock:
+            requests, self._pending = self._pending, []
+            self._flush_timer = None
+        if not requests:
+            return
+        try:
+            batch_id = self.create(requests)
+        except Exception as e:
+            print(f"[verdict_batcher] provider batch submit failed: {e}")
+            with self._lock:
+                self._stats["submit_failures"] += 1
+                for r in requests:
+                    self._waiting.pop(r["custom_id"], None)
+            return
+        with self._lock:
+            self._batches.add(batch_id)
+            self._stats["batches"] += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, daemon=True, name="verdict-batch-poll")
+                self._poller.start()
+        print(f"[verdict_batcher] submitted provider batch {batch_id} ({len(requests)} requests)")
+
+    def _poll_loop(self) -> None:
+        while True:
+            time.sleep(self.poll)
+            with self._lock:
+                batches = list(self._batches)
+            for batch_id in batches:
+                try:
+                    results = self.fetch(batch_id)
+                except Exception as e:
+                    print(f"[verdict_batcher] poll {batch_id} failed: {e}")
+                    continue
+                if results is None:
+                    continue
+                with self._lock:
+                    self._batches.discard(batch_id)
+                for r in results:
+                    with self._lock:
+                        cb = self._waiting.pop(r.custom_id, None)
+                        self._stats["results"] += 1
+                    if cb is not None:
+                        try:
+                            cb(r)
+                        except Exception as e:
+                            print(f"[verdict_batcher] result handler error: {e}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "open_batches": len(self._batches), "waiting": len(self._waiting)}